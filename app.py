@@ -1,17 +1,46 @@
 import gradio as gr
-import torch
 import os
 import sys
 import tempfile
 import shutil
 import subprocess
+import threading
+import json
+import time
+import atexit
 import spaces # Keep this if you use @spaces.GPU
-from typing import Any, Dict, List, Union # Added Union
+import queue
+import random
+import dataclasses
+from collections import deque
+from typing import Any, Callable, Dict, List, Tuple, Union # Added Union
+
+from artifact_store import ArtifactStore
+from cancellation import CancelToken, JobCancelled, terminate_process_group
+from device_registry import Device, DeviceFailure, DeviceRegistry, parse_devices, visible_gpu_ids
+from fused_pipeline import MERGE_STAGE, SKELETON_STAGE, SKIN_STAGE, load_handoff, parse_fused_line
+from glb_inspector import GLBError, GLBInfo, estimate_runtime, inspect_glb, reject_reason
+from glb_optimize import compression_tool, optimize_glb
+from job_scheduler import SchedulerFull, Stage, StageScheduler
+from metrics import (ARTIFACTS_RECLAIMED_BYTES, OUTPUT_BYTES, PROFILED_STEPS, RIG_REQUESTS, TIME_TO_FIRST_RESULT, Gauge,
+                     StepTimer, log_json, parse_timing_marker, record_job, register, render_metrics, set_json_log_path)
+from preflight import (build_diagnostic_script, compute_fingerprint, failed_checks, fingerprint_digest,
+                       load_manifest, parse_diagnostic_output, save_manifest)
+from process_output import OutputTail, parse_progress_fraction, start_line_readers
+from readiness import FAILED, PROVISIONING, READY, VERIFYING, ReadinessState
+from remote_worker import RemoteWorker
+from single_flight import SingleFlight
+from resource_governor import CpuAllocator, MemoryLimitExceeded, ResourceProfile, RssWatchdog, wait_and_measure
+from result_cache import ResultCache, file_sha256, make_cache_key, read_git_revision
+from rig_preview import build_preview_glb
+from worker_pool import BlenderWorkerPool, WorkerUnavailable
 
 # --- Configuration ---
 APP_ROOT_DIR = os.path.abspath(os.path.dirname(__file__)) # Should be /home/user/app
 
-UNIRIG_REPO_DIR = os.path.join(APP_ROOT_DIR, "UniRig")
+# Both can be overridden, e.g. to run against the stand-ins in benchmarks/ on a machine without Blender.
+UNIRIG_REPO_DIR = os.environ.get("UNIRIG_REPO_DIR") or os.path.join(APP_ROOT_DIR, "UniRig")
+BLENDER_EXEC_OVERRIDE = os.environ.get("UNIRIG_BLENDER_EXEC") or None
 
 BLENDER_VERSION_NAME = "blender-4.2.0-linux-x64"
 BLENDER_LOCAL_INSTALL_BASE_DIR = os.path.join(APP_ROOT_DIR, "blender_installation")
@@ -30,108 +59,383 @@ BLENDER_EXEC_SYMLINK = "/usr/local/bin/blender" # Fallback system symlink
 
 SETUP_SCRIPT = os.path.join(APP_ROOT_DIR, "setup_blender.sh")
 SETUP_SCRIPT_TIMEOUT = 1800
-
-# --- Initial Checks ---
-print("--- Environment Checks ---")
-print(f"APP_ROOT_DIR: {APP_ROOT_DIR}")
-print(f"Expected Blender Install Dir: {BLENDER_INSTALL_DIR}")
-print(f"Expected Blender Executable: {BLENDER_EXEC}")
-
+# Rig requests that arrive while the environment is still provisioning wait this long for it.
+STARTUP_WAIT_TIMEOUT = int(os.environ.get("UNIRIG_STARTUP_WAIT_TIMEOUT", str(SETUP_SCRIPT_TIMEOUT + 600)))
+
+# Persistent Blender workers (see blender_worker.py / worker_pool.py). Set the pool size to 0
+# to always use the one-shot `blender --background` subprocess per step.
+BLENDER_WORKER_SCRIPT = os.path.join(APP_ROOT_DIR, "blender_worker.py")
+WORKER_POOL_SIZE = int(os.environ.get("UNIRIG_WORKER_POOL_SIZE", "1"))
+WORKER_MAX_JOBS = int(os.environ.get("UNIRIG_WORKER_MAX_JOBS", "20")) # Recycle a worker after this many steps
+WORKER_STARTUP_TIMEOUT = int(os.environ.get("UNIRIG_WORKER_STARTUP_TIMEOUT", "300"))
+# Job scheduler (see job_scheduler.py): skeleton/skin run on the GPU lane, merging on the CPU lane.
+# Devices for skeleton/skin steps (see device_registry.py)
+DEVICES_SPEC = os.environ.get("UNIRIG_DEVICES", "auto")
+DEVICE_SLOTS = int(os.environ.get("UNIRIG_DEVICE_SLOTS", "1")) # Concurrent steps per device
+DEVICE_ATTEMPTS = int(os.environ.get("UNIRIG_DEVICE_ATTEMPTS", "2")) # Devices a step is tried on before it fails
+DEVICE_QUARANTINE_SECONDS = float(os.environ.get("UNIRIG_DEVICE_QUARANTINE_SECONDS", "60"))
+REMOTE_WORKER_TOKEN = os.environ.get("UNIRIG_REMOTE_WORKER_TOKEN") or None
+# Signs in a failed step's stderr that the device, not the input, was at fault
+DEVICE_FAILURE_MARKERS = ("cuda error", "cuda out of memory", "cudnn_status_", "cublas_status_",
+                          "illegal memory access", "no cuda gpus are available")
+
+# 0 = one per device slot, so every device can run a step at the same time
+GPU_LANE_WORKERS = (int(os.environ.get("UNIRIG_GPU_LANE_WORKERS", "0"))
+                    or sum(d.slots for d in parse_devices(DEVICES_SPEC, visible_gpu_ids(), DEVICE_SLOTS)))
+CPU_LANE_WORKERS = int(os.environ.get("UNIRIG_CPU_LANE_WORKERS", "2"))
+MAX_ACTIVE_JOBS = int(os.environ.get("UNIRIG_MAX_ACTIVE_JOBS", "16")) # Admission limit (queued + running)
+# Per-step timeout: the step's runtime estimate (from the input size) times the factor, clamped to
+# [min, max]. Steps without an estimate, such as the diagnostic, get the maximum.
+STEP_TIMEOUT_FACTOR = float(os.environ.get("UNIRIG_STEP_TIMEOUT_FACTOR", "4"))
+STEP_TIMEOUT_MIN = int(os.environ.get("UNIRIG_STEP_TIMEOUT_MIN", "300"))
+STEP_TIMEOUT_MAX = int(os.environ.get("UNIRIG_STEP_TIMEOUT_MAX", "1800"))
+# A cancelled or timed-out step's process group gets SIGTERM, then SIGKILL after this many seconds.
+CANCEL_GRACE_SECONDS = float(os.environ.get("UNIRIG_CANCEL_GRACE_SECONDS", "10"))
+# Per-step resource profile (see resource_governor.py)
+CPUS_PER_STEP = int(os.environ.get("UNIRIG_CPUS_PER_STEP", "0")) # 0 = host CPUs / concurrent lane workers
+STEP_RSS_LIMIT_MB = int(os.environ.get("UNIRIG_STEP_RSS_LIMIT_MB", "0")) # 0 = no limit
+STEP_ADDRESS_SPACE_MB = int(os.environ.get("UNIRIG_STEP_ADDRESS_SPACE_MB", "0")) # RLIMIT_AS of CPU-only steps, 0 = no limit
+# Optional compaction of the rigged GLB after merging (see glb_optimize.py)
+GLB_OPTIMIZE = os.environ.get("UNIRIG_GLB_OPTIMIZE", "0") == "1"
+GLB_MAX_INFLUENCES = int(os.environ.get("UNIRIG_GLB_MAX_INFLUENCES", "4"))
+if GLB_MAX_INFLUENCES < 1:
+    raise ValueError(f"UNIRIG_GLB_MAX_INFLUENCES must be at least 1, got {GLB_MAX_INFLUENCES}.")
+GLB_QUANTIZE = os.environ.get("UNIRIG_GLB_QUANTIZE", "1") == "1"
+GLB_COMPRESSION = os.environ.get("UNIRIG_GLB_COMPRESSION", "auto") # auto, meshopt, draco or none
+# Lines of stdout/stderr kept in memory per step (streamed output is logged as it arrives)
+STEP_LOG_TAIL_LINES = int(os.environ.get("UNIRIG_STEP_LOG_TAIL_LINES", "500"))
+# Lines shown in the UI progress log
+UI_LOG_LINES = 200
+# Seconds between UI updates while a job produces no events (queued or silent)
+PROGRESS_HEARTBEAT_SECONDS = 5
+# Batch mode runs each stage for all inputs in one Blender process; the timeout scales per input.
+BATCH_STEP_TIMEOUT_PER_INPUT = int(os.environ.get("UNIRIG_BATCH_STEP_TIMEOUT_PER_INPUT", "1800"))
+
+# Uploads are inspected (see glb_inspector.py) and rejected before any Blender launch above these limits.
+MAX_INPUT_BYTES = int(float(os.environ.get("UNIRIG_MAX_INPUT_MB", "200")) * 1024**2)
+MAX_INPUT_VERTICES = int(os.environ.get("UNIRIG_MAX_INPUT_VERTICES", "1000000"))
+# ZeroGPU window per step: runtime estimate * margin, capped; the default applies without an estimate.
+ZEROGPU_DURATION_MARGIN = float(os.environ.get("UNIRIG_ZEROGPU_DURATION_MARGIN", "1.5"))
+ZEROGPU_MAX_DURATION = int(os.environ.get("UNIRIG_ZEROGPU_MAX_DURATION", "300"))
+ZEROGPU_DEFAULT_DURATION = 60
+# Decimate-then-transfer (see proxy_mesh.py): inputs above the triangle threshold are rigged on a proxy
+# simplified to the face budget, then the weights are transferred back. A threshold of 0 disables it.
+PROXY_MESH_SCRIPT = os.path.join(APP_ROOT_DIR, "proxy_mesh.py")
+PROXY_TRIANGLE_THRESHOLD = int(os.environ.get("UNIRIG_PROXY_TRIANGLE_THRESHOLD", "0"))
+PROXY_TARGET_FACES = int(os.environ.get("UNIRIG_PROXY_TARGET_FACES", "100000"))
+# Skeleton, skin and merge of a run in one Blender process (see fused_pipeline.py) instead of three launches.
+FUSED_PIPELINE_SCRIPT = os.path.join(APP_ROOT_DIR, "fused_pipeline.py")
+FUSED_PIPELINE = os.environ.get("UNIRIG_FUSED_PIPELINE", "0") == "1"
+# Inference profile of UniRig steps that run without a GPU (see blender_hooks.install_cpu_inference_profile):
+# any of threads, bf16, int8 and compile, or none for plain fp32. bf16 and int8 trade some skin-weight
+# accuracy for speed (benchmarks/cpu_inference_bench.py measures both).
+CPU_INFERENCE = [o.strip() for o in os.environ.get("UNIRIG_CPU_INFERENCE", "threads").split(",")
+                 if o.strip() and o.strip() != "none"]
+CPU_INTEROP_THREADS = int(os.environ.get("UNIRIG_CPU_INTEROP_THREADS", "1"))
+# Progressive results: the UI shows the input mesh with the predicted bones (see rig_preview.py) as soon as
+# skeleton prediction finishes, then replaces it with the rigged GLB.
+PROGRESSIVE_PREVIEW = os.environ.get("UNIRIG_PROGRESSIVE_PREVIEW", "1") == "1"
+# Structured per-step/per-job timing records (see metrics.py); stdout when unset.
+JSON_LOG_PATH = os.environ.get("UNIRIG_JSON_LOG_PATH") or None
+# Profiling of the Blender steps (see blender_hooks.StepProfiler): a sampled fraction of rig jobs, plus
+# API jobs submitted with profile=true. Reports are published to the artifact store.
+PROFILE_SAMPLE_RATE = float(os.environ.get("UNIRIG_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_MODES = [m.strip() for m in os.environ.get("UNIRIG_PROFILE_MODES", "cprofile").split(",") if m.strip()]
+PROFILE_TOP_N = int(os.environ.get("UNIRIG_PROFILE_TOP_N", "25"))
+PROFILE_TRACEMALLOC_FRAMES = int(os.environ.get("UNIRIG_PROFILE_TRACEMALLOC_FRAMES", "1"))
+# Address of the combined Gradio + /metrics server
+SERVER_NAME = os.environ.get("GRADIO_SERVER_NAME", "0.0.0.0")
+SERVER_PORT = int(os.environ.get("GRADIO_SERVER_PORT", "7860"))
+
+# UniRig pipeline configuration (Hydra config names passed to run.py)
+SKELETON_CONFIG = "skeleton_config"
+SKIN_CONFIG = "skin_config"
+MERGE_CONFIG = "merge_config"
+
+# Content-addressed cache of final rigged GLBs (see result_cache.py). A budget of 0 disables it.
+CACHE_ROOT_DIR = os.environ.get("UNIRIG_CACHE_DIR", os.path.join(APP_ROOT_DIR, "unirig_cache"))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("UNIRIG_RESULT_CACHE_MAX_BYTES", str(2 * 1024**3)))
+# Skeleton/skin intermediates, reused by retries and by the skin + merge only mode.
+STAGE_CACHE_MAX_BYTES = int(os.environ.get("UNIRIG_STAGE_CACHE_MAX_BYTES", str(4 * 1024**3)))
+# Working directories, bootstrap scripts and published outputs (see artifact_store.py). Point the root at
+# a tmpfs (e.g. /dev/shm/unirig) to keep intermediates off the disk. A quota of 0 disables eviction.
+ARTIFACT_DIR = os.environ.get("UNIRIG_ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "unirig_artifacts"))
+ARTIFACT_MAX_BYTES = int(os.environ.get("UNIRIG_ARTIFACT_MAX_BYTES", str(5 * 1024**3)))
+ARTIFACT_TTL_SECONDS = int(os.environ.get("UNIRIG_ARTIFACT_TTL_SECONDS", "3600")) # How long outputs stay downloadable
+ARTIFACT_REAP_INTERVAL = int(os.environ.get("UNIRIG_ARTIFACT_REAP_INTERVAL", "300"))
+# Identical requests (same input content and parameters) arriving while one is running join it instead of
+# starting their own pipeline (see single_flight.py).
+SINGLE_FLIGHT = os.environ.get("UNIRIG_SINGLE_FLIGHT", "1") == "1"
+# On-disk inductor cache of the "compile" CPU optimization, so later processes skip most of the compilation.
+TORCH_COMPILE_CACHE_DIR = os.path.join(CACHE_ROOT_DIR, "torch_compile")
+# Fingerprinted record of the last Blender environment diagnostic (see preflight.py)
+PREFLIGHT_MANIFEST_PATH = os.path.join(CACHE_ROOT_DIR, "preflight_manifest.json")
+# Job API (see job_api.py)
+JOBS_DIR = os.environ.get("UNIRIG_JOBS_DIR", os.path.join(CACHE_ROOT_DIR, "jobs"))
+API_MAX_RUNNING_JOBS = int(os.environ.get("UNIRIG_API_MAX_RUNNING_JOBS", "2")) # The rest wait in the job store
+JOB_TTL_SECONDS = int(os.environ.get("UNIRIG_JOB_TTL_SECONDS", str(7 * 24 * 3600))) # Finished jobs are deleted after this; 0 keeps them
+# Hosts a job's callback_url may name; empty rejects callbacks (they are requests made by the server)
+API_CALLBACK_HOSTS = [host.strip() for host in os.environ.get("UNIRIG_API_CALLBACK_HOSTS", "").split(",") if host.strip()]
+
+# --- Environment state ---
+# Provisioning and verification run in a background thread (see provision_environment) so the UI
+# binds immediately; rig requests wait for the ready state.
+environment = ReadinessState(PROVISIONING, "Starting up.")
 blender_executable_to_use = None
-if os.path.exists(BLENDER_EXEC):
-    print(f"Blender executable found at direct local path: {BLENDER_EXEC}")
-    blender_executable_to_use = BLENDER_EXEC
-elif os.path.exists(BLENDER_EXEC_LOCAL_SYMLINK):
-    print(f"Blender executable found via local symlink: {BLENDER_EXEC_LOCAL_SYMLINK}")
-    blender_executable_to_use = BLENDER_EXEC_LOCAL_SYMLINK
-elif os.path.exists(BLENDER_EXEC_SYMLINK):
-    print(f"Blender executable found via system symlink: {BLENDER_EXEC_SYMLINK}")
-    blender_executable_to_use = BLENDER_EXEC_SYMLINK
-else:
-    print(f"Blender executable not found. Running setup script...")
-    if os.path.exists(SETUP_SCRIPT):
-        try:
-            setup_result = subprocess.run(
-                ["bash", SETUP_SCRIPT],
-                check=True,
-                capture_output=True,
-                text=True,
-                timeout=SETUP_SCRIPT_TIMEOUT
-            )
-            print("Setup script executed successfully.")
-            print(f"Setup STDOUT:\n{setup_result.stdout}")
-            if setup_result.stderr: print(f"Setup STDERR:\n{setup_result.stderr}")
-
-            if os.path.exists(BLENDER_EXEC):
-                blender_executable_to_use = BLENDER_EXEC
-                print(f"Blender executable now found at direct local path: {BLENDER_EXEC}")
-            elif os.path.exists(BLENDER_EXEC_LOCAL_SYMLINK):
-                blender_executable_to_use = BLENDER_EXEC_LOCAL_SYMLINK
-                print(f"Blender executable now found via local symlink: {BLENDER_EXEC_LOCAL_SYMLINK}")
-            elif os.path.exists(BLENDER_EXEC_SYMLINK):
-                 blender_executable_to_use = BLENDER_EXEC_SYMLINK
-                 print(f"Blender executable now found via system symlink: {BLENDER_EXEC_SYMLINK}")
-
-            if not blender_executable_to_use:
-                 raise RuntimeError(f"Setup script ran but Blender executable still not found.")
-        except subprocess.TimeoutExpired:
-             print(f"ERROR: Setup script timed out: {SETUP_SCRIPT}")
-             raise gr.Error(f"Setup script timed out. Check logs.")
-        except subprocess.CalledProcessError as e:
-            print(f"ERROR running setup script: {SETUP_SCRIPT}\nStderr: {e.stderr}")
-            raise gr.Error(f"Failed to execute setup script. Stderr: {e.stderr[-500:]}")
-        except Exception as e:
-            raise gr.Error(f"Unexpected error running setup script '{SETUP_SCRIPT}': {e}")
-    else:
-        raise gr.Error(f"Blender executable not found and setup script missing: {SETUP_SCRIPT}")
 
+# Set from the preflight verdict (see ensure_preflight), which replaces the per-request bpy/diagnostic runs.
 bpy_import_ok = False
-if blender_executable_to_use:
-    try:
-        print("Testing bpy import via Blender...")
-        test_script_content = "import bpy; print('bpy imported successfully')"
-        test_result = subprocess.run(
-            [blender_executable_to_use, "--background", "--python-expr", test_script_content],
-            capture_output=True, text=True, check=True, timeout=30
-        )
-        if "bpy imported successfully" in test_result.stdout:
-            print("Successfully imported 'bpy' using Blender executable.")
-            bpy_import_ok = True
-        else:
-            print(f"WARNING: 'bpy' import test unexpected output:\nSTDOUT:{test_result.stdout}\nSTDERR:{test_result.stderr}")
-    except subprocess.TimeoutExpired:
-        print("WARNING: 'bpy' import test via Blender timed out.")
-    except subprocess.CalledProcessError as e:
-        print(f"WARNING: Failed to import 'bpy' using Blender executable:\nSTDOUT:{e.stdout}\nSTDERR:{e.stderr}")
-    except Exception as e:
-        print(f"WARNING: Unexpected error during 'bpy' import test: {e}")
-else:
-     print("WARNING: Cannot test bpy import as Blender executable was not found.")
 
 unirig_repo_ok = False
 unirig_run_py_ok = False
 UNIRIG_RUN_PY = os.path.join(UNIRIG_REPO_DIR, "run.py")
-if not os.path.isdir(UNIRIG_REPO_DIR):
-    raise gr.Error(f"UniRig repository missing at: {UNIRIG_REPO_DIR}.")
-else:
+
+def find_blender_executable() -> Union[str, None]:
+    for label, path in (("direct local path", BLENDER_EXEC), ("local symlink", BLENDER_EXEC_LOCAL_SYMLINK),
+                        ("system symlink", BLENDER_EXEC_SYMLINK)):
+        if os.path.exists(path):
+            print(f"Blender executable found via {label}: {path}")
+            return path
+    return None
+
+def locate_blender() -> str:
+    """Returns the Blender executable, running the setup script when none is installed. Raises RuntimeError."""
+    print("--- Environment Checks ---")
+    print(f"APP_ROOT_DIR: {APP_ROOT_DIR}")
+    print(f"Expected Blender Install Dir: {BLENDER_INSTALL_DIR}")
+    print(f"Expected Blender Executable: {BLENDER_EXEC}")
+    if BLENDER_EXEC_OVERRIDE:
+        if not os.path.exists(BLENDER_EXEC_OVERRIDE):
+            raise RuntimeError(f"UNIRIG_BLENDER_EXEC points to a missing file: {BLENDER_EXEC_OVERRIDE}")
+        print(f"Blender executable set by UNIRIG_BLENDER_EXEC: {BLENDER_EXEC_OVERRIDE}")
+        return BLENDER_EXEC_OVERRIDE
+    blender_path = find_blender_executable()
+    if blender_path:
+        return blender_path
+
+    if not os.path.exists(SETUP_SCRIPT):
+        raise RuntimeError(f"Blender executable not found and setup script missing: {SETUP_SCRIPT}")
+    print(f"Blender executable not found. Running setup script...")
+    environment.set(PROVISIONING, "Installing Blender and UniRig dependencies (first start only).")
+    try:
+        setup_result = subprocess.run(
+            ["bash", SETUP_SCRIPT],
+            check=True,
+            capture_output=True,
+            text=True,
+            timeout=SETUP_SCRIPT_TIMEOUT
+        )
+    except subprocess.TimeoutExpired:
+        print(f"ERROR: Setup script timed out: {SETUP_SCRIPT}")
+        raise RuntimeError(f"Setup script timed out. Check logs.")
+    except subprocess.CalledProcessError as e:
+        print(f"ERROR running setup script: {SETUP_SCRIPT}\nStderr: {e.stderr}")
+        raise RuntimeError(f"Failed to execute setup script. Stderr: {e.stderr[-500:]}")
+    print("Setup script executed successfully.")
+    print(f"Setup STDOUT:\n{setup_result.stdout}")
+    if setup_result.stderr: print(f"Setup STDERR:\n{setup_result.stderr}")
+    blender_path = find_blender_executable()
+    if not blender_path:
+        raise RuntimeError(f"Setup script ran but Blender executable still not found.")
+    return blender_path
+
+def verify_unirig_repo():
+    global unirig_repo_ok, unirig_run_py_ok, UNIRIG_REVISION
+    if not os.path.isdir(UNIRIG_REPO_DIR):
+        raise RuntimeError(f"UniRig repository missing at: {UNIRIG_REPO_DIR}.")
     print(f"UniRig repository found at: {UNIRIG_REPO_DIR}")
     unirig_repo_ok = True
     if not os.path.exists(UNIRIG_RUN_PY):
-        raise gr.Error(f"UniRig's run.py not found at {UNIRIG_RUN_PY}.")
-    else:
-        unirig_run_py_ok = True
+        raise RuntimeError(f"UniRig's run.py not found at {UNIRIG_RUN_PY}.")
+    unirig_run_py_ok = True
+    UNIRIG_REVISION = read_git_revision(UNIRIG_REPO_DIR)
+    print(f"UniRig revision: {UNIRIG_REVISION}")
+
+_device_type = None
+
+def get_device_type() -> str:
+    """"cuda" or "cpu" for UniRig's device argument. torch is imported here, on first use, not at startup."""
+    global _device_type
+    if _device_type is None:
+        import torch
+        _device_type = "cuda" if torch.cuda.is_available() else "cpu"
+        print(f"Gradio environment using device: {_device_type}")
+        if _device_type == "cuda":
+            try:
+                print(f"Gradio CUDA Device Name: {torch.cuda.get_device_name(0)}")
+                print(f"Gradio PyTorch CUDA Built Version: {torch.version.cuda}")
+            except Exception as e:
+                print(f"Could not get Gradio CUDA device details: {e}")
+        else:
+            print("Warning: Gradio environment CUDA not available.")
+    return _device_type
 
-DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"Gradio environment using device: {DEVICE}")
-if DEVICE.type == 'cuda':
+def provision_environment():
+    """Background startup: provisioning -> verifying -> ready, or failed with the reason."""
+    global blender_executable_to_use
+    started = time.time()
     try:
-        print(f"Gradio CUDA Device Name: {torch.cuda.get_device_name(0)}")
-        print(f"Gradio PyTorch CUDA Built Version: {torch.version.cuda}")
+        environment.set(PROVISIONING, "Locating Blender.")
+        blender_executable_to_use = locate_blender()
+        environment.set(VERIFYING, "Checking the UniRig checkout and the Blender environment.")
+        verify_unirig_repo()
+        manifest = ensure_preflight()
+        device_registry.configure(parse_devices(DEVICES_SPEC, visible_gpu_ids() if get_device_type() == "cuda" else [],
+                                                DEVICE_SLOTS))
+        print("--- End Environment Checks ---")
+        failed = failed_checks(manifest.get("verdict"))
+        environment.set(READY, f"Ready after {time.time() - started:.1f}s"
+                               + (f" (preflight warnings: {', '.join(failed)})." if failed else "."))
     except Exception as e:
-        print(f"Could not get Gradio CUDA device details: {e}")
-else:
-    print("Warning: Gradio environment CUDA not available.")
-print("--- End Environment Checks ---")
+        print(f"CRITICAL STARTUP ERROR: {e}")
+        import traceback; traceback.print_exc()
+        environment.set(FAILED, str(e)[:500])
+
+def require_environment(timeout: Union[float, None] = None):
+    """Blocks until the environment is ready. Raises gr.Error when startup failed or did not finish in time."""
+    state = environment.wait(STARTUP_WAIT_TIMEOUT if timeout is None else timeout)
+    if state == FAILED:
+        raise gr.Error(f"System not ready: startup failed. {environment.snapshot()['message']}")
+    if state != READY:
+        raise gr.Error(f"System not ready: the environment is still {state}. Please try again shortly.")
+
+def wait_for_environment_updates(output_count: int):
+    """Yields UI updates (the last one being a status line) while rig requests wait for the environment."""
+    waited = time.time()
+    while environment.wait(timeout=2.0) not in (READY, FAILED):
+        if time.time() - waited > STARTUP_WAIT_TIMEOUT:
+            break
+        snapshot = environment.snapshot()
+        status = f"Waiting for the environment ({snapshot['state']}, {time.time() - waited:.0f}s): {snapshot['message']}"
+        yield tuple([gr.update()] * (output_count - 1)) + (status,)
+    require_environment(timeout=0)
+
+result_cache = ResultCache(os.path.join(CACHE_ROOT_DIR, "results"), RESULT_CACHE_MAX_BYTES)
+stage_cache = ResultCache(os.path.join(CACHE_ROOT_DIR, "stages"), STAGE_CACHE_MAX_BYTES)
+artifact_store = ArtifactStore(ARTIFACT_DIR, ARTIFACT_MAX_BYTES, ARTIFACT_TTL_SECONDS, legacy_dirs=[tempfile.gettempdir()],
+                               on_reclaim=lambda reason, size: ARTIFACTS_RECLAIMED_BYTES.inc(reason, amount=size))
+artifact_store.start_reaper(ARTIFACT_REAP_INTERVAL)
+
+def _artifact_bytes() -> Dict[Tuple[str, ...], int]:
+    stats = artifact_store.stats()
+    return {("work",): stats["work_bytes"], ("output",): stats["output_bytes"]}
+
+register(Gauge("unirig_artifact_bytes", "Bytes held by the artifact store.", ["kind"], read=_artifact_bytes))
+UNIRIG_REVISION = "unknown" # Resolved by verify_unirig_repo() before any request runs
+print(f"Result cache: {result_cache.root} (budget {RESULT_CACHE_MAX_BYTES} bytes)")
+
+set_json_log_path(JSON_LOG_PATH)
+# The stage currently running on this scheduler lane thread, read by execute_unirig_command for metrics.
+_stage_context = threading.local()
+
+def _on_stage_start(job, timing):
+    _stage_context.queue_wait = timing.queue_wait
+    _stage_context.job_id = job.id
+
+def _on_stage_end(job, timing, error):
+    _stage_context.queue_wait = 0.0
+
+rig_scheduler = StageScheduler({"gpu": GPU_LANE_WORKERS, "cpu": CPU_LANE_WORKERS}, max_jobs=MAX_ACTIVE_JOBS,
+                               on_stage_start=_on_stage_start, on_stage_end=_on_stage_end)
+atexit.register(rig_scheduler.shutdown)
+register(Gauge("unirig_queue_depth", "Stages waiting per scheduler lane.", ["lane"],
+               read=lambda: {(lane,): s["queued"] for lane, s in rig_scheduler.stats()["lanes"].items()}))
+register(Gauge("unirig_stages_in_flight", "Stages running per scheduler lane.", ["lane"],
+               read=lambda: {(lane,): s["in_flight"] for lane, s in rig_scheduler.stats()["lanes"].items()}))
+register(Gauge("unirig_lane_estimated_wait_seconds", "Estimated work ahead of a new stage per lane.", ["lane"],
+               read=lambda: {(lane,): s["estimated_wait_seconds"] for lane, s in rig_scheduler.stats()["lanes"].items()}))
+register(Gauge("unirig_environment_ready", "1 once provisioning and verification finished, else 0.",
+               read=lambda: {(): 1 if environment.state == READY else 0}))
+
+device_registry = DeviceRegistry(quarantine_seconds=DEVICE_QUARANTINE_SECONDS) # Configured by provision_environment()
+register(Gauge("unirig_device_steps_in_flight", "Steps running per device.", ["device"],
+               read=lambda: {(name,): d["in_flight"] for name, d in device_registry.stats().items()}))
+register(Gauge("unirig_device_failures", "Steps that failed because of the device, per device.", ["device"],
+               read=lambda: {(name,): d["failures_total"] for name, d in device_registry.stats().items()}))
+register(Gauge("unirig_device_quarantined", "1 while a device is skipped after a failure.", ["device"],
+               read=lambda: {(name,): int(d["quarantined"]) for name, d in device_registry.stats().items()}))
+
+cpu_allocator = CpuAllocator()
+register(Gauge("unirig_cpus_assigned", "Host CPUs assigned to at least one running Blender process.",
+               read=lambda: {(): cpu_allocator.stats()["cpus_in_use"]}))
+register(Gauge("unirig_active_jobs", "Rig jobs admitted by the scheduler (queued or running).",
+               read=lambda: {(): rig_scheduler.stats()["active_jobs"]}))
+
+rig_flights = SingleFlight("rig-flight", on_join=RIG_REQUESTS.inc)
+register(Gauge("unirig_singleflight_in_flight", "Distinct rig runs that identical requests can join.",
+               read=lambda: {(): rig_flights.stats()["in_flight"]}))
+register(Gauge("unirig_singleflight_waiters", "Requests waiting on an in-flight rig run, its leader included.",
+               read=lambda: {(): rig_flights.stats()["waiters"]}))
+
+def get_unirig_device_arg() -> str:
+    return "device=cuda:0" if get_device_type() == "cuda" else "device=cpu"
+
+def pipeline_cache_keys(input_glb_path: str, unirig_device_arg: str,
+                        skeleton_fbx_path: Union[str, None] = None, proxy_target_faces: int = 0) -> Dict[str, str]:
+    """
+    Chained cache keys for each stage. Every key covers the key of the stage it consumes,
+    so changing only the skin or merge configuration keeps the upstream stages reusable.
+    A user-supplied skeleton replaces the skeleton stage key with the hash of that file.
+    proxy_target_faces is the proxy face budget when the run goes through a proxy mesh (0 otherwise).
+    """
+    input_sha256 = file_sha256(input_glb_path)
+    # bf16 and int8 change the predicted skeleton and weights, so CPU runs with them get their own entries.
+    numerics = [o for o in CPU_INFERENCE if o in ("bf16", "int8")] if unirig_device_arg == "device=cpu" else []
+    cpu_key = {"cpu_numerics": ",".join(numerics)} if numerics else {}
+    proxy_key = make_cache_key(stage="proxy", input_sha256=input_sha256, target_faces=proxy_target_faces)
+    if skeleton_fbx_path:
+        skeleton_key = make_cache_key(stage="skeleton", supplied_skeleton_sha256=file_sha256(skeleton_fbx_path))
+    else:
+        skeleton_key = make_cache_key(stage="skeleton", input_sha256=input_sha256, config=SKELETON_CONFIG,
+                                      device=unirig_device_arg, unirig_revision=UNIRIG_REVISION, **cpu_key,
+                                      **({"proxy": proxy_key} if proxy_target_faces else {}))
+    skin_key = make_cache_key(stage="skin", skeleton=skeleton_key, config=SKIN_CONFIG,
+                              device=unirig_device_arg, unirig_revision=UNIRIG_REVISION, **cpu_key)
+    merge_key = make_cache_key(stage="merge", skin=skin_key, input_sha256=input_sha256, config=MERGE_CONFIG,
+                               device=unirig_device_arg, unirig_revision=UNIRIG_REVISION,
+                               **({"proxy": proxy_key} if proxy_target_faces else {}))
+    keys = {"proxy": proxy_key, "skeleton": skeleton_key, "skin": skin_key, "merge": merge_key, "result": merge_key}
+    if GLB_OPTIMIZE:
+        # The optimized GLB is cached under its own key; the raw merge output stays in the stage cache.
+        tool = compression_tool(GLB_COMPRESSION) if GLB_COMPRESSION != "none" else None
+        keys["result"] = make_cache_key(stage="optimize", merge=merge_key, max_influences=GLB_MAX_INFLUENCES,
+                                        quantize=GLB_QUANTIZE, compression=tool[0] if tool else None)
+    return keys
+
+def skeleton_step_args(input_glb_path: str, skeleton_output_path: str, unirig_device_arg: str) -> List[str]:
+    return [
+        f"--config-name={SKELETON_CONFIG}", "with",
+        f"input={input_glb_path}",
+        f"output={skeleton_output_path}",
+        unirig_device_arg
+    ]
+
+def skin_step_args(skeleton_path: str, skin_output_path: str, unirig_device_arg: str) -> List[str]:
+    return [
+        f"--config-name={SKIN_CONFIG}", "with",
+        f"input={skeleton_path}",
+        f"output={skin_output_path}",
+        unirig_device_arg
+    ]
+
+def merge_step_args(skin_path: str, input_glb_path: str, rigged_output_path: str, unirig_device_arg: str) -> List[str]:
+    return [
+        f"--config-name={MERGE_CONFIG}", "with",
+        f"source_path={skin_path}",
+        f"target_path={input_glb_path}",
+        f"output_path={rigged_output_path}",
+        "mode=skin",
+        unirig_device_arg
+    ]
+
+def restore_stage_artifact(stage_key: str, destination_path: str, suffix: str = ".fbx") -> bool:
+    """Copies a cached stage output to destination_path. Returns False on a cache miss."""
+    cached_path = stage_cache.get(stage_key, suffix=suffix)
+    if not cached_path:
+        return False
+    shutil.copyfile(cached_path, destination_path)
+    print(f"Restored stage artifact {stage_key[:12]} -> {destination_path}")
+    return True
 
 def patch_asset_py():
     asset_py_path = os.path.join(UNIRIG_REPO_DIR, "src", "data", "asset.py")
@@ -159,11 +463,7 @@ def patch_asset_py():
     except Exception as e:
         print(f"ERROR: Failed to patch asset.py: {e}. Proceeding cautiously.")
 
-@spaces.GPU
-def run_unirig_command(python_script_path: str, script_args: List[str], step_name: str):
-    if not blender_executable_to_use:
-        raise gr.Error("Blender executable path not determined. Cannot run UniRig step.")
-
+def build_blender_env() -> Dict[str, str]:
     process_env = os.environ.copy()
     # PYTHONPATH is set here, but Blender's Python might not fully utilize it for sys.path initialization
     # as expected. The bootstrap script below will directly manipulate sys.path.
@@ -186,9 +486,138 @@ def run_unirig_command(python_script_path: str, script_args: List[str], step_nam
         process_env["LD_LIBRARY_PATH"] = os.pathsep.join(filter(None, ld_path_parts))
     print(f"Subprocess LD_LIBRARY_PATH: {process_env.get('LD_LIBRARY_PATH', 'Not set')}")
 
+    if CPU_INFERENCE:
+        # Read inside Blender, and only applied by steps that see no CUDA device.
+        process_env["UNIRIG_CPU_INFERENCE_SETTINGS"] = json.dumps(
+            {"optimizations": CPU_INFERENCE, "interop_threads": CPU_INTEROP_THREADS})
+        if "compile" in CPU_INFERENCE:
+            os.makedirs(TORCH_COMPILE_CACHE_DIR, exist_ok=True)
+            process_env.setdefault("TORCHINDUCTOR_CACHE_DIR", TORCH_COMPILE_CACHE_DIR)
+            process_env["TORCHINDUCTOR_FX_GRAPH_CACHE"] = "1"
+
     if os.path.isdir(LOCAL_BIN_DIR):
         process_env["PATH"] = f"{LOCAL_BIN_DIR}{os.pathsep}{process_env.get('PATH', '')}"
     print(f"Subprocess PATH: {process_env.get('PATH', 'Not set')}")
+    return process_env
+
+_worker_pools: Dict[str, BlenderWorkerPool] = {}
+_worker_pool_lock = threading.Lock()
+
+def get_worker_pool(lane: str = "gpu", device: Union[Device, None] = None):
+    """
+    Returns the Blender worker pool of a scheduler lane, or of one local device, or None when pools
+    are disabled. Each lane and device has its own workers so CPU-lane merges never wait for a worker
+    busy with GPU inference, and each device's workers only see that device.
+    """
+    if WORKER_POOL_SIZE <= 0 or not blender_executable_to_use:
+        return None
+    pool_key = device.name if device else lane
+    with _worker_pool_lock:
+        if pool_key not in _worker_pools:
+            pool_env = build_blender_env()
+            if lane == "cpu":
+                pool_env["CUDA_VISIBLE_DEVICES"] = "" # CPU-lane workers must not allocate GPU memory
+            if device:
+                pool_env.update(device.env)
+            _worker_pools[pool_key] = BlenderWorkerPool(
+                size=device.slots if device else (WORKER_POOL_SIZE if lane == "gpu" else CPU_LANE_WORKERS),
+                max_jobs_per_worker=WORKER_MAX_JOBS,
+                blender_exec=blender_executable_to_use,
+                worker_script=BLENDER_WORKER_SCRIPT,
+                unirig_repo_dir=os.path.abspath(UNIRIG_REPO_DIR),
+                env=pool_env,
+                startup_timeout=WORKER_STARTUP_TIMEOUT,
+                kill_grace_seconds=CANCEL_GRACE_SECONDS,
+                resource_profile=lambda: step_resource_profile(lane), # Held for the worker's lifetime
+            )
+            atexit.register(_worker_pools[pool_key].shutdown)
+        return _worker_pools[pool_key]
+
+def step_resource_profile(lane: str) -> ResourceProfile:
+    """
+    CPU set, thread budget and memory ceilings for one Blender process. By default the host CPUs
+    are split evenly between the lane workers, so concurrent steps never oversubscribe the CPU.
+    """
+    cpu_count = CPUS_PER_STEP or max(cpu_allocator.cpu_count // max(GPU_LANE_WORKERS + CPU_LANE_WORKERS, 1), 1)
+    cpus = cpu_allocator.acquire(cpu_count)
+    # CUDA reserves huge virtual address ranges, so RLIMIT_AS only applies to steps without a GPU.
+    cpu_only = lane == "cpu" or get_device_type() != "cuda"
+    return ResourceProfile(cpus=cpus, threads=len(cpus),
+                           address_space_bytes=STEP_ADDRESS_SPACE_MB * 1024**2 if cpu_only else 0,
+                           rss_limit_bytes=STEP_RSS_LIMIT_MB * 1024**2, allocator=cpu_allocator)
+
+def step_timeout(estimated_seconds: Union[float, None]) -> float:
+    if not estimated_seconds:
+        return STEP_TIMEOUT_MAX
+    return min(max(estimated_seconds * STEP_TIMEOUT_FACTOR, STEP_TIMEOUT_MIN), STEP_TIMEOUT_MAX)
+
+def step_file_args(script_args: List[str]) -> Tuple[List[str], List[str]]:
+    """Input files and output paths named in UniRig's key=value step arguments, for remote workers."""
+    inputs, outputs = [], []
+    for arg in script_args:
+        key, separator, value = arg.partition("=")
+        if not separator or not os.path.isabs(value):
+            continue
+        if "output" in key:
+            outputs.append(value)
+        elif os.path.isfile(value):
+            inputs.append(value)
+    return inputs, outputs
+
+def is_device_failure(error: subprocess.CalledProcessError) -> bool:
+    """A step killed by a signal, or one that reports a CUDA/driver error, may succeed on another device."""
+    stderr_lower = (error.stderr or "").lower()
+    return error.returncode < 0 or any(marker in stderr_lower for marker in DEVICE_FAILURE_MARKERS)
+
+def execute_unirig_command(python_script_path: str, script_args: List[str], step_name: str,
+                           on_output: Union[Callable[[str, str], None], None] = None, lane: str = "gpu",
+                           estimated_seconds: Union[float, None] = None,
+                           cancel_token: Union[CancelToken, None] = None):
+    """
+    Runs a script inside Blender's Python, streaming its output line by line to the log and to
+    on_output(stream, line). lane selects the worker pool ("gpu" or "cpu"); CPU-lane steps do not
+    see the GPU. GPU-lane UniRig steps go to the least-loaded device of device_registry and move to
+    another device after a device failure. The timeout scales with estimated_seconds (see
+    step_timeout). Cancelling cancel_token terminates the step's process group and raises
+    JobCancelled. The Blender process runs under step_resource_profile(lane); its peak RSS and CPU
+    time go to the step metrics. Returns the completed result; stdout/stderr hold only the last lines.
+    """
+    if lane != "gpu" or python_script_path not in (UNIRIG_RUN_PY, FUSED_PIPELINE_SCRIPT) or not device_registry.devices:
+        return execute_step(python_script_path, script_args, step_name, on_output, lane, estimated_seconds,
+                            cancel_token)
+    try:
+        return device_registry.run(
+            lambda device: execute_step(python_script_path, script_args, step_name, on_output, lane,
+                                        estimated_seconds, cancel_token, device=device),
+            attempts=DEVICE_ATTEMPTS, cancel_token=cancel_token)
+    except DeviceFailure as e:
+        raise gr.Error(f"Processing step '{step_name}' failed on every device it was tried on. Last error: {str(e)[:500]}")
+
+def execute_step(python_script_path: str, script_args: List[str], step_name: str,
+                 on_output: Union[Callable[[str, str], None], None], lane: str,
+                 estimated_seconds: Union[float, None], cancel_token: Union[CancelToken, None],
+                 device: Union[Device, None] = None):
+    """One attempt of execute_unirig_command, on device when given. Raises DeviceFailure when the device is at fault."""
+    if not blender_executable_to_use:
+        raise gr.Error("Blender executable path not determined. Cannot run UniRig step.")
+    if cancel_token:
+        cancel_token.raise_if_cancelled()
+    timeout = step_timeout(estimated_seconds)
+
+    process_env = build_blender_env()
+    if lane == "cpu":
+        process_env["CUDA_VISIBLE_DEVICES"] = ""
+    if device is not None and device.kind != "remote":
+        process_env.update(device.env)
+        script_args = [device.unirig_device_arg if arg.startswith("device=") else arg for arg in script_args]
+    # Remote workers run the step without the profiler.
+    profile_settings = step_profile_settings(step_name) if device is None or device.kind != "remote" else None
+    if profile_settings:
+        process_env["UNIRIG_PROFILE_SETTINGS"] = json.dumps(profile_settings)
+    # Where a skeleton step saves the predicted armature for the preview (see RigPipelineRun.publish_preview).
+    skeleton_handoff = getattr(_stage_context, "skeleton_handoff", None) if device is None or device.kind != "remote" else None
+    if skeleton_handoff:
+        process_env["UNIRIG_SKELETON_HANDOFF"] = skeleton_handoff
 
     # --- Create a bootstrap script to set sys.path correctly inside Blender's Python ---
     bootstrap_content = f"""
@@ -196,6 +625,17 @@ import sys
 import os
 import runpy
 
+# Timing markers for the parent process (see blender_hooks.py / metrics.py)
+sys.path.append('{APP_ROOT_DIR}')
+try:
+    import blender_hooks
+    blender_hooks.emit_marker("bootstrap_start")
+except Exception as e_hooks:
+    blender_hooks = None
+    print(f"[Bootstrap] Timing hooks unavailable: {{e_hooks}}", file=sys.stderr)
+finally:
+    sys.path.remove('{APP_ROOT_DIR}')
+
 # Path to the UniRig repository root
 # This directory needs to be in sys.path for 'from src...' imports to work
 unirig_repo_dir_abs = '{os.path.abspath(UNIRIG_REPO_DIR)}'
@@ -235,6 +675,15 @@ if os.getcwd() != unirig_repo_dir_abs:
     print(f"[Bootstrap] Changing CWD from {{os.getcwd()}} to {{unirig_repo_dir_abs}}", file=sys.stderr)
     os.chdir(unirig_repo_dir_abs)
 
+profiler = None
+if blender_hooks:
+    blender_hooks.install_timing_hooks()
+    blender_hooks.install_cpu_inference_profile() # bf16/int8/compile when the step has no GPU
+    blender_hooks.apply_resource_limits() # CPU set, RLIMIT_AS, torch threads from the step's profile
+    blender_hooks.emit_marker("script_start")
+    # cProfile / torch.profiler / tracemalloc when the host profiles this step (UNIRIG_PROFILE_SETTINGS)
+    profiler = blender_hooks.start_profiling(os.environ.get("UNIRIG_PROFILE_SETTINGS"))
+
 # Execute the original script
 try:
     runpy.run_path(original_script_to_run, run_name='__main__')
@@ -243,11 +692,31 @@ except Exception as e_runpy:
     import traceback
     traceback.print_exc(file=sys.stderr)
     raise # Re-raise the exception to ensure the calling process sees failure
+else:
+    if blender_hooks and os.environ.get("UNIRIG_SKELETON_HANDOFF"):
+        # Armature of the finished skeleton step, read from the live scene for the host's preview
+        sys.path.append('{APP_ROOT_DIR}')
+        try:
+            from fused_pipeline import save_scene_skeleton
+            save_scene_skeleton(os.environ["UNIRIG_SKELETON_HANDOFF"])
+        except Exception as e_handoff:
+            print(f"[Bootstrap] Skeleton handoff not saved: {{e_handoff}}", file=sys.stderr)
+        finally:
+            sys.path.remove('{APP_ROOT_DIR}')
+finally:
+    if profiler:
+        profiler.stop()
+    if blender_hooks:
+        blender_hooks.emit_marker("script_end", phases=blender_hooks.phase_totals())
 """
     temp_bootstrap_file = None # Define outside try block for visibility in finally
+    step_timer = StepTimer(step_name, queue_wait=getattr(_stage_context, "queue_wait", 0.0))
+    step_via = None
+    step_ok = False
+    profile = None
     try:
         # Use a named temporary file that Blender can access
-        temp_bootstrap_file = tempfile.NamedTemporaryFile(mode='w', delete=False, prefix="blender_bootstrap_", suffix=".py")
+        temp_bootstrap_file = artifact_store.new_workfile(prefix="blender_bootstrap_", suffix=".py")
         temp_bootstrap_file.write(bootstrap_content)
         temp_bootstrap_file.close() # Close the file so Blender can open it
         bootstrap_script_path_for_blender = temp_bootstrap_file.name
@@ -260,21 +729,96 @@ except Exception as e_runpy:
             "--"  # Separator for Blender args vs. bootstrap/target script args
         ] + script_args # These args are passed to the bootstrap script, which then passes them to the target
 
-        print(f"\n--- Running UniRig Step (via bootstrap): {step_name} ---")
-        print(f"Command: {' '.join(cmd)}")
+        tail = OutputTail(STEP_LOG_TAIL_LINES)
 
-        result = subprocess.run(
-            cmd,
-            cwd=UNIRIG_REPO_DIR, # CWD for the Blender process
-            capture_output=True,
-            text=True,
-            check=True,
-            env=process_env,
-            timeout=1800
-        )
-        print(f"{step_name} STDOUT:\n{result.stdout}")
+        def handle_line(stream: str, line: str):
+            print(f"[{step_name}] {line}")
+            step_timer.on_line(stream, line)
+            if on_output:
+                on_output(stream, line)
+
+        result = None
+        if device is not None and device.kind == "remote":
+            print(f"\n--- Running UniRig Step (via remote worker {device.url}): {step_name} ---")
+            step_via = "remote"
+            step_timer.launched()
+            inputs, outputs = step_file_args(script_args)
+            try:
+                result = RemoteWorker(device.url, REMOTE_WORKER_TOKEN).run(
+                    os.path.relpath(python_script_path, UNIRIG_REPO_DIR), script_args, inputs, outputs, timeout,
+                    on_line=handle_line, tail_lines=STEP_LOG_TAIL_LINES, cancel_token=cancel_token)
+            except WorkerUnavailable as e:
+                raise DeviceFailure(str(e)) from e
+            step_timer.record_usage(result.peak_rss_bytes, result.cpu_seconds)
+            if result.returncode != 0:
+                raise subprocess.CalledProcessError(result.returncode, cmd, output=result.stdout, stderr=result.stderr)
+
+        # Only UniRig's run.py (also when fused) goes through the warm workers; ad-hoc scripts keep the one-shot path.
+        worker_pool = (get_worker_pool(lane, device)
+                       if python_script_path in (UNIRIG_RUN_PY, FUSED_PIPELINE_SCRIPT) and result is None else None)
+        if worker_pool is not None:
+            print(f"\n--- Running UniRig Step (via worker pool): {step_name} ---")
+            step_via = "worker"
+            step_timer.launched()
+            try:
+                worker_result = worker_pool.run(os.path.abspath(python_script_path), script_args, timeout=timeout,
+                                                on_line=handle_line, tail_lines=STEP_LOG_TAIL_LINES,
+                                                cancel_token=cancel_token, profile=profile_settings,
+                                                skeleton_handoff=skeleton_handoff)
+                step_timer.record_usage(worker_result.peak_rss_bytes, worker_result.cpu_seconds)
+                if worker_result.returncode != 0:
+                    raise subprocess.CalledProcessError(worker_result.returncode, cmd,
+                                                        output=worker_result.stdout, stderr=worker_result.stderr)
+                result = worker_result
+            except WorkerUnavailable as e:
+                print(f"WARNING: Blender worker pool unavailable for {step_name} ({e}). Falling back to one-shot Blender.")
+
+        if result is None:
+            print(f"\n--- Running UniRig Step (via bootstrap): {step_name} ---")
+            print(f"Command: {' '.join(cmd)}")
+            step_via = "bootstrap"
+            profile = step_resource_profile(lane)
+            process_env.update(profile.env())
+            step_timer.launched()
+
+            process = subprocess.Popen(
+                cmd,
+                cwd=UNIRIG_REPO_DIR, # CWD for the Blender process
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                env=process_env,
+                start_new_session=True # Own process group, so cancellation reaches Blender's children too
+            )
+            profile.pin(process.pid)
+            watchdog = RssWatchdog(process, profile.rss_limit_bytes, grace_seconds=CANCEL_GRACE_SECONDS).start()
+            readers = start_line_readers({"stdout": process.stdout, "stderr": process.stderr}, tail, handle_line)
+            on_cancel = None
+            if cancel_token:
+                on_cancel = cancel_token.add_callback(
+                    lambda reason: terminate_process_group(process, CANCEL_GRACE_SECONDS))
+            try:
+                usage = wait_and_measure(process, timeout)
+            except subprocess.TimeoutExpired:
+                terminate_process_group(process, CANCEL_GRACE_SECONDS)
+                raise
+            finally:
+                watchdog.stop()
+                if on_cancel:
+                    cancel_token.remove_callback(on_cancel)
+                for reader in readers:
+                    reader.join(timeout=10)
+            step_timer.record_usage(max(usage.peak_rss_bytes, watchdog.peak_bytes), usage.cpu_seconds)
+            returncode = usage.returncode
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+            if watchdog.exceeded:
+                raise MemoryLimitExceeded(f"RSS above {STEP_RSS_LIMIT_MB} MB")
+            # Only the last STEP_LOG_TAIL_LINES lines of each stream are kept in memory.
+            result = subprocess.CompletedProcess(cmd, returncode, stdout=tail.text("stdout"), stderr=tail.text("stderr"))
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, cmd, output=result.stdout, stderr=result.stderr)
         if result.stderr:
-            print(f"{step_name} STDERR (Info/Warnings):\n{result.stderr}")
             stderr_lower = result.stderr.lower()
             if "error" in stderr_lower or "failed" in stderr_lower or "traceback" in stderr_lower:
                  # Check for specific bootstrap errors first
@@ -284,17 +828,23 @@ except Exception as e_runpy:
                     print(f"ERROR: 'src' module still not found for {step_name} even after bootstrap. Check sys.path in logs.")
                 else:
                     print(f"WARNING: Potential error messages found in STDERR for {step_name} despite success exit code.")
+        step_ok = True
 
+    except JobCancelled:
+        print(f"{step_name} cancelled ({cancel_token.reason}).")
+        raise
+    except DeviceFailure:
+        raise
     except subprocess.TimeoutExpired:
-        print(f"ERROR: {step_name} timed out after 30 minutes.")
-        raise gr.Error(f"Processing step '{step_name}' timed out.")
+        print(f"ERROR: {step_name} timed out after {timeout:.0f}s.")
+        raise gr.Error(f"Processing step '{step_name}' timed out after {timeout:.0f}s.")
     except subprocess.CalledProcessError as e:
         print(f"ERROR during {step_name}: Subprocess failed!")
         print(f"Command: {' '.join(e.cmd)}")
         print(f"Return code: {e.returncode}")
-        # Print full stdout/stderr from the error for more context
-        print(f"--- {step_name} STDOUT (on error) ---:\n{e.stdout}")
-        print(f"--- {step_name} STDERR (on error) ---:\n{e.stderr}")
+        if device is not None and is_device_failure(e):
+            raise DeviceFailure(f"{device.name}: exit code {e.returncode}") from e
+        # The output was already streamed to the log line by line; e.stderr holds the ring-buffer tail.
         
         error_summary = e.stderr.strip().splitlines()
         last_lines = "\n".join(error_summary[-25:]) if error_summary else "No stderr output." # Increased lines
@@ -307,6 +857,10 @@ except Exception as e_runpy:
         else:
             specific_error = f"Check logs. Last error lines:\n{last_lines}"
         raise gr.Error(f"Error in UniRig '{step_name}'. {specific_error}")
+    except MemoryLimitExceeded as e:
+        print(f"ERROR: {step_name} exceeded its memory limit: {e}")
+        raise gr.Error(f"Processing step '{step_name}' ran out of memory (limit {STEP_RSS_LIMIT_MB} MB, "
+                       f"UNIRIG_STEP_RSS_LIMIT_MB). Try a smaller mesh.")
     except FileNotFoundError:
         print(f"ERROR: Could not find Blender executable or script for {step_name}.")
         raise gr.Error(f"Setup error for UniRig '{step_name}'. Files not found.")
@@ -316,6 +870,13 @@ except Exception as e_runpy:
         traceback.print_exc()
         raise gr.Error(f"Unexpected Python error during '{step_name}': {str(e_general)[:500]}")
     finally:
+        if profile is not None:
+            profile.release()
+        if profile_settings:
+            publish_step_profile(profile_settings)
+        if step_via is not None:
+            step_timer.finished(step_ok, via=step_via, lane=lane, device=device.name if device else None,
+                                cpus=len(profile.cpus) if profile is not None else None)
         # Clean up the temporary bootstrap script
         if temp_bootstrap_file and os.path.exists(temp_bootstrap_file.name):
             try:
@@ -324,23 +885,182 @@ except Exception as e_runpy:
             except Exception as cleanup_e:
                 print(f"Error cleaning up bootstrap script {temp_bootstrap_file.name}: {cleanup_e}")
     print(f"--- Finished UniRig Step (via bootstrap): {step_name} ---")
+    return result
+
+def step_profile_settings(step_name: str) -> Union[Dict[str, Any], None]:
+    """
+    Profiler settings for a step of a profiled rig run (RigPipelineRun.profile), or None. The reports
+    go to a fresh working directory and are tagged with the scheduler job id and the step name.
+    """
+    if not getattr(_stage_context, "profile", False) or not PROFILE_MODES:
+        return None
+    tag = f"job{getattr(_stage_context, 'job_id', 0)}_{step_name.lower().replace(' ', '_')}"
+    return {"modes": PROFILE_MODES, "dir": artifact_store.new_workdir(prefix="unirig_profile_"), "tag": tag,
+            "stage": step_name, "top_n": PROFILE_TOP_N, "tracemalloc_frames": PROFILE_TRACEMALLOC_FRAMES}
 
+def publish_step_profile(profile_settings: Dict[str, Any]):
+    """Publishes the reports of a profiled step and adds them to the run's profile artifacts."""
+    try:
+        reports = sorted(os.listdir(profile_settings["dir"]))
+        published = [artifact_store.publish(os.path.join(profile_settings["dir"], name)) for name in reports]
+    except OSError as e:
+        print(f"[Profile] Reports of {profile_settings['tag']} not published: {e}")
+        published = []
+    finally:
+        artifact_store.release(profile_settings["dir"])
+    PROFILED_STEPS.inc(profile_settings["stage"])
+    getattr(_stage_context, "profile_artifacts", []).extend(published)
+    for path in published:
+        print(f"[Profile] {profile_settings['tag']}: {path}")
+
+def zerogpu_duration(python_script_path: str, script_args: List[str], step_name: str,
+                     on_output: Union[Callable[[str, str], None], None] = None,
+                     estimated_seconds: Union[float, None] = None,
+                     cancel_token: Union[CancelToken, None] = None) -> int:
+    """GPU window to request for one step: the runtime estimate plus a safety margin, capped."""
+    if not estimated_seconds:
+        return ZEROGPU_DEFAULT_DURATION
+    return int(min(max(estimated_seconds * ZEROGPU_DURATION_MARGIN, 10), ZEROGPU_MAX_DURATION))
+
+@spaces.GPU(duration=zerogpu_duration)
+def run_unirig_command(python_script_path: str, script_args: List[str], step_name: str,
+                       on_output: Union[Callable[[str, str], None], None] = None,
+                       estimated_seconds: Union[float, None] = None,
+                       cancel_token: Union[CancelToken, None] = None):
+    return execute_unirig_command(python_script_path, script_args, step_name, on_output=on_output,
+                                  estimated_seconds=estimated_seconds, cancel_token=cancel_token)
+
+preflight_manifest = None
+_preflight_lock = threading.Lock()
+
+def current_environment_fingerprint() -> Dict[str, Any]:
+    return compute_fingerprint(blender_executable_to_use, BLENDER_VERSION_NAME, BLENDER_PYTHON_DIR, UNIRIG_REPO_DIR)
+
+def run_blender_env_diagnostic():
+    """Runs the full Blender environment diagnostic. Returns (verdict or None, combined log)."""
+    print("\n--- Running Blender Python Environment Diagnostic Test (via bootstrap) ---")
+    diagnostic_dir = artifact_store.new_workdir(prefix="unirig_diagnostic_")
+    try:
+        diagnostic_script_path = os.path.join(diagnostic_dir, "env_diagnostic_test.py")
+        with open(diagnostic_script_path, "w") as f: f.write(build_diagnostic_script(UNIRIG_REPO_DIR))
+        try:
+            result = execute_unirig_command(diagnostic_script_path, [], "Blender Env Diagnostic") # Args are empty for diagnostic
+        except gr.Error as e:
+            return None, f"Diagnostic failed: {e}"
+        print("--- Finished Blender Python Environment Diagnostic Test ---\n")
+        return parse_diagnostic_output(result.stdout), f"{result.stdout}\n--- STDERR ---\n{result.stderr}"
+    finally:
+        artifact_store.release(diagnostic_dir)
+
+def ensure_preflight(force: bool = False) -> Dict[str, Any]:
+    """
+    Returns the preflight manifest for the current environment. The asset.py patch and the
+    Blender diagnostic only run when the environment fingerprint changed (or when forced).
+    """
+    global preflight_manifest, bpy_import_ok
+    with _preflight_lock:
+        digest = fingerprint_digest(current_environment_fingerprint())
+        if not force:
+            if preflight_manifest and preflight_manifest.get("digest") == digest:
+                return preflight_manifest
+            stored_manifest = load_manifest(PREFLIGHT_MANIFEST_PATH)
+            if stored_manifest and stored_manifest.get("digest") == digest:
+                print(f"Preflight: environment unchanged ({digest[:12]}), reusing stored verdict.")
+                preflight_manifest = stored_manifest
+                bpy_import_ok = bool((stored_manifest.get("verdict") or {}).get("checks", {}).get("bpy"))
+                return preflight_manifest
+
+        print(f"Preflight: running environment checks (forced={force}).")
+        try:
+            patch_asset_py()
+        except Exception as e:
+            print(f"Ignoring patch error: {e}")
+        # Fingerprint after patching so the patched asset.py is what we record.
+        fingerprint = current_environment_fingerprint()
+        verdict, log = run_blender_env_diagnostic()
+        preflight_manifest = save_manifest(PREFLIGHT_MANIFEST_PATH, fingerprint, verdict, log)
+        bpy_import_ok = bool((verdict or {}).get("checks", {}).get("bpy"))
+        print(f"Preflight verdict: ok={preflight_manifest['ok']}, failed checks: {failed_checks(verdict)}")
+        return preflight_manifest
 
 @spaces.GPU
-def rig_glb_mesh_multistep(input_glb_file_obj):
-    if not blender_executable_to_use:
-        gr.Warning("System not ready: Blender executable not found.")
-        return None
-    if not unirig_repo_ok or not unirig_run_py_ok:
-         gr.Warning("System not ready: UniRig repository or run.py script not found.")
-         return None
+def run_full_diagnostic_gpu() -> Dict[str, Any]:
+    return ensure_preflight(force=True)
+
+def run_full_diagnostic():
+    """On-demand diagnostic from the UI/API. Also refreshes the stored preflight verdict."""
+    require_environment() # Wait outside the GPU window
+    manifest = run_full_diagnostic_gpu()
+    summary = {key: value for key, value in manifest.items() if key != "log"}
+    return manifest["log"], summary
+
+
+PIPELINE_STAGES = [SKELETON_STAGE, SKIN_STAGE, MERGE_STAGE]
+PROXY_PIPELINE_STAGES = ["Proxy Mesh"] + PIPELINE_STAGES + ["Weight Transfer"]
+OPTIMIZE_STAGE = "Optimize Output"
+
+def optimize_rigged_glb(raw_glb_path: str, output_path: str) -> Dict[str, Any]:
+    """Runs glb_optimize on a merge output with the UNIRIG_GLB_* settings; logs and exports the size report."""
+    report = optimize_glb(raw_glb_path, output_path, max_influences=GLB_MAX_INFLUENCES, quantize=GLB_QUANTIZE,
+                          compression=GLB_COMPRESSION)
+    OUTPUT_BYTES.observe(report["raw_bytes"], "raw")
+    OUTPUT_BYTES.observe(report["optimized_bytes"], "optimized")
+    log_json("glb_optimized", input=os.path.basename(raw_glb_path), **report)
+    if report.get("compression_error"):
+        print(f"[GLBOptimize] Compression skipped: {report['compression_error']}")
+    print(f"[GLBOptimize] {report['raw_bytes'] / 1024**2:.2f} MB -> {report['optimized_bytes'] / 1024**2:.2f} MB "
+          f"({report['ratio']:.0%}) in {report['seconds']:.2f}s")
+    return report
+
+class PipelineEvents:
+    """
+    Builds progress events for one pipeline run and hands them to a callback. Events are dicts:
+    {"type": "queued" | "stage_start" | "stage_end" | "stage_skipped" | "log" | "cached" | "preview", "stage", "message",
+     "elapsed" (s since the run started), "fraction" (stage progress, log lines only), "overall" (0-1)}.
+    "preview" events carry the published path of a preview GLB (see RigPipelineRun.publish_preview).
+    """
+
+    def __init__(self, callback: Union[Callable[[Dict[str, Any]], None], None],
+                 stages: Union[List[str], None] = None):
+        self.callback = callback
+        self.stages = stages or PIPELINE_STAGES
+        self.started = time.time()
+        self.stage_started: Dict[str, float] = {}
+
+    def emit(self, event_type: str, stage: Union[str, None] = None, message: str = "",
+             fraction: Union[float, None] = None, **fields):
+        if not self.callback:
+            return
+        stage_index = self.stages.index(stage) if stage in self.stages else len(self.stages)
+        # A preview follows the end (or skip) of its stage.
+        stage_fraction = {"stage_end": 1.0, "stage_skipped": 1.0, "preview": 1.0}.get(event_type, fraction or 0.0)
+        self.callback(dict(
+            type=event_type, stage=stage, message=message, fraction=fraction,
+            elapsed=time.time() - self.started,
+            overall=min((stage_index + stage_fraction) / len(self.stages), 1.0),
+            **fields
+        ))
+
+    def stage_start(self, stage: str):
+        self.stage_started[stage] = time.time()
+        self.emit("stage_start", stage)
+
+    def stage_end(self, stage: str):
+        self.emit("stage_end", stage, message=f"took {time.time() - self.stage_started.get(stage, self.started):.1f}s")
+
+    def output_handler(self, stage: str) -> Callable[[str, str], None]:
+        def handle(stream: str, line: str):
+            self.emit("log", stage, message=line, fraction=parse_progress_fraction(line), stream=stream)
+        return handle
+
+def validate_rig_input(input_glb_file_obj) -> Union[str, None]:
+    """Checks system readiness and the uploaded file. Returns the input path, or None if nothing to do."""
+    require_environment()
+    manifest = ensure_preflight()
     if not bpy_import_ok:
          gr.Warning("System warning: Initial 'bpy' import test failed. Proceeding cautiously.")
-
-    try:
-        patch_asset_py()
-    except Exception as e:
-        print(f"Ignoring patch error: {e}")
+    elif not manifest.get("ok"):
+         gr.Warning(f"System warning: environment preflight failed ({', '.join(failed_checks(manifest.get('verdict')))}). Proceeding cautiously.")
 
     if input_glb_file_obj is None:
         gr.Info("Please upload a .glb file first.")
@@ -352,213 +1072,989 @@ def rig_glb_mesh_multistep(input_glb_file_obj):
          raise gr.Error(f"Invalid input file path or file does not exist: {input_glb_path}")
     if not input_glb_path.lower().endswith(".glb"):
          raise gr.Error("Invalid file type. Please upload a .glb file.")
-
-    # Use a single temporary directory for all processing for this run
-    # This directory will be cleaned up at the end.
-    # The bootstrap script will be created inside this if run_unirig_command doesn't make its own.
-    # For clarity, run_unirig_command now handles its own bootstrap temp file.
-    processing_temp_dir = tempfile.mkdtemp(prefix="unirig_processing_")
-    print(f"Using temporary processing directory: {processing_temp_dir}")
-    
-    diagnostic_script_path = None # For cleanup in finally
-
+    glb_info = inspect_rig_input(input_glb_path)
+    if glb_info.skin_count:
+        gr.Info(f"The uploaded model already has {glb_info.skin_count} skin(s); it will be re-rigged.")
+    return input_glb_path
+
+def uses_proxy_mesh(glb_info: GLBInfo) -> bool:
+    return PROXY_TRIANGLE_THRESHOLD > 0 and glb_info.triangle_count > PROXY_TRIANGLE_THRESHOLD
+
+def inspect_rig_input(input_glb_path: str, allow_proxy: bool = True) -> GLBInfo:
+    """
+    Parses the GLB header (no Blender) and rejects malformed or oversized inputs with a gr.Error.
+    The vertex limit does not apply to inputs that will be rigged through a proxy mesh.
+    """
     try:
-        base_name = os.path.splitext(os.path.basename(input_glb_path))[0]
-        abs_input_glb_path = os.path.abspath(input_glb_path)
-        abs_skeleton_output_path = os.path.join(processing_temp_dir, f"{base_name}_skeleton.fbx")
-        abs_skin_output_path = os.path.join(processing_temp_dir, f"{base_name}_skin.fbx")
-        abs_final_rigged_glb_path = os.path.join(processing_temp_dir, f"{base_name}_rigged_final.glb")
-        unirig_script_to_run = UNIRIG_RUN_PY # This is an absolute path
-
-        print("\n--- Running Blender Python Environment Diagnostic Test (via bootstrap) ---")
-        # Content of the diagnostic script remains the same
-        diagnostic_script_content = f"""
-import sys
-import os
-import traceback
-
-print("--- Enhanced Diagnostic Info from Blender Python ---")
-print(f"Python Executable: {{sys.executable}}")
-print(f"Python Version: {{sys.version.replace('\n', ' ')}}") # Added sys.version
-print(f"Current Working Directory (inside script): {{os.getcwd()}}")
-
-print("\nsys.path:")
-for i, p in enumerate(sys.path): print(f"  {{i}}: {{p}}")
-
-print("\nPYTHONPATH Environment Variable (as seen by script):")
-print(os.environ.get('PYTHONPATH', 'PYTHONPATH not set or empty'))
-
-print("\nLD_LIBRARY_PATH Environment Variable (as seen by script):")
-print(os.environ.get('LD_LIBRARY_PATH', 'LD_LIBRARY_PATH not set or empty'))
-
-print("\n--- Attempting Critical Imports ---")
-
-# 1. bpy
-print("\n1. Attempting 'bpy' import...")
-try:
-    import bpy
-    print("  SUCCESS: 'bpy' imported.")
-    print(f"     bpy version: {{bpy.app.version_string}}")
-except Exception as e:
-    print(f"  FAILED to import 'bpy': {{e}}")
-    traceback.print_exc(file=sys.stderr)
-
-# 2. UniRig 'src' module
-print("\n2. Checking for UniRig 'src' module availability...")
-# UNIRIG_REPO_DIR from app.py's function scope will be interpolated here by Python when app.py runs
-# The f-string formatting {os.path.abspath(UNIRIG_REPO_DIR)} ensures this path is correctly embedded
-# into the script content that Blender's Python will execute.
-print(f"   Expected UniRig repo parent in sys.path: '{os.path.abspath(UNIRIG_REPO_DIR)}'")
-found_unirig_in_sys_path = any(os.path.abspath(UNIRIG_REPO_DIR) == os.path.abspath(p) for p in sys.path)
-print(f"   Is UNIRIG_REPO_DIR ('{os.path.abspath(UNIRIG_REPO_DIR)}') in sys.path (at diagnostic script generation time)? {'Yes' if found_unirig_in_sys_path else 'No'}")
-
-
-unirig_src_dir_in_cwd_exists = os.path.isdir('src')
-print(f"   Is 'src' directory present in CWD ('{{os.getcwd()}}')? {{'Yes' if unirig_src_dir_in_cwd_exists else 'No'}}")
-if unirig_src_dir_in_cwd_exists:
-    init_py_in_src_exists = os.path.isfile(os.path.join('src', '__init__.py'))
-    print(f"     Is 'src/__init__.py' present? {'Yes' if init_py_in_src_exists else 'No'}")
-
-print("   Attempting 'from src.inference.download import download'...")
-try:
-    from src.inference.download import download
-    print("  SUCCESS: 'from src.inference.download import download' worked.")
-except ImportError as e:
-    print(f"  FAILED: 'from src.inference.download import download': {{e}}")
-    print(f"  Make sure '{os.path.abspath(UNIRIG_REPO_DIR)}' is correctly added to sys.path by the bootstrap script executed by Blender.")
-    traceback.print_exc(file=sys.stderr)
-except Exception as e:
-    print(f"  FAILED: 'from src.inference.download import download' with other error: {{e}}")
-    traceback.print_exc(file=sys.stderr)
-
-# 3. flash_attn
-print("\n3. Attempting 'flash_attn' import...")
-try:
-    import flash_attn
-    print("  SUCCESS: 'flash_attn' imported.")
-    if hasattr(flash_attn, '__version__'):
-        print(f"     flash_attn version: {{flash_attn.__version__}}")
-except Exception as e:
-    print(f"  FAILED to import 'flash_attn': {{e}}")
-    print(f"     Note: flash-attn is expected to be installed by setup_blender.sh from a specific wheel.")
-    traceback.print_exc(file=sys.stderr)
-
-# 4. spconv
-print("\n4. Attempting 'spconv' import...")
-try:
-    import spconv
-    print("  SUCCESS: 'spconv' imported.")
-    if hasattr(spconv, 'constants') and hasattr(spconv.constants, 'SPCONV_VERSION'):
-        print(f"     spconv version: {{spconv.constants.SPCONV_VERSION}}")
-    elif hasattr(spconv, '__version__'):
-        print(f"     spconv version: {{spconv.__version__}}")
-except Exception as e:
-    print(f"  FAILED to import 'spconv': {{e}}")
-    print(f"     Note: spconv (e.g., spconv-cu118) should be installed via unirig_requirements.txt in Blender's Python.")
-    traceback.print_exc(file=sys.stderr)
-
-# 5. torch with CUDA check
-print("\n5. Attempting 'torch' import and CUDA check...")
-try:
-    import torch
-    print("  SUCCESS: 'torch' imported.")
-    print(f"     torch version: {{torch.__version__}}")
-    cuda_available = torch.cuda.is_available()
-    print(f"     torch.cuda.is_available(): {{cuda_available}}")
-    if cuda_available:
-        print(f"       torch.version.cuda: {{torch.version.cuda}}")
-        print(f"       torch.cuda.get_device_name(0): {{torch.cuda.get_device_name(0)}}")
-        print(f"       torch.cuda.get_device_capability(0): {{torch.cuda.get_device_capability(0)}}")
-    else:
-        print(f"       CUDA not available to PyTorch in this Blender Python environment.")
-        if "cpu" in torch.__version__: # Check if it's a CPU build explicitly
-            print("       PyTorch build appears to be CPU-only.")
+        glb_info = inspect_glb(input_glb_path)
+    except (GLBError, OSError) as e:
+        raise gr.Error(f"The uploaded file is not a valid GLB: {e}")
+    max_vertices = 0 if allow_proxy and uses_proxy_mesh(glb_info) else MAX_INPUT_VERTICES
+    reason = reject_reason(glb_info, MAX_INPUT_BYTES, max_vertices)
+    if reason:
+        raise gr.Error(f"Input rejected. {reason}")
+    print(f"Inspected {os.path.basename(input_glb_path)} in {glb_info.inspect_ms:.2f} ms: "
+          f"{glb_info.vertex_count} vertices, {glb_info.triangle_count} triangles, {glb_info.skin_count} skins")
+    return glb_info
+
+class RigPipelineRun:
+    """
+    State of one single-mesh rig: cache keys, working directory and stage outputs. Each stage is a
+    separate method so the scheduler can run skeleton/skin on the GPU lane and merge on the CPU lane.
+    With UNIRIG_FUSED_PIPELINE, fused_stage runs all three in one Blender process on the GPU lane.
+    """
+
+    def __init__(self, input_glb_path: str, skeleton_fbx_path: Union[str, None] = None,
+                 require_cached_skeleton: bool = False,
+                 on_event: Union[Callable[[Dict[str, Any]], None], None] = None,
+                 cancel_token: Union[CancelToken, None] = None, profile: bool = False):
+        self.events = PipelineEvents(on_event)
+        self.cancel_token = cancel_token or CancelToken()
+        self.input_glb_path = input_glb_path
+        self.skeleton_fbx_path = skeleton_fbx_path
+        self.require_cached_skeleton = require_cached_skeleton
+        self.unirig_device_arg = get_unirig_device_arg()
+        self.cache_keys: Dict[str, str] = {}
+        self.use_proxy = False
+        self.fused = False
+        self.profile = profile
+        self.profile_artifacts: List[str] = []
+        self.processing_temp_dir = None
+        self.skeleton_artifact_path = None
+        self.stage_estimates: Dict[str, float] = {}
+        self.outputs: Union[Dict[str, str], None] = None
+
+    def prepare(self) -> bool:
+        """Sets up the working directory. Returns True when the final result is already cached."""
+        glb_info = inspect_rig_input(self.input_glb_path, allow_proxy=not self.skeleton_fbx_path)
+        # A supplied skeleton FBX carries its own mesh, so there is nothing to decimate.
+        self.use_proxy = not self.skeleton_fbx_path and uses_proxy_mesh(glb_info)
+        self.cache_keys = pipeline_cache_keys(self.input_glb_path, self.unirig_device_arg, self.skeleton_fbx_path,
+                                              proxy_target_faces=PROXY_TARGET_FACES if self.use_proxy else 0)
+        self.stage_estimates = estimate_runtime(glb_info)
+        # Remote workers only run UniRig's own scripts, so fusing needs local devices.
+        self.fused = FUSED_PIPELINE and not any(d.kind == "remote" for d in device_registry.devices)
+        if self.use_proxy:
+            # Inference runs on the proxy; merging and the transfer still touch every original vertex.
+            proxy_estimates = estimate_runtime(dataclasses.replace(
+                glb_info, vertex_count=min(glb_info.vertex_count, PROXY_TARGET_FACES // 2)))
+            self.stage_estimates.update(skeleton=proxy_estimates["skeleton"], skin=proxy_estimates["skin"],
+                                        proxy=self.stage_estimates["merge"], merge=proxy_estimates["merge"],
+                                        transfer=self.stage_estimates["merge"])
+            self.events.stages = PROXY_PIPELINE_STAGES
+            print(f"{glb_info.triangle_count} triangles > {PROXY_TRIANGLE_THRESHOLD}: rigging a {PROXY_TARGET_FACES}-face proxy.")
+        if GLB_OPTIMIZE:
+            self.events.stages = self.events.stages + [OPTIMIZE_STAGE]
         else:
-            print("       PyTorch build is not CPU-only, but CUDA is still not available. Check drivers/runtime/setup for Blender Python env.")
-
-except Exception as e:
-    print(f"  FAILED to import 'torch' or perform CUDA checks: {{e}}")
-    traceback.print_exc(file=sys.stderr)
-
-print("\n--- End Enhanced Diagnostic Info ---")
-"""
-        # Save diagnostic script to the processing_temp_dir
-        diagnostic_script_path = os.path.join(processing_temp_dir, "env_diagnostic_test.py")
-        with open(diagnostic_script_path, "w") as f: f.write(diagnostic_script_content)
-        
-        run_unirig_command(diagnostic_script_path, [], "Blender Env Diagnostic") # Args are empty for diagnostic
-        print("--- Finished Blender Python Environment Diagnostic Test ---\n")
-        # If the above didn't raise an error, sys.path was likely fixed by bootstrap for the diagnostic.
-
-        unirig_device_arg = "device=cpu"
-        if DEVICE.type == 'cuda':
-             unirig_device_arg = "device=cuda:0"
-        print(f"UniRig steps will attempt to use device argument: {unirig_device_arg}")
-
-        print("\nStarting Step 1: Predicting Skeleton...")
-        skeleton_args = [
-            "--config-name=skeleton_config", "with",
-            f"input={abs_input_glb_path}",
-            f"output={abs_skeleton_output_path}",
-            unirig_device_arg
-        ]
-        run_unirig_command(unirig_script_to_run, skeleton_args, "Skeleton Prediction")
-        if not os.path.exists(abs_skeleton_output_path):
-            raise gr.Error("Skeleton prediction failed. Output file not created.")
-        print("Step 1: Skeleton Prediction completed.")
-
+            self.stage_estimates.pop("optimize", None)
+        cached_glb_path = result_cache.get(self.cache_keys["result"])
+        cached_skeleton_path = stage_cache.get(self.cache_keys["skeleton"], suffix=".fbx")
+        if cached_glb_path:
+            print(f"Result cache hit ({self.cache_keys['result'][:12]}): {cached_glb_path}. Cache stats: {result_cache.stats()}")
+            self.events.emit("cached", message="Result cache hit, skipping all stages.")
+            self.publish_outputs(cached_glb_path, self.skeleton_fbx_path or cached_skeleton_path)
+            return True
+        if self.require_cached_skeleton and not self.skeleton_fbx_path and not cached_skeleton_path:
+            raise gr.Error("No cached skeleton for this mesh. Run the full pipeline once or upload a skeleton FBX.")
+
+        # Use a single temporary directory for all processing for this run
+        # This directory will be cleaned up at the end.
+        # run_unirig_command handles its own bootstrap temp file.
+        self.processing_temp_dir = artifact_store.new_workdir(prefix="unirig_processing_")
+        print(f"Using temporary processing directory: {self.processing_temp_dir}")
+        base_name = os.path.splitext(os.path.basename(self.input_glb_path))[0]
+        self.abs_input_glb_path = os.path.abspath(self.input_glb_path)
+        self.abs_skeleton_output_path = os.path.join(self.processing_temp_dir, f"{base_name}_skeleton.fbx")
+        self.abs_skin_output_path = os.path.join(self.processing_temp_dir, f"{base_name}_skin.fbx")
+        self.abs_final_rigged_glb_path = os.path.join(self.processing_temp_dir, f"{base_name}_rigged_final.glb")
+        self.abs_optimized_glb_path = os.path.join(self.processing_temp_dir, f"{base_name}_rigged_optimized.glb")
+        self.abs_skeleton_handoff_path = os.path.join(self.processing_temp_dir, f"{base_name}_skeleton.npz")
+        self.abs_preview_glb_path = os.path.join(self.processing_temp_dir, f"{base_name}_preview.glb")
+        # With a proxy, UniRig works on the proxy GLB and its merge output is the rigged proxy.
+        self.abs_proxy_glb_path = os.path.join(self.processing_temp_dir, f"{base_name}_proxy.glb")
+        self.abs_rigged_proxy_path = os.path.join(self.processing_temp_dir, f"{base_name}_rigged_proxy.glb")
+        self.abs_mesh_input_path = self.abs_proxy_glb_path if self.use_proxy else self.abs_input_glb_path
+        print(f"UniRig steps will attempt to use device argument: {self.unirig_device_arg}")
+        return False
+
+    def restore_skeleton(self) -> bool:
+        """Puts the supplied or cached skeleton in place. Returns False when it has to be predicted."""
+        if self.skeleton_fbx_path:
+            print(f"\nSkipping Step 1: using supplied skeleton {self.skeleton_fbx_path}")
+            shutil.copyfile(self.skeleton_fbx_path, self.abs_skeleton_output_path)
+            self.events.emit("stage_skipped", "Skeleton Prediction", message="Using the supplied skeleton.")
+            return True
+        if restore_stage_artifact(self.cache_keys["skeleton"], self.abs_skeleton_output_path):
+            print("\nSkipping Step 1: skeleton restored from stage cache.")
+            self.events.emit("stage_skipped", "Skeleton Prediction", message="Restored from the stage cache.")
+            if restore_stage_artifact(self.cache_keys["skeleton"], self.abs_skeleton_handoff_path, suffix=".npz"):
+                self.publish_preview()
+            return True
+        return False
+
+    def restore_skin(self) -> bool:
+        if restore_stage_artifact(self.cache_keys["skin"], self.abs_skin_output_path):
+            print("\nSkipping Step 2: skinning restored from stage cache.")
+            self.events.emit("stage_skipped", "Skinning Prediction", message="Restored from the stage cache.")
+            return True
+        return False
+
+    def cache_skeleton(self):
+        self.skeleton_artifact_path = (
+            stage_cache.get(self.cache_keys["skeleton"], suffix=".fbx")
+            or stage_cache.put(self.cache_keys["skeleton"], self.abs_skeleton_output_path, suffix=".fbx"))
+        if os.path.exists(self.abs_skeleton_handoff_path) and not stage_cache.get(self.cache_keys["skeleton"], suffix=".npz"):
+            stage_cache.put(self.cache_keys["skeleton"], self.abs_skeleton_handoff_path, suffix=".npz")
+
+    def publish_preview(self):
+        """
+        Emits a "preview" event with the input mesh and the predicted bones (see rig_preview.py), built
+        in this process from the skeleton handoff. A preview that cannot be built is only logged.
+        """
+        if not PROGRESSIVE_PREVIEW or not os.path.exists(self.abs_skeleton_handoff_path):
+            return
+        started = time.time()
+        try:
+            report = build_preview_glb(self.abs_input_glb_path, load_handoff(self.abs_skeleton_handoff_path),
+                                       self.abs_preview_glb_path)
+            base_name = os.path.splitext(os.path.basename(self.input_glb_path))[0]
+            preview_path = artifact_store.publish(self.abs_preview_glb_path, name=f"{base_name}_preview.glb")
+        except Exception as e:
+            print(f"[Preview] Not built: {e}")
+            return
+        print(f"[Preview] {report['bones']} bones, {report['bytes']} bytes in {time.time() - started:.2f}s: {preview_path}")
+        self.events.emit("preview", SKELETON_STAGE, message=f"Preview with {report['bones']} bones.", path=preview_path)
+
+    def skeleton_stage(self):
+        if not self.restore_skeleton():
+            print("\nStarting Step 1: Predicting Skeleton...")
+            self.events.stage_start("Skeleton Prediction")
+            skeleton_args = skeleton_step_args(self.abs_mesh_input_path, self.abs_skeleton_output_path, self.unirig_device_arg)
+            # Read by execute_step on this lane thread: the step also saves its armature for the preview.
+            _stage_context.skeleton_handoff = self.abs_skeleton_handoff_path if PROGRESSIVE_PREVIEW else None
+            try:
+                run_unirig_command(UNIRIG_RUN_PY, skeleton_args, "Skeleton Prediction",
+                                   on_output=self.events.output_handler("Skeleton Prediction"),
+                                   estimated_seconds=self.stage_estimates["skeleton"], cancel_token=self.cancel_token)
+            finally:
+                _stage_context.skeleton_handoff = None
+            if not os.path.exists(self.abs_skeleton_output_path):
+                raise gr.Error("Skeleton prediction failed. Output file not created.")
+            print("Step 1: Skeleton Prediction completed.")
+            self.events.stage_end("Skeleton Prediction")
+            self.publish_preview()
+        self.cache_skeleton()
+
+    def skin_stage(self):
+        if self.restore_skin():
+            return
         print("\nStarting Step 2: Predicting Skinning Weights...")
-        skin_args = [
-            "--config-name=skin_config", "with",
-            f"input={abs_skeleton_output_path}",
-            f"output={abs_skin_output_path}",
-            unirig_device_arg
-        ]
-        run_unirig_command(unirig_script_to_run, skin_args, "Skinning Prediction")
-        if not os.path.exists(abs_skin_output_path):
+        self.events.stage_start("Skinning Prediction")
+        skin_args = skin_step_args(self.abs_skeleton_output_path, self.abs_skin_output_path, self.unirig_device_arg)
+        run_unirig_command(UNIRIG_RUN_PY, skin_args, "Skinning Prediction",
+                           on_output=self.events.output_handler("Skinning Prediction"),
+                           estimated_seconds=self.stage_estimates["skin"], cancel_token=self.cancel_token)
+        if not os.path.exists(self.abs_skin_output_path):
             raise gr.Error("Skinning prediction failed. Output file not created.")
         print("Step 2: Skinning Prediction completed.")
+        self.events.stage_end("Skinning Prediction")
+        stage_cache.put(self.cache_keys["skin"], self.abs_skin_output_path, suffix=".fbx")
 
+    def merge_stage(self):
+        # Merging only transfers the predicted skin onto the original mesh: it runs on the CPU lane,
+        # outside any GPU window.
         print("\nStarting Step 3: Merging Results...")
-        merge_args = [
-            "--config-name=merge_config", "with",
-            f"source_path={abs_skin_output_path}",
-            f"target_path={abs_input_glb_path}",
-            f"output_path={abs_final_rigged_glb_path}",
-            "mode=skin",
-            unirig_device_arg
-        ]
-        run_unirig_command(unirig_script_to_run, merge_args, "Merging Results")
-        if not os.path.exists(abs_final_rigged_glb_path):
+        self.events.stage_start("Merging Results")
+        merge_output_path = self.abs_rigged_proxy_path if self.use_proxy else self.abs_final_rigged_glb_path
+        merge_args = merge_step_args(self.abs_skin_output_path, self.abs_mesh_input_path,
+                                     merge_output_path, "device=cpu")
+        execute_unirig_command(UNIRIG_RUN_PY, merge_args, "Merging Results",
+                               on_output=self.events.output_handler("Merging Results"), lane="cpu",
+                               estimated_seconds=self.stage_estimates["merge"], cancel_token=self.cancel_token)
+        if not os.path.exists(merge_output_path):
             raise gr.Error("Merging process failed. Final rigged GLB file not created.")
         print("Step 3: Merging completed.")
-
-        print(f"Successfully generated rigged model: {abs_final_rigged_glb_path}")
-        return gr.update(value=abs_final_rigged_glb_path)
-    except gr.Error as e:
-        print(f"A Gradio Error occurred: {e}")
-        # No need to re-raise, run_unirig_command already does or it's an explicit raise here.
-        # Let Gradio handle displaying it.
-        raise # Re-raise to ensure Gradio UI shows the error
-    except Exception as e:
-        print(f"An unexpected error occurred in rig_glb_mesh_multistep: {e}")
-        import traceback; traceback.print_exc()
-        raise gr.Error(f"An unexpected error occurred: {str(e)[:500]}. Check logs.")
-    finally:
-        # Cleanup diagnostic script if it was created
-        if diagnostic_script_path and os.path.exists(diagnostic_script_path):
+        self.events.stage_end("Merging Results")
+        if not self.use_proxy and not GLB_OPTIMIZE:
+            self.store_result()
+
+    def fused_stage(self):
+        skeleton_ready = self.restore_skeleton()
+        skin_ready = self.restore_skin()
+        merge_output_path = self.abs_rigged_proxy_path if self.use_proxy else self.abs_final_rigged_glb_path
+        fused_args = ["--input", self.abs_mesh_input_path, "--skeleton", self.abs_skeleton_output_path,
+                      "--skin", self.abs_skin_output_path, "--output", merge_output_path]
+        fused_args += (["--skip-skeleton"] if skeleton_ready else []) + (["--skip-skin"] if skin_ready else [])
+        if PROGRESSIVE_PREVIEW and not skeleton_ready:
+            fused_args += ["--skeleton-handoff", self.abs_skeleton_handoff_path]
+        estimated_seconds = (self.stage_estimates["merge"] + (0 if skeleton_ready else self.stage_estimates["skeleton"])
+                             + (0 if skin_ready else self.stage_estimates["skin"]))
+        current_stage = [SKIN_STAGE if skeleton_ready else SKELETON_STAGE]
+        summary: Dict[str, Any] = {}
+        script_started: List[float] = []
+        preview_builders: List[threading.Thread] = []
+
+        def handle_line(stream: str, line: str):
+            event = parse_fused_line(line)
+            if event is None:
+                marker = parse_timing_marker(line)
+                if marker and marker.get("marker") == "script_start":
+                    script_started.append(marker["t"])
+                self.events.output_handler(current_stage[0])(stream, line)
+            elif event.get("event") == "stage_start":
+                current_stage[0] = event["stage"]
+                self.events.stage_start(event["stage"])
+            elif event.get("event") == "stage_end":
+                self.events.stage_end(event["stage"])
+            elif event.get("event") == "skeleton_ready":
+                # Skinning is already running in the Blender process. The preview is built on its own
+                # thread: this is the stderr reader, and a slow build would stall the step's pipe.
+                builder = threading.Thread(target=self.publish_preview, daemon=True, name="rig-preview")
+                builder.start()
+                preview_builders.append(builder)
+            elif event.get("event") == "summary":
+                summary.update(event)
+
+        print("\nStarting the fused pipeline: the remaining stages in one Blender process...")
+        launched = time.time()
+        try:
+            step_result = run_unirig_command(FUSED_PIPELINE_SCRIPT, fused_args + [self.unirig_device_arg], "Fused Pipeline",
+                               on_output=handle_line, estimated_seconds=estimated_seconds, cancel_token=self.cancel_token)
+        finally:
+            # The preview reads the working directory, which cleanup() releases once the job ends.
+            for builder in preview_builders:
+                builder.join()
+        for path, message in ((self.abs_skeleton_output_path, "Skeleton prediction failed. Output file not created."),
+                              (self.abs_skin_output_path, "Skinning prediction failed. Output file not created."),
+                              (merge_output_path, "Merging process failed. Final rigged GLB file not created.")):
+            if not os.path.exists(path):
+                raise gr.Error(message)
+        self.cache_skeleton()
+        if not skin_ready:
+            stage_cache.put(self.cache_keys["skin"], self.abs_skin_output_path, suffix=".fbx")
+        stages = summary.get("stages", {})
+        launches_avoided = max(len(stages) - 1, 0)
+        record: Dict[str, Any] = {"stages": stages, "launches_avoided": launches_avoided}
+        # Only a one-shot launch measures the setup (Blender start, imports) that the three-launch path pays
+        # per stage. A warm worker reports script_start on receipt of the job, so its setup reads as ~0; the
+        # end-to-end saving there is what `benchmarks/run_benchmarks.py --scenario fused` measures.
+        if isinstance(step_result, subprocess.CompletedProcess) and script_started:
+            setup_seconds = script_started[0] - launched
+            record.update(setup_seconds=round(setup_seconds, 3),
+                          estimated_saved_seconds=round(setup_seconds * launches_avoided, 3))
+        log_json("fused_pipeline", input=os.path.basename(self.input_glb_path), **record)
+        if not self.use_proxy and not GLB_OPTIMIZE:
+            self.store_result()
+
+    def proxy_stage(self):
+        if restore_stage_artifact(self.cache_keys["proxy"], self.abs_proxy_glb_path, suffix=".glb"):
+            self.events.emit("stage_skipped", "Proxy Mesh", message="Restored from the stage cache.")
+            return
+        self.events.stage_start("Proxy Mesh")
+        execute_unirig_command(PROXY_MESH_SCRIPT, ["simplify", "--input", self.abs_input_glb_path,
+                                                   "--output", self.abs_proxy_glb_path,
+                                                   "--target-faces", str(PROXY_TARGET_FACES)],
+                               "Proxy Mesh", on_output=self.events.output_handler("Proxy Mesh"), lane="cpu",
+                               estimated_seconds=self.stage_estimates["proxy"], cancel_token=self.cancel_token)
+        if not os.path.exists(self.abs_proxy_glb_path):
+            raise gr.Error("Proxy mesh creation failed. Output file not created.")
+        self.events.stage_end("Proxy Mesh")
+        stage_cache.put(self.cache_keys["proxy"], self.abs_proxy_glb_path, suffix=".glb")
+
+    def transfer_stage(self):
+        self.events.stage_start("Weight Transfer")
+        execute_unirig_command(PROXY_MESH_SCRIPT, ["transfer", "--source", self.abs_rigged_proxy_path,
+                                                   "--target", self.abs_input_glb_path,
+                                                   "--output", self.abs_final_rigged_glb_path],
+                               "Weight Transfer", on_output=self.events.output_handler("Weight Transfer"), lane="cpu",
+                               estimated_seconds=self.stage_estimates["transfer"], cancel_token=self.cancel_token)
+        if not os.path.exists(self.abs_final_rigged_glb_path):
+            raise gr.Error("Weight transfer failed. Final rigged GLB file not created.")
+        self.events.stage_end("Weight Transfer")
+        if not GLB_OPTIMIZE:
+            self.store_result()
+
+    def optimize_stage(self):
+        # Pure numpy plus an optional compression CLI: runs on the CPU lane without Blender.
+        self.events.stage_start(OPTIMIZE_STAGE)
+        stage_cache.put(self.cache_keys["merge"], self.abs_final_rigged_glb_path)
+        try:
+            report = optimize_rigged_glb(self.abs_final_rigged_glb_path, self.abs_optimized_glb_path)
+        except Exception as e:
+            # The raw merge output is still a valid result; an optimizer bug must not fail the job.
+            print(f"[GLBOptimize] Failed, returning the raw merge output: {e}")
+            self.events.emit("stage_skipped", OPTIMIZE_STAGE, message=f"Optimization failed: {str(e)[:200]}")
+            self.publish_outputs(self.abs_final_rigged_glb_path, self.skeleton_artifact_path) # Not cached as optimized
+            return
+        self.events.emit("stage_end", OPTIMIZE_STAGE, report=report,
+                         message=f"{report['raw_bytes'] / 1024**2:.1f} MB -> {report['optimized_bytes'] / 1024**2:.1f} MB "
+                                 f"({report['ratio']:.0%}, compression: {report.get('compression') or 'none'}), "
+                                 f"took {report['seconds']:.1f}s")
+        self.store_result(self.abs_optimized_glb_path)
+
+    def store_result(self, final_glb_path: Union[str, None] = None):
+        final_glb_path = final_glb_path or self.abs_final_rigged_glb_path
+        print(f"Successfully generated rigged model: {final_glb_path}")
+        rigged_glb_path = result_cache.put(self.cache_keys["result"], final_glb_path)
+        print(f"Stored result in cache: {rigged_glb_path}. Cache stats: {result_cache.stats()}")
+        self.publish_outputs(rigged_glb_path, self.skeleton_artifact_path)
+
+    def publish_outputs(self, rigged_glb_path: str, skeleton_fbx_path: Union[str, None]):
+        # Outputs handed to clients are published to the artifact store: the working directory is
+        # deleted when the run ends and cache entries can be evicted, but these stay for the TTL.
+        base_name = os.path.splitext(os.path.basename(self.input_glb_path))[0]
+        self.outputs = {
+            "rigged_glb": artifact_store.publish(rigged_glb_path, name=f"{base_name}_rigged.glb"),
+            "skeleton_fbx": artifact_store.publish(skeleton_fbx_path, name=f"{base_name}_skeleton.fbx")
+                            if skeleton_fbx_path and os.path.exists(skeleton_fbx_path) else None,
+            "profiles": self.profile_artifacts, # Filled in as profiled steps finish
+        }
+
+    def _guarded(self, stage_fn: Callable[[], None]) -> Callable[[], None]:
+        def run_guarded():
+            # Read by execute_step on this lane thread (see step_profile_settings).
+            _stage_context.profile = self.profile
+            _stage_context.profile_artifacts = self.profile_artifacts
             try:
-                os.remove(diagnostic_script_path)
-                print(f"Cleaned up diagnostic script: {diagnostic_script_path}")
-            except Exception as cleanup_e:
-                print(f"Error cleaning up diagnostic script {diagnostic_script_path}: {cleanup_e}")
+                stage_fn()
+            except JobCancelled:
+                raise
+            except gr.Error as e:
+                print(f"A Gradio Error occurred: {e}")
+                raise # Re-raise to ensure Gradio UI shows the error
+            except Exception as e:
+                print(f"An unexpected error occurred in {stage_fn.__name__}: {e}")
+                import traceback; traceback.print_exc()
+                raise gr.Error(f"An unexpected error occurred: {str(e)[:500]}. Check logs.")
+            finally:
+                _stage_context.profile = False
+        return run_guarded
+
+    def scheduler_stages(self) -> List[Stage]:
+        if self.fused:
+            # One GPU-lane slot for all three: merging then runs inside the GPU window, but the job
+            # neither starts Blender again nor waits in the CPU lane.
+            stages = [Stage("Fused Pipeline", "gpu", self._guarded(self.fused_stage),
+                            sum(self.stage_estimates[s] for s in ("skeleton", "skin", "merge")))]
+        else:
+            stages = [
+                Stage("Skeleton Prediction", "gpu", self._guarded(self.skeleton_stage), self.stage_estimates["skeleton"]),
+                Stage("Skinning Prediction", "gpu", self._guarded(self.skin_stage), self.stage_estimates["skin"]),
+                Stage("Merging Results", "cpu", self._guarded(self.merge_stage), self.stage_estimates["merge"]),
+            ]
+        if self.use_proxy:
+            stages.insert(0, Stage("Proxy Mesh", "cpu", self._guarded(self.proxy_stage), self.stage_estimates["proxy"]))
+            stages.append(Stage("Weight Transfer", "cpu", self._guarded(self.transfer_stage),
+                                self.stage_estimates["transfer"]))
+        if GLB_OPTIMIZE:
+            stages.append(Stage(OPTIMIZE_STAGE, "cpu", self._guarded(self.optimize_stage),
+                                self.stage_estimates["optimize"]))
+        return stages
+
+    def cleanup(self):
         # Cleanup the main processing directory
-        if os.path.exists(processing_temp_dir):
+        if self.processing_temp_dir and os.path.exists(self.processing_temp_dir):
              try:
-                 shutil.rmtree(processing_temp_dir)
-                 print(f"Cleaned up temp dir: {processing_temp_dir}")
+                 artifact_store.release(self.processing_temp_dir)
+                 print(f"Cleaned up temp dir: {self.processing_temp_dir}")
              except Exception as cleanup_e:
-                 print(f"Error cleaning up temp dir {processing_temp_dir}: {cleanup_e}")
+                 print(f"Error cleaning up temp dir {self.processing_temp_dir}: {cleanup_e}")
+
+def run_rig_pipeline(input_glb_path: str, skeleton_fbx_path: Union[str, None] = None,
+                     require_cached_skeleton: bool = False,
+                     on_event: Union[Callable[[Dict[str, Any]], None], None] = None,
+                     cancel_token: Union[CancelToken, None] = None, profile: bool = False) -> Dict[str, str]:
+    """
+    Runs skeleton -> skin -> merge for one GLB through the job scheduler, resuming from the last
+    cached stage. With skeleton_fbx_path the skeleton stage is skipped and the given FBX is skinned
+    instead. With require_cached_skeleton the skeleton must already be in the stage cache.
+    Progress events (see PipelineEvents) are passed to on_event as they happen. Cancelling
+    cancel_token drops the job's queued stages, kills the running one and raises JobCancelled.
+    Returns the paths of the rigged GLB and of the skeleton FBX it was built from, and under "profiles"
+    the profiler reports of its Blender steps. Steps are profiled with profile, and for a
+    UNIRIG_PROFILE_SAMPLE_RATE fraction of the runs.
+
+    A request identical to one already running (same input content, supplied skeleton and options)
+    joins that run and gets its events, result or error, instead of running the pipeline again.
+    """
+    if not SINGLE_FLIGHT:
+        RIG_REQUESTS.inc("leader")
+        return _run_rig_pipeline_once(input_glb_path, skeleton_fbx_path, require_cached_skeleton, on_event, cancel_token,
+                                      profile)
+    # A request that asks for a profile does not join an unprofiled run.
+    flight_key = make_cache_key(flight="rig", input_sha256=file_sha256(input_glb_path),
+                                supplied_skeleton_sha256=file_sha256(skeleton_fbx_path) if skeleton_fbx_path else None,
+                                require_cached_skeleton=require_cached_skeleton, device=get_unirig_device_arg(),
+                                profile=profile)
+    started = time.time()
+    is_leader = []
+
+    def leader_run(publish, shared_token):
+        is_leader.append(True)
+        return _run_rig_pipeline_once(input_glb_path, skeleton_fbx_path, require_cached_skeleton, publish, shared_token,
+                                      profile)
+
+    try:
+        outputs = rig_flights.run(flight_key, leader_run, on_event=on_event, cancel_token=cancel_token)
+    except JobCancelled:
+        if not is_leader:
+            record_job(None, "cancelled", time.time() - started, coalesced=True)
+        raise
+    if not is_leader:
+        record_job(None, "coalesced", time.time() - started, flight=flight_key[:12])
+    return outputs
+
+def _run_rig_pipeline_once(input_glb_path: str, skeleton_fbx_path: Union[str, None],
+                           require_cached_skeleton: bool,
+                           on_event: Union[Callable[[Dict[str, Any]], None], None],
+                           cancel_token: Union[CancelToken, None], profile: bool = False) -> Dict[str, str]:
+    # Sampled here, by the run's leader, so sampling does not split identical requests into separate runs.
+    profile = profile or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+    rig_run = RigPipelineRun(input_glb_path, skeleton_fbx_path, require_cached_skeleton, on_event, cancel_token,
+                             profile=profile)
+    if rig_run.prepare():
+        record_job(None, "cached", time.time() - rig_run.events.started)
+        return rig_run.outputs
+    if rig_run.cancel_token.cancelled:
+        rig_run.cleanup()
+        raise JobCancelled(rig_run.cancel_token.reason)
+    scheduler_stats = rig_scheduler.stats()
+    try:
+        job = rig_scheduler.submit(rig_run.scheduler_stages(), on_finish=rig_run.cleanup)
+    except SchedulerFull as e:
+        rig_run.cleanup()
+        raise gr.Error(f"The server is busy ({e}). Please try again in a moment.")
+    rig_run.events.emit("queued", rig_run.events.stages[0],
+                        message=f"job {job.id}, {scheduler_stats['active_jobs']} job(s) ahead, "
+                                f"~{scheduler_stats['lanes']['gpu']['estimated_wait_seconds']:.0f}s estimated wait, "
+                                f"~{sum(rig_run.stage_estimates.values()):.0f}s estimated run")
+    on_cancel = rig_run.cancel_token.add_callback(lambda reason: rig_scheduler.cancel(job, JobCancelled(reason)))
+    status = "failed"
+    try:
+        job.result()
+        status = "done"
+    except JobCancelled:
+        status = "cancelled"
+        raise
+    finally:
+        rig_run.cancel_token.remove_callback(on_cancel)
+        record_job(job.id, status, time.time() - rig_run.events.started, stages=[
+            {"stage": t.stage, "lane": t.lane, "queue_wait": round(t.queue_wait, 3), "seconds": round(t.duration, 3)}
+            for t in job.timings
+        ])
+    return rig_run.outputs
+
+_session_tokens: Dict[str, CancelToken] = {}
+_session_tokens_lock = threading.Lock()
+
+def run_api_job(input_glb_path: str, on_event: Callable[[Dict[str, Any]], None],
+                cancel_token: CancelToken, profile: bool = False) -> Dict[str, str]:
+    """
+    Pipeline entry point of the job API (job_api.py). API jobs wait for the environment and for room
+    in the scheduler instead of failing with "server busy"; they are already queued durably.
+    """
+    require_environment()
+    while rig_scheduler.stats()["active_jobs"] >= rig_scheduler.max_jobs:
+        if cancel_token.wait(1.0):
+            raise JobCancelled(cancel_token.reason)
+    return run_rig_pipeline(input_glb_path, on_event=on_event, cancel_token=cancel_token, profile=profile)
+
+def session_cancel_token(request: Union[gr.Request, None]) -> CancelToken:
+    """
+    Cancel token of a new UI request. A request still running for the same browser session is
+    cancelled: its outputs would be overwritten by this one anyway.
+    """
+    cancel_token = CancelToken()
+    session_hash = getattr(request, "session_hash", None)
+    if session_hash:
+        with _session_tokens_lock:
+            previous_token = _session_tokens.get(session_hash)
+            _session_tokens[session_hash] = cancel_token
+        if previous_token:
+            previous_token.cancel("Superseded by a newer request from the same session.")
+    return cancel_token
+
+def release_session_token(request: Union[gr.Request, None], cancel_token: CancelToken):
+    session_hash = getattr(request, "session_hash", None)
+    with _session_tokens_lock:
+        if session_hash and _session_tokens.get(session_hash) is cancel_token:
+            del _session_tokens[session_hash]
+
+def stream_pipeline_progress(run_pipeline: Callable[[Callable[[Dict[str, Any]], None]], Dict[str, str]],
+                             progress: gr.Progress, cancel_token: CancelToken):
+    """
+    Runs run_pipeline(on_event) in a background thread and yields (model, skeleton, log) updates
+    while it runs: stage start/end and UniRig progress lines go to the progress bar and log pane,
+    and a skeleton preview goes to the model viewer until the rigged GLB replaces it.
+    When Gradio closes this generator early (Cancel button, closed tab), cancel_token is cancelled,
+    which stops the job and frees its lane for the next one.
+    """
+    event_queue: "queue.Queue[Union[Dict[str, Any], None]]" = queue.Queue()
+    outcome: Dict[str, Any] = {}
+
+    def target():
+        try:
+            outcome["result"] = run_pipeline(event_queue.put)
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            event_queue.put(None)
+
+    started = time.time()
+    threading.Thread(target=target, daemon=True, name="rig-pipeline").start()
+    log_lines = deque(maxlen=UI_LOG_LINES)
+    last_yield = 0.0
+    first_result = None # Kind of the first model shown: "preview" or "final"
+    try:
+        while True:
+            try:
+                event = event_queue.get(timeout=PROGRESS_HEARTBEAT_SECONDS)
+            except queue.Empty:
+                # Yield while queued or silent too, so a disconnect closes this generator promptly.
+                yield gr.update(), gr.update(), "\n".join(log_lines)
+                continue
+            if event is None:
+                break
+            elapsed = f"[{event['elapsed']:7.1f}s]"
+            if event["type"] == "log":
+                log_lines.append(f"{elapsed} {event['message']}")
+            else:
+                log_lines.append(f"{elapsed} == {event.get('stage') or 'Pipeline'}: {event['type']} {event.get('message', '')}".rstrip())
+            if event["type"] == "preview":
+                if first_result is None:
+                    first_result = "preview"
+                    TIME_TO_FIRST_RESULT.observe(time.time() - started, first_result)
+                last_yield = time.time()
+                yield gr.update(value=event["path"]), gr.update(), "\n".join(log_lines)
+                continue
+            if event.get("fraction") is not None:
+                progress(event["overall"], desc=f"{event['stage']} ({event['fraction']:.0%})")
+            elif event["type"] in ("stage_start", "stage_end", "stage_skipped"):
+                progress(event["overall"], desc=f"{event['stage']}: {event['type'].replace('stage_', '')}")
+            # Stage transitions always reach the client; log lines are throttled.
+            if event["type"] != "log" or time.time() - last_yield > 0.5:
+                last_yield = time.time()
+                yield gr.update(), gr.update(), "\n".join(log_lines)
+    finally:
+        if not outcome:
+            cancel_token.cancel("The client disconnected or cancelled the request.")
+
+    if isinstance(outcome.get("error"), JobCancelled):
+        raise gr.Error(f"Cancelled. {outcome['error']}")
+    if "error" in outcome:
+        raise outcome["error"]
+    outputs = outcome["result"]
+    if first_result is None:
+        TIME_TO_FIRST_RESULT.observe(time.time() - started, "final")
+    log_lines.append("Done.")
+    yield gr.update(value=outputs["rigged_glb"]), outputs["skeleton_fbx"], "\n".join(log_lines)
+
+def rig_glb_mesh_multistep(input_glb_file_obj, request: gr.Request = None, progress=gr.Progress()):
+    yield from wait_for_environment_updates(3)
+    input_glb_path = validate_rig_input(input_glb_file_obj)
+    if input_glb_path is None:
+        yield None, None, ""
+        return
+    cancel_token = session_cancel_token(request)
+    try:
+        yield from stream_pipeline_progress(
+            lambda on_event: run_rig_pipeline(input_glb_path, on_event=on_event, cancel_token=cancel_token),
+            progress, cancel_token)
+    finally:
+        release_session_token(request, cancel_token)
+
+def rig_glb_skin_merge_only(input_glb_file_obj, skeleton_fbx_file_obj=None, request: gr.Request = None,
+                            progress=gr.Progress()):
+    """Skin + merge only: reuses a user-supplied skeleton FBX, or the cached skeleton for this mesh."""
+    yield from wait_for_environment_updates(3)
+    input_glb_path = validate_rig_input(input_glb_file_obj)
+    if input_glb_path is None:
+        yield None, None, ""
+        return
+    skeleton_fbx_path = skeleton_fbx_file_obj or None
+    if skeleton_fbx_path and (not os.path.exists(skeleton_fbx_path) or not skeleton_fbx_path.lower().endswith(".fbx")):
+        raise gr.Error("Invalid skeleton file. Please upload the .fbx produced by skeleton prediction.")
+    cancel_token = session_cancel_token(request)
+    try:
+        yield from stream_pipeline_progress(
+            lambda on_event: run_rig_pipeline(input_glb_path, skeleton_fbx_path=skeleton_fbx_path,
+                                              require_cached_skeleton=True, on_event=on_event,
+                                              cancel_token=cancel_token), progress, cancel_token)
+    finally:
+        release_session_token(request, cancel_token)
+
+def execute_unirig_batch(jobs: List[Dict[str, Any]], step_name: str, work_dir: str, lane: str = "gpu",
+                         cancel_token: Union[CancelToken, None] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Runs one UniRig stage for many inputs in a single Blender process (blender_worker.py --batch),
+    so the stage pays for one Blender launch and one model load. jobs: [{"id": ..., "args": [...]}].
+    As in execute_unirig_command, CPU-lane batches do not see the GPU, GPU-lane batches run on a local
+    device of device_registry and move to another one after a device failure, the process runs under
+    step_resource_profile(lane) and cancelling cancel_token kills it and raises JobCancelled.
+    Returns {id: {"returncode", "duration", "log"}}; jobs missing from the result never finished.
+    """
+    # Remote workers run single steps only; a batch runs on a local device.
+    remote_devices = [device.name for device in device_registry.devices if device.kind == "remote"]
+    if lane != "gpu" or len(remote_devices) == len(device_registry.devices):
+        return execute_batch_process(jobs, step_name, work_dir, lane, cancel_token)
+    try:
+        return device_registry.run(
+            lambda device: execute_batch_process(jobs, step_name, work_dir, lane, cancel_token, device=device),
+            attempts=DEVICE_ATTEMPTS, cancel_token=cancel_token, exclude=remote_devices)
+    except DeviceFailure as e:
+        print(f"ERROR: Batch step {step_name} failed on every device it was tried on ({e}); "
+              f"its inputs are marked failed.")
+        return {}
+
+def execute_batch_process(jobs: List[Dict[str, Any]], step_name: str, work_dir: str, lane: str,
+                          cancel_token: Union[CancelToken, None],
+                          device: Union[Device, None] = None) -> Dict[str, Dict[str, Any]]:
+    """One Blender process of execute_unirig_batch, on device when given. Raises DeviceFailure when the device is at fault."""
+    if cancel_token:
+        cancel_token.raise_if_cancelled()
+    process_env = build_blender_env()
+    if lane == "cpu":
+        process_env["CUDA_VISIBLE_DEVICES"] = ""
+    if device is not None:
+        process_env.update(device.env)
+        jobs = [dict(job, args=[device.unirig_device_arg if arg.startswith("device=") else arg for arg in job["args"]])
+                for job in jobs]
+
+    # Named after the first job, so the chunks of one stage do not overwrite each other's files.
+    step_slug = f"{step_name.lower().replace(' ', '_')}_{jobs[0]['id']}"
+    manifest_path = os.path.join(work_dir, f"{step_slug}_manifest.json")
+    results_path = os.path.join(work_dir, f"{step_slug}_results.json")
+    manifest = {
+        "script": os.path.abspath(UNIRIG_RUN_PY),
+        "results_path": results_path,
+        "jobs": [dict(job, log_path=os.path.join(work_dir, f"{step_slug}_{job['id']}.log")) for job in jobs],
+    }
+    with open(manifest_path, "w") as f: json.dump(manifest, f)
+
+    cmd = [
+        blender_executable_to_use, "--background",
+        "--python", BLENDER_WORKER_SCRIPT,
+        "--",
+        "--batch", manifest_path,
+        "--unirig-dir", os.path.abspath(UNIRIG_REPO_DIR),
+    ]
+    print(f"\n--- Running UniRig Batch Step: {step_name} ({len(jobs)} inputs"
+          f"{f', on {device.name}' if device is not None else ''}) ---")
+    print(f"Command: {' '.join(cmd)}")
+    profile = step_resource_profile(lane)
+    process_env.update(profile.env())
+    tail = OutputTail(STEP_LOG_TAIL_LINES)
+    failure = None
+    try:
+        process = subprocess.Popen(
+            cmd,
+            cwd=UNIRIG_REPO_DIR,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=process_env,
+            start_new_session=True
+        )
+        profile.pin(process.pid)
+        watchdog = RssWatchdog(process, profile.rss_limit_bytes, grace_seconds=CANCEL_GRACE_SECONDS).start()
+        readers = start_line_readers({"stdout": process.stdout, "stderr": process.stderr}, tail,
+                                     lambda stream, line: print(f"[{step_name} batch] {line}"))
+        on_cancel = None
+        if cancel_token:
+            on_cancel = cancel_token.add_callback(lambda reason: terminate_process_group(process, CANCEL_GRACE_SECONDS))
+        try:
+            usage = wait_and_measure(process, BATCH_STEP_TIMEOUT_PER_INPUT * len(jobs))
+            print(f"Batch step {step_name}: peak RSS {max(usage.peak_rss_bytes, watchdog.peak_bytes) / 2**20:.0f} MB, "
+                  f"{usage.cpu_seconds:.1f} CPU seconds.")
+            if usage.returncode != 0:
+                print(f"WARNING: Batch process for {step_name} exited with code {usage.returncode}.\n"
+                      f"STDERR tail:\n{tail.text('stderr')[-2000:]}")
+                failure = subprocess.CalledProcessError(usage.returncode, cmd, stderr=tail.text("stderr"))
+        except subprocess.TimeoutExpired:
+            print(f"ERROR: Batch step {step_name} timed out; inputs without a result are marked failed.")
+            terminate_process_group(process, CANCEL_GRACE_SECONDS)
+        finally:
+            watchdog.stop()
+            if on_cancel:
+                cancel_token.remove_callback(on_cancel)
+            for reader in readers:
+                reader.join(timeout=10)
+    finally:
+        profile.release()
+    if cancel_token:
+        cancel_token.raise_if_cancelled()
+    if watchdog.exceeded:
+        print(f"ERROR: Batch step {step_name} exceeded its memory limit ({STEP_RSS_LIMIT_MB} MB, "
+              f"UNIRIG_STEP_RSS_LIMIT_MB); inputs without a result are marked failed.")
+    elif device is not None and failure is not None and is_device_failure(failure):
+        # The whole chunk runs again on the next device, as a single step would.
+        raise DeviceFailure(f"{device.name}: exit code {failure.returncode}")
+
+    results = {}
+    if os.path.exists(results_path):
+        with open(results_path) as f: results = json.load(f)
+    for job in manifest["jobs"]:
+        if job["id"] in results and os.path.exists(job["log_path"]):
+            with open(job["log_path"], errors="replace") as f:
+                results[job["id"]]["log"] = f.read()
+    print(f"--- Finished UniRig Batch Step: {step_name} ({len(results)}/{len(jobs)} inputs ran) ---")
+    return results
+
+def zerogpu_batch_duration(jobs: List[Dict[str, Any]], step_name: str, work_dir: str,
+                           estimated_seconds: Union[float, None] = None,
+                           cancel_token: Union[CancelToken, None] = None) -> int:
+    """GPU window to request for one chunk of a batch stage, as zerogpu_duration does for one step."""
+    return zerogpu_duration(BLENDER_WORKER_SCRIPT, [], step_name, estimated_seconds=estimated_seconds)
+
+@spaces.GPU(duration=zerogpu_batch_duration)
+def run_unirig_batch(jobs: List[Dict[str, Any]], step_name: str, work_dir: str,
+                     estimated_seconds: Union[float, None] = None,
+                     cancel_token: Union[CancelToken, None] = None) -> Dict[str, Dict[str, Any]]:
+    return execute_unirig_batch(jobs, step_name, work_dir, "gpu", cancel_token)
+
+def batch_chunks(jobs: List[Dict[str, Any]], estimates: List[float]) -> List[Tuple[List[Dict[str, Any]], float]]:
+    """
+    Splits the jobs of a GPU batch stage into consecutive chunks whose estimate (with the margin) fits
+    one ZeroGPU window. Returns (jobs, estimated seconds) per chunk. A job too large for a window on
+    its own gets a chunk of its own.
+    """
+    chunks: List[Tuple[List[Dict[str, Any]], float]] = []
+    for job, seconds in zip(jobs, estimates):
+        if not chunks or (chunks[-1][1] + seconds) * ZEROGPU_DURATION_MARGIN > ZEROGPU_MAX_DURATION:
+            chunks.append(([], 0.0))
+        chunk_jobs, chunk_seconds = chunks[-1]
+        chunk_jobs.append(job)
+        chunks[-1] = (chunk_jobs, chunk_seconds + seconds)
+    return chunks
+
+def _run_batch_stage(items: List[Dict[str, Any]], step_name: str, stage: str, lane: str, work_dir: str,
+                     output_key: str, build_args, cancel_token: CancelToken) -> None:
+    """
+    Runs one stage for every still-pending item and marks the ones whose output is missing as failed.
+    GPU-lane stages run in chunks, one ZeroGPU window each: a single window cannot cover a large batch.
+    """
+    pending = [item for item in items if item["status"] == "pending"]
+    if not pending:
+        return
+    jobs = [{"id": item["id"], "args": build_args(item)} for item in pending]
+    if lane == "gpu":
+        results = {}
+        for chunk, estimated_seconds in batch_chunks(jobs, [item["estimates"][stage] for item in pending]):
+            results.update(run_unirig_batch(chunk, step_name, work_dir, estimated_seconds=estimated_seconds,
+                                            cancel_token=cancel_token))
+    else:
+        results = execute_unirig_batch(jobs, step_name, work_dir, lane, cancel_token)
+    for item in pending:
+        result = results.get(item["id"])
+        if result and result["returncode"] == 0 and os.path.exists(item[output_key]):
+            continue
+        item["status"] = "failed"
+        if result is None:
+            item["error"] = f"{step_name}: the batch process stopped before this input ran."
+        else:
+            last_lines = "\n".join(result.get("log", "").strip().splitlines()[-10:])
+            item["error"] = f"{step_name} failed (code {result['returncode']}). Last log lines:\n{last_lines}"
+        print(f"Batch item {item['name']} failed in {step_name}.")
+
+def _prepare_batch_item(item: Dict[str, Any], work_dir: str, unirig_device_arg: str) -> None:
+    """Inspects a batch input and sets its paths, cache keys and estimates; restores cached stages."""
+    # The batch stages have no proxy/transfer pass, so the vertex limit always applies here.
+    glb_info = inspect_rig_input(item["input"], allow_proxy=False)
+    item_dir = os.path.join(work_dir, f"{item['id']}_{item['name']}")
+    os.makedirs(item_dir, exist_ok=True)
+    item.update(
+        abs_input=os.path.abspath(item["input"]),
+        skeleton_path=os.path.join(item_dir, f"{item['name']}_skeleton.fbx"),
+        skin_path=os.path.join(item_dir, f"{item['name']}_skin.fbx"),
+        final_path=os.path.join(item_dir, f"{item['name']}_rigged_final.glb"),
+        cache_keys=pipeline_cache_keys(item["input"], unirig_device_arg),
+        estimates=estimate_runtime(glb_info),
+    )
+    cached_glb_path = result_cache.get(item["cache_keys"]["result"])
+    if cached_glb_path:
+        item.update(status="done", rigged_glb=cached_glb_path)
+    elif restore_stage_artifact(item["cache_keys"]["skeleton"], item["skeleton_path"]):
+        item["skeleton_cached"] = True
+        if restore_stage_artifact(item["cache_keys"]["skin"], item["skin_path"]):
+            item["skin_cached"] = True
+
+def run_rig_batch(input_glb_paths: List[str], output_dir: Union[str, None] = None,
+                  cancel_token: Union[CancelToken, None] = None) -> List[Dict[str, Any]]:
+    """
+    Rigs many GLBs stage by stage: one skeleton pass, one skin pass and one merge pass for the whole
+    batch, each in a single Blender process. The passes run as one job of rig_scheduler, skeleton and
+    skin on the GPU lane and merge on the CPU lane; like API jobs, a batch waits for room in the
+    scheduler. Cached stages are reused per input. Returns one result per input ({"input", "status":
+    "done"|"failed", "rigged_glb", "error", "batch_seconds"}); a bad mesh only fails its own entry.
+    Rigged GLBs are copied to output_dir when given. Cancelling cancel_token drops the remaining passes,
+    kills the running one and raises JobCancelled.
+    """
+    require_environment()
+    ensure_preflight()
+    cancel_token = cancel_token or CancelToken()
+    batch_started = time.time()
+    unirig_device_arg = get_unirig_device_arg()
+    work_dir = artifact_store.new_workdir(prefix="unirig_processing_batch_")
+    print(f"Batch of {len(input_glb_paths)} inputs. Working directory: {work_dir}")
+
+    items = []
+    for index, input_glb_path in enumerate(input_glb_paths):
+        base_name = os.path.splitext(os.path.basename(str(input_glb_path)))[0]
+        item = {"id": f"{index:04d}", "input": input_glb_path, "name": base_name,
+                "status": "pending", "error": None, "rigged_glb": None}
+        items.append(item)
+        if not isinstance(input_glb_path, str) or not os.path.exists(input_glb_path):
+            item.update(status="failed", error="Input file does not exist.")
+            continue
+        if not input_glb_path.lower().endswith(".glb"):
+            item.update(status="failed", error="Invalid file type, expected .glb.")
+            continue
+        try:
+            _prepare_batch_item(item, work_dir, unirig_device_arg)
+        except gr.Error as e:
+            item.update(status="failed", error=str(e))
+        except Exception as e:
+            # A parser bug or an unreadable file fails this row only, not the whole batch.
+            print(f"Batch item {item['name']} could not be prepared: {e!r}")
+            item.update(status="failed", error=f"Could not read this input: {str(e)[:500]}")
+
+    def skeleton_stage():
+        skeleton_items = [item for item in items if item["status"] == "pending" and not item.get("skeleton_cached")]
+        _run_batch_stage(skeleton_items, "Skeleton Prediction", "skeleton", "gpu", work_dir, "skeleton_path",
+                         lambda item: skeleton_step_args(item["abs_input"], item["skeleton_path"], unirig_device_arg),
+                         cancel_token)
+        for item in skeleton_items:
+            if item["status"] == "pending":
+                stage_cache.put(item["cache_keys"]["skeleton"], item["skeleton_path"], suffix=".fbx")
+
+    def skin_stage():
+        skin_items = [item for item in items if item["status"] == "pending" and not item.get("skin_cached")]
+        _run_batch_stage(skin_items, "Skinning Prediction", "skin", "gpu", work_dir, "skin_path",
+                         lambda item: skin_step_args(item["skeleton_path"], item["skin_path"], unirig_device_arg),
+                         cancel_token)
+        for item in skin_items:
+            if item["status"] == "pending":
+                stage_cache.put(item["cache_keys"]["skin"], item["skin_path"], suffix=".fbx")
+
+    def merge_stage():
+        _run_batch_stage(items, "Merging Results", "merge", "cpu", work_dir, "final_path",
+                         # Merging needs no GPU, as on the single-run path.
+                         lambda item: merge_step_args(item["skin_path"], item["abs_input"], item["final_path"], "device=cpu"),
+                         cancel_token)
+        for item in items:
+            if item["status"] == "pending":
+                final_path = item["final_path"]
+                if GLB_OPTIMIZE:
+                    stage_cache.put(item["cache_keys"]["merge"], final_path)
+                    optimized_path = os.path.splitext(final_path)[0] + "_optimized.glb"
+                    try:
+                        item["optimize_report"] = optimize_rigged_glb(final_path, optimized_path)
+                    except Exception as e:
+                        # As in RigPipelineRun.optimize_stage: the raw merge output is still a valid result,
+                        # but it is not cached as the optimized one.
+                        print(f"[GLBOptimize] Failed for batch item {item['name']}, returning the raw merge output: {e}")
+                        item["optimize_report"] = {"error": str(e)[:500]}
+                        item.update(status="done", rigged_glb=final_path)
+                        continue
+                    final_path = optimized_path
+                item.update(status="done", rigged_glb=result_cache.put(item["cache_keys"]["result"], final_path))
+
+    try:
+        pending = [item for item in items if item["status"] == "pending"]
+        if pending:
+            estimated = {stage: sum(item["estimates"][stage] for item in pending) for stage in ("skeleton", "skin", "merge")}
+            stages = [
+                Stage("Skeleton Prediction", "gpu", skeleton_stage, estimated["skeleton"]),
+                Stage("Skinning Prediction", "gpu", skin_stage, estimated["skin"]),
+                Stage("Merging Results", "cpu", merge_stage, estimated["merge"]),
+            ]
+            while True:
+                try:
+                    job = rig_scheduler.submit(stages)
+                    break
+                except SchedulerFull:
+                    if cancel_token.wait(1.0):
+                        raise JobCancelled(cancel_token.reason)
+            on_cancel = cancel_token.add_callback(lambda reason: rig_scheduler.cancel(job, JobCancelled(reason)))
+            status = "failed"
+            try:
+                job.result()
+                status = "done"
+            except JobCancelled:
+                status = "cancelled"
+                raise
+            finally:
+                cancel_token.remove_callback(on_cancel)
+                record_job(job.id, status, time.time() - batch_started, inputs=len(pending), stages=[
+                    {"stage": t.stage, "lane": t.lane, "queue_wait": round(t.queue_wait, 3), "seconds": round(t.duration, 3)}
+                    for t in job.timings
+                ])
+
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        for item in items:
+            if item["status"] != "done":
+                continue
+            if output_dir:
+                destination = os.path.join(output_dir, f"{item['id']}_{item['name']}_rigged.glb")
+                shutil.copyfile(item["rigged_glb"], destination)
+                item["rigged_glb"] = destination
+            else:
+                # The working directory goes away below; cache entries can be evicted.
+                item["rigged_glb"] = artifact_store.publish(item["rigged_glb"], name=f"{item['name']}_rigged.glb")
+    finally:
+        artifact_store.release(work_dir)
+
+    elapsed = time.time() - batch_started
+    succeeded = sum(1 for item in items if item["status"] == "done")
+    print(f"Batch finished in {elapsed:.1f}s: {succeeded}/{len(items)} rigged. Cache stats: {result_cache.stats()}")
+    return [
+        {"input": item["input"], "status": item["status"], "rigged_glb": item["rigged_glb"],
+         "error": item["error"], "batch_seconds": round(elapsed, 1)}
+        for item in items
+    ]
+
+def rig_glb_batch(input_glb_file_objs, request: gr.Request = None):
+    """
+    Runs the batch in a background thread and yields while it runs, so that the Cancel Batch button
+    or a closed tab closes this generator, which cancels the batch (see stream_pipeline_progress).
+    """
+    if not input_glb_file_objs:
+        gr.Info("Please upload one or more .glb files first.")
+        yield None, None
+        return
+    require_environment()
+    cancel_token = session_cancel_token(request)
+    outcome: Dict[str, Any] = {}
+    finished = threading.Event()
+
+    def target():
+        try:
+            outcome["result"] = run_rig_batch(list(input_glb_file_objs), cancel_token=cancel_token)
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            finished.set()
+
+    threading.Thread(target=target, daemon=True, name="rig-batch").start()
+    try:
+        while not finished.wait(PROGRESS_HEARTBEAT_SECONDS):
+            yield gr.update(), gr.update()
+    finally:
+        if not outcome:
+            cancel_token.cancel("The client disconnected or cancelled the request.")
+        release_session_token(request, cancel_token)
+
+    if isinstance(outcome.get("error"), JobCancelled):
+        raise gr.Error(f"Cancelled. {outcome['error']}")
+    if "error" in outcome:
+        raise outcome["error"]
+    results = outcome["result"]
+    table = [[os.path.basename(str(r["input"])), r["status"], r["error"] or ""] for r in results]
+    rigged_files = [r["rigged_glb"] for r in results if r["status"] == "done"]
+    yield rigged_files or None, table
+
+threading.Thread(target=provision_environment, daemon=True, name="provision-environment").start()
 
 theme = gr.themes.Soft(
     primary_hue=gr.themes.colors.sky,
@@ -567,53 +2063,162 @@ theme = gr.themes.Soft(
     font=[gr.themes.GoogleFont("Inter"), "ui-sans-serif", "system-ui", "sans-serif"],
 )
 
-startup_error_message = None
-if not blender_executable_to_use:
-     startup_error_message = (f"CRITICAL STARTUP ERROR: Blender executable not located. Expected at {BLENDER_EXEC}")
-elif not unirig_repo_ok:
-     startup_error_message = (f"CRITICAL STARTUP ERROR: UniRig repository not found at {UNIRIG_REPO_DIR}.")
-elif not unirig_run_py_ok:
-      startup_error_message = (f"CRITICAL STARTUP ERROR: UniRig run.py not found at {UNIRIG_RUN_PY}.")
-
-if startup_error_message:
-    print(startup_error_message)
-    with gr.Blocks(theme=theme) as iface:
-        gr.Markdown(f"# Application Startup Error\n\n{startup_error_message}\n\nPlease check Space logs.")
-else:
-    with gr.Blocks(theme=theme) as iface:
+def environment_status_markdown() -> str:
+    snapshot = environment.snapshot()
+    lines = [f"**Environment: {snapshot['state']}** ({snapshot['message']})"]
+    if snapshot["state"] == READY:
+        lines.append(f"Device: **{get_device_type().upper()}**. Blender: `{blender_executable_to_use}`.")
+    elif snapshot["state"] != FAILED:
+        lines.append("Rig requests submitted now are queued until the environment is ready.")
+    return "  \n".join(lines)
+
+def environment_status_update():
+    # Keep polling until startup reaches a final state.
+    return environment_status_markdown(), gr.Timer(active=environment.state not in (READY, FAILED))
+
+# Uploads and Gradio's copies of our outputs are dropped on the same schedule as the artifact store's outputs.
+with gr.Blocks(theme=theme, delete_cache=(ARTIFACT_REAP_INTERVAL, ARTIFACT_TTL_SECONDS)) as iface:
+    gr.Markdown(
+         f"""
+         # UniRig Auto-Rigger (Blender {BLENDER_PYTHON_VERSION_DIR} / Python {BLENDER_PYTHON_VERSION})
+         Upload a `.glb` mesh. UniRig predicts skeleton and skinning weights via Blender's Python.
+         * App Python: `{sys.version.split()[0]}`, UniRig (Blender): `{BLENDER_PYTHON_VERSION}`.
+         * UniRig Source: [https://github.com/VAST-AI-Research/UniRig](https://github.com/VAST-AI-Research/UniRig)
+         """
+     )
+    with gr.Row():
+        environment_status = gr.Markdown(environment_status_markdown)
+    status_timer = gr.Timer(2.0)
+    with gr.Row():
+        with gr.Column(scale=1):
+            input_model = gr.File(
+                label="Upload .glb Mesh File",
+                type="filepath",
+                file_types=[".glb"]
+            )
+            with gr.Row():
+                submit_button = gr.Button("Rig Model", variant="primary")
+                cancel_button = gr.Button("Cancel", variant="stop")
+            with gr.Accordion("Skin + merge only", open=False):
+                gr.Markdown(
+                    "Re-run skinning and merging without predicting the skeleton again. "
+                    "Uses the uploaded skeleton `.fbx`, or the cached skeleton of this mesh if none is given."
+                )
+                input_skeleton = gr.File(
+                    label="Skeleton .fbx (optional)",
+                    type="filepath",
+                    file_types=[".fbx"]
+                )
+                skin_merge_button = gr.Button("Skin & Merge Only")
+        with gr.Column(scale=2):
+            output_model = gr.Model3D(
+                label="Rigged 3D Model (.glb)",
+                clear_color=[0.8, 0.8, 0.8, 1.0],
+            )
+            output_skeleton = gr.File(label="Predicted Skeleton (.fbx)")
+            progress_log = gr.Textbox(label="Progress log", lines=12, max_lines=12, autoscroll=True)
+    with gr.Accordion("Batch rigging", open=False):
         gr.Markdown(
-             f"""
-             # UniRig Auto-Rigger (Blender {BLENDER_PYTHON_VERSION_DIR} / Python {BLENDER_PYTHON_VERSION})
-             Upload a `.glb` mesh. UniRig predicts skeleton and skinning weights via Blender's Python.
-             * App Python: `{sys.version.split()[0]}`, UniRig (Blender): `{BLENDER_PYTHON_VERSION}`.
-             * Device: **{DEVICE.type.upper()}**.
-             * Blender: `{blender_executable_to_use}`.
-             * UniRig Source: [https://github.com/VAST-AI-Research/UniRig](https://github.com/VAST-AI-Research/UniRig)
-             """
-         )
+            "Rig many `.glb` files at once. Each stage runs once for the whole batch, "
+            "and a failing mesh only fails its own row."
+        )
         with gr.Row():
             with gr.Column(scale=1):
-                input_model = gr.File(
-                    label="Upload .glb Mesh File",
+                batch_input_models = gr.File(
+                    label="Upload .glb Mesh Files",
                     type="filepath",
-                    file_types=[".glb"]
+                    file_types=[".glb"],
+                    file_count="multiple"
                 )
-                submit_button = gr.Button("Rig Model", variant="primary")
+                with gr.Row():
+                    batch_button = gr.Button("Rig Batch", variant="primary")
+                    batch_cancel_button = gr.Button("Cancel Batch", variant="stop")
             with gr.Column(scale=2):
-                output_model = gr.Model3D(
-                    label="Rigged 3D Model (.glb)",
-                    clear_color=[0.8, 0.8, 0.8, 1.0],
-                )
-        submit_button.click(
-            fn=rig_glb_mesh_multistep,
-            inputs=[input_model],
-            outputs=[output_model]
+                batch_output_files = gr.File(label="Rigged Models (.glb)", file_count="multiple")
+                batch_report = gr.Dataframe(headers=["File", "Status", "Error"], label="Per-file results")
+    with gr.Accordion("Environment diagnostics", open=False):
+        gr.Markdown(
+            "The Blender environment is checked once at startup and whenever it changes. "
+            "Run the full diagnostic to re-check it now."
+        )
+        diagnostic_button = gr.Button("Run Full Diagnostic")
+        diagnostic_summary = gr.JSON(
+            label="Preflight verdict",
+            value=lambda: {key: value for key, value in (preflight_manifest or {}).items() if key != "log"}
         )
+        diagnostic_log = gr.Textbox(label="Diagnostic output", lines=20, max_lines=40)
+    status_timer.tick(
+        fn=environment_status_update,
+        inputs=[],
+        outputs=[environment_status, status_timer],
+        show_progress="hidden"
+    )
+    rig_event = submit_button.click(
+        fn=rig_glb_mesh_multistep,
+        inputs=[input_model],
+        outputs=[output_model, output_skeleton, progress_log],
+        api_name="rig",
+        concurrency_limit=MAX_ACTIVE_JOBS # The scheduler queues the stages
+    )
+    skin_merge_event = skin_merge_button.click(
+        fn=rig_glb_skin_merge_only,
+        inputs=[input_model, input_skeleton],
+        outputs=[output_model, output_skeleton, progress_log],
+        api_name="rig_skin_merge",
+        concurrency_limit=MAX_ACTIVE_JOBS # The scheduler queues the stages
+    )
+    # Cancelling closes the handler's generator, which kills the running step (see stream_pipeline_progress).
+    cancel_button.click(fn=None, inputs=None, outputs=None, cancels=[rig_event, skin_merge_event])
+    batch_event = batch_button.click(
+        fn=rig_glb_batch,
+        inputs=[batch_input_models],
+        outputs=[batch_output_files, batch_report],
+        api_name="rig_batch"
+    )
+    batch_cancel_button.click(fn=None, inputs=None, outputs=None, cancels=[batch_event])
+    diagnostic_button.click(
+        fn=run_full_diagnostic,
+        inputs=[],
+        outputs=[diagnostic_log, diagnostic_summary],
+        api_name="diagnostic"
+    )
 
 if __name__ == "__main__":
-    if 'iface' in locals():
-        print("Launching Gradio interface...")
-        iface.launch(share=False, ssr_mode=False)
-    else:
-        print("ERROR: Gradio interface not created due to startup errors. Check logs.")
-
+    import argparse
+    cli_parser = argparse.ArgumentParser(description="UniRig auto-rigging Space.")
+    cli_parser.add_argument("--batch", nargs="+", metavar="GLB", help="Rig these .glb files and exit instead of launching the UI.")
+    cli_parser.add_argument("--output-dir", default="rigged_output", help="Where --batch writes the rigged .glb files.")
+    cli_args = cli_parser.parse_args()
+    if cli_args.batch:
+        batch_results = run_rig_batch(cli_args.batch, output_dir=cli_args.output_dir)
+        for batch_result in batch_results:
+            print(f"[{batch_result['status'].upper()}] {batch_result['input']} -> {batch_result['rigged_glb'] or batch_result['error']}")
+        sys.exit(0 if all(r["status"] == "done" for r in batch_results) else 1)
+    import uvicorn
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse, PlainTextResponse
+    from job_api import JobManager, create_job_router
+    from job_store import JobStore
+
+    server_app = FastAPI()
+    job_manager = JobManager(JobStore(JOBS_DIR), run_api_job, max_running=API_MAX_RUNNING_JOBS,
+                             ttl_seconds=JOB_TTL_SECONDS)
+    server_app.include_router(create_job_router(job_manager, MAX_INPUT_BYTES, callback_hosts=API_CALLBACK_HOSTS))
+    register(Gauge("unirig_api_jobs", "Job API jobs by status.", ["status"],
+                   read=lambda: {(status,): count for status, count in job_manager.store.counts().items()}))
+
+    @server_app.get("/metrics", response_class=PlainTextResponse)
+    def metrics_endpoint():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+    @server_app.get("/health")
+    def health_endpoint():
+        # 200 only once rig requests can run; load balancers and probes can use the status code alone.
+        snapshot = environment.snapshot()
+        return JSONResponse(snapshot, status_code=200 if snapshot["state"] == READY else 503)
+
+    print(f"Launching Gradio interface (metrics at /metrics, health at /health, job API at /api/jobs) "
+          f"on {SERVER_NAME}:{SERVER_PORT}...")
+    server_app = gr.mount_gradio_app(server_app, iface, path="/", ssr_mode=False,
+                                     allowed_paths=[artifact_store.outputs_root])
+    uvicorn.run(server_app, host=SERVER_NAME, port=SERVER_PORT)
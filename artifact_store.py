@@ -0,0 +1,236 @@
+"""
+Managed on-disk store for the files a rig run produces.
+
+Layout under the root (a tmpfs such as /dev/shm or a disk path):
+
+    work/<prefix><pid>_<random>/               working directories and bootstrap scripts of running steps
+    outputs/<expires_at>_<random>/<file name>  published outputs, served until <expires_at> (unix time)
+
+Working directories belong to the process whose pid is in their name. They
+are deleted when their run finishes. The reaper deletes those whose process
+no longer exists. Outputs are published with a TTL and deleted by the reaper
+once it has passed. When the store goes over its byte quota, expired outputs
+are evicted first, then the outputs closest to expiry. Working directories of
+live runs are never evicted.
+
+The reaper also reclaims unirig_processing_*, unirig_diagnostic_* and
+blender_bootstrap_* files that crashed runs left behind in the system temp
+directory. It runs at startup and then on a timer.
+"""
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+ORPHAN_PREFIXES = ("unirig_processing_", "unirig_diagnostic_", "unirig_profile_", "blender_bootstrap_")
+_OWNER_PID = re.compile(r"^(?:unirig_processing_(?:batch_)?|unirig_diagnostic_|unirig_profile_|blender_bootstrap_)(\d+)_")
+
+
+def _path_bytes(path: str) -> int:
+    """Bytes under path. Hard-linked files (published outputs) are counted once."""
+    if not os.path.isdir(path):
+        try:
+            return os.lstat(path).st_size
+        except OSError:
+            return 0
+    total = 0
+    seen = set()
+    for dirpath, _dirnames, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                st = os.lstat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            if st.st_nlink > 1:
+                if (st.st_dev, st.st_ino) in seen:
+                    continue
+                seen.add((st.st_dev, st.st_ino))
+            total += st.st_size
+    return total
+
+
+def _remove(path: str):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ArtifactStore:
+    def __init__(self, root: str, max_bytes: int = 0, default_ttl_seconds: float = 3600,
+                 legacy_dirs: Sequence[str] = (), orphan_age_seconds: float = 6 * 3600,
+                 on_reclaim: Optional[Callable[[str, int], None]] = None):
+        """
+        max_bytes of 0 means no quota. legacy_dirs are scanned for orphans left outside the store,
+        which are reclaimed once older than orphan_age_seconds (their owner is unknown).
+        on_reclaim(reason, bytes) is called for every reclaimed entry, e.g. for metrics.
+        """
+        self.root = os.path.abspath(root)
+        self.work_root = os.path.join(self.root, "work")
+        self.outputs_root = os.path.join(self.root, "outputs")
+        self.max_bytes = max_bytes
+        self.default_ttl_seconds = default_ttl_seconds
+        self.legacy_dirs = [os.path.abspath(d) for d in legacy_dirs if os.path.abspath(d) != self.work_root]
+        self.orphan_age_seconds = orphan_age_seconds
+        self.on_reclaim = on_reclaim
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.reclaimed: Dict[str, int] = {"expired": 0, "quota": 0, "orphan": 0}
+        os.makedirs(self.work_root, exist_ok=True)
+        os.makedirs(self.outputs_root, exist_ok=True)
+
+    # --- Working files ---
+
+    def new_workdir(self, prefix: str = "unirig_processing_") -> str:
+        """Creates a working directory owned by this process. Delete it with release() when done."""
+        return tempfile.mkdtemp(prefix=f"{prefix}{os.getpid()}_", dir=self.work_root)
+
+    def new_workfile(self, prefix: str = "blender_bootstrap_", suffix: str = "", mode: str = "w"):
+        """An open NamedTemporaryFile (delete=False) in the work area, owned by this process."""
+        return tempfile.NamedTemporaryFile(mode=mode, delete=False, prefix=f"{prefix}{os.getpid()}_",
+                                           suffix=suffix, dir=self.work_root)
+
+    def release(self, path: Optional[str]):
+        if path and os.path.exists(path):
+            _remove(path)
+
+    # --- Outputs ---
+
+    def publish(self, source_path: str, ttl_seconds: Optional[float] = None, name: Optional[str] = None) -> str:
+        """
+        Copies source_path into the outputs area (a hard link when on the same filesystem) and returns
+        the new path. It stays there for ttl_seconds (the store default when None), whatever happens
+        to the source afterwards.
+        """
+        ttl = self.default_ttl_seconds if ttl_seconds is None else ttl_seconds
+        entry_dir = os.path.join(self.outputs_root, f"{int(time.time() + ttl)}_{uuid.uuid4().hex[:12]}")
+        os.makedirs(entry_dir)
+        path = os.path.join(entry_dir, name or os.path.basename(source_path))
+        try:
+            os.link(source_path, path)
+        except OSError:
+            shutil.copyfile(source_path, path)
+        if self.max_bytes > 0:
+            self.enforce_quota(keep=entry_dir)
+        return path
+
+    def _outputs(self) -> List[Tuple[float, str]]:
+        entries = []
+        try:
+            names = os.listdir(self.outputs_root)
+        except OSError:
+            return entries
+        for name in names:
+            expires_at = name.split("_", 1)[0]
+            if expires_at.isdigit():
+                entries.append((float(expires_at), os.path.join(self.outputs_root, name)))
+        return sorted(entries)
+
+    # --- Reclaiming ---
+
+    def _reclaim(self, path: str, reason: str):
+        size = _path_bytes(path)
+        _remove(path)
+        with self._lock:
+            self.reclaimed[reason] += 1
+        print(f"[Artifacts] Reclaimed {path} ({size} bytes, {reason})")
+        if self.on_reclaim:
+            self.on_reclaim(reason, size)
+
+    def enforce_quota(self, keep: Optional[str] = None):
+        """Evicts expired outputs, then the outputs closest to expiry, until the store fits max_bytes."""
+        total = _path_bytes(self.root)
+        now = time.time()
+        for expires_at, path in self._outputs():
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            size = _path_bytes(path)
+            self._reclaim(path, "expired" if expires_at <= now else "quota")
+            total -= size
+        if total > self.max_bytes:
+            print(f"[Artifacts] Over quota ({total} > {self.max_bytes} bytes) with only live files left.")
+
+    def reap(self) -> int:
+        """Deletes expired outputs and orphaned working files. Returns the number of entries reclaimed."""
+        reclaimed = 0
+        now = time.time()
+        for expires_at, path in self._outputs():
+            if expires_at > now:
+                break
+            self._reclaim(path, "expired")
+            reclaimed += 1
+        for directory in [self.work_root] + self.legacy_dirs:
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                if not name.startswith(ORPHAN_PREFIXES):
+                    continue
+                path = os.path.join(directory, name)
+                if self._is_orphan(name, path, now):
+                    self._reclaim(path, "orphan")
+                    reclaimed += 1
+        if self.max_bytes > 0:
+            self.enforce_quota()
+        return reclaimed
+
+    def _is_orphan(self, name: str, path: str, now: float) -> bool:
+        owner = _OWNER_PID.match(name)
+        if owner:
+            pid = int(owner.group(1))
+            if pid == os.getpid():
+                return False  # This process deletes its own files when its runs finish.
+            if not _pid_alive(pid):
+                return True
+        try:
+            return now - os.lstat(path).st_mtime > self.orphan_age_seconds
+        except OSError:
+            return False
+
+    def start_reaper(self, interval_seconds: float):
+        """Reaps once now, then every interval_seconds in a daemon thread. Idempotent."""
+        if self._reaper is not None:
+            return
+
+        def loop():
+            while True:
+                try:
+                    self.reap()
+                except Exception as e:
+                    print(f"[Artifacts] Reaper pass failed: {e}")
+                if self._stop.wait(interval_seconds):
+                    return
+
+        self._reaper = threading.Thread(target=loop, daemon=True, name="artifact-reaper")
+        self._reaper.start()
+
+    def stop_reaper(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            reclaimed = dict(self.reclaimed)
+        return {"work_bytes": _path_bytes(self.work_root), "output_bytes": _path_bytes(self.outputs_root),
+                "outputs": len(self._outputs()), "max_bytes": self.max_bytes,
+                **{f"reclaimed_{reason}": count for reason, count in reclaimed.items()}}
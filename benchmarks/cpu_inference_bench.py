@@ -0,0 +1,121 @@
+"""
+Latency and skin-weight accuracy of the CPU inference profiles (blender_hooks.install_cpu_inference_profile)
+against the fp32 baseline.
+
+The model stands in for UniRig's skin stage: a transformer encoder over point
+tokens and over joint tokens, and per-vertex weights from a softmax over
+point-joint attention logits. It has random weights at UniRig's width and
+depth. Every profile runs a deep copy of the same model through the same code
+the Blender steps use: optimize_model_for_cpu() and cpu_autocast(). Its
+weights are then compared with the fp32 weights: the largest and the mean
+absolute difference, and how often the strongest joint of a vertex changes.
+Needs torch; run it on the CPU type that serves the overflow traffic, as bf16
+only pays off with native support.
+
+    python benchmarks/cpu_inference_bench.py --profiles fp32 int8 bf16 compile int8,compile --threads 8
+"""
+import argparse
+import copy
+import json
+import os
+import statistics
+import sys
+import time
+
+import torch
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from blender_hooks import cpu_autocast, cpu_numerics, optimize_model_for_cpu  # noqa: E402
+
+
+class SkinHead(torch.nn.Module):
+    def __init__(self, width: int, layers: int, heads: int):
+        super().__init__()
+        self.point_embed = torch.nn.Linear(6, width)
+        self.joint_embed = torch.nn.Linear(6, width)
+        encoder_layer = torch.nn.TransformerEncoderLayer(width, heads, 4 * width, batch_first=True, dropout=0.0)
+        self.points = torch.nn.TransformerEncoder(encoder_layer, layers, enable_nested_tensor=False)
+        self.joints = torch.nn.TransformerEncoder(copy.deepcopy(encoder_layer), 2, enable_nested_tensor=False)
+        self.query = torch.nn.Linear(width, width)
+        self.key = torch.nn.Linear(width, width)
+
+    def forward(self, points, joints):
+        point_features = self.points(self.point_embed(points))
+        joint_features = self.joints(self.joint_embed(joints))
+        logits = self.query(point_features) @ self.key(joint_features).transpose(1, 2)
+        return torch.softmax(logits.float() / point_features.shape[-1] ** 0.5, dim=-1)
+
+
+def run_profile(model, optimizations, inputs, repeats: int, warmup: int):
+    model = copy.deepcopy(model)
+    applied = optimize_model_for_cpu(model, optimizations)
+    numerics = cpu_numerics(torch, optimizations)
+    timings = []
+    with torch.inference_mode():
+        for i in range(warmup + repeats):
+            started = time.perf_counter()
+            with cpu_autocast(torch, optimizations):
+                weights = model(*inputs)
+            if i >= warmup:
+                timings.append(time.perf_counter() - started)
+    return weights.float(), timings, sorted(set(applied + numerics))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU inference profiles vs fp32: latency and skin weights.")
+    parser.add_argument("--profiles", nargs="+", default=["fp32", "int8", "bf16", "compile"],
+                        help="Comma-separated optimizations per profile (bf16, int8, compile); fp32 is the baseline.")
+    parser.add_argument("--points", type=int, default=4096)
+    parser.add_argument("--joints", type=int, default=52)
+    parser.add_argument("--width", type=int, default=768)
+    parser.add_argument("--layers", type=int, default=8)
+    parser.add_argument("--heads", type=int, default=12)
+    parser.add_argument("--threads", type=int, default=len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity")
+                        else os.cpu_count())
+    parser.add_argument("--interop-threads", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed runs first (compilation happens here).")
+    parser.add_argument("--json", help="Also write the reports to this JSON file.")
+    options = parser.parse_args()
+
+    torch.set_num_threads(options.threads)
+    torch.set_num_interop_threads(options.interop_threads)
+    torch.set_flush_denormal(True)
+    torch.manual_seed(0)
+    model = SkinHead(options.width, options.layers, options.heads).eval()
+    inputs = (torch.randn(1, options.points, 6), torch.randn(1, options.joints, 6))
+
+    baseline, baseline_timings, _ = run_profile(model, [], inputs, options.repeats, options.warmup)
+    baseline_p50 = statistics.median(baseline_timings)
+    reports = []
+    for profile in options.profiles:
+        optimizations = [o for o in profile.split(",") if o and o != "fp32"]
+        weights, timings, applied = ((baseline, baseline_timings, []) if not optimizations else
+                                     run_profile(model, optimizations, inputs, options.repeats, options.warmup))
+        error = (weights - baseline).abs()
+        report = {
+            "profile": profile,
+            "applied": applied,
+            "threads": options.threads,
+            "p50_seconds": round(statistics.median(timings), 4),
+            "speedup": round(baseline_p50 / statistics.median(timings), 2),
+            "max_weight_error": round(float(error.max()), 5),
+            "mean_weight_error": round(float(error.mean()), 6),
+            "top_joint_changed": round(float((weights.argmax(-1) != baseline.argmax(-1)).float().mean()), 5),
+        }
+        reports.append(report)
+        print(f"{profile:>16} ({', '.join(applied) or 'fp32'}): {report['p50_seconds']:.3f}s p50, "
+              f"{report['speedup']:.2f}x, max weight error {report['max_weight_error']:.5f}, "
+              f"mean {report['mean_weight_error']:.6f}, top joint changed on {report['top_joint_changed']:.2%} "
+              f"of vertices")
+        if "bf16" in profile and "bf16" not in applied:
+            print(f"{'':>18}bf16 skipped: no native bf16 on this CPU")
+    if options.json:
+        with open(options.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
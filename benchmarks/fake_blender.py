@@ -0,0 +1,36 @@
+"""
+Stand-in for `blender --background --python <script> -- <args>`.
+
+Runs the script with the current Python interpreter after a simulated startup
+delay, with sys.argv shaped like Blender's, so the bootstrap script and
+blender_worker.py run unmodified. Unlike Blender, an uncaught exception in the
+script gives a non-zero exit code (as with --python-exit-code 1).
+
+    UNIRIG_FAKE_BLENDER_STARTUP_SECONDS   simulated launch cost (default 0.5)
+"""
+import os
+import runpy
+import sys
+import time
+import traceback
+
+
+def main(argv):
+    if "--python" not in argv:
+        print("fake_blender: only '--background --python <script> -- ...' is supported", file=sys.stderr)
+        return 2
+    script_path = argv[argv.index("--python") + 1]
+    time.sleep(float(os.environ.get("UNIRIG_FAKE_BLENDER_STARTUP_SECONDS", "0.5")))
+    sys.argv = ["blender"] + argv
+    try:
+        runpy.run_path(script_path, run_name="__main__")
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
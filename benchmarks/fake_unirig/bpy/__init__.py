@@ -0,0 +1,8 @@
+"""Minimal bpy stand-in so the environment diagnostic passes under benchmarks/fake_blender.py."""
+
+
+class _App:
+    version_string = "fake"
+
+
+app = _App()
@@ -0,0 +1,68 @@
+"""
+Stand-in for UniRig's run.py. Accepts the same `--config-name=<name> with key=value ...`
+arguments, sleeps for a simulated stage latency and writes the output file.
+
+Latency per stage = base + per-MB cost of the input:
+    UNIRIG_FAKE_SKELETON_SECONDS (default 2.0)   UNIRIG_FAKE_SKIN_SECONDS (1.5)
+    UNIRIG_FAKE_MERGE_SECONDS (0.5)              UNIRIG_FAKE_SECONDS_PER_MB (0.2)
+"""
+import os
+import shutil
+import sys
+import time
+
+STAGES = {
+    "skeleton_config": "UNIRIG_FAKE_SKELETON_SECONDS",
+    "skin_config": "UNIRIG_FAKE_SKIN_SECONDS",
+    "merge_config": "UNIRIG_FAKE_MERGE_SECONDS",
+}
+DEFAULT_SECONDS = {"skeleton_config": 2.0, "skin_config": 1.5, "merge_config": 0.5}
+
+
+def parse_args(argv):
+    config_name = None
+    options = {}
+    for arg in argv:
+        if arg.startswith("--config-name="):
+            config_name = arg.split("=", 1)[1]
+        elif "=" in arg:
+            key, value = arg.split("=", 1)
+            options[key] = value
+    return config_name, options
+
+
+def main(argv):
+    config_name, options = parse_args(argv)
+    if config_name not in STAGES:
+        print(f"fake run.py: unknown config {config_name!r}", file=sys.stderr)
+        return 2
+    source = options.get("source_path") or options.get("input")
+    output = options.get("output_path") or options.get("output")
+    if not source or not os.path.exists(source):
+        print(f"fake run.py: input not found: {source}", file=sys.stderr)
+        return 1
+
+    size_mb = os.path.getsize(source) / 1024**2
+    seconds = (float(os.environ.get(STAGES[config_name], DEFAULT_SECONDS[config_name]))
+               + float(os.environ.get("UNIRIG_FAKE_SECONDS_PER_MB", "0.2")) * size_mb)
+    steps = 4
+    for step in range(steps):
+        time.sleep(seconds / steps)
+        sys.stderr.write(f"\rPredicting DataLoader 0: {100 * (step + 1) // steps}%|####| {step + 1}/{steps}")
+        sys.stderr.flush()
+    sys.stderr.write("\n")
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    if config_name == "merge_config":
+        # The rigged result is a GLB; hand back the target mesh unchanged.
+        shutil.copyfile(options["target_path"], output)
+    else:
+        with open(source, "rb") as src, open(output, "wb") as dst:
+            dst.write(b"FAKEFBX\n")
+            shutil.copyfileobj(src, dst)
+    print(f"fake run.py: {config_name} wrote {output} in {seconds:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
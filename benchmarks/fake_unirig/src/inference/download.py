@@ -0,0 +1,5 @@
+"""Stand-in for UniRig's checkpoint downloader; the fake run.py needs no checkpoints."""
+
+
+def download(*args, **kwargs):
+    return None
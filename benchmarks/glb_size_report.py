@@ -0,0 +1,167 @@
+"""
+Size and latency report of the post-merge GLB optimization (glb_optimize.py) against the raw merge output.
+
+Generates skinned grid GLBs the way a merge step writes them: float positions
+and normals, 32-bit indices, and two JOINTS/WEIGHTS sets (8 influences with
+smooth falloff around random bones). Each is optimized. The report shows raw
+versus optimized bytes, time per step, estimated transfer times, and the
+largest weight change. It also shows the largest vertex displacement after
+linear blend skinning in a random pose, which checks that the folded
+dequantization reproduces the posed mesh. Needs numpy.
+
+    python benchmarks/glb_size_report.py --vertices 10000 100000 1000000 --max-influences 4 --json report.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from glb_optimize import COMPRESSIONS, GLBDocument, _matrix_from_gltf, optimize_glb  # noqa: E402
+from glb_inspector import CHUNK_BIN, CHUNK_JSON, GLB_MAGIC  # noqa: E402
+
+
+def skinned_grid(vertex_count: int, bones: int, seed: int):
+    rng = np.random.default_rng(seed)
+    side = max(2, int(np.sqrt(vertex_count)))
+    xs = np.linspace(-0.5, 0.5, side)
+    x, z = np.meshgrid(xs, xs)
+    y = 0.05 * np.sin(6 * x) * np.cos(5 * z) + rng.uniform(0, 0.002, x.shape)
+    positions = np.stack([x.ravel(), y.ravel(), z.ravel()], axis=1)
+    normals = np.tile([0.0, 1.0, 0.0], (len(positions), 1))
+    index = np.arange(side * side).reshape(side, side)
+    a, b = index[:-1, :-1].ravel(), index[:-1, 1:].ravel()
+    c, d = index[1:, :-1].ravel(), index[1:, 1:].ravel()
+    faces = np.concatenate([np.stack([a, c, b], 1), np.stack([b, c, d], 1)]).astype(np.uint32)
+    bone_positions = rng.uniform(-0.5, 0.5, (bones, 3))
+    distances = np.linalg.norm(positions[:, None, :] - bone_positions[None], axis=2)
+    joints = np.argsort(distances, axis=1)[:, :8]
+    weights = np.exp(-(np.take_along_axis(distances, joints, axis=1) / 0.15) ** 2) + 1e-3
+    weights /= weights.sum(axis=1, keepdims=True)
+    inverse_bind = np.repeat(np.eye(4)[None], bones, axis=0)
+    inverse_bind[:, :3, 3] = -bone_positions
+    return positions, normals, faces, joints, weights, inverse_bind, bone_positions
+
+
+def write_skinned_glb(path: str, positions, normals, faces, joints, weights, inverse_bind):
+    arrays = [
+        (positions.astype("<f4"), 5126, "VEC3", 34962, True),
+        (normals.astype("<f4"), 5126, "VEC3", 34962, False),
+        (joints[:, :4].astype("<u2"), 5123, "VEC4", 34962, False),
+        (weights[:, :4].astype("<f4"), 5126, "VEC4", 34962, False),
+        (joints[:, 4:].astype("<u2"), 5123, "VEC4", 34962, False),
+        (weights[:, 4:].astype("<f4"), 5126, "VEC4", 34962, False),
+        (faces.reshape(-1, 1).astype("<u4"), 5125, "SCALAR", 34963, False),
+        (inverse_bind.transpose(0, 2, 1).reshape(-1, 16).astype("<f4"), 5126, "MAT4", None, False),
+    ]
+    views, accessors, chunks, offset = [], [], [], 0
+    for data, component_type, accessor_type, target, bounds in arrays:
+        raw = data.tobytes()
+        view = {"buffer": 0, "byteOffset": offset, "byteLength": len(raw)}
+        if target:
+            view["target"] = target
+        accessor = {"bufferView": len(views), "componentType": component_type, "count": len(data),
+                    "type": accessor_type}
+        if bounds:
+            accessor.update(min=data.min(axis=0).tolist(), max=data.max(axis=0).tolist())
+        views.append(view)
+        accessors.append(accessor)
+        chunks.append(raw + b"\x00" * ((-len(raw)) % 4))
+        offset += len(chunks[-1])
+    bones = len(inverse_bind)
+    gltf = {
+        "asset": {"version": "2.0", "generator": "unirig-space glb_size_report"},
+        "scene": 0,
+        "scenes": [{"nodes": [0, 1]}],
+        "nodes": [{"mesh": 0, "skin": 0, "name": "body"}, {"name": "root", "children": list(range(2, 2 + bones))}]
+                 + [{"name": f"bone_{i}"} for i in range(bones)],
+        "meshes": [{"primitives": [{"attributes": {"POSITION": 0, "NORMAL": 1, "JOINTS_0": 2, "WEIGHTS_0": 3,
+                                                   "JOINTS_1": 4, "WEIGHTS_1": 5}, "indices": 6}]}],
+        "skins": [{"joints": list(range(2, 2 + bones)), "inverseBindMatrices": 7}],
+        "buffers": [{"byteLength": offset}],
+        "bufferViews": views,
+        "accessors": accessors,
+    }
+    binary = b"".join(chunks)
+    json_chunk = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+    json_chunk += b" " * ((-len(json_chunk)) % 4)
+    with open(path, "wb") as f:
+        f.write(np.array([GLB_MAGIC, 2, 28 + len(json_chunk) + len(binary)], dtype="<u4").tobytes())
+        f.write(np.array([len(json_chunk), CHUNK_JSON], dtype="<u4").tobytes() + json_chunk)
+        f.write(np.array([len(binary), CHUNK_BIN], dtype="<u4").tobytes() + binary)
+
+
+def posed_vertices(path: str, joint_world: np.ndarray) -> np.ndarray:
+    """Linear blend skinning of the file's first primitive, with the given world matrix per joint."""
+    document = GLBDocument.load(path)
+    primitive = document.gltf["meshes"][0]["primitives"][0]
+    attributes = primitive["attributes"]
+    skin = document.gltf["skins"][0]
+    inverse_bind = _matrix_from_gltf(document.read_float(skin["inverseBindMatrices"]).reshape(-1))
+    skinning = joint_world @ inverse_bind
+    positions = document.read_float(attributes["POSITION"])
+    homogeneous = np.hstack([positions, np.ones((len(positions), 1))])
+    posed = np.zeros_like(homogeneous)
+    set_index = 0
+    while f"JOINTS_{set_index}" in attributes:
+        joints = document.read(attributes[f"JOINTS_{set_index}"]).astype(np.int64)
+        weights = document.read_float(attributes[f"WEIGHTS_{set_index}"])
+        for column in range(4):
+            posed += weights[:, column:column + 1] * np.einsum("nij,nj->ni", skinning[joints[:, column]], homogeneous)
+        set_index += 1
+    return posed[:, :3]
+
+
+def run_case(vertex_count: int, bones: int, max_influences: int, compression: str, work_dir: str):
+    data = skinned_grid(vertex_count, bones, seed=vertex_count)
+    raw_path = os.path.join(work_dir, f"raw_{vertex_count}.glb")
+    optimized_path = os.path.join(work_dir, f"optimized_{vertex_count}.glb")
+    write_skinned_glb(raw_path, *data[:6])
+    report = optimize_glb(raw_path, optimized_path, max_influences=max_influences, compression=compression)
+    rng = np.random.default_rng(1)
+    joint_world = np.repeat(np.eye(4)[None], bones, axis=0)
+    joint_world[:, :3, 3] = data[6] + rng.normal(0, 0.05, (bones, 3))
+    if report.get("compression"):
+        report["max_posed_displacement"] = None  # The compressed file needs the tool's decoder to read back
+    else:
+        displacement = np.linalg.norm(posed_vertices(raw_path, joint_world)
+                                      - posed_vertices(optimized_path, joint_world), axis=1)
+        report["max_posed_displacement"] = round(float(displacement.max()), 6)
+    report["vertices"] = len(data[0])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Raw vs optimized rigged GLB size and latency.")
+    parser.add_argument("--vertices", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--bones", type=int, default=40)
+    parser.add_argument("--max-influences", type=int, default=4)
+    parser.add_argument("--compression", choices=COMPRESSIONS, default="auto")
+    parser.add_argument("--json", help="Also write the reports to this JSON file.")
+    options = parser.parse_args()
+    reports = []
+    with tempfile.TemporaryDirectory(prefix="glb_size_report_") as work_dir:
+        for vertex_count in options.vertices:
+            report = run_case(vertex_count, options.bones, options.max_influences, options.compression, work_dir)
+            reports.append(report)
+            steps = ", ".join(f"{s['step']} {s['bytes'] / 1024**2:.2f} MB in {s['seconds']:.2f}s" for s in report["steps"])
+            print(f"{report['vertices']:>9,} vertices: {report['raw_bytes'] / 1024**2:7.2f} MB -> "
+                  f"{report['optimized_bytes'] / 1024**2:7.2f} MB ({report['ratio']:.1%}), "
+                  f"10 Mbit/s {report['transfer_seconds']['raw']['10mbps']:.1f}s -> "
+                  f"{report['transfer_seconds']['optimized']['10mbps']:.1f}s, "
+                  f"max weight change {report['steps'][0]['max_weight_error']:.4f}, "
+                  f"max posed displacement {report['max_posed_displacement']}, "
+                  f"compression {report.get('compression') or 'none'}")
+            print(f"{'':>20}{steps}")
+    if options.json:
+        with open(options.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
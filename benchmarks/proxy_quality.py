@@ -0,0 +1,99 @@
+"""
+Quality and cost of the decimate-then-transfer proxy mode (proxy_mesh.py) against full resolution.
+
+A dense wavy surface gets smooth synthetic skin weights (Gaussian falloff around
+random "bones", top-4 pruned). These weights play the part of a perfect
+full-resolution prediction. The mesh is decimated to each face budget. The
+proxy receives the same weights function, which stands in for UniRig
+predicting on the proxy. Those weights are then transferred back to the
+full-resolution vertices and compared with the reference. Nearest-vertex
+transfer is reported as a baseline. Needs numpy, scipy and fast-simplification
+(present in Blender's Python):
+
+    python benchmarks/proxy_quality.py --vertices 250000 1000000 --budgets 20000 50000 100000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from glb_inspector import RUNTIME_MODEL  # noqa: E402
+from proxy_mesh import prune_weights, simplify_mesh, transfer_weights  # noqa: E402
+
+
+def wavy_grid(vertex_count: int):
+    side = max(2, int(np.sqrt(vertex_count)))
+    xs = np.linspace(-1.0, 1.0, side)
+    x, z = np.meshgrid(xs, xs)
+    y = 0.15 * np.sin(4 * x) * np.cos(3 * z)
+    vertices = np.stack([x.ravel(), y.ravel(), z.ravel()], axis=1)
+    index = np.arange(side * side).reshape(side, side)
+    a, b = index[:-1, :-1].ravel(), index[:-1, 1:].ravel()
+    c, d = index[1:, :-1].ravel(), index[1:, 1:].ravel()
+    faces = np.concatenate([np.stack([a, c, b], 1), np.stack([b, c, d], 1)])
+    return vertices, faces
+
+
+def synthetic_weights(points: np.ndarray, bones: np.ndarray, sigma: float = 0.35) -> np.ndarray:
+    distances = ((points[:, None, :] - bones[None, :, :]) ** 2).sum(axis=2)
+    return prune_weights(np.exp(-distances / sigma**2).astype(np.float32))
+
+
+def nearest_vertex_transfer(source_vertices, source_weights, target_vertices):
+    from scipy.spatial import cKDTree
+    _, nearest = cKDTree(source_vertices).query(target_vertices)
+    return source_weights[nearest]
+
+
+def compare(weights: np.ndarray, reference: np.ndarray):
+    error = 0.5 * np.abs(weights - reference).sum(axis=1)  # Per-vertex total variation, 0..1
+    dominant = (weights.argmax(axis=1) == reference.argmax(axis=1)).mean()
+    return float(error.mean()), float(np.percentile(error, 99)), float(dominant)
+
+
+def estimated_inference_seconds(vertex_count: int) -> float:
+    return sum(RUNTIME_MODEL[stage]["base"] + RUNTIME_MODEL[stage]["per_million_vertices"] * vertex_count / 1e6
+               for stage in ("skeleton", "skin"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Proxy-mesh weight transfer quality benchmark.")
+    parser.add_argument("--vertices", type=int, nargs="+", default=[250000, 1000000])
+    parser.add_argument("--budgets", type=int, nargs="+", default=[20000, 50000, 100000],
+                        help="Proxy face budgets (UNIRIG_PROXY_TARGET_FACES).")
+    parser.add_argument("--bones", type=int, default=24)
+    parser.add_argument("--seed", type=int, default=0)
+    cli_args = parser.parse_args()
+
+    rng = np.random.default_rng(cli_args.seed)
+    print(f"{'vertices':>9} {'faces':>9} {'budget':>7} {'simplify s':>10} {'transfer s':>10} "
+          f"{'err mean':>8} {'err p99':>8} {'dominant':>8} {'nn err':>8} {'est. GPU s saved':>16}")
+    for vertex_count in cli_args.vertices:
+        vertices, faces = wavy_grid(vertex_count)
+        bones = rng.uniform(-1.0, 1.0, size=(cli_args.bones, 3)) * np.array([1.0, 0.15, 1.0])
+        reference = synthetic_weights(vertices, bones)
+        for budget in cli_args.budgets:
+            started = time.perf_counter()
+            proxy_vertices, proxy_faces = simplify_mesh(vertices, faces, budget)
+            simplify_seconds = time.perf_counter() - started
+            proxy_weights = synthetic_weights(proxy_vertices, bones)
+
+            started = time.perf_counter()
+            transferred = prune_weights(transfer_weights(proxy_vertices, proxy_faces, proxy_weights, vertices))
+            transfer_seconds = time.perf_counter() - started
+            mean_error, p99_error, dominant = compare(transferred, reference)
+            nn_error = compare(nearest_vertex_transfer(proxy_vertices, proxy_weights, vertices), reference)[0]
+            saved = estimated_inference_seconds(len(vertices)) - estimated_inference_seconds(len(proxy_vertices))
+            print(f"{len(vertices):>9} {len(faces):>9} {budget:>7} {simplify_seconds:>10.2f} {transfer_seconds:>10.2f} "
+                  f"{mean_error:>8.4f} {p99_error:>8.4f} {dominant:>8.3f} {nn_error:>8.4f} {saved:>16.1f}")
+    print("err = per-vertex total-variation distance to the full-resolution weights (0 = identical); "
+          "dominant = share of vertices with the same strongest bone; nn = nearest-vertex baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Offline benchmarks for the orchestration layer in app.py.
+
+Blender and UniRig are replaced by benchmarks/fake_blender.py and
+benchmarks/fake_unirig/run.py, which simulate launch and stage latency and
+write real output files. Everything else (subprocesses, bootstrap scripts,
+worker pool, caches, scheduler, temp files) is the production code path, so
+regressions in that overhead show up here. Runs on a CPU-only machine without
+network access.
+
+    python benchmarks/run_benchmarks.py                       # all scenarios
+    python benchmarks/run_benchmarks.py --scenario concurrent --users 8 --jobs 16
+    python benchmarks/run_benchmarks.py --json results.json
+
+Scenarios:
+    single      jobs run one after another through rig_glb_mesh_multistep
+    concurrent  --users threads submit jobs at the same time
+    batch       all inputs through run_rig_batch (one Blender launch per stage)
+    fused       the single scenario on the three-launch path, then with UNIRIG_FUSED_PIPELINE;
+                reports the per-job time saved
+Every input is a fresh synthetic GLB, so the result and stage caches miss.
+
+--devices N simulates N local CPU devices (UNIRIG_DEVICES=cpu:0,...) and
+--remote-workers M starts M local remote_worker.py servers as stand-ins for
+remote hosts, so skeleton/skin placement and retries run as on a multi-GPU box.
+"""
+import argparse
+import json
+import os
+import resource
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+BENCHMARK_DIR = os.path.abspath(os.path.dirname(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+from synthetic_glb import make_glb  # noqa: E402
+
+# Simulated latencies, kept short so a full run takes about a minute. Exported values win.
+FAKE_LATENCY_DEFAULTS = {
+    "UNIRIG_FAKE_BLENDER_STARTUP_SECONDS": "0.3",
+    "UNIRIG_FAKE_SKELETON_SECONDS": "0.5",
+    "UNIRIG_FAKE_SKIN_SECONDS": "0.4",
+    "UNIRIG_FAKE_MERGE_SECONDS": "0.2",
+    "UNIRIG_FAKE_SECONDS_PER_MB": "0.2",
+}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(name: str, latencies: List[float], elapsed: float, failures: int) -> Dict[str, Any]:
+    return {
+        "scenario": name,
+        "jobs": len(latencies) + failures,
+        "failures": failures,
+        "p50_seconds": round(percentile(latencies, 0.50), 3),
+        "p95_seconds": round(percentile(latencies, 0.95), 3),
+        "jobs_per_min": round(60.0 * len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "elapsed_seconds": round(elapsed, 3),
+    }
+
+
+def write_fake_blender(work_dir: str) -> str:
+    """The app expects a single executable; wrap fake_blender.py with this interpreter."""
+    launcher = os.path.join(work_dir, "blender")
+    with open(launcher, "w") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(BENCHMARK_DIR, "fake_blender.py")}" "$@"\n')
+    os.chmod(launcher, os.stat(launcher).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return launcher
+
+
+def start_remote_workers(count: int, blender: str, work_dir: str) -> List[subprocess.Popen]:
+    """Starts local remote_worker.py servers on free ports; their URLs are in process.url."""
+    from remote_worker import RemoteWorker
+    processes = []
+    for index in range(count):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        log = open(os.path.join(work_dir, f"remote_worker_{index}.log"), "w")
+        process = subprocess.Popen([sys.executable, os.path.join(REPO_ROOT, "remote_worker.py"),
+                                    "--blender", blender, "--unirig-dir", os.path.join(BENCHMARK_DIR, "fake_unirig"),
+                                    "--port", str(port), "--device-arg", "device=cpu"],
+                                   stdout=log, stderr=subprocess.STDOUT)
+        process.url = f"http://127.0.0.1:{port}"
+        processes.append(process)
+    for process in processes:
+        deadline = time.time() + 30
+        while RemoteWorker(process.url, connect_timeout=1).health() is None:
+            if time.time() > deadline or process.poll() is not None:
+                raise RuntimeError(f"Remote worker {process.url} did not start.")
+            time.sleep(0.2)
+    return processes
+
+
+class InputFactory:
+    def __init__(self, input_dir: str, vertex_counts: List[int]):
+        self.input_dir = input_dir
+        self.vertex_counts = vertex_counts
+        self._seed = 0
+        self._lock = threading.Lock()
+
+    def next(self) -> str:
+        with self._lock:
+            self._seed += 1
+            seed = self._seed
+        count = self.vertex_counts[seed % len(self.vertex_counts)]
+        return make_glb(os.path.join(self.input_dir, f"grid_{count}_{seed}.glb"), count, seed)
+
+
+def rig_one(app, input_glb_path: str) -> float:
+    started = time.perf_counter()
+    outputs = None
+    for outputs in app.rig_glb_mesh_multistep(input_glb_path, progress=lambda *args, **kwargs: None):
+        pass
+    if not outputs or not outputs[0]:
+        raise RuntimeError(f"No rigged output for {input_glb_path}")
+    return time.perf_counter() - started
+
+
+def run_single(app, inputs: InputFactory, jobs: int) -> Dict[str, Any]:
+    latencies, failures = [], 0
+    started = time.perf_counter()
+    for _ in range(jobs):
+        try:
+            latencies.append(rig_one(app, inputs.next()))
+        except Exception as e:
+            print(f"[Benchmark] single: job failed: {e}")
+            failures += 1
+    return summarize("single", latencies, time.perf_counter() - started, failures)
+
+
+def run_concurrent(app, inputs: InputFactory, jobs: int, users: int) -> Dict[str, Any]:
+    latencies, failures = [], [0]
+    lock = threading.Lock()
+    job_paths = [inputs.next() for _ in range(jobs)]
+
+    def user(paths):
+        for path in paths:
+            try:
+                latency = rig_one(app, path)
+                with lock:
+                    latencies.append(latency)
+            except Exception as e:
+                print(f"[Benchmark] concurrent: job failed: {e}")
+                with lock:
+                    failures[0] += 1
+
+    threads = [threading.Thread(target=user, args=(job_paths[i::users],)) for i in range(users)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize("concurrent", latencies, time.perf_counter() - started, failures[0])
+    result["users"] = users
+    return result
+
+
+def run_batch(app, inputs: InputFactory, jobs: int, output_dir: str) -> Dict[str, Any]:
+    paths = [inputs.next() for _ in range(jobs)]
+    started = time.perf_counter()
+    results = app.run_rig_batch(paths, output_dir=output_dir)
+    elapsed = time.perf_counter() - started
+    done = [r for r in results if r["status"] == "done"]
+    # A batch finishes all inputs together; every input's latency is the batch wall time.
+    return summarize("batch", [elapsed] * len(done), elapsed, len(results) - len(done))
+
+
+def run_fused(app, inputs: InputFactory, jobs: int) -> Dict[str, Any]:
+    previous = app.FUSED_PIPELINE
+    try:
+        app.FUSED_PIPELINE = False
+        three_launch = run_single(app, inputs, jobs)
+        app.FUSED_PIPELINE = True
+        result = run_single(app, inputs, jobs)
+    finally:
+        app.FUSED_PIPELINE = previous
+    result.update(scenario="fused", three_launch_p50_seconds=three_launch["p50_seconds"],
+                  three_launch_failures=three_launch["failures"],
+                  saved_p50_seconds=round(three_launch["p50_seconds"] - result["p50_seconds"], 3))
+    return result
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    # ru_maxrss is in KiB on Linux; children are only counted once they were waited for.
+    return {
+        "host": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline orchestration benchmarks with a fake Blender/UniRig.")
+    parser.add_argument("--scenario", nargs="+", choices=["single", "concurrent", "batch", "fused"],
+                        default=["single", "concurrent", "batch"])
+    parser.add_argument("--vertices", type=int, nargs="+", default=[1000, 20000, 100000],
+                        help="Vertex counts of the synthetic inputs (used round-robin).")
+    parser.add_argument("--jobs", type=int, default=6, help="Jobs per scenario.")
+    parser.add_argument("--users", type=int, default=3, help="Concurrent users in the concurrent scenario.")
+    parser.add_argument("--worker-pool-size", type=int, default=None,
+                        help="UNIRIG_WORKER_POOL_SIZE for this run (0 = one Blender launch per step).")
+    parser.add_argument("--devices", type=int, default=0,
+                        help="Simulated local CPU devices for skeleton/skin steps (0 = the app's default).")
+    parser.add_argument("--remote-workers", type=int, default=0,
+                        help="Local remote_worker.py servers added as devices.")
+    parser.add_argument("--json", help="Also write the report to this file.")
+    cli_args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="unirig_bench_")
+    input_dir = os.path.join(work_dir, "inputs")
+    os.makedirs(input_dir)
+    os.environ["UNIRIG_BLENDER_EXEC"] = write_fake_blender(work_dir)
+    os.environ["UNIRIG_REPO_DIR"] = os.path.join(BENCHMARK_DIR, "fake_unirig")
+    os.environ["UNIRIG_CACHE_DIR"] = os.path.join(work_dir, "cache")
+    os.environ.setdefault("UNIRIG_JSON_LOG_PATH", os.path.join(work_dir, "timings.jsonl"))
+    if cli_args.worker_pool_size is not None:
+        os.environ["UNIRIG_WORKER_POOL_SIZE"] = str(cli_args.worker_pool_size)
+    for key, value in FAKE_LATENCY_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+    remote_workers = start_remote_workers(cli_args.remote_workers, os.environ["UNIRIG_BLENDER_EXEC"], work_dir)
+    devices = [f"cpu:{index}" for index in range(cli_args.devices)] + [p.url for p in remote_workers]
+    if devices:
+        os.environ["UNIRIG_DEVICES"] = ",".join(devices)
+
+    import_started = time.perf_counter()
+    import app
+    import_seconds = time.perf_counter() - import_started
+
+    inputs = InputFactory(input_dir, cli_args.vertices)
+    report: Dict[str, Any] = {
+        "app_import_seconds": round(import_seconds, 3),
+        "worker_pool_size": app.WORKER_POOL_SIZE,
+        "devices": os.environ.get("UNIRIG_DEVICES", "auto"),
+        "vertices": cli_args.vertices,
+        "fake_latency": {key: float(os.environ[key]) for key in FAKE_LATENCY_DEFAULTS},
+        "scenarios": [],
+    }
+    for scenario in cli_args.scenario:
+        print(f"[Benchmark] Running scenario '{scenario}'...")
+        if scenario == "single":
+            result = run_single(app, inputs, cli_args.jobs)
+        elif scenario == "concurrent":
+            result = run_concurrent(app, inputs, cli_args.jobs, cli_args.users)
+        elif scenario == "fused":
+            result = run_fused(app, inputs, cli_args.jobs)
+        else:
+            result = run_batch(app, inputs, cli_args.jobs, os.path.join(work_dir, "batch_output"))
+        report["scenarios"].append(result)
+
+    for pool in list(app._worker_pools.values()):
+        pool.shutdown()
+    for process in remote_workers:
+        process.terminate()
+        process.wait()
+    report["device_stats"] = app.device_registry.stats()
+    report["peak_rss_mb"] = peak_rss_mb()
+    report["timing_log"] = os.environ["UNIRIG_JSON_LOG_PATH"]
+
+    print("\nscenario     jobs  fail   p50 (s)   p95 (s)   jobs/min")
+    for result in report["scenarios"]:
+        print(f"{result['scenario']:<12} {result['jobs']:>4}  {result['failures']:>4}  {result['p50_seconds']:>8.2f}"
+              f"  {result['p95_seconds']:>8.2f}  {result['jobs_per_min']:>9.2f}")
+        if result["scenario"] == "fused":
+            print(f"{'':<12} three-launch p50 {result['three_launch_p50_seconds']:.2f}s, "
+                  f"saved {result['saved_p50_seconds']:.2f}s per job")
+    print(f"peak RSS: host {report['peak_rss_mb']['host']} MB, children {report['peak_rss_mb']['children']} MB")
+    print(f"per-step timing records: {report['timing_log']}")
+    if cli_args.json:
+        with open(cli_args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if all(r["failures"] == 0 for r in report["scenarios"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Synthetic GLB generator for the benchmarks.
+
+Writes a valid glTF 2.0 binary containing one triangulated grid mesh with the
+requested number of vertices (rounded to a square grid). A seed jitters the
+vertex heights so every generated file has a distinct content hash and misses
+the result cache.
+
+    python benchmarks/synthetic_glb.py --vertices 1000 10000 100000 --out-dir /tmp/glbs
+"""
+import argparse
+import json
+import math
+import os
+import random
+import struct
+from typing import List, Tuple
+
+GLB_MAGIC = 0x46546C67  # "glTF"
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+FLOAT = 5126
+UNSIGNED_INT = 5125
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+
+
+def _pad(data: bytes, fill: bytes) -> bytes:
+    return data + fill * ((4 - len(data) % 4) % 4)
+
+
+def grid_mesh(vertex_count: int, seed: int = 0) -> Tuple[List[Tuple[float, float, float]], List[int]]:
+    """Returns (positions, triangle indices) of a side x side grid with about vertex_count vertices."""
+    side = max(2, int(math.isqrt(max(vertex_count, 4))))
+    rng = random.Random(seed)
+    positions = [(x / (side - 1) - 0.5, rng.uniform(0.0, 0.02), z / (side - 1) - 0.5)
+                 for z in range(side) for x in range(side)]
+    indices = []
+    for z in range(side - 1):
+        for x in range(side - 1):
+            a = z * side + x
+            b, c, d = a + 1, a + side, a + side + 1
+            indices.extend((a, c, b, b, c, d))
+    return positions, indices
+
+
+def write_glb(path: str, positions: List[Tuple[float, float, float]], indices: List[int]):
+    position_bytes = struct.pack(f"<{len(positions) * 3}f", *(v for p in positions for v in p))
+    index_bytes = struct.pack(f"<{len(indices)}I", *indices)
+    binary = _pad(position_bytes, b"\x00") + index_bytes
+    mins = [min(p[i] for p in positions) for i in range(3)]
+    maxs = [max(p[i] for p in positions) for i in range(3)]
+    gltf = {
+        "asset": {"version": "2.0", "generator": "unirig-space synthetic_glb"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"mesh": 0, "name": "synthetic"}],
+        "meshes": [{"primitives": [{"attributes": {"POSITION": 0}, "indices": 1}]}],
+        "buffers": [{"byteLength": len(binary)}],
+        "bufferViews": [
+            {"buffer": 0, "byteOffset": 0, "byteLength": len(position_bytes), "target": ARRAY_BUFFER},
+            {"buffer": 0, "byteOffset": len(_pad(position_bytes, b"\x00")), "byteLength": len(index_bytes),
+             "target": ELEMENT_ARRAY_BUFFER},
+        ],
+        "accessors": [
+            {"bufferView": 0, "componentType": FLOAT, "count": len(positions), "type": "VEC3", "min": mins, "max": maxs},
+            {"bufferView": 1, "componentType": UNSIGNED_INT, "count": len(indices), "type": "SCALAR"},
+        ],
+    }
+    json_chunk = _pad(json.dumps(gltf, separators=(",", ":")).encode("utf-8"), b" ")
+    bin_chunk = _pad(binary, b"\x00")
+    total_length = 12 + 8 + len(json_chunk) + 8 + len(bin_chunk)
+    with open(path, "wb") as f:
+        f.write(struct.pack("<III", GLB_MAGIC, 2, total_length))
+        f.write(struct.pack("<II", len(json_chunk), CHUNK_JSON) + json_chunk)
+        f.write(struct.pack("<II", len(bin_chunk), CHUNK_BIN) + bin_chunk)
+
+
+def make_glb(path: str, vertex_count: int, seed: int = 0) -> str:
+    positions, indices = grid_mesh(vertex_count, seed)
+    write_glb(path, positions, indices)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic grid GLBs.")
+    parser.add_argument("--vertices", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--out-dir", default="synthetic_glbs")
+    parser.add_argument("--seed", type=int, default=0)
+    cli_args = parser.parse_args()
+    os.makedirs(cli_args.out_dir, exist_ok=True)
+    for count in cli_args.vertices:
+        out_path = make_glb(os.path.join(cli_args.out_dir, f"grid_{count}.glb"), count, cli_args.seed)
+        print(f"{out_path}: {os.path.getsize(out_path)} bytes")
@@ -0,0 +1,401 @@
+"""
+Instrumentation helpers executed inside Blender's Python.
+
+Loaded by the bootstrap script that execute_unirig_command writes for every
+one-shot step, and by blender_worker.py for every job it serves. The helpers
+only use the standard library plus whatever is already importable inside
+Blender; a missing module simply leaves the corresponding hook uninstalled.
+
+Timing markers are single lines on stderr:
+    [UniRig-Timing] {"marker": "bootstrap_start", "t": <epoch seconds>}
+    [UniRig-Timing] {"marker": "script_start", "t": ...}
+    [UniRig-Timing] {"marker": "script_end", "t": ..., "phases": {"model_load": s, "inference": s, ...}}
+Phase times are exclusive: time spent in an export triggered from inside
+Trainer.predict counts as "export", not as "inference".
+
+apply_resource_limits() applies the resource profile the host passed in the
+environment (see resource_governor.py): CPU affinity, RLIMIT_AS and the torch
+thread counts.
+
+install_cpu_inference_profile() applies the CPU inference profile the host
+passed in UNIRIG_CPU_INFERENCE_SETTINGS when torch has no CUDA device. It
+covers any of: tuned intra-op and inter-op thread counts ("threads"), bf16
+autocast on CPUs with native bf16 ("bf16"), dynamic int8 quantization of the
+nn.Linear layers ("int8") and torch.compile with the inductor cache on disk
+("compile"). The model changes are made on the LightningModule passed to
+Trainer.predict, before inference starts.
+
+StepProfiler wraps a script run in the profilers the host asked for (through
+UNIRIG_PROFILE_SETTINGS in the bootstrap, or the "profile" field of a worker
+"run" request) and writes their reports next to each other:
+    <tag>.prof         cProfile statistics (snakeviz, pstats)
+    <tag>.trace.json   torch.profiler CPU trace (chrome://tracing, Perfetto)
+    <tag>.memory.txt   tracemalloc: peak, top allocation sites, growth over the run
+The top functions of each report are also printed to stderr.
+"""
+import functools
+import io
+import json
+import os
+import sys
+import time
+
+TIMING_MARKER = "[UniRig-Timing]"
+PROFILE_MARKER = "[UniRig-Profile]"
+PROFILE_MODES = ("cprofile", "torch", "tracemalloc")
+CPU_OPTIMIZATIONS = ("threads", "bf16", "int8", "compile")
+
+_phase_totals = {}
+_phase_stack = []
+_installed = set()
+
+
+def emit_marker(marker, **fields):
+    print(f"{TIMING_MARKER} " + json.dumps(dict(marker=marker, t=time.time(), **fields)), file=sys.stderr, flush=True)
+
+
+def _timed(phase, fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        _phase_stack.append(0.0)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = _phase_stack.pop()
+            _phase_totals[phase] = _phase_totals.get(phase, 0.0) + elapsed - nested
+            if _phase_stack:
+                _phase_stack[-1] += elapsed
+    return wrapper
+
+
+def _install_torch_hooks():
+    import torch
+    torch.load = _timed("model_load", torch.load)
+
+
+def _install_lightning_hooks():
+    try:
+        from lightning.pytorch import Trainer
+    except ImportError:
+        from pytorch_lightning import Trainer
+    Trainer.predict = _timed("inference", Trainer.predict)
+
+
+def _install_bpy_hooks():
+    import bpy.ops
+    op_class = bpy.ops._BPyOpsSubModOp
+    original_call = op_class.__call__
+    timed_calls = {
+        "export_scene": _timed("export", original_call),
+        "import_scene": _timed("file_io", original_call),
+    }
+
+    def call(self, *args, **kwargs):
+        return timed_calls.get(self._module, original_call)(self, *args, **kwargs)
+
+    op_class.__call__ = call
+
+
+def _install_numpy_hooks():
+    import numpy
+    for name in ("load", "save", "savez", "savez_compressed"):
+        setattr(numpy, name, _timed("file_io", getattr(numpy, name)))
+
+
+def install_timing_hooks():
+    """Wraps model loading, inference, export and file I/O entry points. Safe to call repeatedly."""
+    for name, install in (("torch", _install_torch_hooks), ("lightning", _install_lightning_hooks),
+                          ("bpy", _install_bpy_hooks), ("numpy", _install_numpy_hooks)):
+        if name in _installed:
+            continue
+        try:
+            install()
+            _installed.add(name)
+        except Exception as e:
+            print(f"[BlenderHooks] Timing hook for {name} not installed: {e}", file=sys.stderr)
+
+
+def apply_resource_limits():
+    """
+    Pins the process to UNIRIG_CPU_AFFINITY, sets RLIMIT_AS from UNIRIG_ADDRESS_SPACE_LIMIT and, if
+    torch is imported, sizes its thread pools from UNIRIG_TORCH_THREADS. Safe to call repeatedly.
+    """
+    affinity = os.environ.get("UNIRIG_CPU_AFFINITY")
+    if affinity and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, {int(cpu) for cpu in affinity.split(",")})
+        except (OSError, ValueError) as e:
+            print(f"[BlenderHooks] CPU affinity {affinity!r} not applied: {e}", file=sys.stderr)
+    address_space = os.environ.get("UNIRIG_ADDRESS_SPACE_LIMIT")
+    if address_space:
+        try:
+            import resource
+            _soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+            limit = int(address_space) if hard == resource.RLIM_INFINITY else min(int(address_space), hard)
+            resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+        except (ImportError, OSError, ValueError) as e:
+            print(f"[BlenderHooks] Address space limit not applied: {e}", file=sys.stderr)
+    threads = os.environ.get("UNIRIG_TORCH_THREADS")
+    if threads and "torch" in sys.modules:
+        torch = sys.modules["torch"]
+        cpu_settings = _active_cpu_settings(torch)
+        try:
+            torch.set_num_threads(int(threads))
+            # Only settable before the first inter-op parallel work; a later call raises.
+            if "threads" in cpu_settings.get("optimizations", ()):
+                torch.set_num_interop_threads(int(cpu_settings.get("interop_threads", 1)))
+            else:
+                torch.set_num_interop_threads(min(int(threads), 4))
+        except (RuntimeError, ValueError):
+            pass
+
+
+def cpu_inference_settings():
+    """The host's CPU inference profile: {"optimizations": [...], "interop_threads": n}, or {}."""
+    raw = os.environ.get("UNIRIG_CPU_INFERENCE_SETTINGS")
+    try:
+        return json.loads(raw) if raw else {}
+    except ValueError:
+        print(f"[BlenderHooks] Ignoring malformed UNIRIG_CPU_INFERENCE_SETTINGS: {raw!r}", file=sys.stderr)
+        return {}
+
+
+def _active_cpu_settings(torch):
+    # The profile only applies to steps that run without a GPU (CPU host, CPU lane or cpu device).
+    return {} if torch.cuda.is_available() else cpu_inference_settings()
+
+
+def bf16_supported(torch) -> bool:
+    """True when the CPU has native bf16 (AVX512-BF16 or AMX); elsewhere bf16 autocast is slower than fp32."""
+    try:
+        return bool(torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def cpu_numerics(torch, optimizations):
+    """
+    The optimizations of the list that change the model's numerics and apply on this CPU. bf16 and
+    int8 are exclusive: dynamically quantized layers take fp32 inputs, which autocast would turn to
+    bf16, so int8 wins when both are asked for.
+    """
+    if "int8" in optimizations:
+        return ["int8"]
+    if "bf16" in optimizations and bf16_supported(torch):
+        return ["bf16"]
+    return []
+
+
+def optimize_model_for_cpu(model, optimizations):
+    """
+    Quantizes and/or compiles model (an nn.Module) in place for CPU inference. Returns the names of the
+    optimizations applied. A model is only optimized once.
+    """
+    import torch
+    if getattr(model, "_unirig_cpu_optimized", None) is not None:
+        return model._unirig_cpu_optimized
+    applied = []
+    if "int8" in cpu_numerics(torch, optimizations):
+        # Only the Linear layers: attention projections and MLPs hold most of the transformer's weights,
+        # and their dynamic int8 kernels need no calibration data.
+        torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        applied.append("int8")
+    if "compile" in optimizations:
+        import torch._dynamo
+        # A graph inductor cannot compile runs eagerly instead of failing the step.
+        torch._dynamo.config.suppress_errors = True
+        for child in model.children():
+            child.compile(dynamic=True)
+        applied.append("compile")
+    model._unirig_cpu_optimized = applied
+    return applied
+
+
+def cpu_autocast(torch, optimizations):
+    """bf16 autocast when the profile uses it on this CPU, a no-op context otherwise."""
+    import contextlib
+    if "bf16" in cpu_numerics(torch, optimizations):
+        return torch.autocast("cpu", dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def _install_cpu_inference_hooks(optimizations):
+    try:
+        from lightning.pytorch import Trainer
+    except ImportError:
+        from pytorch_lightning import Trainer
+    import torch
+    original_predict = Trainer.predict
+    optimize = _timed("cpu_optimize", optimize_model_for_cpu)
+
+    @functools.wraps(original_predict)
+    def predict(self, model=None, *args, **kwargs):
+        if model is not None:
+            applied = optimize(model, optimizations)
+            if "bf16" in cpu_numerics(torch, optimizations):
+                applied = applied + ["bf16 autocast"]
+            print(f"[BlenderHooks] CPU inference: {', '.join(applied) or 'fp32'}, "
+                  f"{torch.get_num_threads()} intra-op threads", file=sys.stderr)
+        with cpu_autocast(torch, optimizations):
+            return original_predict(self, model, *args, **kwargs)
+
+    Trainer.predict = predict
+
+
+def install_cpu_inference_profile():
+    """
+    Applies the host's CPU inference profile when torch runs without CUDA. Call after
+    install_timing_hooks() so the model changes are timed as "cpu_optimize", not as "inference".
+    Safe to call repeatedly.
+    """
+    if "cpu_inference" in _installed:
+        return
+    try:
+        import torch
+    except ImportError:
+        return
+    optimizations = [o for o in _active_cpu_settings(torch).get("optimizations", ()) if o in CPU_OPTIMIZATIONS]
+    if not optimizations:
+        return
+    if "threads" in optimizations:
+        # Denormals show up in the tails of softmax and layer norm and are very slow on x86.
+        torch.set_flush_denormal(True)
+    if set(optimizations) - {"threads"}:
+        try:
+            _install_cpu_inference_hooks(optimizations)
+        except Exception as e:
+            print(f"[BlenderHooks] CPU inference profile not installed: {e}", file=sys.stderr)
+            return
+    _installed.add("cpu_inference")
+
+
+def reset_phase_totals():
+    _phase_totals.clear()
+    del _phase_stack[:]
+
+
+def phase_totals():
+    return dict(_phase_totals)
+
+
+class StepProfiler:
+    """
+    settings: {"modes": [...PROFILE_MODES], "dir": output directory, "tag": file name prefix,
+               "top_n": rows per summary, "tracemalloc_frames": frames kept per allocation}.
+    A profiler that fails to start or to write its report is skipped; the step itself never fails
+    because of profiling.
+    """
+
+    def __init__(self, settings):
+        self.modes = [mode for mode in settings.get("modes", []) if mode in PROFILE_MODES]
+        self.directory = settings["dir"]
+        self.tag = settings.get("tag") or "step"
+        self.top_n = int(settings.get("top_n", 25))
+        self.tracemalloc_frames = int(settings.get("tracemalloc_frames", 1))
+        self._cprofile = None
+        self._torch = None
+        self._baseline = None
+        self._snapshot = None
+        self._traced = (0, 0)
+
+    def _path(self, suffix):
+        return os.path.join(self.directory, f"{self.tag}{suffix}")
+
+    def _summary(self, title, text):
+        print(f"{PROFILE_MARKER} {title}\n{text.rstrip()}", file=sys.stderr, flush=True)
+
+    def start(self):
+        # Started innermost last, so cProfile does not see the other profilers starting.
+        if "tracemalloc" in self.modes:
+            import tracemalloc
+            tracemalloc.start(self.tracemalloc_frames)
+            self._baseline = tracemalloc.take_snapshot()
+        if "torch" in self.modes:
+            try:
+                import torch.profiler
+                self._torch = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU])
+                self._torch.__enter__()
+            except Exception as e:
+                self._torch = None
+                print(f"[BlenderHooks] torch.profiler not started: {e}", file=sys.stderr)
+        if "cprofile" in self.modes:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        return self
+
+    def stop(self):
+        """Stops every profiler and writes the reports. Returns the paths written."""
+        # Everything stops before the first report is written, so no report shows up in another.
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self._torch is not None:
+            try:
+                self._torch.__exit__(None, None, None)
+            except Exception as e:
+                self._torch = None
+                print(f"[BlenderHooks] torch.profiler not stopped: {e}", file=sys.stderr)
+        if self._baseline is not None:
+            import tracemalloc
+            self._snapshot = tracemalloc.take_snapshot()
+            self._traced = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        written = []
+        for name, finish in (("cprofile", self._finish_cprofile), ("torch", self._finish_torch),
+                             ("tracemalloc", self._finish_tracemalloc)):
+            try:
+                path = finish()
+            except Exception as e:
+                print(f"[BlenderHooks] {name} report not written: {e}", file=sys.stderr)
+                continue
+            if path:
+                written.append(path)
+        print(f"{PROFILE_MARKER} " + json.dumps({"files": written}), file=sys.stderr, flush=True)
+        return written
+
+    def _finish_cprofile(self):
+        if self._cprofile is None:
+            return None
+        import pstats
+        path = self._path(".prof")
+        self._cprofile.dump_stats(path)
+        text = io.StringIO()
+        pstats.Stats(self._cprofile, stream=text).sort_stats("tottime").print_stats(self.top_n)
+        self._summary(f"cProfile: top {self.top_n} functions by own time", text.getvalue())
+        return path
+
+    def _finish_torch(self):
+        if self._torch is None:
+            return None
+        path = self._path(".trace.json")
+        self._torch.export_chrome_trace(path)
+        self._summary(f"torch.profiler: top {self.top_n} operators by own CPU time",
+                      self._torch.key_averages().table(sort_by="self_cpu_time_total", row_limit=self.top_n))
+        return path
+
+    def _finish_tracemalloc(self):
+        if self._snapshot is None:
+            return None
+        snapshot = self._snapshot
+        current, peak = self._traced
+        lines = [f"traced memory: current {current / 1024**2:.1f} MB, peak {peak / 1024**2:.1f} MB", "",
+                 f"top {self.top_n} allocation sites:"]
+        lines += [str(stat) for stat in snapshot.statistics("lineno")[:self.top_n]]
+        lines += ["", f"top {self.top_n} changes since the script started:"]
+        lines += [str(stat) for stat in snapshot.compare_to(self._baseline, "lineno")[:self.top_n]]
+        path = self._path(".memory.txt")
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        self._summary("tracemalloc", "\n".join(lines[:3 + min(self.top_n, 10)]))
+        return path
+
+
+def start_profiling(settings):
+    """A started StepProfiler for settings (a dict or its JSON), or None when settings are empty."""
+    if isinstance(settings, str):
+        settings = json.loads(settings) if settings else None
+    if not settings or not settings.get("modes"):
+        return None
+    return StepProfiler(settings).start()
@@ -0,0 +1,350 @@
+"""
+Persistent UniRig worker executed inside Blender's Python.
+
+Started by worker_pool.BlenderWorker as:
+    blender --background --python blender_worker.py -- --socket <path> --unirig-dir <dir>
+or, for one stage of a batch (see run_batch below), as:
+    blender --background --python blender_worker.py -- --batch <manifest.json> --unirig-dir <dir>
+
+The worker pays for Blender startup, the UniRig 'src' import and the
+torch/spconv/flash_attn imports once, then serves step requests over a Unix
+socket. Checkpoint files loaded through torch.load are memoized in host memory
+(install_checkpoint_cache), so later jobs skip reading and unpickling them; the
+models themselves are still built for every job. The host recycles the worker
+after a fixed number of jobs to bound any state that leaks between runs.
+
+Socket protocol (one request per connection, newline-delimited JSON):
+    {"op": "ping"}                               -> {"ok": true, "pid": ..., "jobs_served": ...}
+    {"op": "run", "script": ..., "args": [...], "profile": {...} or null, "skeleton_handoff": path or null}
+                                                 -> {"event": "started", ...}
+                                                    {"event": "finished", "returncode": ...,
+                                                     "cpu_seconds": ..., "peak_rss_bytes": ...}
+    {"op": "shutdown"}                           -> {"ok": true}
+A "run" request carries two file descriptors (SCM_RIGHTS) that become the
+step's stdout and stderr for the duration of the job. Its optional "profile"
+settings wrap the job in blender_hooks.StepProfiler. After a successful job with
+a "skeleton_handoff" path, the armature left in the scene is saved there
+(fused_pipeline.save_scene_skeleton) for the host's preview.
+"""
+import argparse
+import copy
+import gc
+import json
+import os
+import resource
+import runpy
+import socket
+import sys
+import time
+import traceback
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import blender_hooks
+
+DEFAULT_PRELOAD_MODULES = [
+    "torch",
+    "lightning",
+    "spconv.pytorch",
+    "flash_attn",
+    "src.inference.download",
+    "src.data.asset",
+    "src.model.parse",
+    "src.system.parse",
+]
+
+MAX_REQUEST_BYTES = 1024 * 1024
+
+
+def log(message: str):
+    print(f"[BlenderWorker {os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+
+def parse_worker_args(argv):
+    try:
+        argv = argv[argv.index('--') + 1:]
+    except ValueError:
+        argv = []
+    parser = argparse.ArgumentParser(prog="blender_worker.py")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--socket", help="Unix socket path to listen on.")
+    mode.add_argument("--batch", help="Batch manifest to run once, then exit.")
+    parser.add_argument("--unirig-dir", required=True, help="UniRig repository root.")
+    parser.add_argument("--preload", default=",".join(DEFAULT_PRELOAD_MODULES),
+                        help="Comma-separated modules to import before serving.")
+    return parser.parse_args(argv)
+
+
+def preload_modules(module_names):
+    loaded = []
+    for name in filter(None, (m.strip() for m in module_names)):
+        started = time.time()
+        try:
+            __import__(name)
+            loaded.append(name)
+            log(f"Preloaded '{name}' in {time.time() - started:.2f}s")
+        except Exception as e:
+            log(f"Could not preload '{name}' (continuing): {e}")
+    return loaded
+
+
+def _copy_checkpoint(value, device=None):
+    """
+    Copies the dicts and lists of a cached checkpoint, so a job can pop entries at any depth without
+    changing the cache. Tensors are shared, or copied to device when one is given.
+    """
+    if isinstance(value, dict):
+        copied = copy.copy(value)  # Keeps the dict type and attributes such as a state dict's _metadata
+        for key, item in value.items():
+            copied[key] = _copy_checkpoint(item, device)
+        return copied
+    if type(value) in (list, tuple):
+        return type(value)(_copy_checkpoint(item, device) for item in value)
+    if device is not None:
+        import torch
+        if torch.is_tensor(value):
+            return value.to(device)
+    return value
+
+
+def install_checkpoint_cache():
+    """
+    Memoize torch.load of checkpoint files in host memory (map_location="cpu"), so later jobs skip
+    the disk read and the unpickling. The models are still built and loaded for every job. Callers
+    asking for another device get a per-job copy on that device, so no VRAM stays allocated between
+    jobs. Loads with a dict or callable map_location bypass the cache.
+    """
+    try:
+        import torch
+    except Exception as e:
+        log(f"torch not importable, checkpoint cache disabled: {e}")
+        return
+    if getattr(torch.load, "checkpoint_cache", False):
+        return  # Already installed by the worker that runs this job (see fused_pipeline.py)
+    original_load = torch.load
+    cache = {}
+
+    def cached_load(f, *args, **kwargs):
+        map_location = kwargs.pop("map_location", args[0] if args else None)
+        args = args[1:]
+        if not isinstance(f, (str, os.PathLike)) or not isinstance(map_location, (str, torch.device, type(None))):
+            return original_load(f, map_location, *args, **kwargs)
+        device = torch.device(map_location) if map_location is not None else None
+        path = os.path.abspath(os.fspath(f))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return original_load(f, map_location, *args, **kwargs)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        if key not in cache:
+            cache[key] = original_load(f, "cpu", *args, **kwargs)
+            log(f"Checkpoint cached in host memory: {path}")
+        # Lightning pops entries from the checkpoint dict, so every job gets its own containers.
+        return _copy_checkpoint(cache[key], device if device is not None and device.type != "cpu" else None)
+
+    cached_load.checkpoint_cache = True
+    torch.load = cached_load
+
+
+def reset_between_jobs():
+    try:
+        from hydra.core.global_hydra import GlobalHydra
+        GlobalHydra.instance().clear()
+    except Exception:
+        pass
+    try:
+        import bpy
+        bpy.ops.wm.read_factory_settings(use_empty=True)
+    except Exception:
+        pass
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except Exception:
+        pass
+
+
+def run_script(script_path, script_args, unirig_repo_dir, stdout_fd, stderr_fd, profile=None, skeleton_handoff=None):
+    """Run a UniRig script in-process with its output redirected to the given fds."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_stdout_fd = os.dup(1)
+    saved_stderr_fd = os.dup(2)
+    saved_argv = list(sys.argv)
+    saved_cwd = os.getcwd()
+    returncode = 0
+    try:
+        os.dup2(stdout_fd, 1)
+        os.dup2(stderr_fd, 2)
+        sys.argv = [script_path] + list(script_args)
+        os.chdir(unirig_repo_dir)
+        # Same markers as the one-shot bootstrap; spawn and import are already paid by the warm-up.
+        blender_hooks.reset_phase_totals()
+        blender_hooks.emit_marker("bootstrap_start")
+        blender_hooks.emit_marker("script_start")
+        profiler = blender_hooks.start_profiling(profile)
+        try:
+            runpy.run_path(script_path, run_name='__main__')
+        except SystemExit as e:
+            if isinstance(e.code, int):
+                returncode = e.code
+            elif e.code is not None:
+                print(e.code, file=sys.stderr)
+                returncode = 1
+        except BaseException as e:
+            print(f"[BlenderWorker] Error running '{script_path}': {e}", file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+            returncode = 1
+        if profiler:
+            profiler.stop()
+        if returncode == 0 and skeleton_handoff:
+            try:
+                from fused_pipeline import save_scene_skeleton
+                save_scene_skeleton(skeleton_handoff)
+            except Exception as e:
+                print(f"[BlenderWorker] Skeleton handoff not saved: {e}", file=sys.stderr)
+        blender_hooks.emit_marker("script_end", phases=blender_hooks.phase_totals())
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved_stdout_fd, 1)
+        os.dup2(saved_stderr_fd, 2)
+        os.close(saved_stdout_fd)
+        os.close(saved_stderr_fd)
+        sys.argv = saved_argv
+        os.chdir(saved_cwd)
+    return returncode
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def read_request(conn):
+    data, fds, _flags, _addr = socket.recv_fds(conn, MAX_REQUEST_BYTES, 2)
+    while data and not data.endswith(b"\n"):
+        chunk = conn.recv(MAX_REQUEST_BYTES)
+        if not chunk:
+            break
+        data += chunk
+    return (json.loads(data.decode("utf-8")) if data.strip() else {}), fds
+
+
+def send_message(conn, message):
+    conn.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+
+def warm_up(options):
+    unirig_repo_dir = os.path.abspath(options.unirig_dir)
+    if unirig_repo_dir not in sys.path:
+        sys.path.insert(0, unirig_repo_dir)
+    os.chdir(unirig_repo_dir)
+
+    started = time.time()
+    # Before the preload so library thread pools start on the assigned CPUs; again after it for torch.
+    blender_hooks.apply_resource_limits()
+    preloaded = preload_modules(options.preload.split(","))
+    install_checkpoint_cache()
+    blender_hooks.install_timing_hooks()
+    blender_hooks.install_cpu_inference_profile()
+    blender_hooks.apply_resource_limits()
+    log(f"Warm-up finished in {time.time() - started:.2f}s")
+    return unirig_repo_dir, preloaded
+
+
+def run_batch(options):
+    """
+    Runs every job of a batch manifest in this process, so a whole stage of a batch pays for a
+    single Blender launch and model load. Each job's output goes to its own log file and a
+    failing job does not stop the others.
+
+    Manifest: {"script": ..., "results_path": ..., "jobs": [{"id": ..., "args": [...], "log_path": ...}]}
+    Results:  {"<id>": {"returncode": ..., "duration": ...}, ...}
+    """
+    with open(options.batch) as f:
+        manifest = json.load(f)
+    unirig_repo_dir, _preloaded = warm_up(options)
+    results = {}
+    for job in manifest["jobs"]:
+        log(f"Batch job {job['id']} ({len(results) + 1}/{len(manifest['jobs'])})")
+        job_started = time.time()
+        with open(job["log_path"], "w") as job_log:
+            returncode = run_script(manifest["script"], job.get("args", []), unirig_repo_dir,
+                                    job_log.fileno(), job_log.fileno())
+        reset_between_jobs()
+        results[job["id"]] = {"returncode": returncode, "duration": time.time() - job_started}
+        # Rewrite after every job so a crash mid-batch still reports the finished ones.
+        with open(manifest["results_path"], "w") as f:
+            json.dump(results, f)
+    return results
+
+
+def serve(options):
+    unirig_repo_dir, preloaded = warm_up(options)
+
+    if os.path.exists(options.socket):
+        os.remove(options.socket)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(options.socket)
+    server.listen(4)
+    log(f"Listening on {options.socket}")
+
+    jobs_served = 0
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                fds = []
+                try:
+                    request, fds = read_request(conn)
+                    op = request.get("op")
+                    if op == "ping":
+                        send_message(conn, {"ok": True, "pid": os.getpid(),
+                                            "jobs_served": jobs_served, "preloaded": preloaded})
+                    elif op == "shutdown":
+                        send_message(conn, {"ok": True})
+                        log("Shutdown requested.")
+                        return
+                    elif op == "run":
+                        if len(fds) != 2:
+                            send_message(conn, {"event": "error", "message": "run requires stdout/stderr fds"})
+                            continue
+                        send_message(conn, {"event": "started", "pid": os.getpid()})
+                        job_started = time.time()
+                        job_cpu_started = cpu_seconds()
+                        returncode = run_script(request["script"], request.get("args", []),
+                                                unirig_repo_dir, fds[0], fds[1], request.get("profile"),
+                                                request.get("skeleton_handoff"))
+                        jobs_served += 1
+                        reset_between_jobs()
+                        # ru_maxrss is the worker's lifetime peak, which includes the cached checkpoints.
+                        send_message(conn, {"event": "finished", "returncode": returncode,
+                                            "duration": time.time() - job_started,
+                                            "cpu_seconds": cpu_seconds() - job_cpu_started,
+                                            "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                                            "jobs_served": jobs_served})
+                    else:
+                        send_message(conn, {"event": "error", "message": f"unknown op {op!r}"})
+                except Exception as e:
+                    log(f"Error handling request: {e}")
+                    traceback.print_exc(file=sys.stderr)
+                finally:
+                    for fd in fds:
+                        try:
+                            os.close(fd)
+                        except OSError:
+                            pass
+    finally:
+        server.close()
+        if os.path.exists(options.socket):
+            os.remove(options.socket)
+
+
+if __name__ == "__main__":
+    worker_options = parse_worker_args(sys.argv)
+    if worker_options.batch:
+        run_batch(worker_options)
+    else:
+        serve(worker_options)
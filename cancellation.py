@@ -0,0 +1,88 @@
+"""
+Cancellation of running rig jobs.
+
+A CancelToken belongs to one request. Cancelling it (Cancel button, closed tab,
+a newer request from the same session) runs the callbacks registered by
+whatever the job is doing right now: the scheduler drops the job's queued
+stages and the running Blender step terminates its whole process group. Every
+step runs in its own session (start_new_session=True), so the group also covers
+any child processes Blender started.
+"""
+import os
+import signal
+import subprocess
+import threading
+from typing import Callable, List, Optional
+
+
+class JobCancelled(RuntimeError):
+    """The job was cancelled before it finished."""
+
+
+class CancelToken:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[str], None]] = []
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        """Marks the token cancelled and runs the registered callbacks once. Later calls are no-ops."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks = list(self._callbacks)
+        print(f"[Cancel] {reason}")
+        for callback in callbacks:
+            try:
+                callback(reason)
+            except Exception as e:
+                print(f"[Cancel] Cancellation callback failed: {e}")
+
+    def add_callback(self, callback: Callable[[str], None]) -> Callable[[str], None]:
+        """Registers callback(reason); it runs immediately if the token is already cancelled."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return callback
+        callback(self.reason)
+        return callback
+
+    def remove_callback(self, callback: Callable[[str], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise JobCancelled(self.reason)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._event.wait(timeout)
+
+
+def terminate_process_group(process: subprocess.Popen, grace_seconds: float = 10.0):
+    """
+    Sends SIGTERM to the process group led by process (started with start_new_session=True),
+    then SIGKILL once the grace period is over. Leftover group members are killed as well.
+    """
+    def signal_group(sig):
+        try:
+            os.killpg(process.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    if process.poll() is None:
+        signal_group(signal.SIGTERM)
+        try:
+            process.wait(timeout=grace_seconds)
+        except subprocess.TimeoutExpired:
+            print(f"[Cancel] pid {process.pid} ignored SIGTERM for {grace_seconds}s, sending SIGKILL.")
+    signal_group(signal.SIGKILL)
+    process.wait()
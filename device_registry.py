@@ -0,0 +1,170 @@
+"""
+Device registry for GPU-lane steps.
+
+A device is one place a step can run: a local GPU (isolated with
+CUDA_VISIBLE_DEVICES, so the child always sees it as cuda:0), a local CPU
+"device" (several of them simulate a multi-device box on a CPU-only machine),
+or a remote worker reached over HTTP (remote_worker.py). Each device has a
+number of slots. acquire() places a step on the least-loaded healthy device.
+run() retries a step that failed with DeviceFailure on a device it has not
+tried yet, and quarantines the failed device for a while.
+
+UNIRIG_DEVICES lists the devices, comma-separated:
+    auto                    every visible GPU, or a single CPU device
+    cuda:1                  local GPU 1
+    cpu:0, cpu:1            local CPU devices
+    http://host:8765        remote worker
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, TypeVar
+
+from cancellation import CancelToken
+
+T = TypeVar("T")
+
+
+class DeviceFailure(RuntimeError):
+    """A step failed because of the device or worker it ran on; another device may succeed."""
+
+
+class NoDeviceAvailable(RuntimeError):
+    """No configured device is left to run the step on."""
+
+
+@dataclass
+class Device:
+    name: str  # "cuda:1", "cpu:0" or the remote worker URL
+    kind: str  # "cuda", "cpu" or "remote"
+    slots: int = 1
+    env: Dict[str, str] = field(default_factory=dict)  # Added to the step's environment
+    url: Optional[str] = None
+    in_flight: int = 0
+    served: int = 0
+    failures_total: int = 0
+    quarantined_until: float = 0.0
+
+    @property
+    def unirig_device_arg(self) -> str:
+        # Remote workers substitute their own device; the value sent only has to parse.
+        return "device=cpu" if self.kind == "cpu" else "device=cuda:0"
+
+    def quarantined(self, now: Optional[float] = None) -> bool:
+        return self.quarantined_until > (now or time.time())
+
+
+def visible_gpu_ids() -> List[str]:
+    """GPU ids visible to this process, without importing torch (CUDA_VISIBLE_DEVICES or the driver's /proc entries)."""
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible is not None:
+        return [gpu.strip() for gpu in visible.split(",") if gpu.strip() and gpu.strip() != "-1"]
+    try:
+        return [str(index) for index in range(len(os.listdir("/proc/driver/nvidia/gpus")))]
+    except OSError:
+        return []
+
+
+def parse_devices(spec: str, gpu_ids: Sequence[str], slots: int = 1) -> List[Device]:
+    """Builds the device list from a UNIRIG_DEVICES value (see the module docstring)."""
+    entries = [entry.strip() for entry in (spec or "auto").split(",") if entry.strip()]
+    if entries == ["auto"]:
+        if not gpu_ids:
+            return [Device("cpu:0", "cpu", slots, {"CUDA_VISIBLE_DEVICES": ""})]
+        if len(gpu_ids) == 1:
+            # A single GPU needs no isolation (and ZeroGPU manages visibility itself).
+            return [Device("cuda:0", "cuda", slots)]
+        entries = [f"cuda:{gpu}" for gpu in gpu_ids]
+    devices = []
+    for entry in entries:
+        if entry.startswith(("http://", "https://")):
+            devices.append(Device(entry.rstrip("/"), "remote", slots, url=entry.rstrip("/")))
+        elif entry.startswith("cuda:"):
+            devices.append(Device(entry, "cuda", slots, {"CUDA_VISIBLE_DEVICES": entry.split(":", 1)[1]}))
+        elif entry.startswith("cpu"):
+            devices.append(Device(entry if ":" in entry else f"cpu:{len(devices)}", "cpu", slots,
+                                  {"CUDA_VISIBLE_DEVICES": ""}))
+        else:
+            raise ValueError(f"Unknown device {entry!r} in UNIRIG_DEVICES.")
+    return devices
+
+
+class DeviceRegistry:
+    def __init__(self, devices: Sequence[Device] = (), quarantine_seconds: float = 60):
+        self.quarantine_seconds = quarantine_seconds
+        self._condition = threading.Condition()
+        self._devices: List[Device] = list(devices)
+
+    @property
+    def devices(self) -> List[Device]:
+        with self._condition:
+            return list(self._devices)
+
+    def configure(self, devices: Sequence[Device]):
+        """Replaces the device list (e.g. once provisioning knows whether CUDA works)."""
+        with self._condition:
+            self._devices = list(devices)
+            self._condition.notify_all()
+        print(f"[Devices] {', '.join(f'{d.name} ({d.slots} slot(s))' for d in devices) or 'none'}")
+
+    def _pick(self, exclude: Sequence[str]) -> Optional[Device]:
+        candidates = [d for d in self._devices if d.name not in exclude]
+        if not candidates:
+            raise NoDeviceAvailable("Every device has already failed this step.")
+        now = time.time()
+        # Quarantined devices are only used when nothing healthy is left.
+        healthy = [d for d in candidates if not d.quarantined(now)] or candidates
+        free = [d for d in healthy if d.in_flight < d.slots]
+        if not free:
+            return None
+        return min(free, key=lambda d: (d.in_flight / d.slots, d.served))
+
+    def acquire(self, exclude: Sequence[str] = (), cancel_token: Optional[CancelToken] = None) -> Device:
+        """Blocks until a slot is free on the least-loaded healthy device not in exclude."""
+        with self._condition:
+            while True:
+                device = self._pick(exclude)
+                if device is not None:
+                    device.in_flight += 1
+                    return device
+                self._condition.wait(timeout=0.5)
+                if cancel_token:
+                    cancel_token.raise_if_cancelled()
+
+    def release(self, device: Device, failed: bool = False):
+        with self._condition:
+            device.in_flight -= 1
+            device.served += 1
+            if failed:
+                device.failures_total += 1
+                device.quarantined_until = time.time() + self.quarantine_seconds
+            self._condition.notify_all()
+
+    def run(self, step: Callable[[Device], T], attempts: int = 2, cancel_token: Optional[CancelToken] = None,
+            exclude: Sequence[str] = ()) -> T:
+        """
+        Runs step(device) on a device not in exclude, moving to another device after a DeviceFailure, at
+        most attempts times.
+        """
+        tried: List[str] = []
+        while True:
+            device = self.acquire(exclude=list(exclude) + tried, cancel_token=cancel_token)
+            failed = False
+            try:
+                return step(device)
+            except DeviceFailure as e:
+                failed = True
+                tried.append(device.name)
+                print(f"[Devices] Step failed on {device.name} ({e}); quarantined for {self.quarantine_seconds:.0f}s.")
+                if len(tried) >= attempts or len(tried) >= len([d for d in self.devices if d.name not in exclude]):
+                    raise
+            finally:
+                self.release(device, failed)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._condition:
+            now = time.time()
+            return {d.name: {"kind": d.kind, "slots": d.slots, "in_flight": d.in_flight, "served": d.served,
+                             "failures_total": d.failures_total, "quarantined": d.quarantined(now)}
+                    for d in self._devices}
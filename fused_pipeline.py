@@ -0,0 +1,218 @@
+"""
+Skeleton, skin and merge of one mesh in a single Blender process.
+
+Executed inside Blender's Python through the usual bootstrap, or by a warm
+worker (blender_worker.py):
+    fused_pipeline.py --input mesh.glb --skeleton mesh_skeleton.fbx --skin mesh_skin.fbx
+                      --output mesh_rigged.glb device=cuda:0
+                      [--skeleton-handoff mesh_skeleton.npz] [--skip-skeleton] [--skip-skin]
+
+The three-launch path pays for every stage separately: a Blender start, the
+torch and UniRig imports, a checkpoint load and another wait in the
+scheduler. Here the stages run one after another in this process. Checkpoints
+are memoized as in blender_worker.py, and Hydra and the Blender scene are
+reset between stages. --skip-skeleton and --skip-skin mark stage outputs that
+the host already restored from its stage cache.
+
+UniRig's stage entry points read and write files, so the skeleton and the
+skin still go to the next stage as FBX files in the run's working directory.
+The host does not read them back. With --skeleton-handoff, the armature is
+read from the live scene right after skeleton prediction, with no re-import
+(joint names, parent indices, and head and tail positions), and saved to a
+compressed .npz file (the "handoff", see save_scene_skeleton and
+load_handoff), so the host can show a preview (rig_preview.py) while
+skinning runs.
+
+Progress lines for the host, on stderr:
+    [FusedPipeline-Event] {"event": "stage_start", "stage": "Skeleton Prediction"}
+    [FusedPipeline-Event] {"event": "stage_end", "stage": ..., "seconds": ...}
+    [FusedPipeline-Event] {"event": "skeleton_ready", "path": ...}
+    [FusedPipeline-Event] {"event": "summary", "stages": {stage: seconds}}
+"""
+import argparse
+import json
+import os
+import runpy
+import sys
+import time
+
+import numpy as np
+
+FUSED_MARKER = "[FusedPipeline-Event]"
+SKELETON_STAGE = "Skeleton Prediction"
+SKIN_STAGE = "Skinning Prediction"
+MERGE_STAGE = "Merging Results"
+
+
+def parse_fused_line(line: str):
+    """The event dict of a progress line, or None for any other output line."""
+    index = line.find(FUSED_MARKER)
+    if index < 0:
+        return None
+    try:
+        return json.loads(line[index + len(FUSED_MARKER):])
+    except ValueError:
+        return None
+
+
+def load_handoff(path: str):
+    """Reads a handoff .npz into a dict of arrays (see save_handoff)."""
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+
+def save_handoff(path: str, skeleton, mesh_bounds=None) -> int:
+    """
+    Writes the armature read from the scene. skeleton: joint_names (J,), parents (J,) with -1 for roots,
+    heads and tails (J, 3) in world space, or None. mesh_bounds: (2, 3) world-space min and max of the
+    scene's meshes, when known. Returns the file size.
+    """
+    arrays = {}
+    if mesh_bounds is not None:
+        arrays["mesh_bounds"] = np.asarray(mesh_bounds, dtype=np.float32)
+    if skeleton:
+        arrays.update(joint_names=np.asarray(skeleton["joint_names"], dtype=np.str_),
+                      parents=np.asarray(skeleton["parents"], dtype=np.int32),
+                      heads=np.asarray(skeleton["heads"], dtype=np.float32),
+                      tails=np.asarray(skeleton["tails"], dtype=np.float32))
+    np.savez_compressed(path, **arrays)
+    return os.path.getsize(path)
+
+
+def _emit(event: str, **fields):
+    print(f"{FUSED_MARKER} " + json.dumps(dict(event=event, **fields)), file=sys.stderr, flush=True)
+
+
+def _log(message: str):
+    print(f"[FusedPipeline] {message}", file=sys.stderr, flush=True)
+
+
+def _scene_armature():
+    """(armature object, skeleton arrays) of the first armature in the scene, or (None, None)."""
+    try:
+        import bpy
+        armature = next(obj for obj in bpy.data.objects if obj.type == 'ARMATURE')
+    except Exception:
+        return None, None
+    bones = list(armature.data.bones)
+    index = {bone.name: i for i, bone in enumerate(bones)}
+    world = armature.matrix_world
+    return armature, {
+        "joint_names": [bone.name for bone in bones],
+        "parents": [index[bone.parent.name] if bone.parent else -1 for bone in bones],
+        "heads": [tuple(world @ bone.head_local) for bone in bones],
+        "tails": [tuple(world @ bone.tail_local) for bone in bones],
+    }
+
+
+def _scene_mesh_bounds():
+    """World-space (2, 3) min and max over the bounding boxes of the scene's meshes, or None."""
+    try:
+        import bpy
+        from mathutils import Vector
+        corners = [tuple(obj.matrix_world @ Vector(corner)) for obj in bpy.data.objects if obj.type == 'MESH'
+                   for corner in obj.bound_box]
+    except Exception:
+        return None
+    if not corners:
+        return None
+    corners = np.asarray(corners, dtype=np.float64)
+    return np.stack([corners.min(axis=0), corners.max(axis=0)])
+
+
+def save_scene_skeleton(path: str) -> int:
+    """
+    Writes the scene's armature and mesh bounds as a skeleton-only handoff, for the host's preview.
+    Called after a skeleton stage, by this script and by the bootstrap or worker of a separate
+    skeleton step. Returns the file size, or 0 when the scene has no armature.
+    """
+    _armature, skeleton = _scene_armature()
+    if not skeleton:
+        return 0
+    return save_handoff(path, skeleton, mesh_bounds=_scene_mesh_bounds())
+
+
+def _reset_scene():
+    # Same reset the warm workers do between jobs; the memoized checkpoints survive it.
+    from blender_worker import reset_between_jobs
+    reset_between_jobs()
+
+
+def run_stage(stage: str, run_py: str, args) -> float:
+    _emit("stage_start", stage=stage)
+    started = time.time()
+    saved_argv = list(sys.argv)
+    sys.argv = [run_py] + list(args)
+    try:
+        runpy.run_path(run_py, run_name='__main__')
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise RuntimeError(f"{stage} exited with {e.code}")
+    finally:
+        sys.argv = saved_argv
+    seconds = time.time() - started
+    _emit("stage_end", stage=stage, seconds=round(seconds, 3))
+    return seconds
+
+
+def run_fused(options) -> int:
+    from blender_worker import install_checkpoint_cache
+    install_checkpoint_cache()
+    run_py = os.path.join(os.getcwd(), "run.py")
+    stages = {}
+
+    if not options.skip_skeleton:
+        stages[SKELETON_STAGE] = run_stage(SKELETON_STAGE, run_py, [
+            "--config-name=skeleton_config", "with", f"input={options.input}", f"output={options.skeleton}",
+            options.device])
+        _armature, skeleton = _scene_armature()
+        if options.skeleton_handoff and skeleton:
+            save_handoff(options.skeleton_handoff, skeleton, mesh_bounds=_scene_mesh_bounds())
+            _emit("skeleton_ready", path=options.skeleton_handoff)
+        _reset_scene()
+    if not os.path.exists(options.skeleton):
+        _log(f"Skeleton not found: {options.skeleton}")
+        return 1
+
+    if not options.skip_skin:
+        stages[SKIN_STAGE] = run_stage(SKIN_STAGE, run_py, [
+            "--config-name=skin_config", "with", f"input={options.skeleton}", f"output={options.skin}",
+            options.device])
+        _reset_scene()
+    if not os.path.exists(options.skin):
+        _log(f"Skin not found: {options.skin}")
+        return 1
+
+    # Merging only moves the skin onto the input mesh and needs no GPU, as on the three-launch path.
+    stages[MERGE_STAGE] = run_stage(MERGE_STAGE, run_py, [
+        "--config-name=merge_config", "with", f"source_path={options.skin}", f"target_path={options.input}",
+        f"output_path={options.output}", "mode=skin", "device=cpu"])
+    if not os.path.exists(options.output):
+        _log(f"Merge output not found: {options.output}")
+        return 1
+
+    _emit("summary", stages={stage: round(seconds, 3) for stage, seconds in stages.items()})
+    return 0
+
+
+def parse_args(argv):
+    try:
+        argv = argv[argv.index('--') + 1:]
+    except ValueError:
+        argv = argv[1:]
+    parser = argparse.ArgumentParser(prog="fused_pipeline.py")
+    parser.add_argument("--input", required=True, help="Mesh UniRig rigs (the input GLB, or its proxy).")
+    parser.add_argument("--skeleton", required=True, help="Skeleton FBX, written unless --skip-skeleton.")
+    parser.add_argument("--skin", required=True, help="Skin FBX, written unless --skip-skin.")
+    parser.add_argument("--output", required=True, help="Rigged GLB.")
+    parser.add_argument("--skeleton-handoff", help="Where to write the armature right after skeleton prediction (.npz).")
+    parser.add_argument("--skip-skeleton", action="store_true")
+    parser.add_argument("--skip-skin", action="store_true")
+    parser.add_argument("device", help="UniRig device argument of the skeleton and skin stages, e.g. device=cuda:0.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    # The host's bootstrap only puts the UniRig checkout on sys.path.
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    sys.exit(run_fused(parse_args(sys.argv)))
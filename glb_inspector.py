@@ -0,0 +1,238 @@
+"""
+Fast GLB inspection without Blender.
+
+Reads the 12-byte header, the JSON chunk and the chunk table of a glTF 2.0
+binary through mmap + memoryview (the binary chunk is bounds-checked, never
+copied) and returns the counts the app needs before it commits a Blender
+launch and a GPU window to an upload: vertices, triangles, meshes,
+primitives, existing skins. Typical inputs are inspected in about a
+millisecond. The same counts drive a per-stage runtime estimate used for
+scheduling and for the ZeroGPU duration request.
+"""
+import json
+import mmap
+import os
+import struct
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional, Tuple
+
+GLB_MAGIC = 0x46546C67  # "glTF"
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+HEADER_SIZE = 12
+CHUNK_HEADER_SIZE = 8
+
+COMPONENT_SIZES = {5120: 1, 5121: 1, 5122: 2, 5123: 2, 5125: 4, 5126: 4}
+TYPE_COMPONENTS = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4, "MAT2": 4, "MAT3": 9, "MAT4": 16}
+MODE_TRIANGLES, MODE_TRIANGLE_STRIP, MODE_TRIANGLE_FAN = 4, 5, 6
+
+# Rough per-stage cost model, seconds = base + per_million_vertices * vertices / 1e6.
+# Calibrate against unirig_stage_seconds on /metrics for the deployed hardware.
+RUNTIME_MODEL = {
+    "skeleton": {"base": 25.0, "per_million_vertices": 20.0},
+    "skin": {"base": 20.0, "per_million_vertices": 60.0},
+    "merge": {"base": 5.0, "per_million_vertices": 30.0},
+    "optimize": {"base": 0.5, "per_million_vertices": 3.0},  # glb_optimize.py without a compression tool
+}
+
+
+class GLBError(ValueError):
+    """The file is not a well-formed glTF 2.0 binary."""
+
+
+@dataclass
+class GLBInfo:
+    file_size: int
+    vertex_count: int
+    triangle_count: int
+    mesh_count: int
+    primitive_count: int
+    skin_count: int
+    node_count: int
+    json_bytes: int
+    bin_bytes: int
+    inspect_ms: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _check_structure(gltf: Dict[str, Any]):
+    """The arrays and objects the inspector walks have the JSON types the glTF schema gives them."""
+    for key in ("meshes", "accessors", "bufferViews", "buffers", "nodes", "skins"):
+        items = gltf.get(key, [])
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise GLBError(f"glTF '{key}' is not an array of objects.")
+    for mesh_index, mesh in enumerate(gltf.get("meshes", [])):
+        primitives = mesh.get("primitives", [])
+        if not isinstance(primitives, list) or not all(isinstance(primitive, dict) for primitive in primitives):
+            raise GLBError(f"Mesh {mesh_index} 'primitives' is not an array of objects.")
+        for primitive in primitives:
+            if not isinstance(primitive.get("attributes", {}), dict):
+                raise GLBError(f"A primitive of mesh {mesh_index} has non-object 'attributes'.")
+
+
+def _check_accessor(index: int, accessor: Dict[str, Any], gltf: Dict[str, Any]):
+    if "bufferView" not in accessor:
+        return  # Sparse or extension-provided (e.g. Draco) data; nothing to bounds-check here.
+    views = gltf.get("bufferViews", [])
+    view_index = accessor["bufferView"]
+    if not isinstance(view_index, int) or not 0 <= view_index < len(views):
+        raise GLBError(f"Accessor {index} references missing bufferView {view_index}.")
+    view = views[view_index]
+    element_size = (COMPONENT_SIZES.get(accessor.get("componentType"), 0)
+                    * TYPE_COMPONENTS.get(accessor.get("type"), 0))
+    if element_size == 0:
+        raise GLBError(f"Accessor {index} has an invalid componentType/type.")
+    count = accessor.get("count", 0)
+    stride = view.get("byteStride") or element_size
+    needed = accessor.get("byteOffset", 0) + (count - 1) * stride + element_size if count else 0
+    if needed > view.get("byteLength", 0):
+        raise GLBError(f"Accessor {index} reads past the end of bufferView {view_index}.")
+
+
+def _check_buffer_views(gltf: Dict[str, Any], bin_bytes: int):
+    for index, view in enumerate(gltf.get("bufferViews", [])):
+        buffer_index = view.get("buffer", 0)
+        buffers = gltf.get("buffers", [])
+        if not 0 <= buffer_index < len(buffers):
+            raise GLBError(f"bufferView {index} references missing buffer {buffer_index}.")
+        if buffer_index == 0 and "uri" not in buffers[0]:
+            if view.get("byteOffset", 0) + view.get("byteLength", 0) > bin_bytes:
+                raise GLBError(f"bufferView {index} exceeds the BIN chunk ({bin_bytes} bytes).")
+
+
+def _parse(view: memoryview, file_size: int) -> Dict[str, Any]:
+    magic, version, length = struct.unpack_from("<III", view, 0)
+    if magic != GLB_MAGIC:
+        raise GLBError("Not a GLB file (bad magic).")
+    if version != 2:
+        raise GLBError(f"Unsupported glTF binary version {version}; expected 2.")
+    if length > file_size:
+        raise GLBError(f"Truncated GLB: header declares {length} bytes, file has {file_size}.")
+
+    offset = HEADER_SIZE
+    json_chunk = None
+    json_bytes = 0
+    bin_bytes = 0
+    bin_offset = 0
+    while offset + CHUNK_HEADER_SIZE <= length:
+        chunk_length, chunk_type = struct.unpack_from("<II", view, offset)
+        start = offset + CHUNK_HEADER_SIZE
+        if start + chunk_length > length:
+            raise GLBError("Chunk extends past the end of the file.")
+        if json_chunk is None:
+            if chunk_type != CHUNK_JSON:
+                raise GLBError("First chunk is not JSON.")
+            # Copied out: a slice still exported when a later check raises would keep the mmap open.
+            with view[start:start + chunk_length] as chunk:
+                json_chunk = bytes(chunk)
+            json_bytes = chunk_length
+        elif chunk_type == CHUNK_BIN and not bin_bytes:
+            bin_bytes = chunk_length
+            bin_offset = start
+        offset = start + chunk_length
+    if json_chunk is None:
+        raise GLBError("Missing JSON chunk.")
+    try:
+        gltf = json.loads(str(json_chunk, "utf-8"))
+    except (UnicodeDecodeError, ValueError) as e:
+        raise GLBError(f"Invalid glTF JSON: {e}") from e
+    if not isinstance(gltf, dict):
+        raise GLBError("glTF JSON is not an object.")
+    _check_structure(gltf)
+    return {"gltf": gltf, "json_bytes": json_bytes, "bin_bytes": bin_bytes, "bin_offset": bin_offset}
+
+
+def inspect_glb(path: str) -> GLBInfo:
+    """Parses the GLB container and returns its geometry counts. Raises GLBError for malformed files."""
+    started = time.perf_counter()
+    file_size = os.path.getsize(path)
+    if file_size < HEADER_SIZE + CHUNK_HEADER_SIZE:
+        raise GLBError(f"File too small to be a GLB ({file_size} bytes).")
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with memoryview(mapped) as view:
+            parsed = _parse(view, file_size)
+    gltf = parsed["gltf"]
+    # _check_structure covers the containers; this catches wrongly typed scalars (counts, offsets).
+    try:
+        accessors = gltf.get("accessors", [])
+        _check_buffer_views(gltf, parsed["bin_bytes"])
+
+        def accessor_count(index: Any, role: str) -> int:
+            if not isinstance(index, int) or not 0 <= index < len(accessors):
+                raise GLBError(f"{role} references missing accessor {index}.")
+            _check_accessor(index, accessors[index], gltf)
+            return int(accessors[index].get("count", 0))
+
+        position_accessors = {}
+        triangle_count = 0
+        primitive_count = 0
+        meshes = gltf.get("meshes", [])
+        for mesh in meshes:
+            for primitive in mesh.get("primitives", []):
+                primitive_count += 1
+                attributes = primitive.get("attributes", {})
+                if "POSITION" not in attributes:
+                    continue
+                position_index = attributes["POSITION"]
+                position_accessors[position_index] = accessor_count(position_index, "POSITION")
+                mode = primitive.get("mode", MODE_TRIANGLES)
+                if "indices" in primitive:
+                    element_count = accessor_count(primitive["indices"], "indices")
+                else:
+                    element_count = position_accessors[position_index]
+                if mode == MODE_TRIANGLES:
+                    triangle_count += element_count // 3
+                elif mode in (MODE_TRIANGLE_STRIP, MODE_TRIANGLE_FAN):
+                    triangle_count += max(element_count - 2, 0)
+    except (TypeError, AttributeError) as e:
+        raise GLBError(f"Malformed glTF JSON: {e}") from e
+
+    return GLBInfo(
+        file_size=file_size,
+        vertex_count=sum(position_accessors.values()),
+        triangle_count=triangle_count,
+        mesh_count=len(meshes),
+        primitive_count=primitive_count,
+        skin_count=len(gltf.get("skins", [])),
+        node_count=len(gltf.get("nodes", [])),
+        json_bytes=parsed["json_bytes"],
+        bin_bytes=parsed["bin_bytes"],
+        inspect_ms=(time.perf_counter() - started) * 1000.0,
+    )
+
+
+def load_glb(path: str) -> Tuple[Dict[str, Any], bytes]:
+    """Reads a whole GLB for rewriting (see glb_optimize.py). Returns (glTF JSON, BIN chunk bytes)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < HEADER_SIZE + CHUNK_HEADER_SIZE:
+        raise GLBError(f"File too small to be a GLB ({len(data)} bytes).")
+    parsed = _parse(memoryview(data), len(data))
+    try:
+        _check_buffer_views(parsed["gltf"], parsed["bin_bytes"])
+    except (TypeError, AttributeError) as e:
+        raise GLBError(f"Malformed glTF JSON: {e}") from e
+    return parsed["gltf"], data[parsed["bin_offset"]:parsed["bin_offset"] + parsed["bin_bytes"]]
+
+
+def reject_reason(info: GLBInfo, max_file_bytes: int, max_vertices: int) -> Optional[str]:
+    """Returns why an inspected input must not be rigged, or None if it is acceptable."""
+    if max_file_bytes > 0 and info.file_size > max_file_bytes:
+        return f"File is {info.file_size / 1024**2:.1f} MB; the limit is {max_file_bytes / 1024**2:.0f} MB."
+    if info.mesh_count == 0 or info.vertex_count == 0:
+        return "The GLB contains no mesh geometry."
+    if info.triangle_count == 0:
+        return "The GLB contains no triangles (points/lines only)."
+    if max_vertices > 0 and info.vertex_count > max_vertices:
+        return f"Mesh has {info.vertex_count:,} vertices; the limit is {max_vertices:,}. Decimate it first."
+    return None
+
+
+def estimate_runtime(info: GLBInfo, model: Optional[Dict[str, Dict[str, float]]] = None) -> Dict[str, float]:
+    """Estimated seconds per stage ("skeleton", "skin", "merge", "optimize") for this mesh."""
+    model = model or RUNTIME_MODEL
+    million_vertices = info.vertex_count / 1e6
+    return {stage: cost["base"] + cost["per_million_vertices"] * million_vertices for stage, cost in model.items()}
@@ -0,0 +1,542 @@
+"""
+Post-merge compaction of rigged GLBs (numpy only, no Blender).
+
+    python glb_optimize.py rigged.glb compact.glb --max-influences 4 --compression auto --report report.json
+
+Steps, each optional:
+
+1. Prune: each vertex keeps its max_influences largest joint weights (over
+   all JOINTS_n/WEIGHTS_n sets), renormalized to sum to 1.
+2. Quantize: weights become normalized UNSIGNED_BYTE, with the rounding
+   residual moved to the largest weight so every vertex still sums to
+   exactly 255. Joint indices become UNSIGNED_BYTE (or UNSIGNED_SHORT with
+   more than 256 joints), and triangle indices UNSIGNED_SHORT when they
+   fit. Positions of skinned meshes become UNSIGNED_SHORT on a uniform grid
+   over the skin's bounds, and normals become normalized BYTE
+   (KHR_mesh_quantization). The dequantization transform is folded into the
+   skin's inverse bind matrices, so the posed result is unchanged up to
+   grid precision. Positions of unskinned meshes stay float.
+3. Compress: meshopt (gltfpack) or Draco (gltf-transform, gltf-pipeline)
+   geometry compression through whichever command-line tool is installed.
+   Without one, the step is skipped.
+
+optimize_glb() returns a report that compares the result with the raw
+merge output: bytes after each step, time per step, weight error and
+estimated transfer times.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from glb_inspector import CHUNK_BIN, CHUNK_JSON, GLB_MAGIC, TYPE_COMPONENTS, load_glb
+
+FLOAT, BYTE, UNSIGNED_BYTE, SHORT, UNSIGNED_SHORT, UNSIGNED_INT = 5126, 5120, 5121, 5122, 5123, 5125
+DTYPES = {BYTE: np.int8, UNSIGNED_BYTE: np.uint8, SHORT: np.int16, UNSIGNED_SHORT: np.uint16,
+          UNSIGNED_INT: np.uint32, FLOAT: np.float32}
+NORMALIZED_MAX = {BYTE: 127.0, UNSIGNED_BYTE: 255.0, SHORT: 32767.0, UNSIGNED_SHORT: 65535.0}
+ARRAY_BUFFER, ELEMENT_ARRAY_BUFFER = 34962, 34963
+WEIGHT_EPSILON = 1e-4
+POSITION_STEPS = 65535  # Grid resolution of quantized positions per axis
+QUANTIZATION_EXTENSION = "KHR_mesh_quantization"
+# Inputs that already use these are left alone: their geometry is not in plain accessors.
+COMPRESSED_EXTENSIONS = ("KHR_draco_mesh_compression", "EXT_meshopt_compression")
+TRANSFER_MBPS = (10, 100)  # Link speeds for the estimated transfer times in the report
+COMPRESSIONS = ("auto", "meshopt", "draco", "none")
+
+
+class GLBDocument:
+    """A GLB being rewritten: replaced accessors point at new buffer views appended to new_views."""
+
+    def __init__(self, gltf: Dict[str, Any], binary: bytes):
+        self.gltf = gltf
+        self.binary = binary
+        self.new_views: Dict[int, bytes] = {}
+        self.retired: set = set()  # Accessors replaced by a compacted copy
+
+    @classmethod
+    def load(cls, path: str) -> "GLBDocument":
+        return cls(*load_glb(path))
+
+    def read(self, accessor_index: int) -> np.ndarray:
+        """Accessor data as (count, components) in its stored dtype (not dequantized)."""
+        accessor = self.gltf["accessors"][accessor_index]
+        if "sparse" in accessor or "bufferView" not in accessor:
+            raise ValueError(f"Accessor {accessor_index} is sparse or has no buffer view.")
+        view_index = accessor["bufferView"]
+        view = self.gltf["bufferViews"][view_index]
+        dtype = np.dtype(DTYPES[accessor["componentType"]])
+        components = TYPE_COMPONENTS[accessor["type"]]
+        count = accessor["count"]
+        data = self.new_views.get(view_index)
+        if data is None:
+            start = view.get("byteOffset", 0)
+            data = self.binary[start:start + view["byteLength"]]
+        offset = accessor.get("byteOffset", 0)
+        stride = view.get("byteStride") or dtype.itemsize * components
+        rows = np.ndarray((count, components), dtype=dtype.newbyteorder("<"), buffer=data, offset=offset,
+                          strides=(stride, dtype.itemsize))
+        return rows.copy()
+
+    def read_float(self, accessor_index: int) -> np.ndarray:
+        """Accessor data as float64, dequantized when the accessor is normalized."""
+        accessor = self.gltf["accessors"][accessor_index]
+        values = self.read(accessor_index).astype(np.float64)
+        if accessor.get("normalized"):
+            values = np.maximum(values / NORMALIZED_MAX[accessor["componentType"]], -1.0)
+        return values
+
+    def add_accessor(self, values: np.ndarray, component_type: int, accessor_type: str,
+                     normalized: bool = False, target: Optional[int] = ARRAY_BUFFER,
+                     with_bounds: bool = False) -> int:
+        """
+        Appends values (count, components) as a new accessor and returns its index. Vertex attribute
+        rows are padded to a multiple of 4 bytes, as the glTF spec requires for their stride.
+        """
+        dtype = np.dtype(DTYPES[component_type]).newbyteorder("<")
+        values = np.ascontiguousarray(values, dtype=dtype)
+        count, components = values.shape
+        row_bytes = dtype.itemsize * components
+        stride = None
+        if target == ARRAY_BUFFER and row_bytes % 4:
+            padded_components = -(-row_bytes // 4) * 4 // dtype.itemsize
+            padded = np.zeros((count, padded_components), dtype=dtype)
+            padded[:, :components] = values
+            values, stride = padded, padded_components * dtype.itemsize
+        view = {"buffer": 0, "byteLength": values.nbytes}
+        if stride:
+            view["byteStride"] = stride
+        if target:
+            view["target"] = target
+        self.gltf["bufferViews"].append(view)
+        self.new_views[len(self.gltf["bufferViews"]) - 1] = values.tobytes()
+        accessor = {"bufferView": len(self.gltf["bufferViews"]) - 1, "componentType": component_type,
+                    "count": count, "type": accessor_type}
+        if normalized:
+            accessor["normalized"] = True
+        if with_bounds and count:
+            source = values[:, :components]
+            cast = float if component_type == FLOAT else int
+            accessor["min"] = [cast(v) for v in source.min(axis=0)]
+            accessor["max"] = [cast(v) for v in source.max(axis=0)]
+        self.gltf["accessors"].append(accessor)
+        return len(self.gltf["accessors"]) - 1
+
+    def primitives(self):
+        for mesh_index, mesh in enumerate(self.gltf.get("meshes", [])):
+            for primitive in mesh.get("primitives", []):
+                yield mesh_index, primitive
+
+    def require_extension(self, name: str):
+        for key in ("extensionsUsed", "extensionsRequired"):
+            if name not in self.gltf.setdefault(key, []):
+                self.gltf[key].append(name)
+
+    def _accessor_references(self):
+        """(container, key) of every accessor reference in core glTF and EXT_mesh_gpu_instancing."""
+        gltf = self.gltf
+        for _mesh_index, primitive in self.primitives():
+            for containers in ([primitive.get("attributes", {})], primitive.get("targets", [])):
+                for container in containers:
+                    yield from ((container, key) for key in container)
+            if "indices" in primitive:
+                yield primitive, "indices"
+        for skin in gltf.get("skins", []):
+            if "inverseBindMatrices" in skin:
+                yield skin, "inverseBindMatrices"
+        for animation in gltf.get("animations", []):
+            for sampler in animation.get("samplers", []):
+                yield from ((sampler, key) for key in ("input", "output") if key in sampler)
+        for node in gltf.get("nodes", []):
+            instancing = node.get("extensions", {}).get("EXT_mesh_gpu_instancing", {}).get("attributes", {})
+            yield from ((instancing, key) for key in instancing)
+
+    def _drop_retired_accessors(self):
+        references = list(self._accessor_references())
+        referenced = {container[key] for container, key in references}
+        dropped = sorted(self.retired - referenced)
+        self.retired = set()
+        if not dropped:
+            return
+        remap, kept = {}, []
+        for index, accessor in enumerate(self.gltf["accessors"]):
+            if index not in dropped:
+                remap[index] = len(kept)
+                kept.append(accessor)
+        self.gltf["accessors"] = kept
+        for container, key in references:
+            container[key] = remap[container[key]]
+
+    def to_bytes(self) -> bytes:
+        """
+        Serializes the document. Replaced accessors nothing references any more, and buffer views no
+        accessor or image references, are dropped.
+        """
+        self._drop_retired_accessors()
+        gltf = self.gltf
+        used = set()
+        for accessor in gltf.get("accessors", []):
+            if "bufferView" in accessor:
+                used.add(accessor["bufferView"])
+            sparse = accessor.get("sparse")
+            if sparse:
+                used.update((sparse["indices"]["bufferView"], sparse["values"]["bufferView"]))
+        used.update(image["bufferView"] for image in gltf.get("images", []) if "bufferView" in image)
+        remap: Dict[int, int] = {}
+        views: List[Dict[str, Any]] = []
+        chunks: List[bytes] = []
+        offset = 0
+        for index, view in enumerate(gltf.get("bufferViews", [])):
+            if index not in used:
+                continue
+            data = self.new_views.get(index)
+            if data is None:
+                start = view.get("byteOffset", 0)
+                data = self.binary[start:start + view["byteLength"]]
+            padding = (-offset) % 4
+            chunks.append(b"\x00" * padding + data)
+            offset += padding
+            remap[index] = len(views)
+            views.append(dict(view, buffer=0, byteOffset=offset, byteLength=len(data)))
+            offset += len(data)
+        for accessor in gltf.get("accessors", []):
+            if "bufferView" in accessor:
+                accessor["bufferView"] = remap[accessor["bufferView"]]
+            sparse = accessor.get("sparse")
+            if sparse:
+                for part in ("indices", "values"):
+                    sparse[part]["bufferView"] = remap[sparse[part]["bufferView"]]
+        for image in gltf.get("images", []):
+            if "bufferView" in image:
+                image["bufferView"] = remap[image["bufferView"]]
+        gltf["bufferViews"] = views
+        binary = b"".join(chunks)
+        binary += b"\x00" * ((-len(binary)) % 4)
+        gltf["buffers"] = [{"byteLength": len(binary)}] if binary else []
+        self.binary, self.new_views = binary, {}
+        json_chunk = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+        json_chunk += b" " * ((-len(json_chunk)) % 4)
+        total = 12 + 8 + len(json_chunk) + (8 + len(binary) if binary else 0)
+        parts = [np.array([GLB_MAGIC, 2, total], dtype="<u4").tobytes(),
+                 np.array([len(json_chunk), CHUNK_JSON], dtype="<u4").tobytes(), json_chunk]
+        if binary:
+            parts += [np.array([len(binary), CHUNK_BIN], dtype="<u4").tobytes(), binary]
+        return b"".join(parts)
+
+    def save(self, path: str) -> int:
+        data = self.to_bytes()
+        with open(path, "wb") as f:
+            f.write(data)
+        return len(data)
+
+
+def top_k_influences(joints: np.ndarray, weights: np.ndarray, max_influences: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Keeps the max_influences largest weights per vertex (columns sorted by weight), drops weights
+    below WEIGHT_EPSILON and renormalizes. Vertices left without weight keep their first joint at 1.
+    """
+    order = np.argsort(-weights, axis=1, kind="stable")[:, :max_influences]
+    kept_weights = np.take_along_axis(weights, order, axis=1)
+    kept_joints = np.take_along_axis(joints, order, axis=1)
+    kept_weights[kept_weights < WEIGHT_EPSILON] = 0.0
+    totals = kept_weights.sum(axis=1, keepdims=True)
+    kept_weights = np.divide(kept_weights, totals, out=np.zeros_like(kept_weights), where=totals > 0)
+    unweighted = totals[:, 0] <= 0
+    kept_weights[unweighted, 0] = 1.0
+    kept_joints[kept_weights == 0] = 0
+    return kept_joints, kept_weights
+
+
+def quantize_weights(weights: np.ndarray) -> np.ndarray:
+    """Rounds weights to bytes that sum to exactly 255 per vertex (residual goes to the largest)."""
+    quantized = np.rint(weights * 255.0).astype(np.int32)
+    residual = 255 - quantized.sum(axis=1)
+    largest = np.argmax(weights, axis=1)
+    quantized[np.arange(len(quantized)), largest] += residual
+    return np.clip(quantized, 0, 255).astype(np.uint8)
+
+
+def _influence_sets(primitive: Dict[str, Any]) -> List[Tuple[int, int]]:
+    attributes = primitive.get("attributes", {})
+    sets = []
+    while f"JOINTS_{len(sets)}" in attributes and f"WEIGHTS_{len(sets)}" in attributes:
+        sets.append((attributes[f"JOINTS_{len(sets)}"], attributes[f"WEIGHTS_{len(sets)}"]))
+    return sets
+
+
+def compact_weights(document: GLBDocument, max_influences: int, quantize: bool) -> Dict[str, Any]:
+    """Step 1 and the weight/joint part of step 2. Returns statistics for the report."""
+    if max_influences < 1:
+        # With none kept, every JOINTS/WEIGHTS set would be deleted and the mesh left unskinned.
+        raise ValueError(f"max_influences must be at least 1, got {max_influences}.")
+    stats = {"skinned_vertices": 0, "influences_before": 0, "influences_after": 0,
+             "pruned_weight_mass": 0.0, "max_weight_error": 0.0}
+    replaced: Dict[Tuple[Tuple[int, int], ...], List[Tuple[int, int]]] = {}
+    joint_count = max([len(skin.get("joints", [])) for skin in document.gltf.get("skins", [])] or [0])
+    for _mesh_index, primitive in document.primitives():
+        sets = tuple(_influence_sets(primitive))
+        if not sets:
+            continue
+        if sets not in replaced:
+            joints = np.hstack([document.read(joint_index).astype(np.int64) for joint_index, _ in sets])
+            weights = np.hstack([document.read_float(weight_index) for _, weight_index in sets])
+            totals = weights.sum(axis=1, keepdims=True)
+            reference = np.divide(weights, totals, out=np.zeros_like(weights), where=totals > 0)
+            kept_joints, kept_weights = top_k_influences(joints, reference, max_influences)
+            set_count = -(-max_influences // 4)
+            width = set_count * 4
+            kept_joints = np.pad(kept_joints, ((0, 0), (0, width - kept_joints.shape[1])))
+            kept_weights = np.pad(kept_weights, ((0, 0), (0, width - kept_weights.shape[1])))
+            if quantize:
+                stored_weights = quantize_weights(kept_weights)
+                final_weights = stored_weights / 255.0
+                weight_type = UNSIGNED_BYTE
+                joint_type = UNSIGNED_BYTE if max(joint_count, int(kept_joints.max(initial=0)) + 1) <= 256 else UNSIGNED_SHORT
+            else:
+                stored_weights, final_weights = kept_weights.astype(np.float32), kept_weights
+                weight_type, joint_type = FLOAT, document.gltf["accessors"][sets[0][0]]["componentType"]
+            # Error against the unpruned weights, per joint (scatter both onto joint columns).
+            error = _weight_error(joints, reference, kept_joints, final_weights)
+            stats["skinned_vertices"] += len(weights)
+            stats["influences_before"] += int((reference > WEIGHT_EPSILON).sum())
+            stats["influences_after"] += int((final_weights > 0).sum())
+            dropped = 1.0 - -np.sort(-reference, axis=1)[:, :max_influences].sum(axis=1)
+            stats["pruned_weight_mass"] = max(stats["pruned_weight_mass"], float(dropped[totals[:, 0] > 0].max(initial=0.0)))
+            stats["max_weight_error"] = max(stats["max_weight_error"], error)
+            new_sets = []
+            for index in range(set_count):
+                columns = slice(index * 4, index * 4 + 4)
+                new_sets.append((
+                    document.add_accessor(kept_joints[:, columns], joint_type, "VEC4"),
+                    document.add_accessor(stored_weights[:, columns], weight_type, "VEC4", normalized=quantize),
+                ))
+            replaced[sets] = new_sets
+            document.retired.update(index for pair in sets for index in pair)
+        attributes = primitive["attributes"]
+        for index in range(len(sets)):
+            del attributes[f"JOINTS_{index}"], attributes[f"WEIGHTS_{index}"]
+        for index, (joint_index, weight_index) in enumerate(replaced[sets]):
+            attributes[f"JOINTS_{index}"], attributes[f"WEIGHTS_{index}"] = joint_index, weight_index
+    stats["pruned_weight_mass"] = round(stats["pruned_weight_mass"], 6)
+    stats["max_weight_error"] = round(stats["max_weight_error"], 6)
+    return stats
+
+
+def _weight_error(joints: np.ndarray, weights: np.ndarray, kept_joints: np.ndarray, kept_weights: np.ndarray) -> float:
+    """Largest per-vertex, per-joint absolute difference between two sparse weight sets."""
+    if not len(joints):
+        return 0.0
+    columns = int(max(joints.max(), kept_joints.max())) + 1
+    before = np.zeros((len(joints), columns))
+    after = np.zeros((len(joints), columns))
+    rows = np.arange(len(joints))[:, None]
+    np.add.at(before, (rows, joints), weights)
+    np.add.at(after, (rows, kept_joints), kept_weights)
+    return float(np.abs(before - after).max())
+
+
+def compact_indices(document: GLBDocument) -> int:
+    """UNSIGNED_INT triangle indices that fit in 16 bits become UNSIGNED_SHORT. Returns accessors converted."""
+    converted: Dict[int, int] = {}
+    for _mesh_index, primitive in document.primitives():
+        index = primitive.get("indices")
+        if index is None:
+            continue
+        if index not in converted:
+            accessor = document.gltf["accessors"][index]
+            converted[index] = index
+            if accessor["componentType"] == UNSIGNED_INT and "bufferView" in accessor and "sparse" not in accessor:
+                values = document.read(index)
+                if not len(values) or values.max() < 65535:  # 65535 is the primitive restart value
+                    converted[index] = document.add_accessor(values, UNSIGNED_SHORT, "SCALAR",
+                                                             target=ELEMENT_ARRAY_BUFFER)
+                    document.retired.add(index)
+        primitive["indices"] = converted[index]
+    return sum(1 for old, new in converted.items() if old != new)
+
+
+def _matrix_from_gltf(values: np.ndarray) -> np.ndarray:
+    return values.reshape(-1, 4, 4).transpose(0, 2, 1)  # glTF matrices are column-major
+
+
+def quantize_skinned_positions(document: GLBDocument) -> int:
+    """
+    Step 2 for geometry: positions and normals of meshes used by exactly one skin (and by no unskinned
+    node). The dequantization transform D becomes part of the skin's inverse bind matrices. Returns the
+    number of primitives quantized.
+    """
+    gltf = document.gltf
+    mesh_users: Dict[int, set] = {}
+    for node in gltf.get("nodes", []):
+        if "mesh" in node:
+            mesh_users.setdefault(node["mesh"], set()).add(node.get("skin"))
+    accessor_users: Dict[int, set] = {}
+    for mesh_index, primitive in document.primitives():
+        for accessor_index in primitive.get("attributes", {}).values():
+            accessor_users.setdefault(accessor_index, set()).add(mesh_index)
+    quantized = 0
+    for skin_index, skin in enumerate(gltf.get("skins", [])):
+        meshes = [mesh for mesh, users in mesh_users.items() if users == {skin_index}]
+        primitives = [primitive for mesh in meshes for primitive in gltf["meshes"][mesh].get("primitives", [])]
+        eligible = [
+            primitive for primitive in primitives
+            if "targets" not in primitive and "POSITION" in primitive.get("attributes", {})
+            and gltf["accessors"][primitive["attributes"]["POSITION"]]["componentType"] == FLOAT
+            and accessor_users[primitive["attributes"]["POSITION"]] <= set(meshes)
+        ]
+        if not eligible or len(eligible) != len(primitives):
+            continue
+        positions = {primitive["attributes"]["POSITION"]: None for primitive in eligible}
+        for accessor_index in positions:
+            positions[accessor_index] = document.read_float(accessor_index)
+        stacked = np.vstack(list(positions.values()))
+        low = stacked.min(axis=0)
+        step = float((stacked.max(axis=0) - low).max()) / POSITION_STEPS
+        if step <= 0:
+            continue
+        dequantize = np.eye(4)
+        dequantize[:3, :3] *= step
+        dequantize[:3, 3] = low
+        converted: Dict[int, int] = {}
+        for accessor_index, values in positions.items():
+            grid = np.clip(np.rint((values - low) / step), 0, POSITION_STEPS).astype(np.uint16)
+            converted[accessor_index] = document.add_accessor(grid, UNSIGNED_SHORT, "VEC3", with_bounds=True)
+            document.retired.add(accessor_index)
+        for primitive in eligible:
+            attributes = primitive["attributes"]
+            attributes["POSITION"] = converted[attributes["POSITION"]]
+            normal_index = attributes.get("NORMAL")
+            if normal_index is not None and gltf["accessors"][normal_index]["componentType"] == FLOAT:
+                if normal_index not in converted:
+                    converted[normal_index] = document.add_accessor(
+                        np.rint(np.clip(document.read_float(normal_index), -1.0, 1.0) * 127.0),
+                        BYTE, "VEC3", normalized=True)
+                attributes["NORMAL"] = converted[normal_index]
+                document.retired.add(normal_index)
+            quantized += 1
+        if "inverseBindMatrices" in skin:
+            document.retired.add(skin["inverseBindMatrices"])
+            matrices = _matrix_from_gltf(document.read_float(skin["inverseBindMatrices"]).reshape(-1))
+        else:
+            matrices = np.repeat(np.eye(4)[None], len(skin["joints"]), axis=0)
+        matrices = matrices @ dequantize
+        skin["inverseBindMatrices"] = document.add_accessor(matrices.transpose(0, 2, 1).reshape(-1, 16),
+                                                            FLOAT, "MAT4", target=None)
+    if quantized:
+        document.require_extension(QUANTIZATION_EXTENSION)
+    return quantized
+
+
+def compression_tool(compression: str) -> Optional[Tuple[str, Any]]:
+    """
+    (description, build_command(input, output)) of the installed tool for compression ("meshopt",
+    "draco" or "auto" for the first one found), or None.
+    """
+    tools = {
+        "meshopt": [("gltfpack", lambda i, o: ["gltfpack", "-i", i, "-o", o, "-cc", "-kn"])],
+        "draco": [("gltf-transform", lambda i, o: ["gltf-transform", "draco", i, o]),
+                  ("gltf-pipeline", lambda i, o: ["gltf-pipeline", "-i", i, "-o", o, "-d"])],
+    }
+    kinds = ["meshopt", "draco"] if compression == "auto" else [compression] if compression in tools else []
+    for kind in kinds:
+        for executable, build_command in tools[kind]:
+            if shutil.which(executable):
+                return f"{kind} ({executable})", build_command
+    return None
+
+
+def _transfer_seconds(size_bytes: int) -> Dict[str, float]:
+    return {f"{mbps}mbps": round(size_bytes * 8 / (mbps * 1e6), 3) for mbps in TRANSFER_MBPS}
+
+
+def optimize_glb(input_path: str, output_path: str, max_influences: int = 4, quantize: bool = True,
+                 compression: str = "auto", tool_timeout: float = 300) -> Dict[str, Any]:
+    """Writes the compacted GLB to output_path and returns the size and latency report."""
+    started = time.perf_counter()
+    raw_bytes = os.path.getsize(input_path)
+    report: Dict[str, Any] = {"raw_bytes": raw_bytes, "max_influences": max_influences, "quantize": quantize,
+                              "steps": []}
+
+    def step_done(name: str, step_started: float, size: int, **fields: Any):
+        report["steps"].append(dict(step=name, seconds=round(time.perf_counter() - step_started, 3),
+                                    bytes=size, **fields))
+
+    document = GLBDocument.load(input_path)
+    used = set(document.gltf.get("extensionsUsed", []))
+    if used & set(COMPRESSED_EXTENSIONS) or any("uri" in b for b in document.gltf.get("buffers", [])):
+        shutil.copyfile(input_path, output_path)
+        report.update(skipped="Input is already compressed or uses external buffers.", optimized_bytes=raw_bytes)
+    else:
+        step_started = time.perf_counter()
+        weight_stats = compact_weights(document, max_influences, quantize)
+        step_done("prune" + ("+quantize_weights" if quantize else ""), step_started,
+                  len(document.to_bytes()), **weight_stats)
+        if quantize:
+            step_started = time.perf_counter()
+            index_accessors = compact_indices(document)
+            primitives = quantize_skinned_positions(document)
+            step_done("quantize_geometry", step_started, len(document.to_bytes()),
+                      index_accessors=index_accessors, primitives=primitives)
+        size = document.save(output_path)
+        tool = compression_tool(compression) if compression != "none" else None
+        report["compression"] = tool[0] if tool else None
+        if tool:
+            step_started = time.perf_counter()
+            fd, compressed_path = tempfile.mkstemp(suffix=".glb", dir=os.path.dirname(os.path.abspath(output_path)))
+            os.close(fd)
+            try:
+                result = subprocess.run(tool[1](output_path, compressed_path), capture_output=True, text=True,
+                                        timeout=tool_timeout)
+                if result.returncode == 0 and os.path.getsize(compressed_path) > 0:
+                    os.replace(compressed_path, output_path)
+                    size = os.path.getsize(output_path)
+                    step_done("compress", step_started, size, tool=tool[0])
+                else:
+                    report["compression_error"] = (result.stderr or result.stdout).strip()[-500:]
+            except (OSError, subprocess.TimeoutExpired) as e:
+                report["compression_error"] = str(e)
+            finally:
+                if os.path.exists(compressed_path):
+                    os.remove(compressed_path)
+        elif compression not in ("none", "auto"):
+            report["compression_error"] = f"No {compression} tool installed."
+        report["optimized_bytes"] = size
+    report["ratio"] = round(report["optimized_bytes"] / raw_bytes, 4) if raw_bytes else 1.0
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    report["transfer_seconds"] = {"raw": _transfer_seconds(raw_bytes),
+                                  "optimized": _transfer_seconds(report["optimized_bytes"])}
+    return report
+
+
+def parse_args(argv: Sequence[str]):
+    parser = argparse.ArgumentParser(description="Compact a rigged GLB (prune, quantize, compress).")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--max-influences", type=int, default=4, help="Joint influences kept per vertex (at least 1).")
+    parser.add_argument("--no-quantize", action="store_true")
+    parser.add_argument("--compression", choices=COMPRESSIONS, default="auto")
+    parser.add_argument("--report", help="Also write the report to this JSON file.")
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str]) -> int:
+    options = parse_args(argv)
+    report = optimize_glb(options.input, options.output, options.max_influences, not options.no_quantize,
+                          options.compression)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if options.report:
+        with open(options.report, "w") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,329 @@
+"""
+Asynchronous job API, mounted next to the Gradio UI.
+
+    POST /api/jobs                   multipart "file" (.glb), optional "callback_url" and "profile"
+                                     -> 202 {"job_id", ...}
+    GET  /api/jobs                   recent jobs (?status=queued|running|done|failed|cancelled&limit=N)
+    GET  /api/jobs/{job_id}          status, current stage, progress (0-1) and per-stage state
+    GET  /api/jobs/{job_id}/result   the rigged .glb once the job is done (409 before that)
+    GET  /api/jobs/{job_id}/skeleton the skeleton .fbx the result was built from
+    GET  /api/jobs/{job_id}/profiles/{name}  a profiler report of a job submitted with profile=true
+    POST /api/jobs/{job_id}/cancel   cancels a queued or running job
+
+A submission only stores the upload and returns, so no client connection
+stays open for the length of a job. JobManager runs the stored jobs from an
+asyncio queue, at most max_running at a time. Each job runs in a worker thread
+through the same rig pipeline as the UI. Progress and results go to the
+SQLite JobStore, so a restart resumes queued work. When a job finishes, its
+record is POSTed as JSON to the callback URL, if one was given. Callback URLs
+must name a host on the server's allowlist, since anyone who can submit a job
+could otherwise make the server send requests to internal addresses; redirects
+are not followed for the same reason. Failed deliveries are retried with
+backoff. Finished jobs, with their input and
+result files, are deleted ttl_seconds after they end.
+
+With profile=true, the Blender steps of the job run under the profilers
+configured on the server. The reports are kept with the job and listed as
+"profile_urls".
+"""
+import asyncio
+import json
+import os
+import shutil
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Callable, Dict, Optional, Sequence
+from urllib.parse import urlparse
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import FileResponse, JSONResponse
+
+from cancellation import CancelToken, JobCancelled
+from job_store import CANCELLED, DONE, FAILED, QUEUED, RUNNING, TERMINAL_STATUSES, JobStore
+
+# run_pipeline(input_glb_path, on_event, cancel_token, **options)
+#     -> {"rigged_glb": ..., "skeleton_fbx": ..., "profiles": [...]}
+RunPipeline = Callable[..., Dict[str, Any]]
+
+PROGRESS_WRITE_INTERVAL = 1.0  # Seconds between progress writes from log lines
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+EXPIRY_INTERVAL = 600  # Seconds between passes deleting expired jobs
+
+
+class JobManager:
+    def __init__(self, store: JobStore, run_pipeline: RunPipeline, max_running: int = 2,
+                 callback_timeout: float = 10, callback_attempts: int = 5, ttl_seconds: float = 0):
+        self.store = store
+        self.run_pipeline = run_pipeline
+        self.max_running = max_running
+        self.callback_timeout = callback_timeout
+        self.callback_attempts = callback_attempts
+        self.ttl_seconds = ttl_seconds
+        self._queue: Optional["asyncio.Queue[str]"] = None
+        self._tasks = []
+        self._tokens: Dict[str, CancelToken] = {}
+        self._stopping = False
+
+    async def start(self):
+        if self._queue is not None:
+            return  # Startup hooks may fire once per router and once per app
+        self._queue = asyncio.Queue()
+        queued = self.store.recover()
+        for job_id in queued:
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker(), name=f"job-api-worker-{index}")
+                       for index in range(self.max_running)]
+        if self.ttl_seconds > 0:
+            self._tasks.append(asyncio.create_task(self._expire_jobs(), name="job-api-expiry"))
+        # Callbacks that were not delivered before the last shutdown.
+        for status in TERMINAL_STATUSES:
+            for job in self.store.list(status=status, limit=1000):
+                if job["callback_url"] and job["callback_status"] in (None, "pending"):
+                    self._tasks.append(asyncio.create_task(self._deliver_callback(job["id"])))
+        print(f"[JobAPI] Started {self.max_running} job runner(s); {len(queued)} queued job(s) resumed.")
+
+    async def stop(self):
+        """Interrupts running jobs; they go back to the queue and resume after the next start."""
+        self._stopping = True
+        for token in list(self._tokens.values()):
+            token.cancel("The server is shutting down.")
+        for task in self._tasks:
+            task.cancel()
+
+    def enqueue(self, job_id: str):
+        self._queue.put_nowait(job_id)
+
+    def cancel(self, job_id: str) -> Dict[str, Any]:
+        job = self.store.get(job_id)
+        # Only while still queued: a runner that started the job in the meantime owns it (see _run_job).
+        if job["status"] == QUEUED and self.store.update(
+                job_id, expect_status=QUEUED, status=CANCELLED, finished_at=time.time(),
+                error="Cancelled before it started.", callback_status="pending" if job["callback_url"] else None):
+            if job["callback_url"]:
+                self._tasks.append(asyncio.get_running_loop().create_task(self._deliver_callback(job_id)))
+        elif job_id in self._tokens:
+            self._tokens[job_id].cancel(f"Job {job_id} cancelled through the API.")
+        return self.store.get(job_id)
+
+    def stats(self) -> Dict[str, int]:
+        counts = self.store.counts()
+        counts["waiting_in_memory"] = self._queue.qsize() if self._queue else 0
+        return counts
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self.store.get(job_id)
+            if not job or job["status"] != QUEUED:
+                continue
+            if not await asyncio.to_thread(self._run_job, job):
+                continue  # Cancelled between the read above and the start; cancel() sends its callback
+            job = self.store.get(job_id)
+            if job["callback_url"] and job["status"] in TERMINAL_STATUSES:
+                self._tasks.append(asyncio.create_task(self._deliver_callback(job_id)))
+
+    def _run_job(self, job: Dict[str, Any]) -> bool:
+        """Runs a queued job to a terminal status. Returns False if it was no longer queued."""
+        job_id = job["id"]
+        token = CancelToken()
+        # Registered first: a cancel() that loses the race below finds the token instead.
+        self._tokens[job_id] = token
+        if not self.store.update(job_id, expect_status=QUEUED, status=RUNNING, started_at=time.time(),
+                                 attempts=job["attempts"] + 1, message="Started.", error=None):
+            self._tokens.pop(job_id, None)
+            return False
+        options = (job.get("details") or {}).get("options") or {}
+        stages: Dict[str, Dict[str, Any]] = {}
+        last_write = [0.0]
+
+        def on_event(event: Dict[str, Any]):
+            if event["type"] == "log":
+                if event.get("fraction") is None or time.time() - last_write[0] < PROGRESS_WRITE_INTERVAL:
+                    return
+            elif event.get("stage"):
+                stage_state = {"stage_start": "running", "stage_end": "done",
+                               "stage_skipped": "skipped", "queued": "queued"}.get(event["type"])
+                if stage_state:
+                    stages[event["stage"]] = {"status": stage_state, "message": event.get("message", ""),
+                                              "elapsed": round(event["elapsed"], 1)}
+            last_write[0] = time.time()
+            self.store.update(job_id, stage=event.get("stage"), progress=round(event.get("overall") or 0.0, 3),
+                              message=(event.get("message") or event["type"])[:500],
+                              details={"options": options, "stages": stages})
+
+        try:
+            outputs = self.run_pipeline(job["input_path"], on_event, token, **options)
+            # Results are copied out of the shared caches, which may evict them.
+            result_path = os.path.join(self.store.job_dir(job_id), "rigged.glb")
+            shutil.copyfile(outputs["rigged_glb"], result_path)
+            skeleton_path = None
+            if outputs.get("skeleton_fbx") and os.path.exists(outputs["skeleton_fbx"]):
+                skeleton_path = os.path.join(self.store.job_dir(job_id), "skeleton.fbx")
+                shutil.copyfile(outputs["skeleton_fbx"], skeleton_path)
+            profiles = []
+            for report_path in outputs.get("profiles") or []:
+                os.makedirs(os.path.join(self.store.job_dir(job_id), "profiles"), exist_ok=True)
+                shutil.copyfile(report_path, os.path.join(self.store.job_dir(job_id), "profiles",
+                                                          os.path.basename(report_path)))
+                profiles.append(os.path.basename(report_path))
+            self.store.update(job_id, status=DONE, finished_at=time.time(), progress=1.0, message="Finished.",
+                              details={"options": options, "stages": stages, "profiles": profiles},
+                              result_path=result_path, skeleton_path=skeleton_path,
+                              callback_status="pending" if job["callback_url"] else None)
+        except JobCancelled as e:
+            if self._stopping:
+                self.store.update(job_id, status=QUEUED, message="Interrupted by a shutdown; resumes on restart.")
+            else:
+                self.store.update(job_id, status=CANCELLED, finished_at=time.time(), error=str(e),
+                                  callback_status="pending" if job["callback_url"] else None)
+        except Exception as e:
+            print(f"[JobAPI] Job {job_id} failed: {e}")
+            self.store.update(job_id, status=FAILED, finished_at=time.time(), error=str(e)[:2000],
+                              callback_status="pending" if job["callback_url"] else None)
+        finally:
+            self._tokens.pop(job_id, None)
+        return True
+
+    async def _expire_jobs(self):
+        while True:
+            expired = self.store.expired(time.time() - self.ttl_seconds)
+            for job_id in expired:
+                await asyncio.to_thread(self.store.delete, job_id)
+            if expired:
+                print(f"[JobAPI] Deleted {len(expired)} job(s) older than {self.ttl_seconds:.0f}s.")
+            await asyncio.sleep(min(EXPIRY_INTERVAL, self.ttl_seconds))
+
+    async def _deliver_callback(self, job_id: str):
+        job = self.store.get(job_id)
+        body = json.dumps(public_job(job)).encode("utf-8")
+        for attempt in range(1, self.callback_attempts + 1):
+            try:
+                await asyncio.to_thread(self._post, job["callback_url"], body)
+                self.store.update(job_id, callback_status="delivered")
+                return
+            except (OSError, urllib.error.URLError) as e:
+                print(f"[JobAPI] Callback for job {job_id} failed (attempt {attempt}): {e}")
+                if attempt < self.callback_attempts:
+                    await asyncio.sleep(min(2 ** attempt, 60))
+        self.store.update(job_id, callback_status="failed")
+
+    def _post(self, url: str, body: bytes):
+        request = urllib.request.Request(url, data=body, method="POST", headers={"Content-Type": "application/json"})
+        with _CALLBACK_OPENER.open(request, timeout=self.callback_timeout) as response:
+            response.read()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """A redirect fails the delivery: it could point the callback at a host off the allowlist."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_CALLBACK_OPENER = urllib.request.build_opener(_NoRedirect)
+
+
+def callback_url_error(callback_url: str, allowed_hosts: Sequence[str]) -> Optional[str]:
+    """Why callback_url may not be used, or None. Hosts match exactly, without the port."""
+    parsed = urlparse(callback_url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return "callback_url must be an http(s) URL."
+    if not allowed_hosts:
+        return "Callbacks are disabled on this server."
+    if parsed.hostname.lower() not in {host.lower() for host in allowed_hosts}:
+        return f"callback_url host {parsed.hostname!r} is not allowed on this server."
+    return None
+
+
+def public_job(job: Dict[str, Any], prefix: str = "/api/jobs") -> Dict[str, Any]:
+    """The job record as returned to clients: no server paths, plus the URLs to poll and download."""
+    record = {key: job[key] for key in ("status", "created_at", "started_at", "finished_at", "input_name",
+                                        "stage", "progress", "message", "error", "attempts", "callback_status")}
+    record["job_id"] = job["id"]
+    record["stages"] = (job.get("details") or {}).get("stages", {})
+    record["status_url"] = f"{prefix}/{job['id']}"
+    if job["status"] == DONE:
+        record["result_url"] = f"{prefix}/{job['id']}/result"
+        if job["skeleton_path"]:
+            record["skeleton_url"] = f"{prefix}/{job['id']}/skeleton"
+        profiles = (job.get("details") or {}).get("profiles") or []
+        if profiles:
+            record["profile_urls"] = [f"{prefix}/{job['id']}/profiles/{name}" for name in profiles]
+    return record
+
+
+def create_job_router(manager: JobManager, max_input_bytes: int, prefix: str = "/api/jobs",
+                      callback_hosts: Sequence[str] = ()) -> APIRouter:
+    """callback_hosts: hosts that callback_url may name; with none, submissions with a callback_url are rejected."""
+    router = APIRouter(prefix=prefix, tags=["jobs"], on_startup=[manager.start], on_shutdown=[manager.stop])
+
+    def get_job_or_404(job_id: str) -> Dict[str, Any]:
+        job = manager.store.get(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail=f"Unknown job {job_id}.")
+        return job
+
+    @router.post("", status_code=202)
+    async def submit_job(file: UploadFile = File(...), callback_url: Optional[str] = Form(None),
+                         profile: bool = Form(False)):
+        if not (file.filename or "").lower().endswith(".glb"):
+            raise HTTPException(status_code=400, detail="Upload a .glb file.")
+        callback_error = callback_url_error(callback_url, callback_hosts) if callback_url else None
+        if callback_error:
+            raise HTTPException(status_code=400, detail=callback_error)
+        job = manager.store.create(os.path.basename(file.filename), callback_url,
+                                   options={"profile": True} if profile else None)
+        written = 0
+        with open(job["input_path"], "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                written += len(chunk)
+                if written > max_input_bytes:
+                    f.close()
+                    manager.store.delete(job["id"])
+                    raise HTTPException(status_code=413,
+                                        detail=f"Input larger than {max_input_bytes / 1024**2:.0f} MB.")
+                f.write(chunk)
+        manager.enqueue(job["id"])
+        return JSONResponse(public_job(manager.store.get(job["id"]), prefix), status_code=202)
+
+    @router.get("")
+    async def list_jobs(status: Optional[str] = None, limit: int = 100):
+        return {"jobs": [public_job(job, prefix) for job in manager.store.list(status, min(limit, 1000))],
+                "counts": manager.stats()}
+
+    @router.get("/{job_id}")
+    async def get_job(job_id: str):
+        return public_job(get_job_or_404(job_id), prefix)
+
+    @router.get("/{job_id}/result")
+    async def get_result(job_id: str):
+        job = get_job_or_404(job_id)
+        if job["status"] != DONE:
+            raise HTTPException(status_code=409, detail=f"Job is {job['status']}, no result yet.")
+        base_name = os.path.splitext(job["input_name"] or "model")[0]
+        return FileResponse(job["result_path"], media_type="model/gltf-binary", filename=f"{base_name}_rigged.glb")
+
+    @router.get("/{job_id}/skeleton")
+    async def get_skeleton(job_id: str):
+        job = get_job_or_404(job_id)
+        if job["status"] != DONE or not job["skeleton_path"]:
+            raise HTTPException(status_code=409, detail="No skeleton for this job.")
+        base_name = os.path.splitext(job["input_name"] or "model")[0]
+        return FileResponse(job["skeleton_path"], media_type="application/octet-stream",
+                            filename=f"{base_name}_skeleton.fbx")
+
+    @router.get("/{job_id}/profiles/{name}")
+    async def get_profile(job_id: str, name: str):
+        job = get_job_or_404(job_id)
+        if name not in ((job.get("details") or {}).get("profiles") or []):
+            raise HTTPException(status_code=404, detail=f"No profile {name!r} for this job.")
+        return FileResponse(os.path.join(manager.store.job_dir(job_id), "profiles", name),
+                            media_type="application/octet-stream", filename=name)
+
+    @router.post("/{job_id}/cancel")
+    async def cancel_job(job_id: str):
+        get_job_or_404(job_id)
+        return public_job(manager.cancel(job_id), prefix)
+
+    return router
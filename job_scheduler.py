@@ -0,0 +1,206 @@
+"""
+Stage scheduler with separate execution lanes.
+
+A job is a list of stages, each bound to a lane ("gpu" for skeleton/skin
+inference, "cpu" for merging). Every lane has its own worker threads, so the
+CPU-side merge of one job overlaps with GPU inference of the next one and
+throughput approaches the GPU-stage bound instead of the full pipeline latency.
+A cancelled job's queued stages are dropped as soon as a lane reaches them, so
+its slots go straight to the jobs behind it.
+Admission control caps the number of jobs inside the scheduler; because no
+lane can hold more than that many jobs, the lane queues are bounded as well.
+"""
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+
+class SchedulerFull(RuntimeError):
+    """Raised by submit() when the admission limit is reached."""
+
+
+@dataclass
+class Stage:
+    name: str
+    lane: str
+    run: Callable[[], None]
+    estimated_seconds: float = 0.0  # Runtime estimate, used for the lane backlog
+
+
+@dataclass
+class StageTiming:
+    stage: str
+    lane: str
+    queued_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def queue_wait(self) -> float:
+        return (self.started_at or time.time()) - self.queued_at
+
+    @property
+    def duration(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+
+@dataclass
+class Job:
+    id: int
+    stages: List[Stage]
+    on_finish: Optional[Callable[[], None]] = None
+    future: Future = field(default_factory=Future)
+    next_stage: int = 0
+    submitted_at: float = field(default_factory=time.time)
+    timings: List[StageTiming] = field(default_factory=list)
+    cancel_error: Optional[BaseException] = None  # Set by StageScheduler.cancel()
+
+    def result(self, timeout: Optional[float] = None):
+        return self.future.result(timeout)
+
+
+class _Lane:
+    def __init__(self, name: str, parallelism: int, max_queued: int):
+        self.name = name
+        self.parallelism = parallelism
+        self.queue: "queue.Queue[Optional[Job]]" = queue.Queue(maxsize=max_queued)
+        self.in_flight = 0
+        self.backlog_seconds = 0.0  # Estimated work queued or running on this lane
+        self.threads: List[threading.Thread] = []
+
+
+class StageScheduler:
+    def __init__(self, lanes: Dict[str, int], max_jobs: int,
+                 on_stage_start: Optional[Callable[[Job, StageTiming], None]] = None,
+                 on_stage_end: Optional[Callable[[Job, StageTiming, Optional[BaseException]], None]] = None):
+        """
+        lanes: lane name -> number of worker threads (parallelism) for that lane.
+        max_jobs: admission limit on jobs inside the scheduler (queued or running).
+        on_stage_start / on_stage_end: optional hooks, e.g. for metrics.
+        """
+        self.max_jobs = max_jobs
+        self.on_stage_start = on_stage_start
+        self.on_stage_end = on_stage_end
+        # Room for max_jobs jobs plus one shutdown sentinel per lane thread.
+        self._lanes = {name: _Lane(name, parallelism, max_jobs + parallelism) for name, parallelism in lanes.items()}
+        self._lock = threading.Lock()
+        self._active_jobs = 0
+        self._ids = itertools.count(1)
+        self._closed = False
+        for lane in self._lanes.values():
+            for index in range(lane.parallelism):
+                thread = threading.Thread(target=self._lane_worker, args=(lane,), daemon=True,
+                                          name=f"{lane.name}-lane-{index}")
+                thread.start()
+                lane.threads.append(thread)
+
+    def submit(self, stages: List[Stage], on_finish: Optional[Callable[[], None]] = None) -> Job:
+        """Admits a job and queues its first stage. on_finish runs once the job succeeded or failed."""
+        for stage in stages:
+            if stage.lane not in self._lanes:
+                raise ValueError(f"Unknown lane '{stage.lane}' for stage '{stage.name}'.")
+        with self._lock:
+            if self._closed:
+                raise SchedulerFull("Scheduler is shut down.")
+            if self._active_jobs >= self.max_jobs:
+                raise SchedulerFull(f"{self._active_jobs} jobs already in progress (limit {self.max_jobs}).")
+            self._active_jobs += 1
+            job = Job(id=next(self._ids), stages=stages, on_finish=on_finish)
+        self._advance(job)
+        return job
+
+    def cancel(self, job: Job, error: BaseException):
+        """
+        Stops a job: stages not started yet are skipped and the job fails with error. A stage that is
+        already running finishes (or is killed by its owner) first.
+        """
+        if job.cancel_error is None and not job.future.done():
+            job.cancel_error = error
+
+    def _advance(self, job: Job):
+        if job.cancel_error is not None:
+            self._finish(job, job.cancel_error)
+            return
+        if job.next_stage >= len(job.stages):
+            self._finish(job, None)
+            return
+        stage = job.stages[job.next_stage]
+        job.timings.append(StageTiming(stage=stage.name, lane=stage.lane, queued_at=time.time()))
+        with self._lock:
+            self._lanes[stage.lane].backlog_seconds += stage.estimated_seconds
+        # Admission control bounds every lane queue to max_jobs, so this never blocks.
+        self._lanes[stage.lane].queue.put_nowait(job)
+
+    def _finish(self, job: Job, error: Optional[BaseException]):
+        try:
+            if job.on_finish:
+                job.on_finish()
+        except Exception as e:
+            print(f"[Scheduler] on_finish of job {job.id} failed: {e}")
+        with self._lock:
+            self._active_jobs -= 1
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(None)
+
+    def _lane_worker(self, lane: _Lane):
+        while True:
+            job = lane.queue.get()
+            if job is None:
+                return
+            stage = job.stages[job.next_stage]
+            timing = job.timings[-1]
+            if job.cancel_error is not None:
+                with self._lock:
+                    lane.backlog_seconds = max(lane.backlog_seconds - stage.estimated_seconds, 0.0)
+                self._finish(job, job.cancel_error)
+                continue
+            timing.started_at = time.time()
+            with self._lock:
+                lane.in_flight += 1
+            if self.on_stage_start:
+                self.on_stage_start(job, timing)
+            error = None
+            try:
+                stage.run()
+            except BaseException as e:
+                error = e
+            finally:
+                timing.finished_at = time.time()
+                with self._lock:
+                    lane.in_flight -= 1
+                    lane.backlog_seconds = max(lane.backlog_seconds - stage.estimated_seconds, 0.0)
+            if self.on_stage_end:
+                self.on_stage_end(job, timing, error)
+            if error is not None:
+                self._finish(job, job.cancel_error or error)
+            else:
+                job.next_stage += 1
+                self._advance(job)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active_jobs": self._active_jobs,
+                "max_jobs": self.max_jobs,
+                "lanes": {
+                    name: {"queued": lane.queue.qsize(), "in_flight": lane.in_flight,
+                           "parallelism": lane.parallelism,
+                           "estimated_wait_seconds": lane.backlog_seconds / max(lane.parallelism, 1)}
+                    for name, lane in self._lanes.items()
+                },
+            }
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+        for lane in self._lanes.values():
+            for _ in lane.threads:
+                lane.queue.put(None)
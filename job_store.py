@@ -0,0 +1,146 @@
+"""
+Persistent store for jobs submitted through the job API (job_api.py).
+
+One SQLite table holds every API job: its status, the stage it is in,
+progress, error, result paths and callback delivery state. Inputs and
+results live in a per-job directory next to the database, so a restart can
+pick queued jobs up again: recover() puts jobs that were running when the
+process died back into the queue.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL_STATUSES = (DONE, FAILED, CANCELLED)
+
+_COLUMNS = ("id", "status", "created_at", "started_at", "finished_at", "input_name", "input_path",
+            "callback_url", "callback_status", "stage", "progress", "message", "error",
+            "result_path", "skeleton_path", "attempts", "details")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    input_name TEXT,
+    input_path TEXT NOT NULL,
+    callback_url TEXT,
+    callback_status TEXT,
+    stage TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    error TEXT,
+    result_path TEXT,
+    skeleton_path TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+"""
+
+
+class JobStore:
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "jobs.sqlite3"), check_same_thread=False,
+                                   isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+
+    def job_dir(self, job_id: str) -> str:
+        return os.path.join(self.root, job_id)
+
+    def create(self, input_name: str, callback_url: Optional[str] = None,
+               options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Creates a queued job and its directory. The caller writes the input to job["input_path"].
+        options (pipeline keyword arguments) are kept in details["options"].
+        """
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.job_dir(job_id))
+        input_path = os.path.join(self.job_dir(job_id), "input.glb")
+        details = json.dumps({"options": options}) if options else None
+        with self._lock:
+            self._db.execute("INSERT INTO jobs (id, status, created_at, input_name, input_path, callback_url, details) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (job_id, QUEUED, time.time(), input_name, input_path, callback_url, details))
+        return self.get(job_id)
+
+    def update(self, job_id: str, expect_status: Optional[str] = None, **fields: Any) -> bool:
+        """
+        Sets fields of a job. With expect_status, only if the job still has that status, in the same
+        statement, so two writers cannot both make the same transition. Returns whether a job changed.
+        """
+        unknown = set(fields) - set(_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown job fields: {sorted(unknown)}")
+        if "details" in fields and not isinstance(fields["details"], (str, type(None))):
+            fields["details"] = json.dumps(fields["details"])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        query, params = f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id)
+        if expect_status is not None:
+            query, params = query + " AND status = ?", (*params, expect_status)
+        with self._lock:
+            return self._db.execute(query, params).rowcount > 0
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        query, params = "SELECT * FROM jobs", ()
+        if status:
+            query, params = query + " WHERE status = ?", (status,)
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY created_at DESC LIMIT ?", (*params, limit)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def recover(self) -> List[str]:
+        """Requeues jobs interrupted by a restart. Returns the ids of all queued jobs, oldest first."""
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = ?, stage = NULL, progress = 0, "
+                             "message = 'Requeued after a restart.' WHERE status = ?", (QUEUED, RUNNING))
+            rows = self._db.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)).fetchall()
+        return [row["id"] for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def expired(self, finished_before: float) -> List[str]:
+        """Ids of finished, failed or cancelled jobs that ended before finished_before."""
+        placeholders = ", ".join("?" for _ in TERMINAL_STATUSES)
+        with self._lock:
+            rows = self._db.execute(f"SELECT id FROM jobs WHERE status IN ({placeholders}) AND finished_at < ? "
+                                    "AND (callback_status IS NULL OR callback_status != 'pending')",
+                                    (*TERMINAL_STATUSES, finished_before)).fetchall()
+        return [row["id"] for row in rows]
+
+    def delete(self, job_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["details"] = json.loads(job["details"]) if job.get("details") else None
+        return job
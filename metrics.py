@@ -0,0 +1,255 @@
+"""
+Job and stage instrumentation.
+
+Every step records a breakdown of where its time went: queue wait in the
+scheduler, Blender process spawn, bootstrap/imports, model load, inference,
+FBX/GLB export, file I/O, the unattributed remainder and Blender shutdown. The
+in-Blender part of the breakdown comes from the timing markers printed by
+blender_hooks.py. Finished steps and jobs are written as one JSON record per
+line (stdout, or UNIRIG_JSON_LOG_PATH) and aggregated into Prometheus metrics
+that render_metrics() exposes in the text exposition format.
+"""
+import json
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from blender_hooks import TIMING_MARKER
+
+LATENCY_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800)
+MEMORY_BUCKETS = tuple(mb * 1024 ** 2 for mb in (256, 512, 1024, 2048, 4096, 8192, 16384, 32768))
+SIZE_BUCKETS = tuple(int(mb * 1024 ** 2) for mb in (0.25, 0.5, 1, 2, 5, 10, 25, 50, 100, 250))
+
+PHASES = ("queue_wait", "spawn", "import", "model_load", "cpu_optimize", "inference", "export", "file_io", "other",
+          "shutdown")
+SCRIPT_PHASES = ("model_load", "cpu_optimize", "inference", "export", "file_io")
+
+
+def _format_labels(label_names: Sequence[str], label_values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Gauge whose samples are read from a callback at render time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 read: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, label_names)
+        self.read = read
+
+    def render(self) -> List[str]:
+        try:
+            samples = self.read() if self.read else {}
+        except Exception as e:
+            print(f"[Metrics] Could not read gauge {self.name}: {e}")
+            samples = {}
+        return self.header() + [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}"
+                                for k, v in sorted(samples.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts + [sum]
+
+    def observe(self, value: float, *label_values: str):
+        with self._lock:
+            series = self._series.setdefault(label_values, [0.0] * (len(self.buckets) + 1))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        lines = self.header()
+        for label_values, series in items:
+            for bound, count in zip(self.buckets, series):
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, label_values, le)} {_format_value(count)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, label_values)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, label_values)} {_format_value(series[-2])}")
+        return lines
+
+
+_registry: List[_Metric] = []
+_json_log_path: Optional[str] = None
+_json_log_lock = threading.Lock()
+
+
+def register(metric: _Metric) -> _Metric:
+    _registry.append(metric)
+    return metric
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = register(Histogram("unirig_stage_seconds", "Wall time of a pipeline stage, queue wait excluded.", ["stage"]))
+STAGE_PHASE_SECONDS = register(Histogram("unirig_stage_phase_seconds", "Time spent per phase of a pipeline stage.",
+                                         ["stage", "phase"]))
+STAGE_PEAK_RSS_BYTES = register(Histogram("unirig_stage_peak_rss_bytes", "Peak resident memory of a stage's Blender process.",
+                                          ["stage"], buckets=MEMORY_BUCKETS))
+STAGE_CPU_SECONDS = register(Histogram("unirig_stage_cpu_seconds", "User plus system CPU time of a pipeline stage.", ["stage"]))
+JOB_SECONDS = register(Histogram("unirig_job_seconds", "End-to-end latency of a rig job.", ["status"]))
+STAGE_FAILURES = register(Counter("unirig_stage_failures_total", "Failed pipeline stages.", ["stage"]))
+OUTPUT_BYTES = register(Histogram("unirig_output_bytes", "Size of rigged GLBs before (raw) and after (optimized) "
+                                  "the post-merge optimization.", ["variant"], buckets=SIZE_BUCKETS))
+TIME_TO_FIRST_RESULT = register(Histogram("unirig_time_to_first_result_seconds",
+                                          "Time from a UI rig request to the first model shown: the skeleton "
+                                          "preview, or the final GLB when none came first.", ["kind"]))
+JOBS_TOTAL = register(Counter("unirig_jobs_total", "Finished rig jobs by outcome.", ["status"]))
+ARTIFACTS_RECLAIMED_BYTES = register(Counter("unirig_artifacts_reclaimed_bytes_total",
+                                                 "Bytes deleted from the artifact store, by reason.", ["reason"]))
+RIG_REQUESTS = register(Counter("unirig_rig_requests_total",
+                                    "Rig requests by single-flight role: a leader runs the pipeline, "
+                                    "a follower joins an identical run already in flight.", ["role"]))
+PROFILED_STEPS = register(Counter("unirig_profiled_steps_total",
+                                 "Pipeline steps run under a profiler, by stage.", ["stage"]))
+
+
+def set_json_log_path(path: Optional[str]):
+    global _json_log_path
+    _json_log_path = path or None
+
+
+def log_json(event: str, **fields: Any):
+    """Writes one structured log record (a single JSON line)."""
+    line = json.dumps(dict(event=event, ts=round(time.time(), 3), **fields), default=str)
+    with _json_log_lock:
+        if _json_log_path:
+            with open(_json_log_path, "a") as f:
+                f.write(line + "\n")
+        else:
+            print(line, flush=True)
+
+
+def parse_timing_marker(line: str) -> Optional[Dict[str, Any]]:
+    index = line.find(TIMING_MARKER)
+    if index < 0:
+        return None
+    try:
+        return json.loads(line[index + len(TIMING_MARKER):])
+    except ValueError:
+        return None
+
+
+class StepTimer:
+    """
+    Collects the phase breakdown of one step: call launched() before starting Blender (or
+    handing the step to a warm worker), feed every output line to on_line, then call finished().
+    """
+
+    def __init__(self, stage: str, queue_wait: float = 0.0):
+        self.stage = stage
+        self.queue_wait = queue_wait
+        self.launched_at: Optional[float] = None
+        self.markers: Dict[str, Dict[str, Any]] = {}
+        self.usage: Dict[str, float] = {}
+
+    def launched(self):
+        self.launched_at = time.time()
+
+    def on_line(self, stream: str, line: str):
+        marker = parse_timing_marker(line)
+        if marker and "marker" in marker:
+            self.markers[marker["marker"]] = marker
+
+    def record_usage(self, peak_rss_bytes: int, cpu_seconds: float):
+        """Resource usage of the step's process (from os.wait4, or reported by a warm worker)."""
+        self.usage = {"peak_rss_bytes": peak_rss_bytes, "cpu_seconds": cpu_seconds}
+
+    def phases(self, finished_at: float) -> Dict[str, float]:
+        phases = {"queue_wait": self.queue_wait}
+        launched_at = self.launched_at or finished_at
+        bootstrap_start = self.markers.get("bootstrap_start", {}).get("t")
+        script_start = self.markers.get("script_start", {}).get("t")
+        script_end = self.markers.get("script_end", {})
+        if bootstrap_start is None or script_start is None or "t" not in script_end:
+            # No markers (script crashed early or is not instrumented): only the total is known.
+            phases["other"] = finished_at - launched_at
+            return phases
+        phases["spawn"] = max(bootstrap_start - launched_at, 0.0)
+        phases["import"] = max(script_start - bootstrap_start, 0.0)
+        in_script = dict(script_end.get("phases", {}))
+        for phase in SCRIPT_PHASES:
+            phases[phase] = float(in_script.get(phase, 0.0))
+        script_seconds = script_end["t"] - script_start
+        phases["other"] = max(script_seconds - sum(phases[p] for p in SCRIPT_PHASES), 0.0)
+        phases["shutdown"] = max(finished_at - script_end["t"], 0.0)
+        return phases
+
+    def finished(self, ok: bool, **fields: Any) -> Dict[str, float]:
+        finished_at = time.time()
+        phases = self.phases(finished_at)
+        duration = finished_at - (self.launched_at or finished_at)
+        STAGE_SECONDS.observe(duration, self.stage)
+        for phase, seconds in phases.items():
+            STAGE_PHASE_SECONDS.observe(seconds, self.stage, phase)
+        if not ok:
+            STAGE_FAILURES.inc(self.stage)
+        if self.usage:
+            if self.usage["peak_rss_bytes"]:
+                STAGE_PEAK_RSS_BYTES.observe(self.usage["peak_rss_bytes"], self.stage)
+            STAGE_CPU_SECONDS.observe(self.usage["cpu_seconds"], self.stage)
+            fields.update(peak_rss_mb=round(self.usage["peak_rss_bytes"] / 1024 ** 2, 1),
+                          cpu_seconds=round(self.usage["cpu_seconds"], 3))
+        log_json("stage_finished", stage=self.stage, ok=ok, seconds=round(duration, 3),
+                 phases={p: round(s, 3) for p, s in phases.items()}, **fields)
+        return phases
+
+
+def record_job(job_id: Any, status: str, seconds: float, **fields: Any):
+    JOBS_TOTAL.inc(status)
+    JOB_SECONDS.observe(seconds, status)
+    log_json("job_finished", job=job_id, status=status, seconds=round(seconds, 3), **fields)
@@ -0,0 +1,257 @@
+"""
+Preflight checks for the Blender/UniRig environment.
+
+The Blender environment diagnostic (bpy, UniRig 'src', flash_attn, spconv,
+torch/CUDA) is expensive: it needs a full Blender launch. It is run once per
+environment and its verdict is stored in a manifest together with a
+fingerprint of everything it depends on (Blender build, installed packages in
+Blender's site-packages, UniRig checkout revision, UniRig's asset.py). Requests
+only recompute the fingerprint, which costs a few stat calls, and rerun the
+diagnostic when it changes.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+from result_cache import read_git_revision
+
+RESULT_MARKER = "[Preflight-Result]"
+
+# Checks whose failure makes rigging impossible; the others only degrade it.
+CRITICAL_CHECKS = ("bpy", "unirig_src", "torch")
+
+# Executed inside Blender's Python through the usual bootstrap. __UNIRIG_REPO_DIR__ is substituted
+# with the repr() of the UniRig checkout path when the script is written.
+DIAGNOSTIC_SCRIPT_TEMPLATE = r'''
+import json
+import sys
+import os
+import traceback
+
+UNIRIG_REPO_DIR = __UNIRIG_REPO_DIR__
+checks = {}
+versions = {}
+
+print("--- Enhanced Diagnostic Info from Blender Python ---")
+print(f"Python Executable: {sys.executable}")
+print(f"Python Version: {sys.version.replace(chr(10), ' ')}")
+print(f"Current Working Directory (inside script): {os.getcwd()}")
+
+print("\nsys.path:")
+for i, p in enumerate(sys.path): print(f"  {i}: {p}")
+
+print("\nPYTHONPATH Environment Variable (as seen by script):")
+print(os.environ.get('PYTHONPATH', 'PYTHONPATH not set or empty'))
+
+print("\nLD_LIBRARY_PATH Environment Variable (as seen by script):")
+print(os.environ.get('LD_LIBRARY_PATH', 'LD_LIBRARY_PATH not set or empty'))
+
+print("\n--- Attempting Critical Imports ---")
+
+# 1. bpy
+print("\n1. Attempting 'bpy' import...")
+try:
+    import bpy
+    print("  SUCCESS: 'bpy' imported.")
+    print(f"     bpy version: {bpy.app.version_string}")
+    checks["bpy"] = True
+    versions["bpy"] = bpy.app.version_string
+except Exception as e:
+    print(f"  FAILED to import 'bpy': {e}")
+    traceback.print_exc(file=sys.stderr)
+    checks["bpy"] = False
+
+# 2. UniRig 'src' module
+print("\n2. Checking for UniRig 'src' module availability...")
+print(f"   Expected UniRig repo parent in sys.path: '{UNIRIG_REPO_DIR}'")
+found_unirig_in_sys_path = any(UNIRIG_REPO_DIR == os.path.abspath(p) for p in sys.path)
+print(f"   Is UNIRIG_REPO_DIR ('{UNIRIG_REPO_DIR}') in sys.path? {'Yes' if found_unirig_in_sys_path else 'No'}")
+
+unirig_src_dir_in_cwd_exists = os.path.isdir('src')
+print(f"   Is 'src' directory present in CWD ('{os.getcwd()}')? {'Yes' if unirig_src_dir_in_cwd_exists else 'No'}")
+if unirig_src_dir_in_cwd_exists:
+    init_py_in_src_exists = os.path.isfile(os.path.join('src', '__init__.py'))
+    print(f"     Is 'src/__init__.py' present? {'Yes' if init_py_in_src_exists else 'No'}")
+
+print("   Attempting 'from src.inference.download import download'...")
+try:
+    from src.inference.download import download
+    print("  SUCCESS: 'from src.inference.download import download' worked.")
+    checks["unirig_src"] = True
+except ImportError as e:
+    print(f"  FAILED: 'from src.inference.download import download': {e}")
+    print(f"  Make sure '{UNIRIG_REPO_DIR}' is correctly added to sys.path by the bootstrap script executed by Blender.")
+    traceback.print_exc(file=sys.stderr)
+    checks["unirig_src"] = False
+except Exception as e:
+    print(f"  FAILED: 'from src.inference.download import download' with other error: {e}")
+    traceback.print_exc(file=sys.stderr)
+    checks["unirig_src"] = False
+
+# 3. flash_attn
+print("\n3. Attempting 'flash_attn' import...")
+try:
+    import flash_attn
+    print("  SUCCESS: 'flash_attn' imported.")
+    if hasattr(flash_attn, '__version__'):
+        print(f"     flash_attn version: {flash_attn.__version__}")
+        versions["flash_attn"] = flash_attn.__version__
+    checks["flash_attn"] = True
+except Exception as e:
+    print(f"  FAILED to import 'flash_attn': {e}")
+    print(f"     Note: flash-attn is expected to be installed by setup_blender.sh from a specific wheel.")
+    traceback.print_exc(file=sys.stderr)
+    checks["flash_attn"] = False
+
+# 4. spconv
+print("\n4. Attempting 'spconv' import...")
+try:
+    import spconv
+    print("  SUCCESS: 'spconv' imported.")
+    if hasattr(spconv, 'constants') and hasattr(spconv.constants, 'SPCONV_VERSION'):
+        print(f"     spconv version: {spconv.constants.SPCONV_VERSION}")
+        versions["spconv"] = str(spconv.constants.SPCONV_VERSION)
+    elif hasattr(spconv, '__version__'):
+        print(f"     spconv version: {spconv.__version__}")
+        versions["spconv"] = spconv.__version__
+    checks["spconv"] = True
+except Exception as e:
+    print(f"  FAILED to import 'spconv': {e}")
+    print(f"     Note: spconv (e.g., spconv-cu118) should be installed via unirig_requirements.txt in Blender's Python.")
+    traceback.print_exc(file=sys.stderr)
+    checks["spconv"] = False
+
+# 5. torch with CUDA check
+print("\n5. Attempting 'torch' import and CUDA check...")
+try:
+    import torch
+    print("  SUCCESS: 'torch' imported.")
+    print(f"     torch version: {torch.__version__}")
+    versions["torch"] = torch.__version__
+    checks["torch"] = True
+    cuda_available = torch.cuda.is_available()
+    checks["cuda"] = cuda_available
+    print(f"     torch.cuda.is_available(): {cuda_available}")
+    if cuda_available:
+        print(f"       torch.version.cuda: {torch.version.cuda}")
+        print(f"       torch.cuda.get_device_name(0): {torch.cuda.get_device_name(0)}")
+        print(f"       torch.cuda.get_device_capability(0): {torch.cuda.get_device_capability(0)}")
+    else:
+        print(f"       CUDA not available to PyTorch in this Blender Python environment.")
+        if "cpu" in torch.__version__: # Check if it's a CPU build explicitly
+            print("       PyTorch build appears to be CPU-only.")
+        else:
+            print("       PyTorch build is not CPU-only, but CUDA is still not available. Check drivers/runtime/setup for Blender Python env.")
+
+except Exception as e:
+    print(f"  FAILED to import 'torch' or perform CUDA checks: {e}")
+    traceback.print_exc(file=sys.stderr)
+    checks["torch"] = False
+    checks["cuda"] = False
+
+print("\n--- End Enhanced Diagnostic Info ---")
+print("__RESULT_MARKER__ " + json.dumps({"checks": checks, "versions": versions}))
+'''
+
+
+def build_diagnostic_script(unirig_repo_dir: str) -> str:
+    return (DIAGNOSTIC_SCRIPT_TEMPLATE
+            .replace("__UNIRIG_REPO_DIR__", repr(os.path.abspath(unirig_repo_dir)))
+            .replace("__RESULT_MARKER__", RESULT_MARKER))
+
+
+def parse_diagnostic_output(stdout: str) -> Optional[Dict[str, Any]]:
+    """Extracts the JSON verdict printed by the diagnostic script, or None if it never got that far."""
+    for line in reversed(stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            try:
+                return json.loads(line[len(RESULT_MARKER):])
+            except ValueError:
+                return None
+    return None
+
+
+def _file_sha256(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _stat_signature(path: str) -> Optional[str]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def compute_fingerprint(blender_exec: Optional[str], blender_version_name: str,
+                        blender_python_dir: str, unirig_repo_dir: str) -> Dict[str, Any]:
+    """Cheap description of the environment the diagnostic verdict depends on."""
+    installed_packages = []
+    lib_dir = os.path.join(blender_python_dir, "lib")
+    if os.path.isdir(lib_dir):
+        for python_dir in sorted(os.listdir(lib_dir)):
+            site_packages = os.path.join(lib_dir, python_dir, "site-packages")
+            if os.path.isdir(site_packages):
+                # dist-info directory names carry "<name>-<version>".
+                installed_packages.extend(sorted(
+                    name for name in os.listdir(site_packages) if name.endswith((".dist-info", ".egg-info"))
+                ))
+    blender_exec_real = os.path.realpath(blender_exec) if blender_exec else None
+    return {
+        "blender_version": blender_version_name,
+        "blender_exec": blender_exec_real,
+        "blender_exec_signature": _stat_signature(blender_exec_real) if blender_exec_real else None,
+        "packages_sha256": hashlib.sha256("\n".join(installed_packages).encode("utf-8")).hexdigest(),
+        "package_count": len(installed_packages),
+        "unirig_revision": read_git_revision(unirig_repo_dir),
+        "asset_py_sha256": _file_sha256(os.path.join(unirig_repo_dir, "src", "data", "asset.py")),
+    }
+
+
+def fingerprint_digest(fingerprint: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_manifest(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(path: str, fingerprint: Dict[str, Any], verdict: Optional[Dict[str, Any]], log: str) -> Dict[str, Any]:
+    manifest = {
+        "fingerprint": fingerprint,
+        "digest": fingerprint_digest(fingerprint),
+        "verdict": verdict,
+        "ok": verdict_ok(verdict),
+        "created_at": time.time(),
+        "log": log,
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".preflight_", suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def verdict_ok(verdict: Optional[Dict[str, Any]]) -> bool:
+    if not verdict:
+        return False
+    checks = verdict.get("checks", {})
+    return all(checks.get(name) for name in CRITICAL_CHECKS)
+
+
+def failed_checks(verdict: Optional[Dict[str, Any]]):
+    if not verdict:
+        return ["diagnostic"]
+    return [name for name, passed in verdict.get("checks", {}).items() if not passed]
@@ -0,0 +1,101 @@
+"""
+Incremental reading of child process output.
+
+Blender steps can run for tens of minutes, so their stdout/stderr are read
+line by line while the process runs instead of being buffered until it exits.
+Every line is forwarded to an optional callback (live logs, progress parsing)
+and kept in a bounded ring buffer whose tail feeds the error summaries.
+"""
+import os
+import re
+import threading
+from collections import deque
+from typing import BinaryIO, Callable, Dict, List, Optional, Union
+
+# tqdm / Lightning progress bars, e.g. "Predicting DataLoader 0:  50%|#####     | 1/2"
+PROGRESS_PERCENT_RE = re.compile(r"(\d{1,3})%\|")
+PROGRESS_COUNT_RE = re.compile(r"\|\s*(\d+)/(\d+)\b")
+# Longest line kept; longer output without a line break is split.
+MAX_LINE_BYTES = 64 * 1024
+
+LineCallback = Callable[[str, str], None]
+
+
+class OutputTail:
+    """Thread-safe ring buffer of the last N lines of each stream."""
+
+    def __init__(self, max_lines: int = 500):
+        self.max_lines = max_lines
+        self._lines: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stream: str, line: str):
+        with self._lock:
+            if stream not in self._lines:
+                self._lines[stream] = deque(maxlen=self.max_lines)
+            self._lines[stream].append(line)
+
+    def text(self, stream: str) -> str:
+        with self._lock:
+            return "\n".join(self._lines.get(stream, ()))
+
+
+def _emit(stream: str, part: bytes, tail: OutputTail, on_line: Optional[LineCallback]):
+    line = part.decode("utf-8", errors="replace")
+    tail.add(stream, line)
+    if on_line:
+        # A failing callback must not stop the reader: the child would block on a full pipe.
+        try:
+            on_line(stream, line)
+        except Exception as e:
+            print(f"[Output] Line callback failed on {stream}: {e!r}")
+
+
+def _read_lines(source: Union[BinaryIO, int], stream: str, tail: OutputTail, on_line: Optional[LineCallback]):
+    fd = source if isinstance(source, int) else source.fileno()
+    pending = b""
+    try:
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            # Progress bars redraw with '\r'; treat it as a line break so updates arrive live.
+            parts = re.split(rb"[\r\n]", pending + chunk)
+            pending = parts.pop()
+            # Output without line breaks (binary dumps, runaway progress bars) is cut into lines of
+            # MAX_LINE_BYTES instead of being buffered without bound.
+            while len(pending) >= MAX_LINE_BYTES:
+                parts.append(pending[:MAX_LINE_BYTES])
+                pending = pending[MAX_LINE_BYTES:]
+            for part in parts:
+                if part:
+                    _emit(stream, part, tail, on_line)
+        if pending:
+            _emit(stream, pending, tail, on_line)
+    finally:
+        if isinstance(source, int):
+            os.close(source)
+        else:
+            source.close()
+
+
+def start_line_readers(sources: Dict[str, Union[BinaryIO, int]], tail: OutputTail,
+                       on_line: Optional[LineCallback] = None) -> List[threading.Thread]:
+    """Starts one daemon reader per stream (file object or raw fd, closed at EOF)."""
+    readers = []
+    for stream, source in sources.items():
+        reader = threading.Thread(target=_read_lines, args=(source, stream, tail, on_line), daemon=True)
+        reader.start()
+        readers.append(reader)
+    return readers
+
+
+def parse_progress_fraction(line: str) -> Optional[float]:
+    """Returns the completion fraction reported by a progress-bar line, if any."""
+    match = PROGRESS_PERCENT_RE.search(line)
+    if match:
+        return min(int(match.group(1)), 100) / 100.0
+    match = PROGRESS_COUNT_RE.search(line)
+    if match and int(match.group(2)) > 0:
+        return min(int(match.group(1)) / int(match.group(2)), 1.0)
+    return None
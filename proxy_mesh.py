@@ -0,0 +1,273 @@
+"""
+Proxy meshes for very dense inputs (decimate, rig the proxy, transfer back).
+
+Executed inside Blender's Python through the usual bootstrap:
+    proxy_mesh.py simplify --input in.glb --output proxy.glb --target-faces 100000
+    proxy_mesh.py transfer --source rigged_proxy.glb --target in.glb --output rigged.glb
+
+"simplify" joins every mesh of the input in world space and decimates it with
+fast-simplification. UniRig predicts the skeleton and skin on that proxy, and
+its merge step puts the rig back into the proxy's (= the input's) frame.
+"transfer" then moves the skin weights onto the full-resolution meshes. For
+every full-resolution vertex it finds the closest point on the proxy surface
+among the triangles whose centroids are nearest (scipy cKDTree), and it
+blends the weights of that triangle's corners barycentrically. The numpy parts
+need no Blender and are reused by benchmarks/proxy_quality.py.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+MAX_INFLUENCES = 4
+WEIGHT_EPSILON = 1e-4
+
+
+def simplify_mesh(vertices: np.ndarray, faces: np.ndarray, target_faces: int):
+    """Decimates a triangle mesh to about target_faces faces. Returns (vertices, faces)."""
+    import fast_simplification
+    if len(faces) <= target_faces:
+        return vertices, faces
+    reduction = 1.0 - float(target_faces) / len(faces)
+    proxy_vertices, proxy_faces = fast_simplification.simplify(
+        vertices.astype(np.float32), faces.astype(np.int64), target_reduction=reduction)
+    return np.asarray(proxy_vertices, dtype=np.float64), np.asarray(proxy_faces, dtype=np.int64)
+
+
+def closest_point_barycentric(points: np.ndarray, a: np.ndarray, b: np.ndarray, c: np.ndarray):
+    """
+    Barycentric coordinates (N, 3) of the point of each triangle (a[i], b[i], c[i]) closest to
+    points[i], and the squared distance to it. Vectorized form of Ericson's region tests.
+    """
+    ab, ac = b - a, c - a
+    ap, bp, cp = points - a, points - b, points - c
+    d1, d2 = np.einsum("ij,ij->i", ab, ap), np.einsum("ij,ij->i", ac, ap)
+    d3, d4 = np.einsum("ij,ij->i", ab, bp), np.einsum("ij,ij->i", ac, bp)
+    d5, d6 = np.einsum("ij,ij->i", ab, cp), np.einsum("ij,ij->i", ac, cp)
+    va, vb, vc = d3 * d6 - d5 * d4, d5 * d2 - d1 * d6, d1 * d4 - d3 * d2
+
+    def safe_div(numerator, denominator):
+        return numerator / np.where(np.abs(denominator) > 1e-20, denominator, 1e-20)
+
+    # Interior by default. The region tests run in reverse of Ericson's order so the earliest match wins.
+    total = va + vb + vc
+    v, w = safe_div(vb, total), safe_div(vc, total)
+    bary = np.stack([1.0 - v - w, v, w], axis=1)
+    edge_t = {
+        "ab": safe_div(d1, d1 - d3),
+        "ac": safe_div(d2, d2 - d6),
+        "bc": safe_div(d4 - d3, (d4 - d3) + (d5 - d6)),
+    }
+    vertex_bary = {"a": (1.0, 0.0, 0.0), "b": (0.0, 1.0, 0.0), "c": (0.0, 0.0, 1.0)}
+    regions = [
+        ("bc", (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)),
+        ("ac", (vb <= 0) & (d2 >= 0) & (d6 <= 0)),
+        ("c", (d6 >= 0) & (d5 <= d6)),
+        ("ab", (vc <= 0) & (d1 >= 0) & (d3 <= 0)),
+        ("b", (d3 >= 0) & (d4 <= d3)),
+        ("a", (d1 <= 0) & (d2 <= 0)),
+    ]
+    for region, mask in regions:
+        if not mask.any():
+            continue
+        if region in vertex_bary:
+            bary[mask] = vertex_bary[region]
+            continue
+        t = edge_t[region][mask]
+        zeros = np.zeros_like(t)
+        bary[mask] = {"ab": np.stack([1 - t, t, zeros], 1), "ac": np.stack([1 - t, zeros, t], 1),
+                      "bc": np.stack([zeros, 1 - t, t], 1)}[region]
+    closest = bary[:, :1] * a + bary[:, 1:2] * b + bary[:, 2:] * c
+    return bary, np.einsum("ij,ij->i", points - closest, points - closest)
+
+
+def transfer_weights(source_vertices: np.ndarray, source_faces: np.ndarray, source_weights: np.ndarray,
+                     target_vertices: np.ndarray, candidates: int = 8, chunk_size: int = 65536) -> np.ndarray:
+    """
+    Interpolates per-vertex weights (n_source, n_groups) from a source triangle mesh onto target
+    vertices at the closest surface point. Returns (n_target, n_groups).
+    """
+    from scipy.spatial import cKDTree
+    triangles = source_vertices[source_faces]  # (m, 3, 3)
+    tree = cKDTree(triangles.mean(axis=1))
+    k = min(candidates, len(source_faces))
+    target_weights = np.zeros((len(target_vertices), source_weights.shape[1]), dtype=np.float32)
+    for start in range(0, len(target_vertices), chunk_size):
+        points = target_vertices[start:start + chunk_size]
+        _, nearest = tree.query(points, k=k)
+        nearest = nearest.reshape(len(points), k)
+        repeated = np.repeat(points, k, axis=0)
+        flat = nearest.reshape(-1)
+        bary, dist2 = closest_point_barycentric(repeated, triangles[flat, 0], triangles[flat, 1], triangles[flat, 2])
+        best = dist2.reshape(len(points), k).argmin(axis=1)
+        rows = np.arange(len(points)) * k + best
+        corner_weights = source_weights[source_faces[flat[rows]]]  # (p, 3, groups)
+        target_weights[start:start + len(points)] = np.einsum("pc,pcg->pg", bary[rows], corner_weights)
+    return target_weights
+
+
+def prune_weights(weights: np.ndarray, max_influences: int = MAX_INFLUENCES) -> np.ndarray:
+    """Keeps the largest max_influences weights per vertex and renormalizes them to sum to 1."""
+    if weights.shape[1] > max_influences:
+        # Select columns by index so ties cannot keep more than max_influences weights.
+        kept = np.argpartition(-weights, max_influences - 1, axis=1)[:, :max_influences]
+        pruned = np.zeros_like(weights)
+        np.put_along_axis(pruned, kept, np.take_along_axis(weights, kept, axis=1), axis=1)
+        weights = pruned
+    else:
+        weights = weights.copy()
+    weights[weights < WEIGHT_EPSILON] = 0.0
+    totals = weights.sum(axis=1, keepdims=True)
+    return np.divide(weights, totals, out=np.zeros_like(weights), where=totals > 0)
+
+
+# --- Blender glue -------------------------------------------------------------------------------
+
+def _log(message: str):
+    print(f"[ProxyMesh] {message}", flush=True)
+
+
+def _import_glb(path: str):
+    import bpy
+    before = set(bpy.context.scene.objects)
+    bpy.ops.import_scene.gltf(filepath=path)
+    return [obj for obj in bpy.context.scene.objects if obj not in before]
+
+
+def _world_mesh_arrays(obj):
+    """World-space vertices (n, 3) and triangles (m, 3) of a mesh object, modifiers applied."""
+    import bpy
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    evaluated = obj.evaluated_get(depsgraph)
+    mesh = evaluated.to_mesh()
+    try:
+        mesh.calc_loop_triangles()
+        vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+        mesh.vertices.foreach_get("co", vertices)
+        vertices = vertices.reshape(-1, 3)
+        faces = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int64)
+        mesh.loop_triangles.foreach_get("vertices", faces)
+        matrix = np.array(obj.matrix_world)
+        vertices = vertices @ matrix[:3, :3].T + matrix[:3, 3]
+        return vertices, faces.reshape(-1, 3)
+    finally:
+        evaluated.to_mesh_clear()
+
+
+def _read_vertex_weights(obj) -> np.ndarray:
+    weights = np.zeros((len(obj.data.vertices), len(obj.vertex_groups)), dtype=np.float32)
+    for vertex in obj.data.vertices:
+        for element in vertex.groups:
+            weights[vertex.index, element.group] = element.weight
+    return weights
+
+
+def _write_vertex_weights(obj, weights: np.ndarray, group_names):
+    # Vertex-group writes are per call; batching vertices by quantized weight keeps the call count
+    # at most 256 per group instead of one per vertex.
+    quantized = np.round(weights * 255.0).astype(np.int32)
+    for group_index, name in enumerate(group_names):
+        column = quantized[:, group_index]
+        if not column.any():
+            continue
+        group = obj.vertex_groups.get(name) or obj.vertex_groups.new(name=name)
+        for level in np.unique(column[column > 0]):
+            group.add(np.nonzero(column == level)[0].tolist(), float(level) / 255.0, 'REPLACE')
+
+
+def run_simplify(options) -> int:
+    import bpy
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    meshes = [obj for obj in _import_glb(options.input) if obj.type == 'MESH']
+    if not meshes:
+        _log("Input has no mesh objects.")
+        return 1
+    parts = [_world_mesh_arrays(obj) for obj in meshes]
+    offsets = np.cumsum([0] + [len(v) for v, _ in parts[:-1]])
+    vertices = np.concatenate([v for v, _ in parts])
+    faces = np.concatenate([f + offset for (_, f), offset in zip(parts, offsets)])
+    started = time.time()
+    proxy_vertices, proxy_faces = simplify_mesh(vertices, faces, options.target_faces)
+    _log(f"Simplified {len(faces)} -> {len(proxy_faces)} faces in {time.time() - started:.2f}s")
+
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    mesh = bpy.data.meshes.new("proxy")
+    mesh.from_pydata(proxy_vertices.tolist(), [], proxy_faces.tolist())
+    mesh.update()
+    proxy = bpy.data.objects.new("proxy", mesh)
+    bpy.context.scene.collection.objects.link(proxy)
+    bpy.ops.export_scene.gltf(filepath=options.output, export_format='GLB')
+    return 0
+
+
+def run_transfer(options) -> int:
+    import bpy
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    source_objects = _import_glb(options.source)
+    armatures = [obj for obj in source_objects if obj.type == 'ARMATURE']
+    source_meshes = [obj for obj in source_objects if obj.type == 'MESH' and obj.vertex_groups]
+    if not armatures or not source_meshes:
+        _log("Rigged proxy has no armature or no skinned mesh.")
+        return 1
+    armature, proxy = armatures[0], source_meshes[0]
+    group_names = [group.name for group in proxy.vertex_groups]
+    proxy_vertices, proxy_faces = _world_mesh_arrays(proxy)
+    proxy_weights = _read_vertex_weights(proxy)
+
+    target_objects = _import_glb(options.target)
+    targets = [obj for obj in target_objects if obj.type == 'MESH']
+    # Already-skinned inputs: drop their old rig so the new armature is the only deformer.
+    world_matrices = {obj.name: obj.matrix_world.copy() for obj in targets}
+    for obj in targets:
+        for modifier in [m for m in obj.modifiers if m.type == 'ARMATURE']:
+            obj.modifiers.remove(modifier)
+        obj.parent = None
+        obj.matrix_world = world_matrices[obj.name]
+    for obj in target_objects:
+        if obj.type == 'ARMATURE':
+            bpy.data.objects.remove(obj, do_unlink=True)
+    bpy.context.view_layer.update()
+
+    started = time.time()
+    for obj in targets:
+        # Evaluated vertex order matches obj.data for plain imported meshes (no generative modifiers).
+        vertices, _faces = _world_mesh_arrays(obj)
+        weights = prune_weights(transfer_weights(proxy_vertices, proxy_faces, proxy_weights, vertices))
+        obj.vertex_groups.clear()
+        _write_vertex_weights(obj, weights, group_names)
+        obj.parent = armature
+        obj.matrix_parent_inverse = armature.matrix_world.inverted()
+        obj.matrix_world = world_matrices[obj.name]
+        modifier = obj.modifiers.new(name="Armature", type='ARMATURE')
+        modifier.object = armature
+        _log(f"Transferred {len(group_names)} groups to {len(vertices)} vertices of '{obj.name}'")
+    _log(f"Weight transfer took {time.time() - started:.2f}s")
+
+    for obj in source_meshes:
+        bpy.data.objects.remove(obj, do_unlink=True)
+    bpy.ops.export_scene.gltf(filepath=options.output, export_format='GLB')
+    return 0
+
+
+def parse_args(argv):
+    try:
+        argv = argv[argv.index('--') + 1:]
+    except ValueError:
+        argv = argv[1:]
+    parser = argparse.ArgumentParser(prog="proxy_mesh.py")
+    commands = parser.add_subparsers(dest="command", required=True)
+    simplify = commands.add_parser("simplify")
+    simplify.add_argument("--input", required=True)
+    simplify.add_argument("--output", required=True)
+    simplify.add_argument("--target-faces", type=int, required=True)
+    transfer = commands.add_parser("transfer")
+    transfer.add_argument("--source", required=True, help="Rigged proxy GLB (UniRig merge output).")
+    transfer.add_argument("--target", required=True, help="Full-resolution input GLB.")
+    transfer.add_argument("--output", required=True)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    proxy_options = parse_args(sys.argv)
+    sys.exit(run_simplify(proxy_options) if proxy_options.command == "simplify" else run_transfer(proxy_options))
@@ -0,0 +1,63 @@
+"""
+Readiness state of the app's environment.
+
+Provisioning (locating or installing Blender) and verification (UniRig checkout,
+preflight diagnostic) run in a background thread so the UI binds immediately.
+The thread moves a ReadinessState through provisioning -> verifying -> ready,
+or to failed. Request handlers block on wait(); the UI and /health read
+snapshot().
+"""
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+PROVISIONING = "provisioning"
+VERIFYING = "verifying"
+READY = "ready"
+FAILED = "failed"
+STATES = (PROVISIONING, VERIFYING, READY, FAILED)
+TERMINAL_STATES = (READY, FAILED)
+
+
+class ReadinessState:
+    """Thread-safe current state plus a short transition history."""
+
+    def __init__(self, initial: str = PROVISIONING, message: str = ""):
+        self._condition = threading.Condition()
+        self._started = time.time()
+        self._state = initial
+        self._message = message
+        self._since = self._started
+        self._history: List[Dict[str, Any]] = [{"state": initial, "message": message, "at": self._started}]
+
+    @property
+    def state(self) -> str:
+        with self._condition:
+            return self._state
+
+    def set(self, state: str, message: str = ""):
+        if state not in STATES:
+            raise ValueError(f"Unknown readiness state {state!r}")
+        with self._condition:
+            self._state = state
+            self._message = message
+            self._since = time.time()
+            self._history.append({"state": state, "message": message, "at": self._since})
+            self._condition.notify_all()
+        print(f"[Readiness] {state}{': ' + message if message else ''}")
+
+    def wait(self, timeout: Optional[float] = None) -> str:
+        """Blocks until the state is ready or failed, or until the timeout. Returns the state."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._state in TERMINAL_STATES, timeout=timeout)
+            return self._state
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "state": self._state,
+                "message": self._message,
+                "since": self._since,
+                "uptime_seconds": round(time.time() - self._started, 1),
+                "history": [dict(entry) for entry in self._history],
+            }
@@ -0,0 +1,325 @@
+"""
+Remote Blender workers over HTTP.
+
+A host with Blender, a UniRig checkout and its own devices runs
+
+    python remote_worker.py --blender <exec> --unirig-dir <dir> --port 8765 [--slots 2] [--token T]
+
+and serves GPU-lane steps for other app instances (list it in their
+UNIRIG_DEVICES as http://host:8765). Steps run in a local BlenderWorkerPool,
+so they reuse warm Blender processes (Blender started, torch and UniRig
+imported, checkpoint files cached in host memory) like local steps do. The
+models are still built for every step.
+
+Protocol (stdlib http.server / http.client, no extra dependencies):
+    GET  /health -> {"ok": true, "slots": ..., "in_flight": ...}
+    POST /run    {"script": <path relative to the UniRig dir>, "args": [...],
+                  "inputs": [{"path": <client path>, "data": <base64>}],
+                  "outputs": [<client path>, ...]}
+         -> newline-delimited JSON, streamed while the step runs:
+            {"event": "line", "stream": "stdout", "line": ...}
+            {"event": "heartbeat"}
+            {"event": "finished", "returncode": ..., "outputs": {<client path>: <base64>}, ...}
+            {"event": "error", "message": ...}
+Client paths in the arguments are rewritten to files in a per-request
+directory on the worker, and "device=..." arguments to the worker's own
+device. Closing the connection cancels the step. Requests must carry
+"Authorization: Bearer <token>" when the worker was started with a token.
+Only expose a worker to a trusted network.
+"""
+import argparse
+import base64
+import hmac
+import http.client
+import json
+import os
+import queue
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from cancellation import CancelToken, JobCancelled
+from process_output import LineCallback, OutputTail
+from worker_pool import BlenderWorkerPool, WorkerResult, WorkerUnavailable
+
+APP_ROOT_DIR = os.path.abspath(os.path.dirname(__file__))
+HEARTBEAT_SECONDS = 5
+
+
+def _abort(sock: Optional[socket.socket]):
+    """Wakes a thread blocked reading the response; the worker sees the disconnect and cancels the step."""
+    try:
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class RemoteWorker:
+    """Client side: runs one step on a remote worker and copies its outputs back."""
+
+    def __init__(self, url: str, token: Optional[str] = None, connect_timeout: float = 10):
+        parsed = urlparse(url)
+        self.url = url
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        self.https = parsed.scheme == "https"
+        self.token = token
+        self.connect_timeout = connect_timeout
+
+    def _connection(self, timeout: float) -> http.client.HTTPConnection:
+        connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=timeout)
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+    def health(self) -> Optional[Dict]:
+        try:
+            connection = self._connection(self.connect_timeout)
+            connection.request("GET", "/health", headers=self._headers())
+            response = connection.getresponse()
+            return json.loads(response.read()) if response.status == 200 else None
+        except (OSError, ValueError, http.client.HTTPException):
+            return None
+
+    def run(self, script: str, script_args: List[str], inputs: List[str], outputs: List[str], timeout: float,
+            on_line: Optional[LineCallback] = None, tail_lines: int = 500,
+            cancel_token: Optional[CancelToken] = None) -> WorkerResult:
+        payload = {"script": script, "args": script_args, "outputs": outputs, "inputs": []}
+        for path in inputs:
+            with open(path, "rb") as f:
+                payload["inputs"].append({"path": path, "data": base64.b64encode(f.read()).decode("ascii")})
+        tail = OutputTail(tail_lines)
+        deadline = time.time() + timeout
+        # Reads block at most a few heartbeats; a silent worker is treated as lost.
+        connection = self._connection(max(self.connect_timeout, HEARTBEAT_SECONDS * 3))
+        on_cancel = None
+        finished = None
+        try:
+            connection.request("POST", "/run", body=json.dumps(payload), headers=self._headers())
+            # getresponse() detaches the socket from an HTTP/1.0 connection, so keep our own reference.
+            sock = connection.sock
+            if cancel_token:
+                on_cancel = cancel_token.add_callback(lambda reason: _abort(sock))
+            response = connection.getresponse()
+            if response.status != 200:
+                raise WorkerUnavailable(f"{self.url} answered {response.status}: {response.read()[:200]!r}")
+            while True:
+                if time.time() > deadline:
+                    raise WorkerUnavailable(f"{self.url} did not finish the step within {timeout:.0f}s.")
+                line = response.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                event = message.get("event")
+                if event == "line":
+                    tail.add(message["stream"], message["line"])
+                    if on_line:
+                        on_line(message["stream"], message["line"])
+                elif event == "finished":
+                    finished = message
+                    break
+                elif event == "error":
+                    raise WorkerUnavailable(f"{self.url} rejected the step: {message.get('message')}")
+        except (OSError, ValueError, http.client.HTTPException) as e:
+            if cancel_token and cancel_token.cancelled:
+                raise JobCancelled(cancel_token.reason) from None
+            raise WorkerUnavailable(f"Lost connection to {self.url}: {e}") from e
+        finally:
+            if on_cancel:
+                cancel_token.remove_callback(on_cancel)
+            connection.close()
+        if cancel_token and cancel_token.cancelled:
+            raise JobCancelled(cancel_token.reason)
+        if finished is None:
+            raise WorkerUnavailable(f"{self.url} closed the connection before the step finished.")
+        for path, data in finished.get("outputs", {}).items():
+            if path in outputs:
+                with open(path, "wb") as f:
+                    f.write(base64.b64decode(data))
+        return WorkerResult(returncode=int(finished.get("returncode", 1)), stdout=tail.text("stdout"),
+                            stderr=tail.text("stderr"), cpu_seconds=float(finished.get("cpu_seconds", 0.0)),
+                            peak_rss_bytes=int(finished.get("peak_rss_bytes", 0)))
+
+
+class _RunHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.0"  # The streamed response ends when the connection closes.
+    server: "RemoteWorkerServer"
+
+    def log_message(self, format, *args):
+        print(f"[RemoteWorker] {self.address_string()} {format % args}", file=sys.stderr)
+
+    def _authorized(self) -> bool:
+        if not self.server.token:
+            return True
+        supplied = self.headers.get("Authorization", "")
+        if hmac.compare_digest(supplied, f"Bearer {self.server.token}"):
+            return True
+        self._send_json(401, {"ok": False, "message": "unauthorized"})
+        return False
+
+    def _send_json(self, status: int, body: Dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_event(self, message: Dict):
+        self.wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"ok": False})
+            return
+        if not self._authorized():
+            return
+        self._send_json(200, {"ok": True, "slots": self.server.slots, "in_flight": self.server.in_flight,
+                              "device_arg": self.server.device_arg})
+
+    def do_POST(self):
+        if self.path != "/run":
+            self._send_json(404, {"ok": False})
+            return
+        if not self._authorized():
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0"))))
+            script = os.path.realpath(os.path.join(self.server.unirig_dir, request["script"]))
+            if not script.startswith(self.server.unirig_dir + os.sep) or not os.path.isfile(script):
+                raise ValueError(f"script {request['script']!r} is not in the UniRig directory")
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {"ok": False, "message": str(e)})
+            return
+
+        work_dir = tempfile.mkdtemp(prefix="remote_step_")
+        try:
+            # Client path -> local path, longest first so nested paths are rewritten correctly.
+            path_map: Dict[str, str] = {}
+            for index, item in enumerate(request.get("inputs", [])):
+                local_path = os.path.join(work_dir, f"in{index}_{os.path.basename(item['path'])}")
+                with open(local_path, "wb") as f:
+                    f.write(base64.b64decode(item["data"]))
+                path_map[item["path"]] = local_path
+            for index, path in enumerate(request.get("outputs", [])):
+                path_map[path] = os.path.join(work_dir, f"out{index}_{os.path.basename(path)}")
+            args = []
+            for arg in request.get("args", []):
+                if arg.startswith("device="):
+                    arg = self.server.device_arg
+                for client_path in sorted(path_map, key=len, reverse=True):
+                    arg = arg.replace(client_path, path_map[client_path])
+                args.append(arg)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            self._stream_run(script, args, request.get("outputs", []), path_map)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _stream_run(self, script: str, args: List[str], outputs: List[str], path_map: Dict[str, str]):
+        events: "queue.Queue[Dict]" = queue.Queue()
+        cancel_token = CancelToken()
+
+        def run():
+            try:
+                result = self.server.pool.run(script, args, self.server.step_timeout,
+                                              on_line=lambda stream, line: events.put(
+                                                  {"event": "line", "stream": stream, "line": line}),
+                                              cancel_token=cancel_token)
+                encoded = {}
+                for path in outputs:
+                    if os.path.exists(path_map[path]):
+                        with open(path_map[path], "rb") as f:
+                            encoded[path] = base64.b64encode(f.read()).decode("ascii")
+                events.put({"event": "finished", "returncode": result.returncode, "outputs": encoded,
+                            "cpu_seconds": result.cpu_seconds, "peak_rss_bytes": result.peak_rss_bytes})
+            except BaseException as e:
+                events.put({"event": "error", "message": f"{type(e).__name__}: {e}"})
+
+        with self.server.lock:
+            self.server.in_flight += 1
+        thread = threading.Thread(target=run, daemon=True, name="remote-step")
+        thread.start()
+        try:
+            while True:
+                try:
+                    message = events.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    message = {"event": "heartbeat"}
+                self._write_event(message)
+                if message["event"] in ("finished", "error"):
+                    break
+        except OSError:
+            cancel_token.cancel("remote client disconnected")
+        finally:
+            thread.join()
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+
+class RemoteWorkerServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, pool: BlenderWorkerPool, unirig_dir: str, slots: int, device_arg: str,
+                 step_timeout: float, token: Optional[str] = None):
+        super().__init__(address, _RunHandler)
+        self.pool = pool
+        self.unirig_dir = os.path.realpath(unirig_dir)
+        self.slots = slots
+        self.device_arg = device_arg
+        self.step_timeout = step_timeout
+        self.token = token
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve UniRig steps to remote app instances.")
+    parser.add_argument("--blender", required=True, help="Blender executable.")
+    parser.add_argument("--unirig-dir", required=True, help="UniRig repository root.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--slots", type=int, default=1, help="Steps run at the same time (persistent workers).")
+    parser.add_argument("--device-arg", default="device=cuda:0", help="UniRig device argument used on this host.")
+    parser.add_argument("--max-jobs-per-worker", type=int, default=20)
+    parser.add_argument("--step-timeout", type=float, default=1800)
+    parser.add_argument("--token", default=os.environ.get("UNIRIG_REMOTE_WORKER_TOKEN"),
+                        help="Shared secret clients must send (default: UNIRIG_REMOTE_WORKER_TOKEN).")
+    options = parser.parse_args(argv)
+
+    pool = BlenderWorkerPool(size=options.slots, max_jobs_per_worker=options.max_jobs_per_worker,
+                             blender_exec=options.blender,
+                             worker_script=os.path.join(APP_ROOT_DIR, "blender_worker.py"),
+                             unirig_repo_dir=os.path.abspath(options.unirig_dir), env=dict(os.environ))
+    server = RemoteWorkerServer((options.host, options.port), pool, options.unirig_dir, options.slots,
+                                options.device_arg, options.step_timeout, options.token)
+    print(f"[RemoteWorker] Serving {options.unirig_dir} on http://{options.host}:{options.port} "
+          f"({options.slots} slot(s), {options.device_arg})")
+    # Stop the persistent Blender workers (own sessions) on SIGTERM as well.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
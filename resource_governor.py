@@ -0,0 +1,199 @@
+"""
+Resource governance for Blender child processes.
+
+Without limits every Blender/torch child starts one OpenMP/MKL thread per core.
+Concurrent rig steps then oversubscribe the CPU, and one large mesh can push
+the others into the OOM killer. Each step therefore runs under a
+ResourceProfile:
+
+* a CPU set handed out by the host-wide CpuAllocator (least-used CPUs first),
+* a thread budget equal to the size of that set (OMP/MKL/OpenBLAS, torch intra-op),
+* an optional RLIMIT_AS ceiling and an optional RSS ceiling for the process group.
+
+The profile reaches the child as environment variables and is applied inside
+Blender by blender_hooks.apply_resource_limits(). The host pins the child
+right after it starts, runs an RssWatchdog over its process group, and reads
+the child's peak RSS and CPU time from os.wait4 once it exits.
+"""
+import os
+import subprocess
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from cancellation import terminate_process_group
+
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+CPU_AFFINITY_ENV = "UNIRIG_CPU_AFFINITY"
+TORCH_THREADS_ENV = "UNIRIG_TORCH_THREADS"
+ADDRESS_SPACE_ENV = "UNIRIG_ADDRESS_SPACE_LIMIT"
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class MemoryLimitExceeded(RuntimeError):
+    """The process group went over its RSS ceiling and was terminated."""
+
+
+def host_cpus() -> List[int]:
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # Not Linux
+        return list(range(os.cpu_count() or 1))
+
+
+class CpuAllocator:
+    """
+    Hands out CPU sets for child processes, least-used CPUs first. It never blocks: when more
+    CPUs are requested than the host has free, the sets overlap as evenly as possible.
+    """
+
+    def __init__(self, cpus: Optional[List[int]] = None):
+        self._usage: Dict[int, int] = {cpu: 0 for cpu in (cpus or host_cpus())}
+        self._lock = threading.Lock()
+
+    @property
+    def cpu_count(self) -> int:
+        return len(self._usage)
+
+    def acquire(self, count: int) -> List[int]:
+        count = max(1, min(count, len(self._usage)))
+        with self._lock:
+            chosen = sorted(sorted(self._usage), key=lambda cpu: self._usage[cpu])[:count]
+            for cpu in chosen:
+                self._usage[cpu] += 1
+        return sorted(chosen)
+
+    def release(self, cpus: List[int]):
+        with self._lock:
+            for cpu in cpus:
+                if self._usage.get(cpu, 0) > 0:
+                    self._usage[cpu] -= 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"cpus": len(self._usage), "cpus_in_use": sum(1 for n in self._usage.values() if n),
+                    "max_sharing": max(self._usage.values(), default=0)}
+
+
+@dataclass
+class ResourceProfile:
+    cpus: List[int]
+    threads: int
+    address_space_bytes: int = 0  # RLIMIT_AS inside the child; 0 = unlimited. Not for CUDA processes.
+    rss_limit_bytes: int = 0  # Enforced from the host over the whole process group; 0 = unlimited.
+    allocator: Optional[CpuAllocator] = field(default=None, repr=False, compare=False)
+
+    def env(self) -> Dict[str, str]:
+        env = {name: str(self.threads) for name in THREAD_ENV_VARS}
+        env[TORCH_THREADS_ENV] = str(self.threads)
+        if self.cpus:
+            env[CPU_AFFINITY_ENV] = ",".join(str(cpu) for cpu in self.cpus)
+        if self.address_space_bytes:
+            env[ADDRESS_SPACE_ENV] = str(self.address_space_bytes)
+        return env
+
+    def pin(self, pid: int):
+        """Pins a freshly started child; threads it creates afterwards inherit the CPU set."""
+        if self.cpus and hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(pid, self.cpus)
+            except OSError as e:
+                print(f"[Resources] Could not pin pid {pid} to CPUs {self.cpus}: {e}")
+
+    def release(self):
+        if self.allocator is not None:
+            self.allocator.release(self.cpus)
+            self.allocator = None
+
+    def to_dict(self) -> Dict[str, object]:
+        return {key: value for key, value in asdict(self).items() if key != "allocator"}
+
+
+@dataclass
+class ProcessUsage:
+    returncode: int
+    peak_rss_bytes: int
+    cpu_seconds: float
+
+
+def process_group_rss_bytes(pgid: int) -> int:
+    """Sum of the resident set sizes of all processes in a process group (Linux /proc)."""
+    total = 0
+    try:
+        pids = [name for name in os.listdir("/proc") if name.isdigit()]
+    except OSError:
+        return 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                stat = f.read()
+            # Fields after the parenthesised command: state ppid pgrp ... rss is field 24 overall.
+            fields = stat[stat.rindex(b")") + 2:].split()
+            if int(fields[2]) == pgid:
+                total += int(fields[21]) * _PAGE_SIZE
+        except (OSError, ValueError, IndexError):
+            continue
+    return total
+
+
+class RssWatchdog:
+    """
+    Samples the RSS of a process group in a background thread, keeps the peak and, above
+    limit_bytes, terminates the group (SIGTERM, then SIGKILL) and sets exceeded.
+    """
+
+    def __init__(self, process: subprocess.Popen, limit_bytes: int = 0, interval: float = 1.0,
+                 grace_seconds: float = 10.0, on_exceeded: Optional[Callable[[int], None]] = None):
+        self.process = process
+        self.limit_bytes = limit_bytes
+        self.interval = interval
+        self.grace_seconds = grace_seconds
+        self.on_exceeded = on_exceeded
+        self.peak_bytes = 0
+        self.exceeded = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"rss-watchdog-{process.pid}")
+
+    def start(self) -> "RssWatchdog":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 1)
+
+    def _run(self):
+        while not self._stop.is_set() and self.process.poll() is None:
+            rss = process_group_rss_bytes(self.process.pid)
+            self.peak_bytes = max(self.peak_bytes, rss)
+            if self.limit_bytes and rss > self.limit_bytes:
+                self.exceeded = True
+                print(f"[Resources] pid {self.process.pid}: RSS {rss / 1024**2:.0f} MB over the "
+                      f"{self.limit_bytes / 1024**2:.0f} MB limit, terminating its process group.")
+                if self.on_exceeded:
+                    self.on_exceeded(rss)
+                terminate_process_group(self.process, self.grace_seconds)
+                return
+            self._stop.wait(self.interval)
+
+
+def wait_and_measure(process: subprocess.Popen, timeout: float, poll_interval: float = 0.1) -> ProcessUsage:
+    """
+    Waits for process like Popen.wait(timeout) (raising subprocess.TimeoutExpired), but reaps it
+    with os.wait4 to get its peak RSS and CPU time (including its waited-for children).
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        except ChildProcessError:
+            # Reaped elsewhere (e.g. by a concurrent terminate_process_group); usage is unknown.
+            return ProcessUsage(process.wait(), 0, 0.0)
+        if pid:
+            process.returncode = os.waitstatus_to_exitcode(status)
+            return ProcessUsage(process.returncode, rusage.ru_maxrss * 1024, rusage.ru_utime + rusage.ru_stime)
+        if time.monotonic() > deadline:
+            raise subprocess.TimeoutExpired(process.args, timeout)
+        time.sleep(poll_interval)
@@ -0,0 +1,173 @@
+"""
+Content-addressed on-disk cache for pipeline artifacts (rigged GLBs).
+
+Entries are stored as <root>/<key[:2]>/<key><suffix>. Writes go to a temporary
+file in the same directory followed by os.replace, so concurrent jobs never
+observe a partially written entry. Recency is tracked through the entry mtime
+(refreshed on every hit) and the oldest entries are evicted once the total
+size exceeds the byte budget.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+
+_digest_memo: "OrderedDict[Tuple[Any, ...], str]" = OrderedDict()
+_digest_memo_lock = threading.Lock()
+_DIGEST_MEMO_SIZE = 256
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    # Hashes are memoised per (file, size, mtime), so hashing the same upload twice in a request is free.
+    st = os.stat(path)
+    memo_key = (os.path.realpath(path), st.st_ino, st.st_size, st.st_mtime_ns)
+    with _digest_memo_lock:
+        if memo_key in _digest_memo:
+            _digest_memo.move_to_end(memo_key)
+            return _digest_memo[memo_key]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    with _digest_memo_lock:
+        _digest_memo[memo_key] = digest.hexdigest()
+        while len(_digest_memo) > _DIGEST_MEMO_SIZE:
+            _digest_memo.popitem(last=False)
+    return digest.hexdigest()
+
+
+def make_cache_key(**parts: Any) -> str:
+    """Stable SHA-256 over the given key parts (JSON-serialisable values)."""
+    encoded = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def read_git_revision(repo_dir: str) -> str:
+    """Resolve HEAD of a git checkout without spawning git. Returns 'unknown' if not resolvable."""
+    git_dir = os.path.join(repo_dir, ".git")
+    try:
+        with open(os.path.join(git_dir, "HEAD")) as f:
+            head = f.read().strip()
+        if not head.startswith("ref:"):
+            return head
+        ref = head.split(":", 1)[1].strip()
+        ref_path = os.path.join(git_dir, ref)
+        if os.path.exists(ref_path):
+            with open(ref_path) as f:
+                return f.read().strip()
+        packed_refs = os.path.join(git_dir, "packed-refs")
+        if os.path.exists(packed_refs):
+            with open(packed_refs) as f:
+                for line in f:
+                    fields = line.strip().split(" ", 1)
+                    if len(fields) == 2 and fields[1] == ref:
+                        return fields[0]
+    except OSError:
+        pass
+    return "unknown"
+
+
+class ResultCache:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self._lock_path = os.path.join(self.root, ".lock")
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _entry_path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}{suffix}")
+
+    @contextmanager
+    def _locked(self):
+        # Inter-process lock so concurrent workers do not evict each other's fresh entries mid-scan.
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _count(self, counter: str):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key: str, suffix: str = ".glb") -> Optional[str]:
+        if not self.enabled:
+            return None
+        path = self._entry_path(key, suffix)
+        try:
+            os.utime(path)  # Mark as most recently used
+        except OSError:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return path
+
+    def put(self, key: str, source_path: str, suffix: str = ".glb") -> str:
+        """Atomically copies source_path into the cache and returns the cached path."""
+        if not self.enabled:
+            return source_path
+        path = self._entry_path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_", suffix=suffix)
+        try:
+            with os.fdopen(fd, "wb") as dst, open(source_path, "rb") as src:
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._count("stores")
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep: Optional[str] = None):
+        """Removes least recently used entries until the cache fits its byte budget."""
+        with self._locked():
+            entries = []
+            total = 0
+            for dirpath, _dirnames, filenames in os.walk(self.root):
+                for name in filenames:
+                    if name.startswith("."):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+            entries.sort()
+            for _mtime, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                self._count("evictions")
+                print(f"[ResultCache] Evicted {path} ({size} bytes)")
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses, "stores": self.stores, "evictions": self.evictions}
@@ -0,0 +1,241 @@
+"""
+Preview GLB of a rig in progress (numpy only, no Blender).
+
+As soon as skeleton prediction finishes, the host shows the uploaded mesh
+with the predicted bones, long before skinning and merging are done. The
+preview is the uploaded GLB with its materials ghosted (alpha blended) so
+the bones inside stay visible, plus one mesh of octahedral bones, drawn as
+Blender draws them. The input's buffer is kept byte for byte and the bone
+geometry is appended after it. Compressed, quantized or textured inputs
+therefore preview as they are.
+
+The skeleton comes from a skeleton handoff .npz (fused_pipeline.save_scene_skeleton):
+the joints' heads and tails in Blender world space, which is Z up and
+normalized however UniRig normalized the mesh. mesh_bounds, the bounds of the
+mesh in that scene, maps the bones onto the bounds of the uploaded mesh.
+Without mesh_bounds, only the Z-up to Y-up conversion of Blender's glTF
+importer is undone.
+
+    python rig_preview.py mesh.glb mesh_skeleton.npz preview.glb
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from glb_inspector import CHUNK_BIN, CHUNK_JSON, GLB_MAGIC, load_glb
+
+FLOAT = 5126
+UNSIGNED_INT = 5125
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+NORMALIZED_MAX = {5120: 127.0, 5121: 255.0, 5122: 32767.0, 5123: 65535.0}
+
+BONE_WIDTH = 0.1  # Octahedron radius and ring position, relative to the bone length
+MESH_ALPHA = 0.35  # Opacity of the ghosted input mesh
+BONE_COLOR = [1.0, 0.55, 0.1, 1.0]
+
+
+def _local_matrix(node: Dict[str, Any]) -> np.ndarray:
+    if "matrix" in node:
+        return np.asarray(node["matrix"], dtype=np.float64).reshape(4, 4).T  # glTF matrices are column-major
+    x, y, z, w = node.get("rotation", [0.0, 0.0, 0.0, 1.0])
+    rotation = np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+        [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+        [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+    ])
+    matrix = np.eye(4)
+    matrix[:3, :3] = rotation * np.asarray(node.get("scale", [1.0, 1.0, 1.0]))
+    matrix[:3, 3] = node.get("translation", [0.0, 0.0, 0.0])
+    return matrix
+
+
+def mesh_world_bounds(gltf: Dict[str, Any]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """World-space (min, max) of the default scene's meshes, from the POSITION bounds. None without meshes."""
+    nodes = gltf.get("nodes", [])
+    scenes = gltf.get("scenes") or [{"nodes": list(range(len(nodes)))}]
+    pending = [(index, np.eye(4)) for index in scenes[gltf.get("scene", 0)].get("nodes", [])]
+    corners: List[np.ndarray] = []
+    while pending:
+        index, parent = pending.pop()
+        node = nodes[index]
+        world = parent @ _local_matrix(node)
+        pending += [(child, world) for child in node.get("children", [])]
+        if "mesh" not in node:
+            continue
+        for primitive in gltf["meshes"][node["mesh"]].get("primitives", []):
+            position = primitive.get("attributes", {}).get("POSITION")
+            accessor = gltf["accessors"][position] if position is not None else {}
+            if "min" not in accessor or "max" not in accessor:
+                continue
+            low, high = np.asarray(accessor["min"], dtype=np.float64), np.asarray(accessor["max"], dtype=np.float64)
+            if accessor.get("normalized"):
+                scale = NORMALIZED_MAX[accessor["componentType"]]
+                low, high = np.maximum(low / scale, -1.0), np.maximum(high / scale, -1.0)
+            box = np.array([[low[0] if i & 1 else high[0], low[1] if i & 2 else high[1],
+                             low[2] if i & 4 else high[2], 1.0] for i in range(8)])
+            corners.append((box @ world.T)[:, :3])
+    if not corners:
+        return None
+    corners = np.concatenate(corners)
+    return corners.min(axis=0), corners.max(axis=0)
+
+
+def blender_to_gltf(points: np.ndarray) -> np.ndarray:
+    """Blender world space (Z up) to glTF (Y up): the inverse of the glTF importer's conversion."""
+    points = np.asarray(points, dtype=np.float64)
+    return np.stack([points[..., 0], points[..., 2], -points[..., 1]], axis=-1)
+
+
+def fit_to_bounds(points: np.ndarray, source: Tuple[np.ndarray, np.ndarray],
+                  target: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+    """Maps points from the source box onto the target box: centers aligned, uniform scale of the largest side."""
+    source_extent = float(np.max(source[1] - source[0]))
+    scale = float(np.max(target[1] - target[0])) / source_extent if source_extent > 0 else 1.0
+    return (points - (source[0] + source[1]) / 2) * scale + (target[0] + target[1]) / 2
+
+
+def bone_geometry(heads: np.ndarray, tails: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Flat-shaded octahedral bones: (positions, normals), 24 vertices (8 triangles) per bone with a
+    non-zero length. The triangles are the consecutive vertex triples.
+    """
+    axis = tails - heads
+    lengths = np.linalg.norm(axis, axis=1)
+    keep = lengths > 1e-8
+    heads, tails, axis, lengths = heads[keep], tails[keep], axis[keep], lengths[keep]
+    direction = axis / lengths[:, None]
+    # Any vector not parallel to the bone gives its cross-section axes.
+    helper = np.where(np.abs(direction[:, :1]) < 0.9, [[1.0, 0.0, 0.0]], [[0.0, 1.0, 0.0]])
+    u = np.cross(direction, helper)
+    u /= np.linalg.norm(u, axis=1, keepdims=True)
+    v = np.cross(direction, u)
+    width = (BONE_WIDTH * lengths)[:, None]
+    center = heads + direction * width
+    ring = np.stack([center + width * u, center + width * v, center - width * u, center - width * v], axis=1)
+    triangles = []
+    for i in range(4):
+        current, following = ring[:, i], ring[:, (i + 1) % 4]
+        triangles.append(np.stack([heads, following, current], axis=1))  # Faces toward the head
+        triangles.append(np.stack([tails, current, following], axis=1))  # Faces toward the tail
+    triangles = np.stack(triangles, axis=1)  # (bones, 8, 3 corners, 3)
+    normals = np.cross(triangles[:, :, 1] - triangles[:, :, 0], triangles[:, :, 2] - triangles[:, :, 0])
+    normals /= np.maximum(np.linalg.norm(normals, axis=-1, keepdims=True), 1e-12)
+    normals = np.repeat(normals[:, :, None], 3, axis=2)
+    return triangles.reshape(-1, 3), normals.reshape(-1, 3)
+
+
+def _ghost_materials(gltf: Dict[str, Any]):
+    """Blends every material the meshes use at MESH_ALPHA; primitives without one get a grey one."""
+    materials = gltf.setdefault("materials", [])
+    ghost_index = None
+    for mesh in gltf.get("meshes", []):
+        for primitive in mesh.get("primitives", []):
+            if "material" not in primitive:
+                if ghost_index is None:
+                    materials.append({"name": "preview_mesh",
+                                      "pbrMetallicRoughness": {"baseColorFactor": [0.8, 0.8, 0.8, 1.0]}})
+                    ghost_index = len(materials) - 1
+                primitive["material"] = ghost_index
+    for material in materials:
+        pbr = material.setdefault("pbrMetallicRoughness", {})
+        color = list(pbr.get("baseColorFactor", [1.0, 1.0, 1.0, 1.0]))
+        pbr["baseColorFactor"] = color[:3] + [color[3] * MESH_ALPHA]
+        material["alphaMode"] = "BLEND"
+        material.pop("alphaCutoff", None)
+        material["doubleSided"] = True
+
+
+def _append_views(gltf: Dict[str, Any], binary: bytes, arrays) -> bytes:
+    """Appends (data, componentType, type, target) arrays after the existing buffer; returns the new buffer."""
+    buffers = gltf.setdefault("buffers", [])
+    if buffers and "uri" in buffers[0]:
+        raise ValueError("The GLB's first buffer is external; only embedded buffers can be extended.")
+    chunks = [binary, b"\x00" * ((-len(binary)) % 4)]
+    offset = sum(len(chunk) for chunk in chunks)
+    views, accessors = gltf.setdefault("bufferViews", []), gltf.setdefault("accessors", [])
+    for data, component_type, accessor_type, target in arrays:
+        raw = np.ascontiguousarray(data).tobytes()
+        views.append({"buffer": 0, "byteOffset": offset, "byteLength": len(raw), "target": target})
+        accessor = {"bufferView": len(views) - 1, "componentType": component_type, "count": len(data),
+                    "type": accessor_type}
+        if accessor_type == "VEC3" and target == ARRAY_BUFFER:
+            accessor.update(min=data.min(axis=0).tolist(), max=data.max(axis=0).tolist())
+        accessors.append(accessor)
+        chunks += [raw, b"\x00" * ((-len(raw)) % 4)]
+        offset += len(raw) + (-len(raw)) % 4
+    binary = b"".join(chunks)
+    if buffers:
+        buffers[0]["byteLength"] = len(binary)
+    else:
+        buffers.append({"byteLength": len(binary)})
+    return binary
+
+
+def build_preview_glb(input_glb_path: str, skeleton: Dict[str, np.ndarray], output_path: str) -> Dict[str, Any]:
+    """
+    Writes the input mesh plus the bones of skeleton (a skeleton handoff, see load_handoff) to output_path.
+    Returns {"bones", "bytes", "fitted"}; fitted is False when the bones could not be mapped onto the
+    mesh bounds and only had their axes converted.
+    """
+    gltf, binary = load_glb(input_glb_path)
+    heads = blender_to_gltf(skeleton["heads"])
+    tails = blender_to_gltf(skeleton["tails"])
+    target = mesh_world_bounds(gltf)
+    fitted = "mesh_bounds" in skeleton and target is not None
+    if fitted:
+        source = blender_to_gltf(skeleton["mesh_bounds"])
+        source = (source.min(axis=0), source.max(axis=0))  # The axis flip swaps min and max on one axis
+        heads, tails = fit_to_bounds(heads, source, target), fit_to_bounds(tails, source, target)
+    positions, normals = bone_geometry(heads, tails)
+    if not len(positions):
+        raise ValueError("The skeleton has no bone with a non-zero length.")
+
+    _ghost_materials(gltf)
+    first_accessor = len(gltf.get("accessors", []))
+    binary = _append_views(gltf, binary, [
+        (positions.astype("<f4"), FLOAT, "VEC3", ARRAY_BUFFER),
+        (normals.astype("<f4"), FLOAT, "VEC3", ARRAY_BUFFER),
+        (np.arange(len(positions), dtype="<u4").reshape(-1, 1), UNSIGNED_INT, "SCALAR", ELEMENT_ARRAY_BUFFER),
+    ])
+    gltf["materials"].append({"name": "preview_bones", "emissiveFactor": [c * 0.35 for c in BONE_COLOR[:3]],
+                              "pbrMetallicRoughness": {"baseColorFactor": BONE_COLOR, "metallicFactor": 0.0,
+                                                       "roughnessFactor": 0.6}})
+    gltf.setdefault("meshes", []).append({"name": "preview_bones", "primitives": [{
+        "attributes": {"POSITION": first_accessor, "NORMAL": first_accessor + 1},
+        "indices": first_accessor + 2, "material": len(gltf["materials"]) - 1}]})
+    nodes = gltf.setdefault("nodes", [])
+    nodes.append({"name": "preview_skeleton", "mesh": len(gltf["meshes"]) - 1})
+    scenes = gltf.setdefault("scenes", [{"nodes": list(range(len(nodes) - 1))}])
+    scenes[gltf.setdefault("scene", 0)].setdefault("nodes", []).append(len(nodes) - 1)
+
+    json_chunk = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+    json_chunk += b" " * ((-len(json_chunk)) % 4)
+    with open(output_path, "wb") as f:
+        f.write(np.array([GLB_MAGIC, 2, 28 + len(json_chunk) + len(binary)], dtype="<u4").tobytes())
+        f.write(np.array([len(json_chunk), CHUNK_JSON], dtype="<u4").tobytes() + json_chunk)
+        f.write(np.array([len(binary), CHUNK_BIN], dtype="<u4").tobytes() + binary)
+    return {"bones": len(positions) // 24, "bytes": 28 + len(json_chunk) + len(binary), "fitted": fitted}
+
+
+def parse_args(argv: Sequence[str]):
+    parser = argparse.ArgumentParser(description="Preview GLB of a mesh and its predicted skeleton.")
+    parser.add_argument("input", help="Mesh GLB.")
+    parser.add_argument("skeleton", help="Skeleton handoff .npz (fused_pipeline.save_scene_skeleton).")
+    parser.add_argument("output", help="Preview GLB.")
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str]) -> int:
+    from fused_pipeline import load_handoff
+    options = parse_args(argv)
+    report = build_preview_glb(options.input, load_handoff(options.skeleton), options.output)
+    print(json.dumps(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -26,7 +26,23 @@ TORCH_INDEX_URL="https://download.pytorch.org/whl/${TARGET_CUDA_VERSION_SHORT}"
 
 # Direct URL for the compatible flash-attn wheel for v2.5.8
 # Compatible with: Python 3.11 (cp311), PyTorch 2.3.x (torch2.3), CUDA 11.8 (cu118), CXX11 ABI TRUE
-FLASH_ATTN_WHEEL_URL="https://github.com/Dao-AILab/flash-attention/releases/download/v2.5.8/flash_attn-2.5.8+cu118torch2.3cxx11abiTRUE-cp311-cp311-linux_x86_64.whl"
+FLASH_ATTN_VERSION="2.5.8"
+FLASH_ATTN_WHEEL_URL="https://github.com/Dao-AILab/flash-attention/releases/download/v${FLASH_ATTN_VERSION}/flash_attn-${FLASH_ATTN_VERSION}+cu118torch2.3cxx11abiTRUE-cp311-cp311-linux_x86_64.whl"
+
+# --- Snapshots and caches ---
+# snapshot: restore the whole Blender install (site-packages included) from a content-hashed archive
+#           when one matches the lock hash below, otherwise install and then archive the result.
+# install:  install step by step (still skipping steps whose lock hash matches), no archives.
+SETUP_MODE="${UNIRIG_SETUP_MODE:-snapshot}"
+SNAPSHOT_DIR="${UNIRIG_SNAPSHOT_DIR:-${APP_DIR}/blender_snapshots}"
+SNAPSHOT_URL="${UNIRIG_SNAPSHOT_URL:-}" # Optional base URL serving <snapshot>.tar.{zst,gz} and its .sha256
+SNAPSHOT_RESTORE="${UNIRIG_SNAPSHOT_RESTORE:-extract}" # extract | hardlink (needs SNAPSHOT_DIR on the same filesystem)
+SNAPSHOT_KEEP="${UNIRIG_SNAPSHOT_KEEP:-2}" # Archives kept per snapshot directory
+WHEEL_CACHE_DIR="${UNIRIG_WHEEL_CACHE_DIR:-${APP_DIR}/wheel_cache}"
+OFFLINE="${UNIRIG_OFFLINE:-0}" # 1 = install only from WHEEL_CACHE_DIR / local snapshots
+VERIFY_MODE="${UNIRIG_SETUP_VERIFY:-quick}" # quick = package list checksum | full = every file against pip RECORD hashes
+STATE_DIR="${INSTALL_DIR}/.unirig_setup"
+SITE_PACKAGES_DIR="${INSTALL_DIR}/${BLENDER_MAJOR_MINOR}/python/lib/${BLENDER_PYTHON_VERSION}/site-packages"
 
 # --- Set Environment Variables for Build ---
 export CUDA_HOME=${CUDA_HOME:-/usr/local/cuda} # This might be nominal if nvcc isn't actually used
@@ -47,14 +63,165 @@ echo "Blender Python Executable: ${BLENDER_PY_EXEC}"
 echo "Using CUDA_HOME=${CUDA_HOME}"
 echo "Targeting PyTorch for CUDA: ${TARGET_CUDA_VERSION_SHORT}"
 echo "TORCH_CUDA_ARCH_LIST: ${TORCH_CUDA_ARCH_LIST}"
-echo "Attempting to install flash-attn from direct wheel URL: ${FLASH_ATTN_WHEEL_URL}"
+echo "Setup mode: ${SETUP_MODE} (snapshots: ${SNAPSHOT_DIR}, wheel cache: ${WHEEL_CACHE_DIR}, offline: ${OFFLINE})"
+
+
+# --- Lock hashes ---
+# Each step's hash covers its own inputs and the hash of the step before it, so changing e.g. the
+# torch version reinstalls torch and everything after it, but not Blender.
+lock_hash() { printf '%s\n' "$@" | sha256sum | cut -c1-16; }
+BLENDER_LOCK=$(lock_hash "${BLENDER_URL}")
+PIP_BASE_LOCK=$(lock_hash "${BLENDER_LOCK}" "pip setuptools wheel packaging ninja")
+TORCH_LOCK=$(lock_hash "${PIP_BASE_LOCK}" "torch==${TORCH_VERSION}" "torchvision==${TORCHVISION_VERSION}" "${TORCH_INDEX_URL}")
+FLASH_ATTN_LOCK=$(lock_hash "${TORCH_LOCK}" "${FLASH_ATTN_WHEEL_URL}")
+REQUIREMENTS_LOCK=$(lock_hash "${FLASH_ATTN_LOCK}" "$(sha256sum < "${UNIRIG_REQS_FILE_IN_SPACE}" 2>/dev/null)")
+SNAPSHOT_NAME="blender-${BLENDER_VERSION}-${REQUIREMENTS_LOCK}"
+echo "Environment lock hash: ${REQUIREMENTS_LOCK}"
+
+step_done() { [ -f "${STATE_DIR}/$1.lock" ] && [ "$(cat "${STATE_DIR}/$1.lock")" = "$2" ]; }
+mark_step() { mkdir -p "${STATE_DIR}" && echo "$2" > "${STATE_DIR}/$1.lock"; }
+
+# Wheels are built/downloaded into WHEEL_CACHE_DIR once and always installed from there, so a
+# reinstall of the same lock needs no network (UNIRIG_OFFLINE=1 skips the download entirely).
+fetch_wheels() {
+    if [ "${OFFLINE}" = "1" ]; then return 0; fi
+    "${BLENDER_PY_EXEC}" -m pip wheel --wheel-dir "${WHEEL_CACHE_DIR}" --find-links "${WHEEL_CACHE_DIR}" "$@"
+}
+install_from_cache() {
+    "${BLENDER_PY_EXEC}" -m pip install --no-index --find-links "${WHEEL_CACHE_DIR}" "$@"
+}
+
+package_list_checksum() { ls "${SITE_PACKAGES_DIR}" 2>/dev/null | grep '\.dist-info$' | sha256sum | cut -d' ' -f1; }
+
+# Checks every installed file against the sha256 in its package's RECORD, without running pip.
+verify_records() {
+    "${BLENDER_PY_EXEC}" - "${SITE_PACKAGES_DIR}" <<'PYEOF'
+import base64, csv, glob, hashlib, os, sys
+site_packages = sys.argv[1]
+checked, bad = 0, []
+for record in glob.glob(os.path.join(site_packages, "*.dist-info", "RECORD")):
+    with open(record, newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[1].startswith("sha256="):
+                continue
+            path = os.path.normpath(os.path.join(site_packages, row[0]))
+            try:
+                with open(path, "rb") as data:
+                    digest = base64.urlsafe_b64encode(hashlib.sha256(data.read()).digest()).rstrip(b"=").decode()
+            except OSError:
+                bad.append(f"missing {row[0]}")
+                continue
+            checked += 1
+            if "sha256=" + digest != row[1]:
+                bad.append(f"modified {row[0]}")
+print(f"Checked {checked} installed files against pip RECORD hashes: {len(bad)} problem(s).")
+for line in bad[:20]:
+    print(f"  {line}")
+sys.exit(1 if bad else 0)
+PYEOF
+}
+
+verify_install() {
+    if [ ! -x "${INSTALL_DIR}/blender" ] || [ ! -f "${BLENDER_PY_EXEC}" ]; then
+        echo "Verification failed: Blender or its Python is missing."; return 1
+    fi
+    if [ "$(package_list_checksum)" != "$(cat "${STATE_DIR}/packages.sha256" 2>/dev/null)" ]; then
+        echo "Verification failed: installed package set differs from the recorded one."; return 1
+    fi
+    if [ "${VERIFY_MODE}" = "full" ]; then
+        verify_records || return 1
+    fi
+    echo "Installed environment verified (${VERIFY_MODE})."
+}
+
+find_snapshot() {
+    for ext in tar.zst tar.gz; do
+        if [ -f "${SNAPSHOT_DIR}/${SNAPSHOT_NAME}.${ext}" ] && [ -f "${SNAPSHOT_DIR}/${SNAPSHOT_NAME}.${ext}.sha256" ]; then
+            echo "${SNAPSHOT_DIR}/${SNAPSHOT_NAME}.${ext}"; return 0
+        fi
+    done
+    return 1
+}
+
+download_snapshot() {
+    if [ -z "${SNAPSHOT_URL}" ] || [ "${OFFLINE}" = "1" ]; then return 1; fi
+    mkdir -p "${SNAPSHOT_DIR}"
+    for ext in tar.zst tar.gz; do
+        local archive="${SNAPSHOT_DIR:?}/${SNAPSHOT_NAME:?}.${ext}"
+        if wget -nv -O "${archive}.sha256" "${SNAPSHOT_URL}/${SNAPSHOT_NAME}.${ext}.sha256"; then
+            wget -nv -O "${archive}" "${SNAPSHOT_URL}/${SNAPSHOT_NAME}.${ext}" && return 0
+        fi
+        rm -f "${archive}" "${archive}.sha256"
+    done
+    return 1
+}
+
+tar_compress_flag() { case "$1" in *.zst) echo "--zstd" ;; *) echo "--gzip" ;; esac; }
+
+restore_snapshot() {
+    local archive
+    archive=$(find_snapshot) || { download_snapshot && archive=$(find_snapshot); } || return 1
+    echo "Verifying snapshot checksum: ${archive}"
+    if ! (cd "${SNAPSHOT_DIR}" && sha256sum --quiet -c "$(basename "${archive}").sha256"); then
+        echo "WARNING: Snapshot ${archive} is corrupt, removing it."
+        rm -f "${archive:?}" "${archive:?}.sha256"
+        return 1
+    fi
+    local install_name
+    install_name=$(basename "${INSTALL_DIR}")
+    local staging="${BLENDER_INSTALL_BASE:?}/.restore-$$"
+    rm -rf "${staging}" && mkdir -p "${staging}"
+    if [ "${SNAPSHOT_RESTORE}" = "hardlink" ]; then
+        # An extracted copy next to the archive is hard-linked into place: no file data is copied.
+        local tree="${SNAPSHOT_DIR:?}/${SNAPSHOT_NAME:?}"
+        if [ ! -d "${tree}/${install_name}" ]; then
+            rm -rf "${tree}" && mkdir -p "${tree}"
+            tar -xf "${archive}" $(tar_compress_flag "${archive}") -C "${tree}" || return 1
+        fi
+        cp -al "${tree}/${install_name}" "${staging}/" || cp -a "${tree}/${install_name}" "${staging}/" || return 1
+    else
+        tar -xf "${archive}" $(tar_compress_flag "${archive}") -C "${staging}" || return 1
+    fi
+    rm -rf "${INSTALL_DIR:?}"
+    mv "${staging}/${install_name}" "${INSTALL_DIR}" || return 1
+    rm -rf "${staging}"
+    echo "Restored snapshot ${SNAPSHOT_NAME}."
+}
+
+build_snapshot() {
+    mkdir -p "${SNAPSHOT_DIR}"
+    local ext="tar.gz"
+    if command -v zstd >/dev/null 2>&1; then ext="tar.zst"; fi
+    local archive="${SNAPSHOT_DIR}/${SNAPSHOT_NAME}.${ext}"
+    echo "Building snapshot ${archive}..."
+    tar -cf "${archive}.partial" $(tar_compress_flag "${archive}") -C "${BLENDER_INSTALL_BASE}" "$(basename "${INSTALL_DIR}")"
+    mv "${archive}.partial" "${archive}"
+    (cd "${SNAPSHOT_DIR}" && sha256sum "$(basename "${archive}")" > "$(basename "${archive}").sha256")
+    # Keep only the newest SNAPSHOT_KEEP archives (and their extracted trees).
+    ls -1t "${SNAPSHOT_DIR}"/blender-*.tar.zst "${SNAPSHOT_DIR}"/blender-*.tar.gz 2>/dev/null | tail -n +$((SNAPSHOT_KEEP + 1)) | while read -r old; do
+        echo "Removing old snapshot ${old}"
+        rm -rf "${old:?}" "${old:?}.sha256" "${old%.tar.*}"
+    done
+    echo "Snapshot ready: $(cat "${archive}.sha256")"
+}
 
-# --- Download and Extract Blender ---
 mkdir -p "${BLENDER_INSTALL_BASE}"
 mkdir -p "${LOCAL_BIN_DIR}"
+mkdir -p "${WHEEL_CACHE_DIR}"
 
-if [ ! -d "${INSTALL_DIR}" ] || [ -z "$(ls -A "${INSTALL_DIR}")" ]; then
-    echo "Blender not found or directory empty at ${INSTALL_DIR}. Proceeding with download and extraction."
+ENVIRONMENT_READY=0
+if step_done snapshot "${REQUIREMENTS_LOCK}" && verify_install; then
+    echo "Blender environment is up to date (${SNAPSHOT_NAME}); nothing to install."
+    ENVIRONMENT_READY=1
+elif [ "${SETUP_MODE}" = "snapshot" ] && restore_snapshot && verify_install; then
+    ENVIRONMENT_READY=1
+fi
+
+if [ "${ENVIRONMENT_READY}" != "1" ]; then
+# --- Download and Extract Blender ---
+if [ ! -d "${INSTALL_DIR}" ] || [ -z "$(ls -A "${INSTALL_DIR}")" ] || { [ -d "${STATE_DIR}" ] && ! step_done blender "${BLENDER_LOCK}"; }; then
+    echo "Blender not found or not at the locked version in ${INSTALL_DIR}. Proceeding with download and extraction."
+    rm -rf "${INSTALL_DIR:?}"
     echo "Downloading Blender ${BLENDER_VERSION}..."
     if [ ! -f "/tmp/${BLENDER_TARBALL}" ]; then
         wget -nv -O "/tmp/${BLENDER_TARBALL}" ${BLENDER_URL}
@@ -74,16 +241,9 @@ if [ ! -d "${INSTALL_DIR}" ] || [ -z "$(ls -A "${INSTALL_DIR}")" ]; then
 else
     echo "Blender already appears to be extracted to ${INSTALL_DIR}."
 fi
+mark_step blender "${BLENDER_LOCK}"
 echo "Extraction complete."
 
-if [ -f "${INSTALL_DIR}/blender" ]; then
-    echo "Creating local symlink for Blender executable in ${LOCAL_BIN_DIR}..."
-    ln -sf "${INSTALL_DIR}/blender" "${LOCAL_BIN_DIR}/blender"
-    echo "Local symlink created at ${LOCAL_BIN_DIR}/blender."
-else
-    echo "WARNING: Blender executable not found at ${INSTALL_DIR}/blender."
-fi
-
 # --- Install Dependencies into Blender's Python ---
 echo "Installing dependencies into Blender's Python (${BLENDER_PY_EXEC})..."
 if [ ! -f "${BLENDER_PY_EXEC}" ]; then
@@ -95,36 +255,63 @@ if [ ! -f "${UNIRIG_REQS_FILE_IN_SPACE}" ]; then
     exit 1
 fi
 
-echo "Upgrading pip for Blender Python..."
-"${BLENDER_PY_EXEC}" -m pip install --no-cache-dir --upgrade pip setuptools wheel -vvv
-
-echo "Installing packaging and ninja (recommended for flash-attn)..."
-"${BLENDER_PY_EXEC}" -m pip install --no-cache-dir packaging ninja -vvv
-
-echo "Step 1: Installing PyTorch ${TORCH_VERSION} (for CUDA ${TARGET_CUDA_VERSION_SHORT}) and Torchvision ${TORCHVISION_VERSION}..."
-"${BLENDER_PY_EXEC}" -m pip install --no-cache-dir \
-    torch==${TORCH_VERSION} \
-    torchvision==${TORCHVISION_VERSION} \
-    --index-url ${TORCH_INDEX_URL} -vvv
-echo "PyTorch and Torchvision installation attempted."
-
-echo "Step 2: Installing flash-attn from direct wheel URL..."
-# Install flash-attn from a direct wheel URL to ensure compatibility and avoid source build.
-# Using --no-deps as we manage other dependencies separately and assume the wheel is self-contained or relies on PyTorch.
-"${BLENDER_PY_EXEC}" -m pip install --no-cache-dir \
-    --no-deps \
-    "${FLASH_ATTN_WHEEL_URL}" -vvv
-echo "flash-attn installation attempted from wheel."
-
-echo "Step 3: Installing remaining dependencies from ${UNIRIG_REQS_FILE_IN_SPACE}..."
-# Ensure flash-attn is REMOVED from unirig_requirements.txt.
-# This will install torch-scatter, torch-cluster, spconv, bpy, etc.
-# PyG (torch-scatter, etc.) links in unirig_requirements.txt might need to be updated for torch 2.3 + cu118
-# Example: torch-scatter -f https://data.pyg.org/whl/torch-2.3.0+cu118.html (adjust torch version if needed)
-"${BLENDER_PY_EXEC}" -m pip install --no-cache-dir \
-    -r "${UNIRIG_REQS_FILE_IN_SPACE}" -vvv
+if step_done pip_base "${PIP_BASE_LOCK}"; then
+    echo "pip, setuptools, wheel, packaging and ninja already installed (lock ${PIP_BASE_LOCK})."
+else
+    echo "Upgrading pip for Blender Python..."
+    fetch_wheels pip setuptools wheel packaging ninja
+    install_from_cache --upgrade pip setuptools wheel packaging ninja
+    mark_step pip_base "${PIP_BASE_LOCK}"
+fi
+
+if step_done torch "${TORCH_LOCK}"; then
+    echo "Step 1: PyTorch ${TORCH_VERSION} already installed (lock ${TORCH_LOCK})."
+else
+    echo "Step 1: Installing PyTorch ${TORCH_VERSION} (for CUDA ${TARGET_CUDA_VERSION_SHORT}) and Torchvision ${TORCHVISION_VERSION}..."
+    fetch_wheels torch==${TORCH_VERSION} torchvision==${TORCHVISION_VERSION} --index-url ${TORCH_INDEX_URL}
+    install_from_cache torch==${TORCH_VERSION} torchvision==${TORCHVISION_VERSION}
+    mark_step torch "${TORCH_LOCK}"
+fi
+
+if step_done flash_attn "${FLASH_ATTN_LOCK}"; then
+    echo "Step 2: flash-attn ${FLASH_ATTN_VERSION} already installed (lock ${FLASH_ATTN_LOCK})."
+else
+    echo "Step 2: Installing flash-attn from direct wheel URL..."
+    # Install flash-attn from a direct wheel URL to ensure compatibility and avoid source build.
+    # Using --no-deps as we manage other dependencies separately and assume the wheel is self-contained or relies on PyTorch.
+    fetch_wheels --no-deps "${FLASH_ATTN_WHEEL_URL}"
+    install_from_cache --no-deps flash-attn==${FLASH_ATTN_VERSION}
+    mark_step flash_attn "${FLASH_ATTN_LOCK}"
+fi
+
+if step_done requirements "${REQUIREMENTS_LOCK}"; then
+    echo "Step 3: UniRig requirements already installed (lock ${REQUIREMENTS_LOCK})."
+else
+    echo "Step 3: Installing remaining dependencies from ${UNIRIG_REQS_FILE_IN_SPACE}..."
+    # Ensure flash-attn is REMOVED from unirig_requirements.txt.
+    # This will install torch-scatter, torch-cluster, spconv, bpy, etc.
+    # PyG (torch-scatter, etc.) links in unirig_requirements.txt might need to be updated for torch 2.3 + cu118
+    # Example: torch-scatter -f https://data.pyg.org/whl/torch-2.3.0+cu118.html (adjust torch version if needed)
+    fetch_wheels -r "${UNIRIG_REQS_FILE_IN_SPACE}"
+    install_from_cache -r "${UNIRIG_REQS_FILE_IN_SPACE}"
+    mark_step requirements "${REQUIREMENTS_LOCK}"
+fi
 
 echo "Dependency installation for Blender's Python complete."
+package_list_checksum > "${STATE_DIR}/packages.sha256"
+mark_step snapshot "${REQUIREMENTS_LOCK}"
+if [ "${SETUP_MODE}" = "snapshot" ]; then
+    build_snapshot
+fi
+fi # ENVIRONMENT_READY
+
+if [ -f "${INSTALL_DIR}/blender" ]; then
+    echo "Creating local symlink for Blender executable in ${LOCAL_BIN_DIR}..."
+    ln -sf "${INSTALL_DIR}/blender" "${LOCAL_BIN_DIR}/blender"
+    echo "Local symlink created at ${LOCAL_BIN_DIR}/blender."
+else
+    echo "WARNING: Blender executable not found at ${INSTALL_DIR}/blender."
+fi
 
 # --- FIX: Ensure UniRig/src is treated as a package ---
 UNIRIG_SRC_DIR="${UNIRIG_REPO_CLONE_DIR}/src"
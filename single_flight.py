@@ -0,0 +1,128 @@
+"""
+Single-flight execution of identical requests.
+
+SingleFlight.run(key, work) runs work once per key at a time. The first
+caller (the leader) starts it in a background thread. Callers that arrive
+with the same key while it is running (followers) attach to it. Every caller
+gets the same result or the same exception. Progress events are broadcast to
+every attached caller. A caller that joins late first receives a replay of
+the stage transitions it missed.
+
+Each caller can give up on its own through its CancelToken, without
+affecting the others. The shared work is cancelled only when every caller has
+left. The key is then released, so the next request starts a fresh flight.
+"""
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+from cancellation import CancelToken, JobCancelled
+
+T = TypeVar("T")
+EventCallback = Callable[[Dict[str, Any]], None]
+LEADER = "leader"
+FOLLOWER = "follower"
+
+
+class _Flight:
+    def __init__(self, key: str):
+        self.key = key
+        self.future: Future = Future()
+        self.cancel_token = CancelToken()
+        self.subscribers: List[EventCallback] = []
+        self.history: List[Dict[str, Any]] = []  # Non-log events, replayed to late joiners
+        self.waiters = 0
+        self.lock = threading.Lock()
+
+    def publish(self, event: Dict[str, Any]):
+        with self.lock:
+            if event.get("type") != "log":
+                self.history.append(event)
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber(event)
+            except Exception as e:
+                print(f"[SingleFlight] Event subscriber failed: {e}")
+
+
+class SingleFlight:
+    def __init__(self, name: str = "single-flight",
+                 on_join: Optional[Callable[[str], None]] = None):
+        """on_join(role) is called for every caller with role "leader" or "follower", e.g. for metrics."""
+        self.name = name
+        self.on_join = on_join
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def run(self, key: str, work: Callable[[EventCallback, CancelToken], T],
+            on_event: Optional[EventCallback] = None, cancel_token: Optional[CancelToken] = None) -> T:
+        """
+        Runs work(publish_event, shared_cancel_token), or joins the identical run already in flight.
+        Raises JobCancelled as soon as cancel_token is cancelled, whether or not the shared run goes on.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            role = FOLLOWER if flight else LEADER
+            if flight is None:
+                flight = _Flight(key)
+                self._flights[key] = flight
+                threading.Thread(target=self._execute, args=(flight, work), daemon=True,
+                                 name=f"{self.name}-{key[:12]}").start()
+            with flight.lock:
+                flight.waiters += 1
+                if on_event:
+                    for event in flight.history:
+                        on_event(dict(event, replayed=True))
+                    flight.subscribers.append(on_event)
+        if role == FOLLOWER:
+            print(f"[SingleFlight] Joined the in-flight run {key[:12]} ({flight.waiters} waiter(s)).")
+        if self.on_join:
+            self.on_join(role)
+
+        settled = threading.Event()
+        flight.future.add_done_callback(lambda future: settled.set())
+        on_cancel = cancel_token.add_callback(lambda reason: settled.set()) if cancel_token else None
+        try:
+            settled.wait()
+            if flight.future.done():
+                return flight.future.result()
+            raise JobCancelled(cancel_token.reason)
+        finally:
+            if on_cancel:
+                cancel_token.remove_callback(on_cancel)
+            self._leave(flight, on_event)
+
+    def _leave(self, flight: _Flight, on_event: Optional[EventCallback]):
+        with self._lock:
+            with flight.lock:
+                flight.waiters -= 1
+                if on_event in flight.subscribers:
+                    flight.subscribers.remove(on_event)
+                abandoned = flight.waiters == 0 and not flight.future.done()
+            if abandoned and self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        if abandoned:
+            flight.cancel_token.cancel("Every request waiting for this run was cancelled.")
+
+    def _execute(self, flight: _Flight, work: Callable[[EventCallback, CancelToken], Any]):
+        try:
+            result = work(flight.publish, flight.cancel_token)
+        except BaseException as e:
+            self._release(flight)
+            flight.future.set_exception(e)
+        else:
+            self._release(flight)
+            flight.future.set_result(result)
+
+    def _release(self, flight: _Flight):
+        # Released before the result is published, so a request arriving afterwards starts a fresh run
+        # (which normally hits the result cache) instead of joining a finished one.
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            flights = list(self._flights.values())
+        return {"in_flight": len(flights), "waiters": sum(flight.waiters for flight in flights)}
@@ -0,0 +1,150 @@
+import threading
+import time
+
+import pytest
+
+from cancellation import CancelToken, JobCancelled
+from device_registry import Device, DeviceFailure, DeviceRegistry, NoDeviceAvailable, parse_devices
+
+
+def cpu_devices(count, slots=1):
+    return [Device(f"cpu:{i}", "cpu", slots, {"CUDA_VISIBLE_DEVICES": ""}) for i in range(count)]
+
+
+def test_parse_devices_auto():
+    assert [(d.name, d.kind) for d in parse_devices("auto", [])] == [("cpu:0", "cpu")]
+    assert [(d.name, d.env) for d in parse_devices("auto", ["0"])] == [("cuda:0", {})]
+    devices = parse_devices("", ["0", "3"], slots=2)
+    assert [(d.name, d.env, d.slots) for d in devices] == [("cuda:0", {"CUDA_VISIBLE_DEVICES": "0"}, 2),
+                                                          ("cuda:3", {"CUDA_VISIBLE_DEVICES": "3"}, 2)]
+
+
+def test_parse_devices_explicit_list():
+    devices = parse_devices("cuda:1, cpu:0 ,http://worker:8765/", ["0", "1"])
+    assert [(d.name, d.kind) for d in devices] == [("cuda:1", "cuda"), ("cpu:0", "cpu"),
+                                                  ("http://worker:8765", "remote")]
+    assert devices[0].env == {"CUDA_VISIBLE_DEVICES": "1"}
+    assert devices[1].unirig_device_arg == "device=cpu"
+    assert devices[2].url == "http://worker:8765"
+
+
+def test_parse_devices_rejects_unknown_entries():
+    with pytest.raises(ValueError):
+        parse_devices("tpu:0", [])
+
+
+def test_acquire_picks_the_least_loaded_device():
+    registry = DeviceRegistry(cpu_devices(2, slots=2))
+    assert [registry.acquire().name for _ in range(3)] == ["cpu:0", "cpu:1", "cpu:0"]
+    cpu1 = registry.acquire()
+    assert cpu1.name == "cpu:1"
+    registry.release(cpu1)
+    # cpu:0 is full and cpu:1 has a free slot again.
+    assert registry.acquire().name == "cpu:1"
+
+
+def test_acquire_blocks_until_a_slot_is_released():
+    registry = DeviceRegistry(cpu_devices(1))
+    held = registry.acquire()
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(registry.acquire()))
+    waiter.start()
+    time.sleep(0.2)
+    assert not acquired
+    registry.release(held)
+    waiter.join(timeout=5)
+    assert [d.name for d in acquired] == ["cpu:0"]
+
+
+def test_acquire_stops_waiting_when_cancelled():
+    registry = DeviceRegistry(cpu_devices(1))
+    registry.acquire()
+    token = CancelToken()
+    token.cancel("test")
+    with pytest.raises(JobCancelled):
+        registry.acquire(cancel_token=token)
+
+
+def test_failed_device_is_quarantined():
+    registry = DeviceRegistry(cpu_devices(2), quarantine_seconds=60)
+    failed = registry.acquire()
+    registry.release(failed, failed=True)
+    assert registry.stats()[failed.name]["quarantined"]
+    assert registry.stats()[failed.name]["failures_total"] == 1
+    # The healthy device is preferred, even though the quarantined one has fewer steps served...
+    for _ in range(3):
+        healthy = registry.acquire()
+        assert healthy.name != failed.name
+        registry.release(healthy)
+    # ...and quarantined devices are still used when no healthy one is left.
+    registry.release(registry.acquire(), failed=True)
+    assert all(entry["quarantined"] for entry in registry.stats().values())
+    assert registry.acquire().name in ("cpu:0", "cpu:1")
+
+
+def test_quarantine_expires():
+    registry = DeviceRegistry(cpu_devices(1), quarantine_seconds=0.2)
+    device = registry.acquire()
+    registry.release(device, failed=True)
+    assert device.quarantined()
+    time.sleep(0.3)
+    assert not device.quarantined()
+
+
+def test_run_retries_on_another_device():
+    registry = DeviceRegistry(cpu_devices(3))
+    tried = []
+
+    def step(device):
+        tried.append(device.name)
+        if len(tried) == 1:
+            raise DeviceFailure("crashed")
+        return device.name
+
+    assert registry.run(step, attempts=2) == tried[1]
+    assert tried[0] != tried[1]
+    stats = registry.stats()
+    assert stats[tried[0]]["quarantined"] and not stats[tried[1]]["quarantined"]
+    assert all(entry["in_flight"] == 0 for entry in stats.values())
+
+
+def test_run_gives_up_after_attempts():
+    registry = DeviceRegistry(cpu_devices(3))
+    tried = []
+
+    def step(device):
+        tried.append(device.name)
+        raise DeviceFailure("crashed")
+
+    with pytest.raises(DeviceFailure):
+        registry.run(step, attempts=2)
+    assert len(set(tried)) == 2
+
+
+def test_run_skips_excluded_devices():
+    registry = DeviceRegistry(cpu_devices(2))
+    tried = []
+
+    def step(device):
+        tried.append(device.name)
+        raise DeviceFailure("crashed")
+
+    with pytest.raises(DeviceFailure):
+        registry.run(step, attempts=3, exclude=["cpu:0"])
+    assert tried == ["cpu:1"]
+    with pytest.raises(NoDeviceAvailable):
+        registry.run(step, exclude=["cpu:0", "cpu:1"])
+
+
+def test_run_does_not_retry_other_errors():
+    registry = DeviceRegistry(cpu_devices(2))
+    calls = []
+
+    def step(device):
+        calls.append(device.name)
+        raise RuntimeError("bad input")
+
+    with pytest.raises(RuntimeError):
+        registry.run(step, attempts=2)
+    assert len(calls) == 1
+    assert not any(entry["quarantined"] for entry in registry.stats().values())
@@ -0,0 +1,68 @@
+import json
+import struct
+
+import pytest
+
+from glb_inspector import CHUNK_BIN, CHUNK_JSON, GLB_MAGIC, GLBError, estimate_runtime, inspect_glb, load_glb, reject_reason
+from synthetic_glb import grid_mesh, make_glb
+
+
+def test_inspect_counts_the_synthetic_grid(tmp_path):
+    positions, indices = grid_mesh(1000)
+    info = inspect_glb(make_glb(str(tmp_path / "grid.glb"), 1000))
+    assert info.vertex_count == len(positions)
+    assert info.triangle_count == len(indices) // 3
+    assert (info.mesh_count, info.primitive_count, info.skin_count) == (1, 1, 0)
+    assert reject_reason(info, 0, 0) is None
+    assert "limit" in reject_reason(info, 0, len(positions) - 1)
+
+
+def test_estimate_runtime_grows_with_vertices(tmp_path):
+    small = estimate_runtime(inspect_glb(make_glb(str(tmp_path / "small.glb"), 100)))
+    large = estimate_runtime(inspect_glb(make_glb(str(tmp_path / "large.glb"), 10000)))
+    assert set(small) >= {"skeleton", "skin", "merge"}
+    assert all(large[stage] >= small[stage] for stage in small)
+
+
+def test_truncated_file_is_rejected(tmp_path):
+    path = make_glb(str(tmp_path / "grid.glb"), 100)
+    with open(path, "rb") as f:
+        data = f.read()
+    truncated = tmp_path / "truncated.glb"
+    truncated.write_bytes(data[:len(data) // 2])
+    with pytest.raises(GLBError):
+        inspect_glb(str(truncated))
+
+
+def _glb_bytes(gltf_json: bytes, bin_length: int, bin_data: bytes = b"") -> bytes:
+    """A GLB with the given JSON chunk and a BIN chunk declaring bin_length bytes (bin_data may be shorter)."""
+    json_chunk = gltf_json + b" " * ((-len(gltf_json)) % 4)
+    chunks = struct.pack("<II", len(json_chunk), CHUNK_JSON) + json_chunk
+    chunks += struct.pack("<II", bin_length, CHUNK_BIN) + bin_data
+    return struct.pack("<III", GLB_MAGIC, 2, 12 + len(chunks)) + chunks
+
+
+def test_bin_chunk_past_the_end_is_rejected(tmp_path):
+    path = tmp_path / "overlong_bin.glb"
+    path.write_bytes(_glb_bytes(b'{"asset":{"version":"2.0"}}', 1 << 20, b"\x00" * 16))
+    with pytest.raises(GLBError, match="past the end"):
+        inspect_glb(str(path))
+    with pytest.raises(GLBError):
+        load_glb(str(path))
+
+
+@pytest.mark.parametrize("gltf", [
+    {"meshes": "x"},
+    {"accessors": ["x"]},
+    {"bufferViews": {"0": {}}},
+    {"meshes": [{"primitives": "x"}]},
+    {"meshes": [{"primitives": [{"attributes": ["POSITION"]}]}]},
+    {"meshes": [{"primitives": [{"attributes": {"POSITION": 0}}]}],
+     "accessors": [{"bufferView": 0, "componentType": 5126, "type": "VEC3", "count": "many"}],
+     "bufferViews": [{"buffer": 0, "byteLength": 12}], "buffers": [{"byteLength": 12}]},
+])
+def test_wrongly_typed_json_is_rejected(tmp_path, gltf):
+    path = tmp_path / "malformed.glb"
+    path.write_bytes(_glb_bytes(json.dumps(gltf).encode("utf-8"), 12, b"\x00" * 12))
+    with pytest.raises(GLBError):
+        inspect_glb(str(path))
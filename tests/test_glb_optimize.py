@@ -0,0 +1,105 @@
+import os
+
+import numpy as np
+import pytest
+
+from glb_optimize import (POSITION_STEPS, GLBDocument, compact_indices, compact_weights, optimize_glb,
+                          quantize_skinned_positions, quantize_weights, top_k_influences)
+from glb_size_report import posed_vertices, skinned_grid, write_skinned_glb
+from synthetic_glb import grid_mesh, make_glb
+
+BONES = 12
+
+
+@pytest.fixture
+def skinned_glb(tmp_path):
+    data = skinned_grid(900, BONES, seed=3)
+    path = str(tmp_path / "skinned.glb")
+    write_skinned_glb(path, *data[:6])
+    return path, data
+
+
+def test_quantize_weights_sums_to_255():
+    rng = np.random.default_rng(0)
+    weights = rng.dirichlet(np.ones(4), size=1000)
+    weights[:10] = [0.25, 0.25, 0.25, 0.25]  # Rounds to 64 each: the residual must go somewhere
+    quantized = quantize_weights(weights)
+    assert quantized.dtype == np.uint8
+    assert (quantized.astype(np.int64).sum(axis=1) == 255).all()
+    assert np.abs(quantized / 255.0 - weights).max() < 4 / 255.0
+
+
+def test_top_k_influences_renormalizes():
+    joints = np.array([[0, 1, 2, 3, 4, 5], [6, 7, 8, 9, 10, 11]])
+    weights = np.array([[0.05, 0.4, 0.1, 0.3, 0.1, 0.05], [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]])
+    kept_joints, kept_weights = top_k_influences(joints, weights, 3)
+    np.testing.assert_allclose(kept_weights.sum(axis=1), 1.0)
+    assert list(kept_joints[0]) == [1, 3, 2]
+    np.testing.assert_allclose(kept_weights[0], np.array([0.4, 0.3, 0.1]) / 0.8)
+    # A vertex without weight keeps its first joint at full weight.
+    assert list(kept_weights[1]) == [1.0, 0.0, 0.0]
+
+
+def test_compact_weights_keeps_max_influences(skinned_glb):
+    path, _ = skinned_glb
+    document = GLBDocument.load(path)
+    stats = compact_weights(document, 4, quantize=True)
+    attributes = document.gltf["meshes"][0]["primitives"][0]["attributes"]
+    assert "JOINTS_1" not in attributes and "WEIGHTS_1" not in attributes
+    weights = document.read(attributes["WEIGHTS_0"]).astype(np.int64)
+    assert (weights.sum(axis=1) == 255).all()
+    assert stats["influences_after"] <= stats["skinned_vertices"] * 4
+
+
+@pytest.mark.parametrize("max_influences", [0, -1])
+def test_compact_weights_rejects_no_influences(skinned_glb, max_influences):
+    path, _ = skinned_glb
+    with pytest.raises(ValueError):
+        compact_weights(GLBDocument.load(path), max_influences, quantize=True)
+
+
+def test_quantized_positions_keep_the_pose(skinned_glb, tmp_path):
+    path, data = skinned_glb
+    rng = np.random.default_rng(1)
+    joint_world = np.repeat(np.eye(4)[None], BONES, axis=0)
+    joint_world[:, :3, 3] = data[6] + rng.normal(0, 0.05, (BONES, 3))
+    joint_world[:, :3, :3] = np.linalg.qr(rng.normal(size=(BONES, 3, 3)))[0]
+
+    document = GLBDocument.load(path)
+    assert quantize_skinned_positions(document) == 1
+    quantized_path = str(tmp_path / "quantized.glb")
+    document.save(quantized_path)
+
+    reloaded = GLBDocument.load(quantized_path)
+    position_accessor = reloaded.gltf["accessors"][reloaded.gltf["meshes"][0]["primitives"][0]["attributes"]["POSITION"]]
+    assert position_accessor["componentType"] == 5123  # UNSIGNED_SHORT
+    # Only the rounding to the position grid may move a vertex: half a step per axis.
+    extent = float((data[0].max(axis=0) - data[0].min(axis=0)).max())
+    displacement = np.linalg.norm(posed_vertices(quantized_path, joint_world) - posed_vertices(path, joint_world), axis=1)
+    assert displacement.max() < extent / POSITION_STEPS
+
+
+def test_drop_retired_accessors_remaps_references(tmp_path):
+    positions, indices = grid_mesh(100)
+    path = make_glb(str(tmp_path / "grid.glb"), 100)
+    document = GLBDocument.load(path)
+    assert compact_indices(document) == 1  # Appends accessor 2 and retires accessor 1
+    primitive = document.gltf["meshes"][0]["primitives"][0]
+    assert primitive["indices"] == 2
+    output_path = str(tmp_path / "compacted.glb")
+    document.save(output_path)
+
+    reloaded = GLBDocument.load(output_path)
+    primitive = reloaded.gltf["meshes"][0]["primitives"][0]
+    assert len(reloaded.gltf["accessors"]) == 2
+    assert primitive["attributes"]["POSITION"] == 0 and primitive["indices"] == 1
+    assert reloaded.read(1).dtype == np.uint16
+    np.testing.assert_array_equal(reloaded.read(1).ravel(), indices)
+    np.testing.assert_allclose(reloaded.read_float(0), np.array(positions), atol=1e-6)
+
+
+def test_optimize_glb_writes_a_smaller_file(skinned_glb, tmp_path):
+    path, _ = skinned_glb
+    output_path = str(tmp_path / "optimized.glb")
+    report = optimize_glb(path, output_path, compression="none")
+    assert report["optimized_bytes"] == os.path.getsize(output_path) < report["raw_bytes"]
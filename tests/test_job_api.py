@@ -0,0 +1,52 @@
+import asyncio
+
+from job_api import JobManager
+from job_store import CANCELLED, DONE, QUEUED, JobStore
+
+
+class StubPipeline:
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.inputs = []
+
+    def __call__(self, input_path, on_event, cancel_token, **options):
+        self.inputs.append(input_path)
+        return {"rigged_glb": self.output_path}
+
+
+def make_manager(tmp_path):
+    output_path = tmp_path / "rigged.glb"
+    output_path.write_bytes(b"glTF")
+    pipeline = StubPipeline(str(output_path))
+    return JobManager(JobStore(str(tmp_path / "jobs")), pipeline, max_running=1), pipeline
+
+
+def test_cancel_before_start_wins_over_the_runner(tmp_path):
+    manager, pipeline = make_manager(tmp_path)
+    job = manager.store.create("input.glb")
+    # The runner read the job while it was queued; the cancel lands before it starts it.
+    assert manager.cancel(job["id"])["status"] == CANCELLED
+    assert manager._run_job(job) is False
+    assert pipeline.inputs == []
+    assert manager.store.get(job["id"])["status"] == CANCELLED
+    assert manager._tokens == {}
+
+
+def test_runner_skips_a_job_cancelled_in_the_queue(tmp_path):
+    manager, pipeline = make_manager(tmp_path)
+    cancelled = manager.store.create("cancelled.glb")
+    kept = manager.store.create("kept.glb")
+
+    async def scenario():
+        manager.cancel(cancelled["id"])
+        await manager.start()
+        for _ in range(200):
+            if manager.store.get(kept["id"])["status"] != QUEUED and not manager._tokens:
+                break
+            await asyncio.sleep(0.02)
+        await manager.stop()
+
+    asyncio.run(scenario())
+    assert pipeline.inputs == [kept["input_path"]]
+    assert manager.store.get(cancelled["id"])["status"] == CANCELLED
+    assert manager.store.get(kept["id"])["status"] == DONE
@@ -0,0 +1,35 @@
+import threading
+
+from job_store import CANCELLED, QUEUED, RUNNING, JobStore
+
+
+def test_expect_status_lets_one_of_two_writers_win(tmp_path):
+    # Two connections to one database, as the job runner and the cancel endpoint may be.
+    runner, canceller = JobStore(str(tmp_path)), JobStore(str(tmp_path))
+    for _ in range(20):
+        job_id = runner.create("input.glb")["id"]
+        barrier = threading.Barrier(2)
+        outcomes = {}
+
+        def write(name, store, status):
+            barrier.wait()
+            outcomes[name] = store.update(job_id, expect_status=QUEUED, status=status)
+
+        threads = [threading.Thread(target=write, args=("start", runner, RUNNING)),
+                   threading.Thread(target=write, args=("cancel", canceller, CANCELLED))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+        assert sorted(outcomes.values()) == [False, True]
+        winner = RUNNING if outcomes["start"] else CANCELLED
+        assert runner.get(job_id)["status"] == canceller.get(job_id)["status"] == winner
+
+
+def test_expect_status_mismatch_changes_nothing(tmp_path):
+    store = JobStore(str(tmp_path))
+    job_id = store.create("input.glb")["id"]
+    assert store.update(job_id, expect_status=QUEUED, status=CANCELLED)
+    assert not store.update(job_id, expect_status=QUEUED, status=RUNNING, message="Started.")
+    job = store.get(job_id)
+    assert job["status"] == CANCELLED and job["message"] != "Started."
@@ -0,0 +1,17 @@
+import numpy as np
+
+from proxy_mesh import MAX_INFLUENCES, prune_weights
+
+
+def test_prune_weights_keeps_exactly_max_influences_on_ties():
+    weights = np.full((3, 8), 0.125, dtype=np.float32)
+    pruned = prune_weights(weights)
+    assert ((pruned > 0).sum(axis=1) == MAX_INFLUENCES).all()
+    assert np.allclose(pruned.sum(axis=1), 1.0)
+
+
+def test_prune_weights_keeps_the_largest_weights():
+    weights = np.array([[0.05, 0.4, 0.1, 0.3, 0.15, 0.0]], dtype=np.float32)
+    pruned = prune_weights(weights, max_influences=2)
+    assert np.nonzero(pruned[0])[0].tolist() == [1, 3]
+    assert np.allclose(pruned[0, [1, 3]], [0.4 / 0.7, 0.3 / 0.7])
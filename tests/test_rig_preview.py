@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from glb_inspector import inspect_glb, load_glb
+from rig_preview import bone_geometry, build_preview_glb, mesh_world_bounds
+from synthetic_glb import grid_mesh, make_glb
+
+
+def test_bone_geometry_faces_outward():
+    heads = np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 1.0], [1.0, 1.0, 1.0]])
+    tails = np.array([[0.0, 0.0, 1.0], [0.0, 0.0, 1.0], [1.0, 2.0, 1.0]])  # The second one has no length
+    positions, normals = bone_geometry(heads, tails)
+    assert positions.shape == normals.shape == (2 * 24, 3)
+    centers = np.repeat((heads[[0, 2]] + tails[[0, 2]]) / 2, 24, axis=0)
+    assert (np.einsum("ij,ij->i", positions - centers, normals) > 0).all()
+
+
+def test_preview_adds_fitted_bones(tmp_path):
+    positions, _ = grid_mesh(400)
+    input_path = make_glb(str(tmp_path / "grid.glb"), 400)
+    # Blender space (Z up), normalized to a box of side 2 as UniRig does.
+    skeleton = {"heads": np.array([[0.0, 0.0, -1.0], [0.0, 0.0, 0.0]]),
+                "tails": np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 1.0]]),
+                "mesh_bounds": np.array([[-1.0, -1.0, -1.0], [1.0, 1.0, 1.0]])}
+    output_path = str(tmp_path / "preview.glb")
+    report = build_preview_glb(input_path, skeleton, output_path)
+    assert report["bones"] == 2 and report["fitted"]
+    assert inspect_glb(output_path).vertex_count == len(positions) + 2 * 24
+
+    gltf, binary = load_glb(output_path)
+    bone_accessor = gltf["accessors"][gltf["meshes"][-1]["primitives"][0]["attributes"]["POSITION"]]
+    view = gltf["bufferViews"][bone_accessor["bufferView"]]
+    bone_positions = np.frombuffer(binary, "<f4", bone_accessor["count"] * 3, view.get("byteOffset", 0)).reshape(-1, 3)
+    # The skeleton box is mapped onto the uploaded mesh's bounds: same center, its largest side.
+    low, high = mesh_world_bounds(load_glb(input_path)[0])
+    np.testing.assert_allclose(low, np.min(positions, axis=0), atol=1e-6)
+    center, extent = (low + high) / 2, float((high - low).max())
+    np.testing.assert_allclose(bone_positions.min(axis=0)[1], center[1] - extent / 2, atol=1e-5)
+    np.testing.assert_allclose(bone_positions.max(axis=0)[1], center[1] + extent / 2, atol=1e-5)
+    assert (np.abs(bone_positions - center) <= extent / 2 + 1e-5).all()
+
+
+def test_skeleton_without_bones_is_rejected(tmp_path):
+    input_path = make_glb(str(tmp_path / "grid.glb"), 100)
+    skeleton = {"heads": np.zeros((1, 3)), "tails": np.zeros((1, 3))}
+    with pytest.raises(ValueError):
+        build_preview_glb(input_path, skeleton, str(tmp_path / "preview.glb"))
@@ -0,0 +1,290 @@
+"""
+Host-side pool of persistent Blender workers (see blender_worker.py).
+
+Each BlenderWorker owns one long-lived `blender --background` process that
+keeps UniRig imported and its checkpoint files cached in memory. The pool health-checks a
+worker before handing it a step, recycles it after `max_jobs_per_worker` jobs
+and raises WorkerUnavailable whenever it cannot serve a request, so callers can
+fall back to the one-shot subprocess path. A cancelled step kills its worker's
+process group (the worker cannot be interrupted mid-script) and the pool starts
+a fresh worker for the next request. Given a resource profile factory, every
+worker holds a CPU set and thread budget for its lifetime and is watched by an
+RssWatchdog; the CPU set goes back to the allocator when the worker stops.
+"""
+import json
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from cancellation import CancelToken, JobCancelled, terminate_process_group
+from process_output import LineCallback, OutputTail, start_line_readers
+from resource_governor import MemoryLimitExceeded, ResourceProfile, RssWatchdog
+
+
+class WorkerUnavailable(RuntimeError):
+    """The pool could not run a step; the caller should use the one-shot path."""
+
+
+@dataclass
+class WorkerResult:
+    returncode: int
+    stdout: str  # Last lines only (ring buffer)
+    stderr: str
+    cpu_seconds: float = 0.0
+    peak_rss_bytes: int = 0  # Worker's lifetime peak, models included
+
+
+class BlenderWorker:
+    def __init__(self, blender_exec: str, worker_script: str, unirig_repo_dir: str,
+                 env: Dict[str, str], startup_timeout: float = 300, kill_grace_seconds: float = 10,
+                 resource_profile: Optional[Callable[[], ResourceProfile]] = None):
+        self.blender_exec = blender_exec
+        self.worker_script = worker_script
+        self.unirig_repo_dir = unirig_repo_dir
+        self.env = env
+        self.startup_timeout = startup_timeout
+        self.kill_grace_seconds = kill_grace_seconds
+        self.resource_profile = resource_profile
+        self.profile: Optional[ResourceProfile] = None
+        self.watchdog: Optional[RssWatchdog] = None
+        self.process: Optional[subprocess.Popen] = None
+        self.socket_dir: Optional[str] = None
+        self.socket_path: Optional[str] = None
+        self.jobs_served = 0
+
+    def start(self):
+        self.socket_dir = tempfile.mkdtemp(prefix="blender_worker_")
+        self.socket_path = os.path.join(self.socket_dir, "worker.sock")
+        cmd = [
+            self.blender_exec, "--background",
+            "--python", self.worker_script,
+            "--",
+            "--socket", self.socket_path,
+            "--unirig-dir", self.unirig_repo_dir,
+        ]
+        env = dict(self.env)
+        if self.resource_profile:
+            self.profile = self.resource_profile()
+            env.update(self.profile.env())
+        print(f"[WorkerPool] Starting Blender worker: {' '.join(cmd)}")
+        try:
+            self.process = subprocess.Popen(cmd, cwd=self.unirig_repo_dir, env=env,
+                                            stdin=subprocess.DEVNULL, start_new_session=True)
+        except OSError as e:
+            self.stop()
+            raise WorkerUnavailable(f"Could not launch Blender worker: {e}") from e
+        if self.profile:
+            self.profile.pin(self.process.pid)
+            self.watchdog = RssWatchdog(self.process, self.profile.rss_limit_bytes,
+                                        grace_seconds=self.kill_grace_seconds).start()
+
+        deadline = time.time() + self.startup_timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                code = self.process.returncode
+                self.stop()
+                raise WorkerUnavailable(f"Blender worker exited during startup (code {code}).")
+            if os.path.exists(self.socket_path) and self.ping(timeout=5):
+                print(f"[WorkerPool] Worker pid {self.process.pid} ready.")
+                return
+            time.sleep(0.25)
+        self.stop()
+        raise WorkerUnavailable(f"Blender worker not ready after {self.startup_timeout}s.")
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def _request(self, message: Dict, timeout: Optional[float], fds: Optional[List[int]] = None):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.settimeout(timeout)
+        conn.connect(self.socket_path)
+        payload = (json.dumps(message) + "\n").encode("utf-8")
+        if fds:
+            socket.send_fds(conn, [payload], fds)
+        else:
+            conn.sendall(payload)
+        return conn
+
+    def ping(self, timeout: float = 5) -> bool:
+        if not self.alive():
+            return False
+        try:
+            with self._request({"op": "ping"}, timeout) as conn:
+                reply = json.loads(conn.makefile("r").readline() or "{}")
+            return bool(reply.get("ok"))
+        except (OSError, ValueError):
+            return False
+
+    def run(self, script_path: str, script_args: List[str], timeout: float,
+            on_line: Optional[LineCallback] = None, tail_lines: int = 500,
+            cancel_token: Optional[CancelToken] = None, profile: Optional[Dict] = None,
+            skeleton_handoff: Optional[str] = None) -> WorkerResult:
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        tail = OutputTail(tail_lines)
+        readers = start_line_readers({"stdout": stdout_r, "stderr": stderr_r}, tail, on_line)
+
+        finished = None
+        on_cancel = cancel_token.add_callback(lambda reason: self.kill()) if cancel_token else None
+        try:
+            try:
+                conn = self._request({"op": "run", "script": script_path, "args": script_args, "profile": profile,
+                                      "skeleton_handoff": skeleton_handoff}, timeout, fds=[stdout_w, stderr_w])
+            except OSError as e:
+                raise WorkerUnavailable(f"Could not reach Blender worker: {e}") from e
+            finally:
+                # The worker holds its own copies now; closing ours lets the readers see EOF.
+                os.close(stdout_w)
+                os.close(stderr_w)
+            with conn:
+                stream = conn.makefile("r")
+                try:
+                    for line in stream:
+                        message = json.loads(line)
+                        if message.get("event") == "finished":
+                            finished = message
+                            break
+                        if message.get("event") == "error":
+                            raise WorkerUnavailable(f"Worker rejected request: {message.get('message')}")
+                except socket.timeout:
+                    self.kill()
+                    raise subprocess.TimeoutExpired([self.blender_exec, script_path] + script_args, timeout)
+                except (OSError, ValueError) as e:
+                    raise WorkerUnavailable(f"Lost connection to Blender worker: {e}") from e
+        except WorkerUnavailable:
+            if cancel_token and cancel_token.cancelled:
+                raise JobCancelled(cancel_token.reason) from None
+            if self.watchdog and self.watchdog.exceeded:
+                raise MemoryLimitExceeded(f"Blender worker exceeded the {self.profile.rss_limit_bytes // 1024**2} MB "
+                                          f"memory limit.") from None
+            raise
+        finally:
+            if on_cancel:
+                cancel_token.remove_callback(on_cancel)
+            if finished is None and self.alive():
+                # Unknown state (timeout, protocol error); the worker must not be reused.
+                self.kill()
+            for reader in readers:
+                reader.join(timeout=10)
+
+        if cancel_token and cancel_token.cancelled:
+            raise JobCancelled(cancel_token.reason)
+        if finished is None:
+            if self.watchdog and self.watchdog.exceeded:
+                raise MemoryLimitExceeded(f"Blender worker exceeded the {self.profile.rss_limit_bytes // 1024**2} MB "
+                                          f"memory limit.")
+            raise WorkerUnavailable("Blender worker exited before finishing the step.")
+        self.jobs_served += 1
+        return WorkerResult(
+            returncode=int(finished.get("returncode", 1)),
+            stdout=tail.text("stdout"),
+            stderr=tail.text("stderr"),
+            cpu_seconds=float(finished.get("cpu_seconds", 0.0)),
+            peak_rss_bytes=int(finished.get("peak_rss_bytes", 0)),
+        )
+
+    def kill(self):
+        if self.process is not None and self.process.poll() is None:
+            terminate_process_group(self.process, self.kill_grace_seconds)
+
+    def stop(self, timeout: float = 10):
+        if self.alive():
+            try:
+                with self._request({"op": "shutdown"}, timeout) as conn:
+                    conn.makefile("r").readline()
+                self.process.wait(timeout=timeout)
+            except (OSError, subprocess.TimeoutExpired):
+                self.kill()
+        if self.watchdog:
+            self.watchdog.stop()
+            self.watchdog = None
+        if self.profile:
+            self.profile.release()
+            self.profile = None
+        if self.socket_dir and os.path.isdir(self.socket_dir):
+            shutil.rmtree(self.socket_dir, ignore_errors=True)
+
+
+class BlenderWorkerPool:
+    def __init__(self, size: int, max_jobs_per_worker: int, blender_exec: str, worker_script: str,
+                 unirig_repo_dir: str, env: Dict[str, str], startup_timeout: float = 300,
+                 kill_grace_seconds: float = 10, resource_profile: Optional[Callable[[], ResourceProfile]] = None):
+        self.size = size
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self._worker_kwargs = dict(blender_exec=blender_exec, worker_script=worker_script,
+                                   unirig_repo_dir=unirig_repo_dir, env=env,
+                                   startup_timeout=startup_timeout, kill_grace_seconds=kill_grace_seconds,
+                                   resource_profile=resource_profile)
+        # Slots are None until a worker is started lazily on first use.
+        self._slots: "queue.Queue[Optional[BlenderWorker]]" = queue.Queue()
+        for _ in range(size):
+            self._slots.put(None)
+        self._workers: List[BlenderWorker] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _spawn(self) -> BlenderWorker:
+        worker = BlenderWorker(**self._worker_kwargs)
+        worker.start()
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _retire(self, worker: BlenderWorker):
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        worker.stop()
+
+    def _acquire(self, cancel_token: Optional[CancelToken]) -> Optional[BlenderWorker]:
+        """Waits for a free slot, giving up as soon as the request is cancelled."""
+        while True:
+            try:
+                return self._slots.get(timeout=0.5)
+            except queue.Empty:
+                if cancel_token:
+                    cancel_token.raise_if_cancelled()
+
+    def run(self, script_path: str, script_args: List[str], timeout: float,
+            on_line: Optional[LineCallback] = None, tail_lines: int = 500,
+            cancel_token: Optional[CancelToken] = None, profile: Optional[Dict] = None,
+            skeleton_handoff: Optional[str] = None) -> WorkerResult:
+        if self._closed:
+            raise WorkerUnavailable("Worker pool is shut down.")
+        worker = self._acquire(cancel_token)
+        try:
+            if worker is not None and not worker.ping():
+                print("[WorkerPool] Worker failed health check, replacing it.")
+                self._retire(worker)
+                worker = None
+            if worker is None:
+                worker = self._spawn()
+            result = worker.run(script_path, script_args, timeout, on_line=on_line, tail_lines=tail_lines,
+                                cancel_token=cancel_token, profile=profile, skeleton_handoff=skeleton_handoff)
+            if worker.jobs_served >= self.max_jobs_per_worker:
+                print(f"[WorkerPool] Recycling worker after {worker.jobs_served} jobs.")
+                self._retire(worker)
+                worker = None
+            return result
+        except BaseException:
+            if worker is not None and not worker.alive():
+                self._retire(worker)
+                worker = None
+            raise
+        finally:
+            self._slots.put(worker)
+
+    def shutdown(self):
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()